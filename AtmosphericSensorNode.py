@@ -1,4 +1,5 @@
 from lib.inboxidau.pico_w_sensor_node import UPicoWSensorNode
+from lib.inboxidau.config_schema import STR
 from lib.inboxidau.rolling_appender_log import LogLevel
 
 
@@ -15,18 +16,24 @@ class AtmosphericSensorNode(UPicoWSensorNode):
 
     POST_SENSOR_DATA_FORMAT = "{}.post_sensor_data() {} to >{}"
 
+    # Channels written to the binary sensor data log
+    SENSOR_DATA_CHANNELS = (("tempC", "f"), ("pres_hPa", "f"), ("humRH", "f"))
+
+    CONFIG_FIELDS = UPicoWSensorNode.CONFIG_FIELDS + (
+        ('MQTT_TOPIC_temperature', STR, ''),
+        ('MQTT_TOPIC_humidity', STR, ''),
+        ('MQTT_TOPIC_airPressure', STR, ''),
+    )
+
     def __init__(self, log, config_path='AtmosphericSensorNode.json'):
         super().__init__(log, config_path)
         if self.config:
-            self.MQTT_TOPIC_temperature = self.config.get('MQTT_TOPIC_temperature', '')  # noqa: E501
-            self.MQTT_TOPIC_humidity = self.config.get('MQTT_TOPIC_humidity', '')  # noqa: E501
-            self.MQTT_TOPIC_airPressure = self.config.get('MQTT_TOPIC_airPressure', '')  # noqa: E501
             self.log.log_message(f"{self.__class__.__name__} Config values applied", LogLevel.INFO)  # noqa: E501
         else:
             self.log.log_message(f"{self.__class__.__name__} Failed to load config file.", LogLevel.ERROR)  # noqa: E501
 
-        self.log.log_message(f"{self.__class__.__name__} initialized.",
-                             LogLevel.DEBUG)
+        self.log.log_format(LogLevel.DEBUG, "{} initialized.",
+                            self.__class__.__name__)
 
         from lib.PiicoDev_BME280 import PiicoDev_BME280
         self.sensor = PiicoDev_BME280()  # instantiate the sensor
@@ -35,35 +42,29 @@ class AtmosphericSensorNode(UPicoWSensorNode):
         try:
             self.log_message("post_sensor_data", LogLevel.INFO)
 
-            log_message = self.POST_SENSOR_DATA_FORMAT.format(
-                self.__class__.__name__,
-                self.sensor_data['tempC'],
-                self.MQTT_TOPIC_temperature
-             )
-            self.log_message(log_message, LogLevel.DEBUG)
-            self.mqtt_client.publish(self.MQTT_TOPIC_temperature,
-                                     f"{self.sensor_data['tempC']}")
-
-            log_message = self.POST_SENSOR_DATA_FORMAT.format(
-                self.__class__.__name__,
-                self.sensor_data['pres_hPa'],
-                self.MQTT_TOPIC_airPressure
-             )
-            self.log_message(log_message, LogLevel.DEBUG)
-            self.mqtt_client.publish(self.MQTT_TOPIC_airPressure,
-                                     f"{int(self.sensor_data['pres_hPa'])}")
-
-            log_message = self.POST_SENSOR_DATA_FORMAT.format(
-                self.__class__.__name__,
-                self.sensor_data['humRH'],
-                self.MQTT_TOPIC_humidity
-             )
-            self.log_message(log_message, LogLevel.DEBUG)
-            self.mqtt_client.publish(self.MQTT_TOPIC_humidity,
-                                     f"{int(self.sensor_data['humRH'])}")
+            self.log_format(LogLevel.DEBUG, self.POST_SENSOR_DATA_FORMAT,
+                            self.__class__.__name__,
+                            self.sensor_data['tempC'],
+                            self.MQTT_TOPIC_temperature)
+            self.publish_channel("tempC", self.MQTT_TOPIC_temperature,
+                                 self.sensor_data['tempC'])
+
+            self.log_format(LogLevel.DEBUG, self.POST_SENSOR_DATA_FORMAT,
+                            self.__class__.__name__,
+                            self.sensor_data['pres_hPa'],
+                            self.MQTT_TOPIC_airPressure)
+            self.publish_channel("pres_hPa", self.MQTT_TOPIC_airPressure,
+                                 int(self.sensor_data['pres_hPa']))
+
+            self.log_format(LogLevel.DEBUG, self.POST_SENSOR_DATA_FORMAT,
+                            self.__class__.__name__,
+                            self.sensor_data['humRH'],
+                            self.MQTT_TOPIC_humidity)
+            self.publish_channel("humRH", self.MQTT_TOPIC_humidity,
+                                 int(self.sensor_data['humRH']))
 
             if self.LOG_SENSOR_DATA == 1:
-                self.write_to_json(self.LOG_SENSOR_DATA_FILE, self.sensor_data)
+                self.write_sensor_data()
 
         except Exception as e:
             self.log.log_message(f"{self.__class__.__name__}.post_sensor_data() {str(e)}", LogLevel.ERROR)  # noqa: E501
@@ -1,4 +1,5 @@
 from lib.inboxidau.pico_w_sensor_node import UPicoWSensorNode
+from lib.inboxidau.config_schema import BOOL, INT, NUMBER, STR, DICT
 from lib.inboxidau.rolling_appender_log import LogLevel
 
 
@@ -19,15 +20,46 @@ class DistanceSensorNode(UPicoWSensorNode):
 
     POST_SENSOR_DATA_FORMAT = "{}.post_sensor_data() {} to >{}"
 
+    # Channels written to the binary sensor data log
+    SENSOR_DATA_CHANNELS = (("distance", "f"), ("occupancy", "B"))
+
+    CONFIG_FIELDS = UPicoWSensorNode.CONFIG_FIELDS + (
+        ('MQTT_TOPIC_distance', STR, ''),
+        ('MQTT_TOPIC_occupancy', STR, ''),
+        ('OCCUPANCY_DISTANCE', NUMBER, 0),
+        # Occupied below OCCUPANCY_DISTANCE - OCCUPANCY_HYSTERESIS,
+        # vacant above OCCUPANCY_DISTANCE + OCCUPANCY_HYSTERESIS, and
+        # no change sooner than OCCUPANCY_MIN_DWELL seconds after the last
+        ('OCCUPANCY_HYSTERESIS', NUMBER, 0),
+        ('OCCUPANCY_MIN_DWELL', NUMBER, 0),
+        # Streaming filters (median, ema, kalman, hampel) keep their
+        # state between cycles and settle with fewer readings per cycle,
+        # the names create_filter() knows
+        ('DISTANCE_FILTER', STR, 'discard_extremes',
+         ('discard_extremes', 'trimmed_mean', 'median', 'ema', 'kalman',
+          'hampel')),
+        ('DISTANCE_FILTER_WINDOW', INT,
+         lambda node: node.STATIC_NODE_SENSE_FILTER_SIZE),
+        ('DISTANCE_FILTER_READINGS', INT,
+         lambda node: node.STATIC_NODE_SENSE_FILTER_SIZE),
+        ('DISTANCE_FILTER_OPTIONS', DICT, {}),
+        # Sample slowly while the distance is stable and quickly when it
+        # crosses OCCUPANCY_DISTANCE or moves faster than
+        # ADAPTIVE_RATE_THRESHOLD mm/s
+        ('ADAPTIVE_CADENCE', BOOL, False),
+        ('ADAPTIVE_MIN_PERIOD', NUMBER, 1),
+        ('ADAPTIVE_MAX_PERIOD', NUMBER, 10),
+        ('ADAPTIVE_BACKOFF', NUMBER, 2),
+        ('ADAPTIVE_RATE_THRESHOLD', NUMBER, None),
+        ('ADAPTIVE_BURST_SAMPLES', INT,
+         lambda node: node.STATIC_NODE_OCCUPANCY_HISTORY_SIZE),
+        ('MQTT_TOPIC_sample_period', STR, ''),
+    )
+
     def __init__(self, log, config_path='UPicoWSensorNode.json'):
         super().__init__(log, config_path)
         if self.config:
-            self.MQTT_TOPIC_distance = self.config.get(
-                'MQTT_TOPIC_distance', '')
-            self.MQTT_TOPIC_occupancy = self.config.get(
-                'MQTT_TOPIC_occupancy', '')
-            self.OCCUPANCY_DISTANCE = self.config.get(
-                'OCCUPANCY_DISTANCE', '')
+            self.initialize_adaptive_cadence()
             self.log.log_message(
                 f"{self.__class__.__name__} Config values applied",
                 LogLevel.INFO)
@@ -36,47 +68,97 @@ class DistanceSensorNode(UPicoWSensorNode):
                 f"{self.__class__.__name__} Failed to load config file.",
                 LogLevel.ERROR)
 
-        self.log.log_message(
-            f"{self.__class__.__name__} initialized.",
-            LogLevel.DEBUG)
+        self.log.log_format(LogLevel.DEBUG, "{} initialized.",
+                            self.__class__.__name__)
 
         from lib.PiicoDev_VL53L1X import PiicoDev_VL53L1X
         self.distance_sensor = PiicoDev_VL53L1X()  # initialise the sensor
 
-        from lib.inboxidau.sensor_reading_filter import DiscardExtremesFilter
-        self.filtered_distance_sensor = DiscardExtremesFilter(self.STATIC_NODE_SENSE_FILTER_SIZE)
+        self.initialize_distance_filter()
 
-        self.occupancy_history = []  # Stores the last few occupancy assessments
+        # Occupancy changes once STATIC_NODE_OCCUPANCY_HISTORY_SIZE filtered
+        # readings in a row agree on it
+        self.occupancy = None
+        if self.config:
+            from lib.inboxidau.hysteresis_debouncer import UHysteresisDebouncer  # noqa: E501
+            self.occupancy = UHysteresisDebouncer(
+                self.OCCUPANCY_DISTANCE - self.OCCUPANCY_HYSTERESIS,
+                self.OCCUPANCY_DISTANCE + self.OCCUPANCY_HYSTERESIS,
+                self.STATIC_NODE_OCCUPANCY_HISTORY_SIZE,
+                self.OCCUPANCY_MIN_DWELL)
         self.sensor_data["occupancy"] = False
         self.sensor_data["distance"] = 0
-        self.last_removed_occupancy = None  # Tracks the last removed occupancy state
+        # Set when the last reading changed occupancy
+        self.occupancy_changed = False
+
+    def initialize_distance_filter(self):
+        from lib.inboxidau.sensor_reading_filter import create_filter
+        self.filtered_distance_sensor = create_filter(
+            self.DISTANCE_FILTER, self.DISTANCE_FILTER_WINDOW,
+            **self.DISTANCE_FILTER_OPTIONS)
+
+    def initialize_adaptive_cadence(self):
+        self.adaptive_cadence = None
+        if self.ADAPTIVE_CADENCE:
+            from lib.inboxidau.adaptive_cadence import UAdaptiveCadence
+            self.adaptive_cadence = UAdaptiveCadence(
+                self.ADAPTIVE_MIN_PERIOD, self.ADAPTIVE_MAX_PERIOD,
+                self.ADAPTIVE_BACKOFF, self.OCCUPANCY_DISTANCE or None,
+                self.ADAPTIVE_RATE_THRESHOLD, self.ADAPTIVE_BURST_SAMPLES)
+
+    def on_config_changed(self, keys):
+        restart = super().on_config_changed(keys)
+        keys = set(keys)
+        if keys & {'OCCUPANCY_DISTANCE', 'OCCUPANCY_HYSTERESIS',
+                   'OCCUPANCY_MIN_DWELL'}:
+            # the band moves, the current occupancy is kept
+            self.occupancy.set_thresholds(
+                self.OCCUPANCY_DISTANCE - self.OCCUPANCY_HYSTERESIS,
+                self.OCCUPANCY_DISTANCE + self.OCCUPANCY_HYSTERESIS,
+                self.OCCUPANCY_MIN_DWELL)
+        if keys & {'DISTANCE_FILTER', 'DISTANCE_FILTER_WINDOW',
+                   'DISTANCE_FILTER_OPTIONS'}:
+            self.initialize_distance_filter()
+        if 'OCCUPANCY_DISTANCE' in keys or \
+                [key for key in keys if key.startswith('ADAPTIVE_')]:
+            self.initialize_adaptive_cadence()
+        return restart
 
     def post_sensor_data(self):
         try:
             self.log_message("post_sensor_data", LogLevel.INFO)
 
-            log_message = self.POST_SENSOR_DATA_FORMAT.format(
-                self.__class__.__name__,
-                self.sensor_data["distance"],
-                self.MQTT_TOPIC_distance
-             )
-            self.log_message(log_message, LogLevel.DEBUG)
-            self.mqtt_client.publish(
+            self.log_format(LogLevel.DEBUG, self.POST_SENSOR_DATA_FORMAT,
+                            self.__class__.__name__,
+                            self.sensor_data["distance"],
+                            self.MQTT_TOPIC_distance)
+            self.publish_channel(
+                "distance",
                 self.MQTT_TOPIC_distance,
-                f"{self.sensor_data['distance']}")
+                self.sensor_data['distance'])
+
+            self.log_format(LogLevel.DEBUG, self.POST_SENSOR_DATA_FORMAT,
+                            self.__class__.__name__,
+                            self.sensor_data["occupancy"],
+                            self.MQTT_TOPIC_occupancy)
+            # occupancy changes are always reported straight away
+            self.publish_channel(
+                "occupancy",
+                self.MQTT_TOPIC_occupancy,
+                self.sensor_data['occupancy'],
+                force=self.occupancy_changed)
 
-            log_message = self.POST_SENSOR_DATA_FORMAT.format(
-                self.__class__.__name__,
-                self.sensor_data["occupancy"],
-                self.MQTT_TOPIC_occupancy)
+            self.publish_burst()
 
-            self.log_message(log_message, LogLevel.DEBUG)
-            self.mqtt_client.publish(
-                self.MQTT_TOPIC_occupancy,
-                f"{self.sensor_data['occupancy']}")
+            if self.adaptive_cadence is not None and \
+                    self.MQTT_TOPIC_sample_period:
+                self.publish_channel(
+                    "sample_period",
+                    self.MQTT_TOPIC_sample_period,
+                    self.adaptive_cadence.period_s)
 
             if self.LOG_SENSOR_DATA == 1:
-                self.write_to_json(self.LOG_SENSOR_DATA_FILE, self.sensor_data)
+                self.write_sensor_data()
 
         except Exception as e:
             self.log.log_message(
@@ -84,69 +166,75 @@ class DistanceSensorNode(UPicoWSensorNode):
                 LogLevel.ERROR)
         return None
 
+    def post_immediate_data(self):
+        # with a rollup, occupancy changes are still reported straight away
+        super().post_immediate_data()
+        if self.occupancy_changed:
+            try:
+                self.publish_channel("occupancy", self.MQTT_TOPIC_occupancy,
+                                     self.sensor_data['occupancy'],
+                                     force=True)
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.post_immediate_data() {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+
+    # Occupancy steps, kept for subclasses that override them. The history
+    # is the debouncer's count of agreeing readings.
+
+    def assess_occupancy(self, filtered_value):
+        # True if occupied, False if not, a value inside the hysteresis
+        # band keeps the current state
+        return self.occupancy.candidate(filtered_value)
+
     def update_occupancy_history(self, occupancy):
-        # Updates the occupancy history with the latest assessment.
-        # Save the last removed occupancy state before removing it.
-        if len(self.occupancy_history) >= self.STATIC_NODE_OCCUPANCY_HISTORY_SIZE:
-            self.last_removed_occupancy = self.occupancy_history.pop(0)
-        self.occupancy_history.append(occupancy)
+        self.occupancy_changed = self.occupancy.update_state(occupancy)
 
     def detect_occupancy_change(self):
-        # Detects if there's a change in occupancy based on the last few assessments.
-        if len(self.occupancy_history) < self.STATIC_NODE_OCCUPANCY_HISTORY_SIZE:
-            self.log_message("Not enough data to assess a change in occupancy ", LogLevel.DEBUG)
-            return False  # Not enough data to assess a change
-
-        # Check if the last removed value is None
-        if self.last_removed_occupancy is None:
-            self.log_message("Not enough data popped to assess a change in occupancy ", LogLevel.DEBUG)
-            return False  # Not enough change to assess a change
-
-        # Check if all recent assessments are the same
-        last_state = self.occupancy_history[-1]
-        if not all(state == last_state for state in self.occupancy_history):
-            self.log_message("No persistent change in historic occupancy", LogLevel.DEBUG)
-            return False  # No change in occupancy
-
-        # Check that the last popped value is not the same as the persistent value
-        if self.last_removed_occupancy is not None and self.last_removed_occupancy == last_state:
-            self.log_message("No change in historic occupancy", LogLevel.DEBUG)
-            return False  # No change in occupancy
-
-        # Otherwise, there has been a change
-        self.log_message(f"There was a change in historic occupancy last_state:{last_state}  last_removed:{self.last_removed_occupancy}",  # noqa: E501
-                         LogLevel.DEBUG)
-        for index, item in enumerate(self.occupancy_history):
-            print(f"Index {index}: {item}")
-
-        return True
-
-    def assess_occupancy(self, filtered_value):
-        return filtered_value < self.OCCUPANCY_DISTANCE  # noqa: E501  True if occupied, False if not
+        # True when the last reading changed occupancy
+        return self.occupancy_changed
 
     def read_sensor_data(self):
         try:
             self.log_message("read_sensor_data ", LogLevel.DEBUG)
 
-            self.filtered_distance_sensor.reset()
-            for _ in range(self.STATIC_NODE_SENSE_FILTER_SIZE):
+            if not self.filtered_distance_sensor.STREAMING:
+                self.filtered_distance_sensor.reset()
+            readings = self.DISTANCE_FILTER_READINGS
+            burst = None
+            if self.burst_due():
+                # the burst replaces the back to back readings, the filter
+                # takes its last ones
+                burst = self.capture_burst(self.distance_sensor.read)
+                readings = min(readings, self.burst.count)
+            for index in range(readings):
 
                 # read the distance in millimeters
-                distance = self.distance_sensor.read()
+                if burst is None:
+                    distance = self.distance_sensor.read()
+                else:
+                    distance = burst[self.burst.count - readings + index]
                 self.sensor_data["distance"] = self.filtered_distance_sensor.add_reading(distance)
-                self.log.log_message(
-                    f"{str(_)}: {str(self.sensor_data['distance'])} mm (last raw value: {str(distance)} mm)",
-                    LogLevel.DEBUG)
-
-            # Add the current occupancy assessment to the history
-            occupancy_state = self.assess_occupancy(distance)
+                self.log.log_format(
+                    LogLevel.DEBUG, "{}: {} mm (last raw value: {} mm)",
+                    index, self.sensor_data['distance'], distance)
+
+            if self.adaptive_cadence is not None:
+                self.adaptive_cadence.update(self.sensor_data["distance"])
+                self.log.log_format(
+                    LogLevel.DEBUG, "next sample in {} s ({} bursts)",
+                    self.adaptive_cadence.period_s,
+                    self.adaptive_cadence.bursts)
+
+            # Debounce the occupancy assessment of the filtered distance
+            occupancy_state = self.assess_occupancy(
+                self.sensor_data["distance"])
             self.update_occupancy_history(occupancy_state)
-            self.log.log_message(f"{distance} {occupancy_state}", LogLevel.DEBUG)
-
-            # Detect if there has been a consistent change in status according to history
+            self.log.log_format(LogLevel.DEBUG, "{} {} run {}",
+                                self.sensor_data["distance"],
+                                self.occupancy.state, self.occupancy.run)
             if self.detect_occupancy_change() is True:
                 # if object detected within nominated distance
-                self.sensor_data["occupancy"] = occupancy_state
+                self.sensor_data["occupancy"] = self.occupancy.state
                 if self.sensor_data["occupancy"] is True:
                     self.log.log_message("Occupied", LogLevel.INFO)
                 else:
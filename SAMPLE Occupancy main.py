@@ -4,7 +4,8 @@ from DistanceSensorNode import DistanceSensorNode
 
 log = URollingAppenderLog("DistanceSensorNode.log", max_file_size_bytes=4096,
                           max_backups=10, print_messages=True,
-                          log_level=DistanceSensorNode.STATIC_NODE_LOG_LEVEL)
+                          log_level=DistanceSensorNode.STATIC_NODE_LOG_LEVEL,
+                          buffer_size=16)
 
 myNode = DistanceSensorNode(log=log, config_path="config.json")
 
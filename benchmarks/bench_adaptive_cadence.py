@@ -0,0 +1,98 @@
+import os
+import random
+import sys
+
+# Host-side simulation: a car park bay overnight, empty at 2500 mm, a car
+# arriving after 3 hours (driving in over 8 s to 600 mm) and leaving after
+# 9 hours. Compares the fixed 5 s cadence of DistanceSensorNode with the
+# adaptive cadence: samples taken, and seconds from the car crossing
+# OCCUPANCY_DISTANCE until STATIC_NODE_OCCUPANCY_HISTORY_SIZE agreeing
+# samples confirm the change. Once the change is seen it is confirmed at
+# the burst rate; how soon it is first seen is bounded by the longest
+# period.
+#
+# Usage:
+#   python benchmarks/bench_adaptive_cadence.py [hours]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.adaptive_cadence import UAdaptiveCadence  # noqa: E402
+
+OCCUPANCY_DISTANCE = 900
+HISTORY_SIZE = 3
+EMPTY_MM = 2500
+PARKED_MM = 600
+DRIVE_IN_S = 8
+
+
+def distance_at(t, arrive_s, leave_s, noise):
+    if t < arrive_s or t >= leave_s + DRIVE_IN_S:
+        base = EMPTY_MM
+    elif t < arrive_s + DRIVE_IN_S:
+        base = EMPTY_MM - (EMPTY_MM - PARKED_MM) * (t - arrive_s) / DRIVE_IN_S
+    elif t < leave_s:
+        base = PARKED_MM
+    else:
+        base = PARKED_MM + (EMPTY_MM - PARKED_MM) * (t - leave_s) / DRIVE_IN_S
+    return base + noise.uniform(-10, 10)
+
+
+def crossings(arrive_s, leave_s):
+    # when the true distance crosses OCCUPANCY_DISTANCE
+    fraction = (EMPTY_MM - OCCUPANCY_DISTANCE) / (EMPTY_MM - PARKED_MM)
+    return [arrive_s + fraction * DRIVE_IN_S,
+            leave_s + (1 - fraction) * DRIVE_IN_S]
+
+
+def simulate(next_delay, hours):
+    duration_s = hours * 3600
+    arrive_s, leave_s = duration_s / 4, duration_s * 3 / 4
+    noise = random.Random(1)
+    t = 0.0
+    samples = 0
+    history = []
+    confirmed = []
+    while t < duration_s:
+        distance = distance_at(t, arrive_s, leave_s, noise)
+        samples += 1
+        history = (history + [distance < OCCUPANCY_DISTANCE])[-HISTORY_SIZE:]
+        state = history[-1]
+        if len(history) == HISTORY_SIZE and all(h == state for h in history) \
+                and (not confirmed or confirmed[-1][1] != state) \
+                and (confirmed or state):
+            confirmed.append((t, state))
+        t += next_delay(t, distance)
+    latencies = [at - crossing for (at, _), crossing
+                 in zip(confirmed, crossings(arrive_s, leave_s))]
+    return samples, latencies
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 12
+    now = {"ms": 0}
+    clock.ticks_ms = lambda: now["ms"]
+
+    def adaptive(max_s):
+        cadence = UAdaptiveCadence(min_s=1, max_s=max_s,
+                                   threshold=OCCUPANCY_DISTANCE,
+                                   rate_threshold=100,
+                                   burst_samples=HISTORY_SIZE)
+
+        def next_delay(t, distance):
+            now["ms"] = int(t * 1000)
+            return cadence.update(distance)
+        return next_delay
+
+    print(f"{hours:g} h overnight, car in and out once")
+    print(f"{'cadence':<24}{'samples':>10}{'arrive s':>10}{'leave s':>10}")
+    for label, next_delay in (("fixed 5 s", lambda t, distance: 5),
+                              ("fixed 1 s", lambda t, distance: 1),
+                              ("adaptive 1-10 s", adaptive(10)),
+                              ("adaptive 1-60 s", adaptive(60))):
+        samples, latencies = simulate(next_delay, hours)
+        arrive, leave = (latencies + [float("nan")] * 2)[:2]
+        print(f"{label:<24}{samples:>10}{arrive:>10.1f}{leave:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
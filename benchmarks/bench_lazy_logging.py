@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+# Host-side benchmark: the cost of a DEBUG message that is filtered out by
+# an INFO log, for the original call path (f-string, timestamp and prefix
+# built before the level check, reproduced below), the eager call path
+# with the level checked first, and log_format. Also reports the cost of
+# the timestamp with and without the once a second cache.
+#
+# Usage:
+#   python benchmarks/bench_lazy_logging.py [calls]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.rolling_appender_log import URollingAppenderLog, LogLevel  # noqa: E402, E501
+
+
+def original_get_network_time():
+    # UPicoWSensorNode.get_network_time before the cache, gmtime stands in
+    # for utime.localtime
+    current_time_utc = time.gmtime()
+    return "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z".format(
+        current_time_utc[0], current_time_utc[1], current_time_utc[2],
+        current_time_utc[3], current_time_utc[4], current_time_utc[5])
+
+
+class CachedClock:
+
+    # UPicoWSensorNode.get_network_time with the once a second cache
+
+    def __init__(self):
+        self._iso_date = ""
+        self._iso_date_second = None
+
+    def get_network_time(self):
+        now = int(time.time())
+        if now == self._iso_date_second:
+            return self._iso_date
+        self._iso_date = original_get_network_time()
+        self._iso_date_second = now
+        return self._iso_date
+
+
+def original_log_message(log_level, message, level=LogLevel.INFO,
+                         tid="0000-00-00T00:00:00Z"):
+    # URollingAppenderLog.log_message up to the level check, as it was
+    prefix_mapping = {
+        LogLevel.INFO: "INFO",
+        LogLevel.DEBUG: "DEBUG",
+        LogLevel.ERROR: "ERROR"
+    }
+    prefix = prefix_mapping.get(level, "UNKNOWN")
+    if level == LogLevel.ERROR or \
+        (log_level == LogLevel.INFO and level == LogLevel.INFO) or \
+            (log_level == LogLevel.DEBUG and
+             level in (LogLevel.DEBUG, LogLevel.INFO)):
+        display_message = True
+    else:
+        display_message = False
+    message = f"TID:{tid}-{prefix}-{message}"
+    return display_message
+
+
+def timed(label, calls, function):
+    start = time.perf_counter()
+    for count in range(calls):
+        function(count)
+    elapsed_ns = (time.perf_counter() - start) * 1e9 / calls
+    print(f"{label:<44}{elapsed_ns:>10.0f} ns")
+    return elapsed_ns
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    log = URollingAppenderLog("bench.log", log_level=LogLevel.INFO)
+    distance = 1234.5
+
+    print(f"filtered DEBUG message, {calls} calls")
+    original = timed(
+        "original (f-string, timestamp, prefix)", calls,
+        lambda count: original_log_message(
+            LogLevel.INFO,
+            f"{count}: {distance} mm (last raw value: {distance} mm)",
+            LogLevel.DEBUG, original_get_network_time()))
+    eager = timed(
+        "level checked first, f-string still built", calls,
+        lambda count: log.log_message(
+            f"{count}: {distance} mm (last raw value: {distance} mm)",
+            LogLevel.DEBUG))
+    lazy = timed(
+        "log_format", calls,
+        lambda count: log.log_format(
+            LogLevel.DEBUG, "{}: {} mm (last raw value: {} mm)",
+            count, distance, distance))
+    print(f"saved per call: eager {original - eager:.0f} ns, "
+          f"log_format {original - lazy:.0f} ns "
+          f"({original / lazy:.1f}x faster)")
+
+    print("timestamp")
+    clock = CachedClock()
+    uncached = timed("formatted every call", calls,
+                     lambda count: original_get_network_time())
+    cached = timed("cached once a second", calls,
+                   lambda count: clock.get_network_time())
+    print(f"saved per call: {uncached - cached:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+
+# Host-side regression benchmark: runs UPicoWSensorNode.main() for
+# simulated days with the sim package (virtual clock, fake Wi-Fi, NTP and
+# MQTT broker, scripted sensors) for a set of node configurations, and
+# prints per day counts of cycles, publishes, TLS handshakes, Wi-Fi
+# associations, NTP syncs and filesystem operations, and host CPU time per
+# cycle. Counts are deterministic for a given seed, compare them between
+# commits; CPU times depend on the host.
+#
+# Usage:
+#   python benchmarks/bench_node_lifecycle.py [days]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.harness import (ATMOSPHERIC_CONFIG, DISTANCE_CONFIG,  # noqa: E402
+                         NodeSimulation)
+
+DISTANCE = "DistanceSensorNode:DistanceSensorNode"
+ATMOSPHERIC = "AtmosphericSensorNode:AtmosphericSensorNode"
+
+SCENARIOS = (
+    ("distance 5 s", DISTANCE, DISTANCE_CONFIG, {}),
+    ("distance adaptive + rbe", DISTANCE,
+     dict(DISTANCE_CONFIG, ADAPTIVE_CADENCE=True, REPORT_BY_EXCEPTION=True,
+          REPORT_DEADBANDS={"distance": 50}), {}),
+    ("distance 30 min outage", DISTANCE,
+     dict(DISTANCE_CONFIG, PUBLISH_QUEUE=True),
+     {"outages": [(3600, 5400)]}),
+    ("distance burst 20 Hz", DISTANCE,
+     dict(DISTANCE_CONFIG, BURST_CAPTURE=True, BURST_RATE_HZ=20,
+          BURST_EVERY_CYCLES=12, MQTT_TOPIC_burst="carpark01/sim/burst"),
+     {}),
+    ("atmospheric busy", ATMOSPHERIC, ATMOSPHERIC_CONFIG, {}),
+    ("atmospheric light sleep", ATMOSPHERIC,
+     dict(ATMOSPHERIC_CONFIG, SLEEP_MODE="light"), {}),
+    ("atmospheric deep sleep", ATMOSPHERIC,
+     dict(ATMOSPHERIC_CONFIG, SLEEP_MODE="deep"), {}),
+    ("atmospheric HAT 5 min", ATMOSPHERIC,
+     dict(ATMOSPHERIC_CONFIG, MAKERVERSE_NANO_POWER_TIMER_HAT=True),
+     {"hat_period_s": 300}),
+    ("atmospheric metrics", ATMOSPHERIC,
+     dict(ATMOSPHERIC_CONFIG, METRICS_ENABLED=True), {}),
+    ("atmospheric batch cbor", ATMOSPHERIC,
+     dict(ATMOSPHERIC_CONFIG, MQTT_BATCH_PUBLISH=True,
+          MQTT_BATCH_ENCODING="cbor", MQTT_TOPIC_node="weatherstn/sim/node"),
+     {}),
+)
+
+COLUMNS = (("cycles", "cycles"), ("publishes", "pub"),
+           ("payload_bytes", "pub bytes"), ("handshakes", "tls"),
+           ("wifi_associations", "assoc"), ("ntp_syncs", "ntp"),
+           ("fs_ops", "fs ops"), ("fs_bytes_written", "fs bytes"),
+           ("cpu_ms_mean", "cpu ms"), ("cpu_ms_p95", "p95 ms"),
+           ("wall_s", "wall s"))
+
+
+def main():
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    print(f"{days:g} simulated day(s), counts per day")
+    print(f"{'scenario':<26}" + "".join(f"{label:>10}"
+                                        for _, label in COLUMNS))
+    for label, node_class, config, options in SCENARIOS:
+        report = NodeSimulation(node_class, config=config, days=days,
+                                **options).run()
+        cells = []
+        for key, _ in COLUMNS:
+            value = report[key]
+            if key.startswith("cpu") or key == "wall_s":
+                cells.append(f"{value:>10.3f}")
+            else:
+                cells.append(f"{value / days:>10.0f}")
+        print(f"{label:<26}" + "".join(cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+
+# Host-side benchmark: bytes on the wire per sensing cycle for the
+# AtmosphericSensorNode and DistanceSensorNode channels, one publish per
+# channel against one batched publish per encoding. Counts the MQTT PUBLISH
+# packet (QoS 0) and the TLS records umqtt.simple produces for it, one per
+# socket write: fixed header, topic length, topic and payload. TLS 1.2
+# AES-GCM adds 29 bytes per record (5 header, 8 nonce, 16 tag).
+#
+# Usage:
+#   python benchmarks/bench_payload_encoding.py
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.payload_encoding import ENCODINGS, UBatchPayload  # noqa: E402, E501
+
+TLS_RECORD_OVERHEAD = 29
+WRITES_PER_PUBLISH = 4
+
+NODES = {
+    "atmospheric": [
+        ("tempC", "weatherstn/picodev_board/temperature", 21.53, None),
+        ("pres_hPa", "weatherstn/picodev_board/airPressure", 1013, None),
+        ("humRH", "weatherstn/picodev_board/humidity", 48, None)],
+    "distance": [
+        ("distance", "carpark01/picodev_board/distance", 1834.5, "f"),
+        ("occupancy", "carpark01/picodev_board/occupancy", False, "B")],
+}
+NODE_TOPICS = {"atmospheric": "weatherstn/picodev_board/node",
+               "distance": "carpark01/picodev_board/node"}
+
+
+def remaining_length_bytes(length):
+    count = 1
+    while length >= 128:
+        length >>= 7
+        count += 1
+    return count
+
+
+def publish_bytes(topic, payload):
+    # (MQTT bytes, bytes on the wire with TLS) for one QoS 0 PUBLISH
+    remaining = 2 + len(topic) + len(payload)
+    mqtt = 1 + remaining_length_bytes(remaining) + remaining
+    return mqtt, mqtt + WRITES_PER_PUBLISH * TLS_RECORD_OVERHEAD
+
+
+def main():
+    print(f"{'node':<13}{'mode':<16}{'packets':>8}{'payload B':>11}"
+          f"{'MQTT B':>8}{'wire B':>8}")
+    for node, channels in NODES.items():
+        rows = [("per channel", [(topic, f"{value}".encode())
+                                 for _, topic, value, _ in channels])]
+        for encoding in ENCODINGS:
+            batch = UBatchPayload(encoding)
+            for channel, topic, value, type_code in channels:
+                batch.add(channel, topic, value, type_code)
+            rows.append((f"batch {encoding}",
+                         [(NODE_TOPICS[node], batch.encode())]))
+        for mode, publishes in rows:
+            payload = sum(len(payload) for _, payload in publishes)
+            mqtt = wire = 0
+            for topic, body in publishes:
+                packet, on_wire = publish_bytes(topic.encode(), body)
+                mqtt += packet
+                wire += on_wire
+            print(f"{node:<13}{mode:<16}{len(publishes):>8}{payload:>11}"
+                  f"{mqtt:>8}{wire:>8}")
+
+
+if __name__ == '__main__':
+    main()
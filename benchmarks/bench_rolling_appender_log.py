@@ -0,0 +1,103 @@
+import builtins
+import os
+import sys
+import tempfile
+
+# Host-side benchmark: counts the filesystem calls URollingAppenderLog makes
+# per logged message, unbuffered versus buffered, and per rollover for the
+# shift and circular rotations as max_backups grows.
+#
+# Usage:
+#   python benchmarks/bench_rolling_appender_log.py [messages]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import rolling_appender_log  # noqa: E402
+from lib.inboxidau.rolling_appender_log import URollingAppenderLog, LogLevel  # noqa: E402, E501
+
+
+class CountingFileSystem:
+
+    # Wraps the os functions the log uses and builtins.open so that every
+    # call made while the counter is installed is tallied by name.
+
+    WRAPPED = ('listdir', 'stat', 'rename', 'remove')
+
+    def __init__(self):
+        self.counts = {}
+        self._originals = {}
+
+    def _wrap(self, name, function):
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return function(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        for name in self.WRAPPED:
+            self._originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self._originals[name]))
+        self._originals['open'] = builtins.open
+        builtins.open = self._wrap('open', builtins.open)
+        return self
+
+    def __exit__(self, *exc):
+        builtins.open = self._originals.pop('open')
+        for name, function in self._originals.items():
+            setattr(os, name, function)
+        self._originals = {}
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+def run(messages, warm_up=0, **log_kwargs):
+    log_kwargs.setdefault('max_file_size_bytes', 4096)
+    log_kwargs.setdefault('max_backups', 5)
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            log = URollingAppenderLog("bench.log", log_level=LogLevel.DEBUG,
+                                      **log_kwargs)
+            # fill the backups first so that every rollover measured
+            # replaces one
+            for index in range(warm_up):
+                log.log_message(f"0: {index} mm (last raw value: {index} mm)",  # noqa: E501
+                                LogLevel.DEBUG)
+            with CountingFileSystem() as fs:
+                for index in range(messages):
+                    log.log_message(f"0: {index} mm (last raw value: {index} mm)",  # noqa: E501
+                                    LogLevel.DEBUG)
+                log.flush()
+        finally:
+            os.chdir(cwd)
+    return fs
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    assert rolling_appender_log.os is os
+    print(f"{messages} DEBUG messages")
+    print(f"{'mode':<24}{'calls':>8}{'per msg':>10}  breakdown")
+    for label, kwargs in (("unbuffered", {}),
+                          ("buffered 16 slots", {'buffer_size': 16}),
+                          ("buffered 64 slots", {'buffer_size': 64,
+                                                 'buffer_max_bytes': 4096})):
+        fs = run(messages, **kwargs)
+        breakdown = " ".join(f"{k}={v}" for k, v in sorted(fs.counts.items()))  # noqa: E501
+        print(f"{label:<24}{fs.total():>8}{fs.total() / messages:>10.3f}  {breakdown}")  # noqa: E501
+
+    # a rollover on every message, so the calls per message are the calls
+    # per rollover plus the append
+    print("rollover on every message")
+    print(f"{'rotation':<24}{'backups':>8}{'per roll':>10}  breakdown")
+    for rotation in ("shift", "circular"):
+        for max_backups in (2, 5, 20):
+            fs = run(100, warm_up=max_backups + 1, max_file_size_bytes=1,
+                     max_backups=max_backups, rotation=rotation)
+            breakdown = " ".join(f"{k}={v}" for k, v in sorted(fs.counts.items()))  # noqa: E501
+            print(f"{rotation:<24}{max_backups:>8}{fs.total() / 100:>10.2f}  {breakdown}")  # noqa: E501
+
+
+if __name__ == '__main__':
+    main()
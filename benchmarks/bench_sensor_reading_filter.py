@@ -0,0 +1,100 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Host-side benchmark: the incremental sliding window filters against the
+# original list based implementations, reproduced below, for window sizes
+# from 5 to 256. Reports time and bytes allocated per reading.
+#
+# Usage:
+#   python benchmarks/bench_sensor_reading_filter.py [readings]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.sensor_reading_filter import DiscardExtremesFilter, TrimmedMeanFilter  # noqa: E402, E501
+
+
+class ListDiscardExtremesFilter:
+
+    # The original DiscardExtremesFilter, pop(0), sorted() and a slice per
+    # reading
+
+    def __init__(self, window_size=5):
+        self.window = []
+        self.window_size = window_size
+
+    def add_reading(self, value):
+        if len(self.window) >= self.window_size:
+            self.window.pop(0)
+        self.window.append(value)
+
+        if len(self.window) > 2:
+            sorted_window = sorted(self.window)
+            trimmed_window = sorted_window[1:-1]
+            return sum(trimmed_window) / len(trimmed_window)
+        return value
+
+
+class ListTrimmedMeanFilter:
+
+    # The original TrimmedMeanFilter
+
+    def __init__(self, window_size=5, trim_percent=0.1):
+        self.window = []
+        self.window_size = window_size
+        self.trim_percent = trim_percent
+
+    def add_reading(self, value):
+        if len(self.window) >= self.window_size:
+            self.window.pop(0)
+        self.window.append(value)
+
+        if len(self.window) > 1:
+            sorted_window = sorted(self.window)
+            trim_count = int(len(sorted_window) * self.trim_percent)
+            trimmed_window = sorted_window[trim_count:-trim_count] if trim_count else sorted_window  # noqa: E501
+            return sum(trimmed_window) / len(trimmed_window)
+        return value
+
+
+def measure(filter_class, window_size, readings):
+    sensor_filter = filter_class(window_size)
+    # fill the window first so only the steady state is measured
+    for value in readings[:window_size]:
+        sensor_filter.add_reading(value)
+    steady = readings[window_size:]
+
+    start = time.perf_counter()
+    for value in steady:
+        sensor_filter.add_reading(value)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for value in steady:
+        sensor_filter.add_reading(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1e6 / len(steady), peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    random.seed(1)
+    pairs = (("discard extremes", ListDiscardExtremesFilter,
+              DiscardExtremesFilter),
+             ("trimmed mean", ListTrimmedMeanFilter, TrimmedMeanFilter))
+    print(f"{'filter':<18}{'window':>7}{'list us':>10}{'incr us':>10}"
+          f"{'list peak B':>13}{'incr peak B':>13}")
+    for window_size in (5, 10, 32, 64, 128, 256):
+        readings = [random.randint(20, 4000)
+                    for _ in range(count + window_size)]
+        for label, original, incremental in pairs:
+            list_us, list_peak = measure(original, window_size, readings)
+            incr_us, incr_peak = measure(incremental, window_size, readings)
+            print(f"{label:<18}{window_size:>7}{list_us:>10.2f}{incr_us:>10.2f}"  # noqa: E501
+                  f"{list_peak:>13}{incr_peak:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from lib.inboxidau import clock  # type: ignore
+
+
+class UAdaptiveCadence:
+
+    # Adaptive cadence
+    # How it works: Sets the delay before the next sample from the signal.
+    # While readings are stable the period doubles (backoff) each sample up
+    # to max_s. When a reading crosses threshold, or changes faster than
+    # rate_threshold units a second, the period drops to min_s and stays
+    # there for burst_samples samples, so that a debounced change is
+    # confirmed quickly, before backing off again.
+
+    # Usage:
+    # cadence = UAdaptiveCadence(min_s=1, max_s=60, threshold=900,
+    #                            rate_threshold=100)
+    # sleep(cadence.update(distance))
+
+    def __init__(self, min_s=1, max_s=60, backoff=2, threshold=None,
+                 rate_threshold=None, burst_samples=3):
+        if min_s <= 0 or max_s < min_s:
+            raise ValueError("need 0 < min_s <= max_s")
+        if backoff < 1:
+            raise ValueError("backoff must be at least 1")
+        self.min_s = min_s
+        self.max_s = max_s
+        self.backoff = backoff
+        self.threshold = threshold
+        self.rate_threshold = rate_threshold
+        self.burst_samples = burst_samples
+        self.period_s = min_s
+        self.burst_remaining = 0
+        self.last_value = None
+        self.last_ms = None
+        # counters
+        self.samples = 0
+        self.bursts = 0
+
+    def rate_hz(self):
+        # the current sample rate, samples a second
+        return 1 / self.period_s
+
+    def crossed(self, value):
+        if self.threshold is None or self.last_value is None:
+            return False
+        return (self.last_value < self.threshold) != (value < self.threshold)
+
+    def too_fast(self, value, now_ms):
+        if self.rate_threshold is None or self.last_value is None:
+            return False
+        elapsed_s = max(clock.ticks_diff(now_ms, self.last_ms), 1) / 1000
+        return abs(value - self.last_value) / elapsed_s > self.rate_threshold
+
+    def update(self, value):
+        # Seconds to wait before the next sample, given this one
+        now_ms = clock.ticks_ms()
+        if self.crossed(value) or self.too_fast(value, now_ms):
+            if not self.burst_remaining:
+                self.bursts += 1
+            self.burst_remaining = self.burst_samples
+            self.period_s = self.min_s
+        elif self.burst_remaining:
+            self.burst_remaining -= 1
+            self.period_s = self.min_s
+        else:
+            self.period_s = min(self.period_s * self.backoff, self.max_s)
+        self.last_value = value
+        self.last_ms = now_ms
+        self.samples += 1
+        return self.period_s
@@ -0,0 +1,317 @@
+from lib.inboxidau.rolling_appender_log import LogLevel  # type: ignore
+from lib.inboxidau import clock  # type: ignore
+try:
+    import uasyncio as asyncio  # type: ignore
+except ImportError:
+    import asyncio
+
+
+class BoundedQueue:
+
+    # Bounded queue
+    # How it works: A fixed-size ring of items shared by cooperative tasks.
+    # wait_not_empty() waits while it is empty. When it is full put() either
+    # drops the oldest item (drop_oldest, the producer never waits) or waits
+    # for the consumer to make room (backpressure). uasyncio has no Queue,
+    # so it is built on two asyncio.Event objects, create it from a
+    # coroutine as CPython before 3.10 binds events to the current loop.
+
+    def __init__(self, size, drop_oldest=True):
+        if size < 1:
+            raise ValueError("queue size must be at least 1")
+        self.size = size
+        self.drop_oldest = drop_oldest
+        self.items = [None] * size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def __len__(self):
+        return self.count
+
+    def put_nowait(self, item):
+        # False when the queue is full and the oldest item may not be dropped
+        if self.count == self.size:
+            if not self.drop_oldest:
+                return False
+            self.pop()
+            self.dropped += 1
+        self.items[(self.head + self.count) % self.size] = item
+        self.count += 1
+        self._not_empty.set()
+        if self.count == self.size:
+            self._not_full.clear()
+        return True
+
+    async def put(self, item):
+        while not self.put_nowait(item):
+            await self._not_full.wait()
+
+    def peek(self):
+        if self.count == 0:
+            raise IndexError("queue is empty")
+        return self.items[self.head]
+
+    def pop(self):
+        item = self.peek()
+        self.items[self.head] = None
+        self.head = (self.head + 1) % self.size
+        self.count -= 1
+        self._not_full.set()
+        if self.count == 0:
+            self._not_empty.clear()
+        return item
+
+    async def wait_not_empty(self):
+        while self.count == 0:
+            await self._not_empty.wait()
+
+
+class UAsyncNodeRuntime:
+
+    # Async node runtime
+    # How it works: Runs a UPicoWSensorNode as four cooperative tasks in
+    # place of the blocking loop in main().
+    #   sampler         - calls read_sensor_data() on a fixed cadence and
+    #                     queues a copy of sensor_data
+    #   publisher       - takes readings off the queue and calls
+    #                     post_sensor_data() with sensor_data set to the
+    #                     reading, a reading stays queued until it is posted
+    #                     and a retry skips the channels already sent
+    #   link supervisor - brings Wi-Fi and the broker up, waiting for the
+    #                     association without blocking, and keeps the
+    #                     session alive
+    #   log flusher     - flushes a buffered log every flush_interval_s
+    # Subclasses keep their read_sensor_data/post_sensor_data overrides, the
+    # runtime adapts them. A degraded network only delays the publisher, the
+    # sampler keeps its cadence while the queue holds the readings. Broker
+    # connects and NTP still block the loop while they run as umqtt.simple
+    # and ntptime are synchronous.
+
+    # Usage:
+    # UAsyncNodeRuntime(node).run()  # does not return
+
+    # Seconds between link checks and keepalive pings
+    STATIC_LINK_CHECK_S = 5
+    # Wait between reconnect attempts, doubled after each failure
+    STATIC_LINK_BACKOFF_MIN_S = 1
+    STATIC_LINK_BACKOFF_MAX_S = 60
+    # How long a HAT power down waits for queued readings to be published
+    STATIC_HAT_DRAIN_TIMEOUT_S = 10
+    STATIC_POLL_MS = 100
+
+    def __init__(self, node, queue_size=8, drop_oldest=True):
+        self.node = node
+        if queue_size < 1:
+            raise ValueError("queue size must be at least 1")
+        self.queue_size = queue_size
+        self.drop_oldest = drop_oldest
+        # made by run_tasks() on the running loop
+        self.queue = None
+        self.link_up = None
+        self._sent_channels = None  # of the reading at the queue head
+        # counters
+        self.samples = 0
+        self.late_samples = 0
+        self.posted = 0
+        self.post_failures = 0
+        self.reconnects = 0
+
+    def log_message(self, message, log_level=LogLevel.INFO):
+        self.node.log_message(message, log_level)
+
+    def counters(self):
+        return {"samples": self.samples, "late_samples": self.late_samples,
+                "posted": self.posted, "post_failures": self.post_failures,
+                "queued": len(self.queue) if self.queue else 0,
+                "dropped": self.queue.dropped if self.queue else 0,
+                "reconnects": self.reconnects}
+
+    def run(self):
+        asyncio.run(self.run_tasks())
+
+    async def run_tasks(self):
+        self.queue = BoundedQueue(self.queue_size, self.drop_oldest)
+        self.link_up = asyncio.Event()
+        await asyncio.gather(self.sampler(), self.publisher(),
+                             self.link_supervisor(), self.log_flusher())
+
+    # sampling
+
+    def take_sample(self):
+        # Adapter for read_sensor_data(), returns the reading as a copy of
+        # sensor_data and the sensor drivers sampled for it
+        node = self.node
+        node.read_sensor_data()
+        node.cycle += 1
+        self.samples += 1
+        return dict(node.sensor_data), node.sampled_drivers
+
+    async def sampler(self):
+        node = self.node
+        node.initialize_sensors()
+        deadline = clock.ticks_ms()
+        while True:
+            try:
+                await self.queue.put(self.take_sample())
+                await self.cycle_makerverse_nano_hat()
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.sampler() {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+                await asyncio.sleep(node.STATIC_NODE_RESTART_DELAY)
+                node.initialize_sensors()
+                deadline = clock.ticks_ms()
+            # absolute deadlines, a slow reading does not shift the cadence
+            if node.sensor_scheduler is not None:
+                # the sensor scheduler keeps its own deadlines
+                deadline = clock.ticks_add(
+                    clock.ticks_ms(), int(node.next_sleep_delay() * 1000))
+            else:
+                deadline = clock.ticks_add(
+                    deadline, int(node.next_sleep_delay() * 1000))
+            delay_ms = clock.ticks_diff(deadline, clock.ticks_ms())
+            if delay_ms < 0:
+                self.late_samples += 1
+                deadline = clock.ticks_ms()
+                delay_ms = 0
+            await asyncio.sleep(delay_ms / 1000)
+
+    async def cycle_makerverse_nano_hat(self):
+        # Give the publisher a chance to send the reading, then remove power
+        # without blocking the other tasks
+        node = self.node
+        if not node.MAKERVERSE_NANO_POWER_TIMER_HAT:
+            return
+        start = clock.ticks_ms()
+        while len(self.queue) and clock.ticks_diff(clock.ticks_ms(), start) < self.STATIC_HAT_DRAIN_TIMEOUT_S * 1000:  # noqa: E501
+            await asyncio.sleep(self.STATIC_POLL_MS / 1000)
+        if node.power_down_hat():
+            self.link_up.clear()
+            await asyncio.sleep(node.STATIC_HAT_POWERDOWN_WAIT_S)
+
+    # publishing
+
+    def post_reading(self, reading, sent_channels=None):
+        # Adapter for post_sensor_data(), through report_sensor_data(), which
+        # reads self.sensor_data and self.sampled_drivers. publish_channel()
+        # adds the channels it sends to sent_channels and skips those
+        # already in it.
+        node = self.node
+        live = node.sensor_data, node.sampled_drivers
+        node.sensor_data, node.sampled_drivers = reading
+        node.sent_channels = sent_channels
+        try:
+            node.report_sensor_data()
+            if node.metrics is not None:
+                node.publish_metrics()
+        finally:
+            node.sensor_data, node.sampled_drivers = live
+            node.sent_channels = None
+
+    async def publisher(self):
+        node = self.node
+        while True:
+            await self.queue.wait_not_empty()
+            # with a publish queue readings can be posted while offline,
+            # they are stored on flash
+            if node.publish_queue is None:
+                await self.link_up.wait()
+            if self._sent_channels is None:
+                self._sent_channels = set()
+            try:
+                self.post_reading(self.queue.peek(), self._sent_channels)
+                # post_sensor_data overrides log publish errors rather than
+                # raising, a lost session means the reading was not sent
+                if node.publish_queue is None and \
+                        not node.mqtt_session.connected:
+                    raise OSError("broker session lost while posting")
+                self.queue.pop()
+                self._sent_channels = None
+                self.posted += 1
+                node.log_session_counters()
+            except Exception as e:
+                self.post_failures += 1
+                self.log_message(f"{self.__class__.__name__}.publisher() {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+                self.link_up.clear()
+                await asyncio.sleep(self.STATIC_POLL_MS / 1000)
+
+    # link supervision
+
+    async def wait_for_wifi_connection(self, timeout_s):
+        # Like UPicoWSensorNode.wait_for_wifi_connection, without blocking
+        start = clock.ticks_ms()
+        while True:
+            elapsed_ms = clock.ticks_diff(clock.ticks_ms(), start)
+            if self.node.wifi.isconnected():
+                return elapsed_ms
+            if elapsed_ms >= timeout_s * 1000:
+                raise RuntimeError('network connection failed.',
+                                   LogLevel.ERROR)
+            await asyncio.sleep(self.node.STATIC_WIFI_POLL_MS / 1000)
+
+    async def connect_to_wifi(self):
+        # Drives UPicoWSensorNode.connect_to_wifi_steps() with the waits
+        # yielding to the other tasks
+        steps = self.node.connect_to_wifi_steps()
+        try:
+            timeout_s = next(steps)
+            while True:
+                try:
+                    elapsed_ms = await self.wait_for_wifi_connection(
+                        timeout_s)
+                except RuntimeError as e:
+                    timeout_s = steps.throw(e)
+                else:
+                    timeout_s = steps.send(elapsed_ms)
+        except StopIteration:
+            pass
+
+    def link_is_up(self):
+        return self.node.wifi.isconnected() and \
+            self.node.mqtt_session.connected
+
+    async def link_supervisor(self):
+        node = self.node
+        backoff_s = self.STATIC_LINK_BACKOFF_MIN_S
+        while True:
+            if self.link_up.is_set() and not self.link_is_up():
+                self.link_up.clear()
+            if not self.link_up.is_set():
+                try:
+                    await self.connect_to_wifi()
+                    node.connect_broker()
+                    self.reconnects += 1
+                    self.link_up.set()
+                    backoff_s = self.STATIC_LINK_BACKOFF_MIN_S
+                except Exception as e:
+                    self.log_message(f"{self.__class__.__name__}.link_supervisor() retrying in {backoff_s} s {repr(e)}",  # noqa: E501
+                                     LogLevel.ERROR)
+                    await asyncio.sleep(backoff_s)
+                    backoff_s = min(backoff_s * 2,
+                                    self.STATIC_LINK_BACKOFF_MAX_S)
+                    continue
+            else:
+                try:
+                    node.mqtt_session.keep_alive()
+                except Exception as e:
+                    self.log_message(f"{self.__class__.__name__}.link_supervisor() keepalive {repr(e)}",  # noqa: E501
+                                     LogLevel.INFO)
+                    self.link_up.clear()
+                    continue
+            await asyncio.sleep(self.STATIC_LINK_CHECK_S)
+
+    # log flushing
+
+    async def log_flusher(self):
+        log = self.node.log
+        interval_s = getattr(log, 'flush_interval_s', 60)
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                log.flush()
+            except Exception as e:
+                print(f"{self.__class__.__name__}.log_flusher() {repr(e)}")
@@ -0,0 +1,97 @@
+from lib.inboxidau import clock  # type: ignore
+from array import array
+import struct
+
+
+class UBurstCapture:
+
+    # Burst capture
+    # How it works: Samples a sensor at rate_hz for duration_s into an
+    # array allocated once, 'H' (uint16, e.g. millimetres) or 'f', so a
+    # burst allocates nothing per sample. Reads are paced against
+    # ticks_us deadlines. A read that overruns its slot re-anchors the
+    # schedule and is counted, so a receiver can tell when the samples
+    # are not evenly spaced. payloads() cuts the burst into binary MQTT
+    # payloads of at most chunk_samples samples. Each payload has a small
+    # header: the burst's timestamp base and sample interval, the index of
+    # its first sample and the burst length. Sample i of a burst was taken
+    # at timestamp + i * interval_us. Samples are in the board's byte
+    # order, little endian on the RP2040. decode() reads a payload back.
+
+    # Usage:
+    # burst = UBurstCapture(rate_hz=50, duration_s=2)
+    # burst.capture(sensor.read, int(time.time()))
+    # for payload in burst.payloads(chunk_samples=128):
+    #     publish(topic, payload)
+
+    MAGIC = b"UB"
+    VERSION = 1
+    # magic, version, typecode, timestamp base (s), interval (us), first
+    # sample index, samples in this payload, samples in the burst, overruns
+    HEADER_FORMAT = "<2sBBIIHHHH"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    TYPECODES = ("H", "f")
+
+    def __init__(self, rate_hz=50, duration_s=2, typecode="H"):
+        if typecode not in self.TYPECODES:
+            raise ValueError(f"unsupported burst typecode {typecode}")
+        self.capacity = int(rate_hz * duration_s)
+        if not 0 < self.capacity < 0x10000:
+            raise ValueError("a burst holds 1 to 65535 samples")
+        self.interval_us = int(1000000 / rate_hz)
+        self.typecode = typecode
+        self.samples = array(typecode, [0] * self.capacity)
+        self.count = 0
+        self.timestamp_s = 0
+        self.overruns = 0
+        # counters
+        self.captures = 0
+
+    def capture(self, read, timestamp_s):
+        # Fill the burst with read() samples, returns the samples array
+        samples = self.samples
+        interval_us = self.interval_us
+        last = self.capacity - 1
+        self.count = 0
+        self.overruns = 0
+        self.timestamp_s = timestamp_s
+        deadline = clock.ticks_us()
+        for index in range(self.capacity):
+            samples[index] = read()
+            self.count = index + 1
+            if index == last:
+                break
+            deadline = clock.ticks_add(deadline, interval_us)
+            wait_us = clock.ticks_diff(deadline, clock.ticks_us())
+            if wait_us > 0:
+                clock.sleep_us(wait_us)
+            elif wait_us < 0:
+                self.overruns += 1
+                deadline = clock.ticks_us()
+        self.captures += 1
+        return samples
+
+    def payloads(self, chunk_samples=128):
+        # The captured samples as binary payloads, one chunk at a time
+        view = memoryview(self.samples)
+        for first in range(0, self.count, chunk_samples):
+            count = min(chunk_samples, self.count - first)
+            yield struct.pack(self.HEADER_FORMAT, self.MAGIC, self.VERSION,
+                              ord(self.typecode), self.timestamp_s,
+                              self.interval_us, first, count, self.count,
+                              self.overruns) + \
+                bytes(view[first:first + count])
+
+    @classmethod
+    def decode(cls, payload):
+        # (header dict, samples list) of a payload, for host-side tools
+        magic, version, typecode, timestamp_s, interval_us, first, count, \
+            total, overruns = struct.unpack_from(cls.HEADER_FORMAT, payload)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("not a burst payload")
+        typecode = chr(typecode)
+        samples = struct.unpack_from(f"<{count}{typecode}", payload,
+                                     cls.HEADER_SIZE)
+        return {"timestamp": timestamp_s, "interval_us": interval_us,
+                "first": first, "count": count, "total": total,
+                "overruns": overruns, "typecode": typecode}, list(samples)
@@ -0,0 +1,31 @@
+import time  # type: ignore
+
+# Millisecond tick counters used for measuring intervals on the device, and
+# a microsecond sleep for pacing fast sampling.
+# MicroPython provides wrap-safe ticks_* functions in time, CPython (host
+# tests, benchmarks) does not, so fall back to monotonic equivalents.
+#
+# Call these through the module, e.g. clock.ticks_ms(), so that a host-side
+# harness can replace them with a virtual clock.
+
+if hasattr(time, 'ticks_ms'):
+    ticks_ms = time.ticks_ms
+    ticks_us = time.ticks_us
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+    sleep_us = time.sleep_us
+else:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_us():
+        return int(time.monotonic() * 1000000)
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
+
+    def sleep_us(us):
+        time.sleep(us / 1000000)
@@ -0,0 +1,192 @@
+from lib.inboxidau.payload_encoding import decode_cbor, encode_cbor  # type: ignore # noqa: E501
+import os
+import struct
+try:
+    import ujson as json  # type: ignore
+    import ubinascii as binascii  # type: ignore
+except ImportError:
+    import json
+    import binascii
+
+BOOL = "bool"
+INT = "int"
+NUMBER = "number"  # int or float
+STR = "str"
+LIST = "list"
+DICT = "dict"
+
+
+class UConfigSchema:
+
+    # Config schema
+    # How it works: The fields a node reads from its config file are
+    # declared as (key, kind, default) or (key, kind, default, choices)
+    # tuples, see UPicoWSensorNode.CONFIG_FIELDS. validate() checks the
+    # parsed JSON against them: the strings "True"/"False" and 0/1 are
+    # coerced for bool fields, null is only accepted where the default is
+    # None, and every invalid field is reported in one ValueError. Keys the
+    # schema does not know are dropped. apply() sets one attribute per
+    # field on the node, using the default (or default(node) when it is
+    # callable) for keys the config does not give.
+    # load() keeps the validated config in a snapshot file, a header and
+    # the values CBOR encoded against the field positions. The header holds
+    # the schema signature and the source's size, mtime and CRC32, so a
+    # boot whose config file is unchanged decodes the snapshot without
+    # reading the JSON, and one whose file was touched but not changed
+    # only reads it to compare the CRC. CBOR floats are float32, as are
+    # MicroPython floats on the Pico W.
+
+    # Usage:
+    # schema = UConfigSchema(node.CONFIG_FIELDS)
+    # config, compiled = schema.load('config.json', 'config.snapshot')
+    # schema.apply(node, config)
+
+    MAGIC = b"UCS1"
+    HEADER = "<4sIIII"  # magic, signature, source size, mtime, CRC32
+    HEADER_SIZE = struct.calcsize(HEADER)
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.positions = dict((field[0], position)
+                              for position, field in enumerate(fields))
+        self._signature = None
+        # set by validate() for the caller to log
+        self.coerced = []
+        self.unknown = []
+
+    def signature(self):
+        # changes whenever a field is added, removed, moved or retyped
+        if self._signature is None:
+            self._signature = binascii.crc32(
+                "|".join(f"{field[0]}:{field[1]}"
+                         for field in self.fields).encode())
+        return self._signature
+
+    def coerce(self, field, value):
+        # (value, coerced) for a valid value, raises ValueError otherwise
+        key, kind, default = field[0], field[1], field[2]
+        if value is None:
+            if default is None:
+                return None, False
+            raise ValueError(f"{key} may not be null")
+        if kind == BOOL:
+            if isinstance(value, bool):
+                return value, False
+            if isinstance(value, str) and \
+                    value.lower() in ("true", "false"):
+                return value.lower() == "true", True
+            if isinstance(value, int) and value in (0, 1):
+                return value == 1, True
+        elif kind == INT:
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value, False
+            if isinstance(value, float) and value == int(value):
+                return int(value), True
+        elif kind == NUMBER:
+            if isinstance(value, (int, float)) and \
+                    not isinstance(value, bool):
+                return value, False
+        elif kind == STR:
+            if isinstance(value, str):
+                return value, False
+        elif kind == LIST:
+            if isinstance(value, list):
+                return value, False
+        elif kind == DICT:
+            if isinstance(value, dict):
+                return value, False
+        else:
+            raise ValueError(f"{key} has unknown kind {kind}")
+        raise ValueError(f"{key} should be {kind} not {repr(value)}")
+
+    def validate(self, config):
+        # The config with every value checked and coerced, unknown keys
+        # dropped. Raises ValueError naming every invalid field.
+        self.coerced = []
+        self.unknown = []
+        values = {}
+        errors = []
+        for key, value in config.items():
+            position = self.positions.get(key)
+            if position is None:
+                self.unknown.append(key)
+                continue
+            field = self.fields[position]
+            try:
+                value, coerced = self.coerce(field, value)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            if len(field) > 3 and value is not None and \
+                    value not in field[3]:
+                errors.append(f"{key} should be one of {field[3]} not {repr(value)}")  # noqa: E501
+                continue
+            if coerced:
+                self.coerced.append(key)
+            values[key] = value
+        if errors:
+            raise ValueError("invalid config: " + ", ".join(errors))
+        return values
+
+    def apply(self, node, config):
+        for field in self.fields:
+            key = field[0]
+            if key in config:
+                value = config[key]
+            else:
+                value = field[2]
+                if callable(value):
+                    value = value(node)
+                elif isinstance(value, (list, dict)):
+                    value = value.copy()  # not shared between nodes
+            setattr(node, key, value)
+
+    # Snapshot
+
+    def encode(self, config, size, mtime, crc):
+        body = encode_cbor(dict((self.positions[key], value)
+                                for key, value in config.items()))
+        return struct.pack(self.HEADER, self.MAGIC, self.signature(),
+                           size, mtime, crc) + body
+
+    def decode(self, data):
+        # The config held by a snapshot
+        positions, _ = decode_cbor(data, self.HEADER_SIZE)
+        return dict((self.fields[position][0], value)
+                    for position, value in positions.items())
+
+    def read_header(self, data):
+        # (size, mtime, crc) of the source a snapshot was compiled from, or
+        # None when it is not a snapshot of this schema
+        if len(data) < self.HEADER_SIZE:
+            return None
+        magic, signature, size, mtime, crc = struct.unpack_from(
+            self.HEADER, data)
+        if magic != self.MAGIC or signature != self.signature():
+            return None
+        return size, mtime, crc
+
+    def load(self, config_path, snapshot_path):
+        # (config, compiled), compiled is False when the config came from
+        # an up to date snapshot
+        stat = os.stat(config_path)
+        size, mtime = stat[6], stat[8]
+        try:
+            with open(snapshot_path, 'rb') as file:
+                snapshot = file.read()
+            header = self.read_header(snapshot)
+        except OSError:
+            snapshot = header = None
+        if header is not None and mtime and header[:2] == (size, mtime):
+            return self.decode(snapshot), False
+        with open(config_path, 'rb') as file:
+            source = file.read()
+        crc = binascii.crc32(source)
+        if header is not None and header[0] == size and header[2] == crc:
+            config = self.decode(snapshot)
+        else:
+            config = self.validate(json.loads(source))
+        # rewritten with the new mtime so the next boot skips the CRC
+        with open(snapshot_path, 'wb') as file:
+            file.write(self.encode(config, size, mtime, crc))
+        return config, header is None or header[2] != crc
@@ -0,0 +1,93 @@
+from lib.inboxidau import clock  # type: ignore
+
+
+class UHysteresisDebouncer:
+
+    # Hysteresis debouncer
+    # How it works: A two state (active / inactive) machine for a noisy
+    # value. With enter_threshold below exit_threshold the state becomes
+    # active when the value drops below enter_threshold and inactive when
+    # it rises above exit_threshold, the other way round when enter is
+    # above exit, so values inside the band never flap the state. A change
+    # needs run_length consecutive samples agreeing on it, counted rather
+    # than kept in a history, and at least min_dwell_s seconds in the
+    # current state. The state is None until the first run_length samples
+    # agree, which counts as a change.
+
+    # Usage:
+    # occupancy = UHysteresisDebouncer(850, 950, run_length=3)
+    # if occupancy.update(distance):
+    #     publish(occupancy.state)
+
+    def __init__(self, enter_threshold, exit_threshold, run_length=3,
+                 min_dwell_s=0):
+        if run_length < 1:
+            raise ValueError("run_length must be at least 1")
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = exit_threshold
+        self.active_below = enter_threshold <= exit_threshold
+        self.run_length = run_length
+        self.min_dwell_ms = int(min_dwell_s * 1000)
+        self.reset()
+
+    def set_thresholds(self, enter_threshold, exit_threshold,
+                       min_dwell_s=None):
+        # Move the band, e.g. on a config change, keeping the state
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = exit_threshold
+        self.active_below = enter_threshold <= exit_threshold
+        if min_dwell_s is not None:
+            self.min_dwell_ms = int(min_dwell_s * 1000)
+
+    def reset(self):
+        self.state = None
+        self.run = 0  # consecutive samples disagreeing with state
+        self.pending = None  # the state they agree on
+        self.last_change_ms = None
+        # counters
+        self.changes = 0
+        self.held = 0  # changes delayed by min_dwell_s
+
+    def entering(self, value):
+        if self.active_below:
+            return value < self.enter_threshold
+        return value > self.enter_threshold
+
+    def leaving(self, value):
+        if self.active_below:
+            return value > self.exit_threshold
+        return value < self.exit_threshold
+
+    def candidate(self, value):
+        # the state this value argues for
+        if self.state:
+            return not self.leaving(value)
+        return self.entering(value)
+
+    def update(self, value):
+        # Add a sample, True when it changed the state
+        return self.update_state(self.candidate(value))
+
+    def update_state(self, candidate):
+        # Add a sample already assessed by candidate(), True when it
+        # changed the state
+        if candidate == self.state:
+            self.run = 0
+            return False
+        if candidate != self.pending:
+            # before the first state the run can switch sides
+            self.pending = candidate
+            self.run = 0
+        self.run += 1
+        if self.run < self.run_length:
+            return False
+        now_ms = clock.ticks_ms()
+        if self.last_change_ms is not None and \
+                clock.ticks_diff(now_ms, self.last_change_ms) < self.min_dwell_ms:  # noqa: E501
+            self.held += 1
+            return False
+        self.state = candidate
+        self.run = 0
+        self.last_change_ms = now_ms
+        self.changes += 1
+        return True
@@ -0,0 +1,169 @@
+from lib.inboxidau import clock
+
+
+class UMQTTSession:
+
+    # Persistent MQTT session
+    # How it works: One connected MQTTClient is kept open across sensing
+    # cycles instead of paying for a TLS handshake on every reading. The
+    # broker keepalive is sized to the cycle delay and a PINGREQ is sent when
+    # a cycle passes without any other traffic. A session that keep_alive()
+    # finds broken is closed, and only re-established by the next publish,
+    # so a cycle with nothing to send does not pay for a handshake.
+
+    # Usage:
+    # session = UMQTTSession(client, cycle_seconds=300)
+    # session.connect()
+    # session.publish(topic, payload)
+    # session.keep_alive()  # once per cycle
+
+    # The keepalive handed to the broker is this multiple of the cycle delay
+    # plus a margin, so one missed cycle does not drop the session.
+    STATIC_KEEPALIVE_FACTOR = 2
+    STATIC_KEEPALIVE_MARGIN = 30  # seconds
+    STATIC_KEEPALIVE_MAX = 65535  # seconds, MQTT limit
+
+    @classmethod
+    def keepalive_for(cls, cycle_seconds):
+        # Keepalive in seconds to pass to MQTTClient for a cycle delay
+        keepalive = int(cycle_seconds * cls.STATIC_KEEPALIVE_FACTOR) + \
+            cls.STATIC_KEEPALIVE_MARGIN
+        return min(keepalive, cls.STATIC_KEEPALIVE_MAX)
+
+    def __init__(self, client, cycle_seconds, on_connect=None):
+        self.client = client
+        self.keepalive = self.keepalive_for(cycle_seconds)
+        # ping once half of the keepalive has passed without traffic
+        self.ping_interval_ms = self.keepalive * 500
+        self.on_connect = on_connect
+        self.connected = False
+        self._dropped = False  # the next connect is a reconnect
+
+        self.started_ms = clock.ticks_ms()
+        self.last_traffic_ms = self.started_ms
+        # counters
+        self.handshakes = 0
+        self.reconnects = 0
+        self.pings = 0
+        self.publish_count = 0
+        self.publish_latency_ms = 0
+        self.publish_latency_max_ms = 0
+        self._publish_latency_total_ms = 0
+
+    def set_cycle(self, cycle_seconds):
+        # Size the keepalive to a new cycle delay, the broker is told on
+        # the next connect
+        self.keepalive = self.keepalive_for(cycle_seconds)
+        self.ping_interval_ms = self.keepalive * 500
+        if hasattr(self.client, 'keepalive'):
+            self.client.keepalive = self.keepalive
+
+    def connect(self):
+        # Open the session, a no-op when it is already open
+        if self.connected:
+            return
+        self.client.connect()
+        self.connected = True
+        self.handshakes += 1
+        if self._dropped:
+            self._dropped = False
+            self.reconnects += 1
+        self.last_traffic_ms = clock.ticks_ms()
+        if self.on_connect is not None:
+            self.on_connect()
+
+    def disconnect(self):
+        # Close the session, only needed before the radio loses power
+        if not self.connected:
+            return
+        self.connected = False
+        self.client.disconnect()
+
+    def reconnect(self):
+        self.drop()
+        self.connect()
+
+    def drop(self):
+        # The connection is broken, close it without a DISCONNECT
+        self.connected = False
+        self._dropped = True
+        self._close_socket()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        # Publish on the open session, (re)connecting lazily on failure
+        if not self.connected:
+            self.connect()
+        start = clock.ticks_ms()
+        try:
+            self.client.publish(topic, msg, retain, qos)
+        except OSError:
+            self.reconnect()
+            start = clock.ticks_ms()
+            self.client.publish(topic, msg, retain, qos)
+        now = clock.ticks_ms()
+        self._record_publish(clock.ticks_diff(now, start))
+        self.last_traffic_ms = now
+
+    def ping(self):
+        try:
+            self.client.ping()
+        except OSError:
+            self.reconnect()
+            self.client.ping()
+        self.pings += 1
+        self.last_traffic_ms = clock.ticks_ms()
+
+    def keep_alive(self):
+        # Call once per cycle, reads any pending PINGRESP and sends a PINGREQ
+        # when the session would otherwise go quiet for too long. A closed
+        # or broken session is left closed until there is something to
+        # publish.
+        if not self.connected:
+            return
+        try:
+            self.client.check_msg()
+            idle_ms = clock.ticks_diff(clock.ticks_ms(), self.last_traffic_ms)
+            if idle_ms >= self.ping_interval_ms:
+                self.client.ping()
+                self.pings += 1
+                self.last_traffic_ms = clock.ticks_ms()
+        except OSError:
+            self.drop()
+
+    def handshakes_per_hour(self):
+        elapsed_ms = clock.ticks_diff(clock.ticks_ms(), self.started_ms)
+        if elapsed_ms <= 0:
+            return 0
+        return self.handshakes * 3600000 / elapsed_ms
+
+    def publish_latency_avg_ms(self):
+        if self.publish_count == 0:
+            return 0
+        return self._publish_latency_total_ms / self.publish_count
+
+    def counters(self):
+        return {
+            "handshakes": self.handshakes,
+            "handshakes_per_hour": self.handshakes_per_hour(),
+            "reconnects": self.reconnects,
+            "pings": self.pings,
+            "publishes": self.publish_count,
+            "publish_latency_ms": self.publish_latency_ms,
+            "publish_latency_avg_ms": self.publish_latency_avg_ms(),
+            "publish_latency_max_ms": self.publish_latency_max_ms
+        }
+
+    def _record_publish(self, latency_ms):
+        self.publish_count += 1
+        self.publish_latency_ms = latency_ms
+        self._publish_latency_total_ms += latency_ms
+        if latency_ms > self.publish_latency_max_ms:
+            self.publish_latency_max_ms = latency_ms
+
+    def _close_socket(self):
+        sock = getattr(self.client, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
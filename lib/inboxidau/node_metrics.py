@@ -0,0 +1,113 @@
+from lib.inboxidau import clock  # type: ignore
+import gc
+
+
+class UNodeMetrics:
+
+    # Node metrics
+    # How it works: timed() wraps a node method so that each call records
+    # its duration and whether it raised against a phase name. Per phase
+    # the count, total and longest duration (since the last snapshot) and
+    # the exceptions raised are kept in a small list, so recording does
+    # not allocate. sample_memory() tracks the lowest gc.mem_free() and
+    # highest gc.mem_alloc() seen, where the port provides them.
+    # snapshot() returns everything as a dict for a diagnostics message.
+    # The node only wraps its methods when metrics are enabled, so a node
+    # without them pays nothing.
+
+    # Usage:
+    # metrics = UNodeMetrics()
+    # node.read_sensor_data = metrics.timed("read", node.read_sensor_data)
+    # metrics.sample_memory()
+    # publish(ujson.dumps(metrics.snapshot(cycle=node.cycle)))
+    # metrics.reset_window()
+
+    # phase list indexes
+    COUNT = 0
+    TOTAL_MS = 1
+    MAX_MS = 2
+    ERRORS = 3
+
+    def __init__(self):
+        self.phases = {}
+        self._last_ms = clock.ticks_ms()
+        self.uptime_ms = 0  # accumulated, ticks wrap after days
+        self.mem_free_min = None
+        self.mem_alloc_max = None
+        self.rssi = None
+        self._has_mem_free = hasattr(gc, 'mem_free')
+
+    def phase(self, name):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = [0, 0, 0, 0]
+        return stats
+
+    def record(self, name, elapsed_ms, error=False):
+        stats = self.phase(name)
+        stats[self.COUNT] += 1
+        stats[self.TOTAL_MS] += elapsed_ms
+        if elapsed_ms > stats[self.MAX_MS]:
+            stats[self.MAX_MS] = elapsed_ms
+        if error:
+            stats[self.ERRORS] += 1
+
+    def error(self, name):
+        # an exception handled outside a timed phase
+        self.phase(name)[self.ERRORS] += 1
+
+    def timed(self, name, function):
+        # function wrapped to record each call against the phase
+        self.phase(name)
+
+        def timed_function(*args, **kwargs):
+            start = clock.ticks_ms()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self.record(name, clock.ticks_diff(clock.ticks_ms(), start),
+                            True)
+                raise
+            self.record(name, clock.ticks_diff(clock.ticks_ms(), start))
+            return result
+        return timed_function
+
+    def sample_memory(self):
+        if not self._has_mem_free:
+            return
+        free = gc.mem_free()
+        alloc = gc.mem_alloc()
+        if self.mem_free_min is None or free < self.mem_free_min:
+            self.mem_free_min = free
+        if self.mem_alloc_max is None or alloc > self.mem_alloc_max:
+            self.mem_alloc_max = alloc
+
+    def snapshot(self, **extra):
+        # phases as [count, average ms, max ms, errors]
+        now = clock.ticks_ms()
+        self.uptime_ms += clock.ticks_diff(now, self._last_ms)
+        self._last_ms = now
+        snapshot = {"uptime_s": self.uptime_ms // 1000}
+        if self._has_mem_free:
+            snapshot["mem_free"] = gc.mem_free()
+            snapshot["mem_free_min"] = self.mem_free_min
+            snapshot["mem_alloc_max"] = self.mem_alloc_max
+        if self.rssi is not None:
+            snapshot["rssi"] = self.rssi
+        phases = {}
+        for name, stats in self.phases.items():
+            count = stats[self.COUNT]
+            phases[name] = [count,
+                            round(stats[self.TOTAL_MS] / count, 1) if count else 0,  # noqa: E501
+                            stats[self.MAX_MS], stats[self.ERRORS]]
+        snapshot["phases"] = phases
+        snapshot.update(extra)
+        return snapshot
+
+    def reset_window(self):
+        # start the next window's averages and maxima, errors and the
+        # memory marks are kept
+        for stats in self.phases.values():
+            stats[self.COUNT] = 0
+            stats[self.TOTAL_MS] = 0
+            stats[self.MAX_MS] = 0
@@ -0,0 +1,230 @@
+import struct
+try:
+    import ujson as json  # type: ignore
+except ImportError:
+    import json
+
+JSON = "json"
+CBOR = "cbor"
+STRUCT = "struct"
+ENCODINGS = (JSON, CBOR, STRUCT)
+INTEGER_CODES = "bBhHiIlLqQ"
+
+
+def type_code_for(value):
+    # struct type code for a channel value without a declared one
+    if isinstance(value, bool):
+        return "?"
+    if isinstance(value, int):
+        return "i"
+    if isinstance(value, float):
+        return "f"
+    return None
+
+
+class UBatchPayload:
+
+    # Batch payload
+    # How it works: Collects the channel values published during one cycle
+    # and encodes them as a single MQTT payload for the node topic.
+    #   json   - compact JSON object, channel name -> value
+    #   cbor   - the same map encoded as CBOR, floats as float32
+    #   struct - a channel count byte, a bitmask of the channels present
+    #            and their values packed little endian in schema order,
+    #            booleans are packed as "B" as MicroPython has no "?"
+    # The schema lists every channel seen as [name, struct type code,
+    # per-channel topic] in the order they were first added. It is needed
+    # to decode struct payloads and to fan a batch back out to the
+    # per-channel topics, schema_changed is set when a channel is added.
+    # A channel packed as an integer that is later given a float is
+    # widened to "f" and the schema changes with it.
+
+    # Usage:
+    # batch = UBatchPayload("cbor")
+    # batch.add("tempC", "weatherstn/temperature", 21.5)
+    # payload = batch.encode()
+    # batch.clear()
+
+    def __init__(self, encoding=JSON):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"unknown batch encoding {encoding}")
+        self.encoding = encoding
+        self.schema = []
+        self._positions = {}
+        self.values = {}
+        self.schema_changed = False
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, channel, topic, value, type_code=None):
+        if channel not in self._positions:
+            if isinstance(value, bool):
+                type_code = "?"  # decoded as a bool, not a number
+            type_code = type_code or type_code_for(value)
+            if self.encoding == STRUCT and type_code is None:
+                raise ValueError(f"channel {channel} can not be packed")
+            self._positions[channel] = len(self.schema)
+            self.schema.append([channel, type_code, topic])
+            self.schema_changed = True
+        elif isinstance(value, float):
+            entry = self.schema[self._positions[channel]]
+            if entry[1] in INTEGER_CODES:
+                entry[1] = "f"
+                self.schema_changed = True
+        self.values[channel] = value
+
+    def clear(self):
+        self.values = {}
+
+    def schema_payload(self):
+        return json.dumps({"encoding": self.encoding,
+                           "channels": self.schema})
+
+    def encode(self):
+        if self.encoding == JSON:
+            return json.dumps(self.values, separators=(',', ':')).encode()
+        if self.encoding == CBOR:
+            return encode_cbor(self.values)
+        return self._encode_struct()
+
+    def _encode_struct(self):
+        count = len(self.schema)
+        mask = bytearray((count + 7) // 8)
+        codes = "<"
+        values = []
+        for position in range(count):
+            channel, type_code, _ = self.schema[position]
+            if channel in self.values:
+                mask[position // 8] |= 1 << (position % 8)
+                codes += "B" if type_code == "?" else type_code
+                values.append(self.values[channel])
+        return bytes((count,)) + bytes(mask) + struct.pack(codes, *values)
+
+
+def decode(encoding, payload, schema=None):
+    # The channel values of a batch payload, struct payloads need the
+    # schema channels
+    if encoding == JSON:
+        return json.loads(payload)
+    if encoding == CBOR:
+        value, _ = decode_cbor(payload, 0)
+        return value
+    if encoding != STRUCT:
+        raise ValueError(f"unknown batch encoding {encoding}")
+    count = payload[0]
+    if schema is None or count != len(schema):
+        raise ValueError("struct payload does not match the schema")
+    offset = 1 + (count + 7) // 8
+    mask = payload[1:offset]
+    present = [schema[position] for position in range(count)
+               if mask[position // 8] & (1 << (position % 8))]
+    codes = "".join("B" if c[1] == "?" else c[1] for c in present)
+    values = struct.unpack_from("<" + codes, payload, offset)
+    return dict((c[0], bool(value) if c[1] == "?" else value)
+                for c, value in zip(present, values))
+
+
+# A minimal CBOR (RFC 8949) encoder and decoder for maps of channel values
+
+def _cbor_head(major, length):
+    if length < 24:
+        return bytes((major << 5 | length,))
+    if length < 0x100:
+        return bytes((major << 5 | 24, length))
+    if length < 0x10000:
+        return bytes((major << 5 | 25,)) + struct.pack(">H", length)
+    if length < 0x100000000:
+        return bytes((major << 5 | 26,)) + struct.pack(">I", length)
+    return bytes((major << 5 | 27,)) + struct.pack(">Q", length)
+
+
+def encode_cbor(value):
+    if value is False:
+        return b"\xf4"
+    if value is True:
+        return b"\xf5"
+    if value is None:
+        return b"\xf6"
+    if isinstance(value, int):
+        if value >= 0:
+            return _cbor_head(0, value)
+        return _cbor_head(1, -1 - value)
+    if isinstance(value, float):
+        return b"\xfa" + struct.pack(">f", value)
+    if isinstance(value, str):
+        data = value.encode()
+        return _cbor_head(3, len(data)) + data
+    if isinstance(value, (bytes, bytearray)):
+        return _cbor_head(2, len(value)) + bytes(value)
+    if isinstance(value, (list, tuple)):
+        return _cbor_head(4, len(value)) + b"".join(
+            encode_cbor(item) for item in value)
+    if isinstance(value, dict):
+        return _cbor_head(5, len(value)) + b"".join(
+            encode_cbor(key) + encode_cbor(item)
+            for key, item in value.items())
+    raise ValueError(f"can not encode {type(value)} as CBOR")
+
+
+def _half_to_float(half):
+    exponent = (half >> 10) & 0x1f
+    fraction = half & 0x3ff
+    if exponent == 0:
+        value = fraction * 2.0 ** -24
+    elif exponent == 0x1f:
+        value = float("nan") if fraction else float("inf")
+    else:
+        value = (fraction + 1024) * 2.0 ** (exponent - 25)
+    return -value if half & 0x8000 else value
+
+
+def decode_cbor(data, offset):
+    # (value, offset after it) of the CBOR item at offset
+    initial = data[offset]
+    major = initial >> 5
+    info = initial & 0x1f
+    offset += 1
+    if major == 7:
+        if info == 20:
+            return False, offset
+        if info == 21:
+            return True, offset
+        if info == 22:
+            return None, offset
+        if info == 25:
+            return _half_to_float(struct.unpack_from(">H", data, offset)[0]), offset + 2  # noqa: E501
+        if info == 26:
+            return struct.unpack_from(">f", data, offset)[0], offset + 4
+        if info == 27:
+            return struct.unpack_from(">d", data, offset)[0], offset + 8
+        raise ValueError(f"unsupported CBOR simple value {info}")
+    if info < 24:
+        length = info
+    elif info in (24, 25, 26, 27):
+        size = 1 << (info - 24)
+        length = int.from_bytes(data[offset:offset + size], "big")
+        offset += size
+    else:
+        raise ValueError("indefinite length CBOR is not supported")
+    if major == 0:
+        return length, offset
+    if major == 1:
+        return -1 - length, offset
+    if major == 2:
+        return bytes(data[offset:offset + length]), offset + length
+    if major == 3:
+        return bytes(data[offset:offset + length]).decode(), offset + length
+    if major == 4:
+        items = []
+        for _ in range(length):
+            item, offset = decode_cbor(data, offset)
+            items.append(item)
+        return items, offset
+    if major == 5:
+        items = {}
+        for _ in range(length):
+            key, offset = decode_cbor(data, offset)
+            items[key], offset = decode_cbor(data, offset)
+        return items, offset
+    raise ValueError(f"unsupported CBOR major type {major}")
@@ -0,0 +1,131 @@
+from lib.inboxidau import clock  # type: ignore
+
+
+class UPeriodicScheduler:
+
+    # Periodic scheduler
+    # How it works: Cycles start on a grid of absolute ticks_ms deadlines,
+    # one period after the last, rather than a fixed delay after the work.
+    # Wi-Fi, sensing and publishing then shorten the sleep instead of
+    # stretching the period. delay_s() works out how long to sleep to the
+    # next slot, and the node hands that to USleepScheduler. A cycle that
+    # runs past its next slot is an overrun:
+    #   skip     - the missed slots are dropped and counted, the cycle
+    #              after starts on the next slot still ahead
+    #   catch_up - the next cycle starts at once and the grid is kept, so
+    #              the missed cycles run back to back
+    # woke() records how far each cycle started from its slot, the jitter.
+    # With align, sync() tells the scheduler the wall clock time once NTP
+    # has set it, and the grid is moved to the nearest multiple of the
+    # period in epoch time, e.g. :00 and :05 for 300 s. Aligned nodes
+    # sample at the same instants, and a node that deep sleeps or is
+    # power cycled rejoins the same grid after a reboot. The epoch is
+    # given as integer milliseconds, a MicroPython float can not hold an
+    # epoch time to the second. Periods that divide a day fall on the same
+    # boundaries with the 1970 or the 2000 epoch.
+
+    # Usage:
+    # scheduler = UPeriodicScheduler(overrun="skip", align=True)
+    # scheduler.sync(time.time_ns() // 1000000)  # after NTP
+    # node.sleep(scheduler.delay_s(300))
+    # scheduler.woke()
+
+    SKIP = "skip"
+    CATCH_UP = "catch_up"
+    OVERRUNS = (SKIP, CATCH_UP)
+
+    def __init__(self, overrun=SKIP, align=False):
+        if overrun not in self.OVERRUNS:
+            raise ValueError(f"unknown overrun policy {overrun}")
+        self.overrun = overrun
+        self.align = align
+        # the first slot is a period after the scheduler is created
+        self.anchor_ms = clock.ticks_ms()
+        self.deadline_ms = None  # ticks_ms of the slot slept to last
+        self.late = False  # the last cycle overran its slot
+        self._epoch_ms = None
+        self._epoch_ticks = None
+        self._realign = False
+        # counters
+        self.slots = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_ms = 0
+        self.jitter_max_ms = 0
+        self.jitter_count = 0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+
+    def sync(self, epoch_ms):
+        # The wall clock is epoch_ms now, the next slot is aligned to it
+        self._epoch_ms = int(epoch_ms)  # ticks_add() only takes ints
+        self._epoch_ticks = clock.ticks_ms()
+        self._realign = self.align
+
+    def aligned(self, deadline_ms, period_ms):
+        # deadline_ms moved to the nearest period boundary in epoch time
+        epoch_ms = self._epoch_ms + clock.ticks_diff(deadline_ms,
+                                                     self._epoch_ticks)
+        offset = epoch_ms % period_ms
+        if offset >= period_ms // 2:
+            offset -= period_ms  # the next boundary is nearer
+        return clock.ticks_add(deadline_ms, -offset)
+
+    def delay_s(self, period_s):
+        # Seconds to sleep until the next slot, period_s after the last
+        period_ms = max(int(period_s * 1000), 1)
+        now = clock.ticks_ms()
+        previous = self.anchor_ms if self.deadline_ms is None \
+            else self.deadline_ms
+        deadline = clock.ticks_add(previous, period_ms)
+        if self._realign:
+            deadline = self.aligned(deadline, period_ms)
+            self._realign = False
+        self.slots += 1
+        wait_ms = clock.ticks_diff(deadline, now)
+        self.late = wait_ms < 0
+        if self.late:
+            self.overruns += 1
+            if self.overrun == self.SKIP:
+                missed = -wait_ms // period_ms + 1
+                self.skipped += missed
+                deadline = clock.ticks_add(deadline, missed * period_ms)
+                wait_ms = clock.ticks_diff(deadline, now)
+            else:
+                wait_ms = 0
+        self.deadline_ms = deadline
+        return wait_ms / 1000
+
+    def woke(self):
+        # Call as the cycle starts, records how late it is on its slot
+        if self.deadline_ms is None or \
+                (self.late and self.overrun == self.CATCH_UP):
+            return  # a catch up cycle starts late on purpose
+        jitter = clock.ticks_diff(clock.ticks_ms(), self.deadline_ms)
+        self.jitter_ms = jitter
+        if abs(jitter) > self.jitter_max_ms:
+            self.jitter_max_ms = abs(jitter)
+        # Welford's running mean and variance, nothing kept per cycle
+        self.jitter_count += 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self.jitter_count
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+
+    def jitter_mean_ms(self):
+        return self._jitter_mean
+
+    def jitter_std_ms(self):
+        if self.jitter_count < 2:
+            return 0
+        return (self._jitter_m2 / (self.jitter_count - 1)) ** 0.5
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_ms": self.jitter_ms,
+            "jitter_mean_ms": self.jitter_mean_ms(),
+            "jitter_std_ms": self.jitter_std_ms(),
+            "jitter_max_ms": self.jitter_max_ms
+        }
@@ -1,11 +1,14 @@
 from lib.inboxidau.rolling_appender_log import LogLevel  # type: ignore
+from lib.inboxidau.config_schema import (UConfigSchema, BOOL, INT,  # type: ignore # noqa: E501
+                                         NUMBER, STR, LIST, DICT)
+from lib.inboxidau.sleep_scheduler import USleepScheduler  # type: ignore
+from lib.inboxidau.wifi_link_cache import UWiFiLinkCache  # type: ignore
+from lib.inboxidau import clock  # type: ignore
 import ujson  # type: ignore # used to load config data
 import ubinascii  # type: ignore # used to generate a GUID
 import machine  # type: ignore
 import network  # type: ignore
 import time  # type: ignore
-from umqtt.robust import MQTTClient  # type: ignore
-import ntptime  # type: ignore
 import utime  # type: ignore
 
 current_time_utc = ""
@@ -33,11 +36,171 @@ class UPicoWSensorNode:
 
     STATIC_WIFI_RETRY_DELAY = 1  # seconds
 
+    # Time allowed for an association with a cached BSSID/lease or static IP
+    # before falling back to a full scan and DHCP, and for the full connect
+    STATIC_WIFI_FAST_CONNECT_TIMEOUT = 3  # seconds
+    STATIC_WIFI_CONNECT_TIMEOUT = 10      # seconds
+    STATIC_WIFI_POLL_MS = 100
+
+    # A cached DHCP lease is only reused as a static address while it is
+    # younger than this
+    STATIC_WIFI_LEASE_REUSE_S = 12 * 3600
+
+    STATIC_WIFI_CACHE_FILE = 'wifi.json'
+
+    # NTP is skipped while the RTC's worst case drift since the last sync,
+    # at STATIC_RTC_DRIFT_PPM, stays within STATIC_NTP_DRIFT_BUDGET_S
+    STATIC_RTC_DRIFT_PPM = 50
+    STATIC_NTP_DRIFT_BUDGET_S = 2
+    # localtime years before this mean the RTC has not been set
+    STATIC_RTC_VALID_YEAR = 2024
+
+    # State saved before a deep sleep when the port has no RTC memory
+    STATIC_NODE_RESUME_STATE_FILE = 'resume.json'
+
+    # Report by exception's last values, saved before the node loses power
+    STATIC_NODE_REPORT_STATE_FILE = 'report_state.json'
+
+    # The open rollup window and pending rollups, saved likewise
+    STATIC_NODE_ROLLUP_STATE_FILE = 'rollup_state.json'
+
+    # A replayed publish is preceded by the epoch seconds it was queued at
+    # on this sibling of its topic, unless it is retained or the RTC was
+    # not set when it was queued
+    STATIC_PUBLISH_QUEUE_TIMESTAMP_TOPIC = "{}/queued_at"
+
+    # Seconds to wait after asking the Makerverse HAT to remove power
+    STATIC_HAT_POWERDOWN_WAIT_S = 30
+
+    # Channels of sensor_data written to the binary sensor data log as
+    # (name, struct type code) pairs, nodes without channels log JSON.
+    SENSOR_DATA_CHANNELS = ()
+
+    # Burst samples are stored as uint16, e.g. millimetres, use 'f' for
+    # a sensor with fractional values
+    STATIC_BURST_TYPECODE = 'H'
+
+    # The validated config is compiled to this file and reloaded from it
+    # while the config file is unchanged
+    STATIC_NODE_CONFIG_SNAPSHOT_FILE = 'config.snapshot'
+
+    # The config fields as (key, kind, default[, choices]), each applied
+    # as an attribute of the same name, see UConfigSchema. Subclasses add
+    # theirs with CONFIG_FIELDS = UPicoWSensorNode.CONFIG_FIELDS + (...).
+    CONFIG_FIELDS = (
+        # overrides the class constant, e.g. to retune it remotely
+        ('STATIC_NODE_SENSE_REPEAT_DELAY', NUMBER,
+         lambda node: node.STATIC_NODE_SENSE_REPEAT_DELAY),
+        # Global Wi-Fi credentials
+        ('WIFI_SSID', STR, ''),
+        ('WIFI_PASSWORD', STR, ''),
+        # Try the cached BSSID and lease (or the static IP) first
+        ('WIFI_FAST_CONNECT', BOOL, True),
+        # optional [ip, netmask, gateway, dns] instead of DHCP
+        ('WIFI_STATIC_IP', LIST, []),
+        # MQTT Broker Details
+        ('MQTT_BROKER', STR, ''),
+        ('MQTT_PORT', INT, 0),
+        ('MQTT_USERNAME', STR, ''),
+        ('MQTT_PASSWORD', STR, ''),
+        ('MQTT_CA_CERTS', STR, ''),
+        ('MAKERVERSE_NANO_POWER_TIMER_HAT', BOOL, False),
+        ('LOG_SENSOR_DATA', BOOL, False),
+        ('LOG_SENSOR_DATA_FILE', STR, 'main.dat'),
+        ('LOG_SENSOR_DATA_FORMAT', STR, 'binary', ('binary', 'json')),
+        ('LOG_SENSOR_DATA_MAX_BYTES', INT, 65536),
+        ('LOG_SENSOR_DATA_BACKUPS', INT, 1),
+        # Store-and-forward queue for publishes made while offline
+        ('PUBLISH_QUEUE', BOOL, False),
+        ('PUBLISH_QUEUE_FILE', STR, 'publish_queue.dat'),
+        ('PUBLISH_QUEUE_SLOTS', INT, 64),
+        ('PUBLISH_QUEUE_SLOT_SIZE', INT, 128),
+        ('PUBLISH_QUEUE_DROP_OLDEST', BOOL, True),
+        # Only publish channels that moved past their deadband or whose
+        # heartbeat (seconds) expired
+        ('REPORT_BY_EXCEPTION', BOOL, False),
+        ('REPORT_DEADBANDS', DICT, {}),
+        ('REPORT_HEARTBEAT', NUMBER, 900),
+        # Run sensing, publishing and connectivity as asyncio tasks
+        ('ASYNC_RUNTIME', BOOL, False),
+        ('ASYNC_QUEUE_SIZE', INT, 8),
+        ('ASYNC_QUEUE_DROP_OLDEST', BOOL, True),
+        # One message per cycle on MQTT_TOPIC_node with every channel,
+        # encoded as json, cbor or struct
+        ('MQTT_BATCH_PUBLISH', BOOL, False),
+        ('MQTT_BATCH_ENCODING', STR, 'json', ('json', 'cbor', 'struct')),
+        ('MQTT_TOPIC_node', STR, ''),
+        # Publish min/max/mean/stddev per ROLLUP_WINDOW seconds instead
+        # of every reading, sampling every ROLLUP_SAMPLE_PERIOD seconds
+        ('ROLLUP_WINDOW', NUMBER, 0),
+        ('ROLLUP_HISTORY', INT, 8),
+        ('ROLLUP_SAMPLE_PERIOD', NUMBER,
+         lambda node: node.STATIC_NODE_SENSE_REPEAT_DELAY),
+        ('MQTT_TOPIC_rollup', STR, ''),
+        # Phase timings, memory marks, error counts and RSSI published
+        # every METRICS_PUBLISH_CYCLES cycles, see UNodeMetrics
+        ('METRICS_ENABLED', BOOL, False),
+        ('METRICS_PUBLISH_CYCLES', INT, 10),
+        ('MQTT_TOPIC_diagnostics', STR,
+         lambda node: f"{node.guid}/$SYS/diagnostics"),
+        # Sensor drivers with their own sample periods, see USensorDriver
+        ('SENSORS', LIST, []),
+        # busy, light or deep, see USleepScheduler
+        ('SLEEP_MODE', STR, USleepScheduler.BUSY, USleepScheduler.MODES),
+        # Start cycles on a fixed grid of deadlines instead of sleeping a
+        # fixed delay after each one, overruns skip or catch up missed
+        # slots, optionally aligned to the wall clock after NTP, see
+        # UPeriodicScheduler
+        ('PERIODIC_SCHEDULE', BOOL, False),
+        ('PERIODIC_OVERRUN', STR, 'skip', ('skip', 'catch_up')),
+        ('PERIODIC_ALIGN', BOOL, False),
+        # Every BURST_EVERY_CYCLES cycles sample at BURST_RATE_HZ for
+        # BURST_DURATION_S and publish the samples to MQTT_TOPIC_burst in
+        # binary chunks of BURST_CHUNK_SAMPLES, see UBurstCapture
+        ('BURST_CAPTURE', BOOL, False),
+        ('BURST_RATE_HZ', NUMBER, 50),
+        ('BURST_DURATION_S', NUMBER, 2),
+        ('BURST_CHUNK_SAMPLES', INT, 128),
+        ('BURST_EVERY_CYCLES', INT, 1),
+        ('MQTT_TOPIC_burst', STR, ''),
+        # Apply config deltas published to MQTT_TOPIC_config, acknowledged
+        # on MQTT_TOPIC_config_ack, see URemoteConfig
+        ('REMOTE_CONFIG', BOOL, False),
+        ('MQTT_TOPIC_config', STR, lambda node: f"{node.guid}/config"),
+        ('MQTT_TOPIC_config_ack', STR,
+         lambda node: f"{node.guid}/config/ack"),
+    )
+
+    # Config keys a remote config message can change that only take effect
+    # after a restart
+    STATIC_CONFIG_RESTART_KEYS = (
+        'WIFI_SSID', 'WIFI_PASSWORD', 'WIFI_FAST_CONNECT', 'WIFI_STATIC_IP',
+        'MQTT_BROKER', 'MQTT_PORT', 'MQTT_USERNAME', 'MQTT_PASSWORD',
+        'MQTT_CA_CERTS', 'LOG_SENSOR_DATA_FILE', 'LOG_SENSOR_DATA_FORMAT',
+        'LOG_SENSOR_DATA_MAX_BYTES', 'LOG_SENSOR_DATA_BACKUPS',
+        'PUBLISH_QUEUE', 'PUBLISH_QUEUE_FILE', 'PUBLISH_QUEUE_SLOTS',
+        'PUBLISH_QUEUE_SLOT_SIZE', 'PUBLISH_QUEUE_DROP_OLDEST',
+        'ASYNC_RUNTIME', 'ASYNC_QUEUE_SIZE', 'ASYNC_QUEUE_DROP_OLDEST',
+        'METRICS_ENABLED', 'SENSORS', 'REMOTE_CONFIG', 'MQTT_TOPIC_config',
+        'MQTT_TOPIC_config_ack')
+
     def log_message(self, message, log_level=LogLevel.INFO):
-        self.log.log_message(message, log_level, self.get_network_time())
+        # the timestamp is only looked up for messages that will be written
+        if self.log.is_enabled(log_level):
+            self.log.log_message(message, log_level, self.get_network_time())
+
+    def log_format(self, log_level, fmt, *args):
+        # Lazy log_message, fmt.format(*args) only runs when log_level is
+        # enabled
+        if self.log.is_enabled(log_level):
+            self.log.log_message(fmt.format(*args), log_level,
+                                 self.get_network_time())
 
     def set_network_time(self):
         try:
+            # imported here as most boots skip NTP, see
+            # sync_network_time_if_needed
+            import ntptime  # type: ignore
             ntptime.settime()  # Update the system time using NTP
             current_time_utc = utime.localtime()
 
@@ -47,11 +210,46 @@ class UPicoWSensorNode:
             message = f"CONSOLE: SET current time utc: {hours:02d}:{minutes:02d}:{seconds:02d}"  # noqa: E501
 
             self.log_message(message, LogLevel.INFO)
+            return True
         except Exception as e:
             exception_details = repr(e)
             self.log_message(f"{self.__class__.__name__}.set_network_time: {exception_details} ")  # noqa: E501
+            return False
+
+    def sync_network_time_if_needed(self):
+        # Skip NTP while the RTC can not have drifted past the budget since
+        # the last sync
+        last_sync = self.wifi_cache.get("ntp_synced")
+        now = time.time()
+        if last_sync is not None and \
+                utime.localtime()[0] >= self.STATIC_RTC_VALID_YEAR and \
+                0 <= now - last_sync:
+            drift_s = (now - last_sync) * self.STATIC_RTC_DRIFT_PPM / 1000000
+            if drift_s <= self.STATIC_NTP_DRIFT_BUDGET_S:
+                self.log_format(LogLevel.DEBUG,
+                                "NTP skipped, RTC drift at most {:.2f} s",
+                                drift_s)
+                self.clock_synced()
+                return
+        if self.set_network_time():
+            self.wifi_cache.update(ntp_synced=time.time())
+            self.clock_synced()
+
+    def clock_synced(self):
+        # The RTC holds the right time, periodic slots can be aligned to it
+        if self.periodic_scheduler is None:
+            return
+        if hasattr(time, 'time_ns'):
+            epoch_ms = time.time_ns() // 1000000
+        else:
+            epoch_ms = int(time.time()) * 1000  # to the second, ticks are ints
+        self.periodic_scheduler.sync(epoch_ms)
 
     def get_network_time(self, log_level=LogLevel.INFO):  # noqa: E501 getting the time usually needs to be silent
+        # The ISO timestamp only changes once a second, reuse the last one
+        now = int(time.time())
+        if now == self._iso_date_second and log_level != LogLevel.DEBUG:
+            return self._iso_date
         iso_date = ""
         try:
             # Print the current time
@@ -71,6 +269,8 @@ class UPicoWSensorNode:
                     current_time_utc[5]   # Second
                 )
             )
+            self._iso_date = iso_date
+            self._iso_date_second = now
             if log_level == LogLevel.DEBUG:
                 print(f"CONSOLE: Get current time (ISO format): {iso_date}")
         except Exception as e:
@@ -83,45 +283,91 @@ class UPicoWSensorNode:
     # Function to write data to a JSON file
     def write_to_json(self, file_path, data):
         try:
-            self.log_message(f"opening {file_path} ", LogLevel.DEBUG)
+            self.log_format(LogLevel.DEBUG, "opening {} ", file_path)
             with open(file_path, 'w') as file:
                 ujson.dump(data, file)
-            self.log_message(f"Data successfully written to {file_path}",
-                             LogLevel.DEBUG)
+            self.log_format(LogLevel.DEBUG,
+                            "Data successfully written to {}", file_path)
         except Exception as e:
-            exception_details = repr(e)
-            self.log_message(f"{self.__class__.__name__}.write_to_json: {exception_details} ",  # noqa: E501
-                             LogLevel.DEBUG)
+            self.log_format(LogLevel.DEBUG, "{}.write_to_json: {} ",
+                            self.__class__.__name__, repr(e))
+
+    def write_sensor_data(self):
+        # Append sensor_data to the sensor data log, as fixed-width binary
+        # records when the node declares SENSOR_DATA_CHANNELS
+        if self.LOG_SENSOR_DATA_FORMAT == "json" or \
+                not self.SENSOR_DATA_CHANNELS:
+            self.write_to_json(self.LOG_SENSOR_DATA_FILE, self.sensor_data)
+            return
+        try:
+            if self.sensor_data_log is None:
+                from lib.inboxidau.sensor_data_log import USensorDataLog
+                self.sensor_data_log = USensorDataLog(
+                    self.LOG_SENSOR_DATA_FILE, self.SENSOR_DATA_CHANNELS,
+                    max_file_size_bytes=self.LOG_SENSOR_DATA_MAX_BYTES,
+                    max_backups=self.LOG_SENSOR_DATA_BACKUPS)
+            self.sensor_data_log.append(self.sensor_data, time.time())
+            self.log_format(LogLevel.DEBUG, "Data successfully appended to {}",  # noqa: E501
+                            self.LOG_SENSOR_DATA_FILE)
+        except Exception as e:
+            self.log_format(LogLevel.DEBUG, "{}.write_sensor_data: {} ",
+                            self.__class__.__name__, repr(e))
 
     def connect_broker(self):
-        self.log_message(f"{self.__class__.__name__}.connect_broker() called",
-                         LogLevel.DEBUG)
-        self.log_message(f"Connecting to MQTT:{self.MQTT_BROKER}:{self.MQTT_PORT}",  # noqa: E501
-                         LogLevel.DEBUG)
-        self.mqtt_client.connect()
-        self.log_message(f"MQTT:{self.MQTT_BROKER}:{self.MQTT_PORT} Connected.",  # noqa: E501
-                         LogLevel.DEBUG)
+        self.log_format(LogLevel.DEBUG, "{}.connect_broker() called",
+                        self.__class__.__name__)
+        if self.mqtt_session is None:
+            self.initialize_broker()  # Wi-Fi is up, import the MQTT client
+        if self.mqtt_session.connected:
+            return None
+        self.log_format(LogLevel.DEBUG, "Connecting to MQTT:{}:{}",
+                        self.MQTT_BROKER, self.MQTT_PORT)
+        self.mqtt_session.connect()
+        self.log_format(LogLevel.DEBUG, "MQTT:{}:{} Connected.",
+                        self.MQTT_BROKER, self.MQTT_PORT)
         return None
 
     def initialize_broker(self):
-        self.log_message(f"{self.__class__.__name__}.initialize_broker() called ",  # noqa: E501
-                         LogLevel.DEBUG)
+        self.log_format(LogLevel.DEBUG, "{}.initialize_broker() called ",
+                        self.__class__.__name__)
 #         # SSL Context
 #         ssl_params = {"ca_certs": self.MQTT_CA_CERTS}
+        # imported once Wi-Fi is up rather than on boot, see
+        # tools/build_mpy.py
+        from umqtt.simple import MQTTClient  # type: ignore
+        from lib.inboxidau.mqtt_session import UMQTTSession  # type: ignore
+        keepalive = UMQTTSession.keepalive_for(self.longest_sleep_delay())
         self.mqtt_client = MQTTClient(self.guid, self.MQTT_BROKER,
                                       port=self.MQTT_PORT,
                                       user=self.MQTT_USERNAME,
                                       password=self.MQTT_PASSWORD,
+                                      keepalive=keepalive,
                                       ssl=True)
+        # one session is kept open across sensing cycles, any queued
+        # publishes are sent as soon as it (re)connects
+        self.mqtt_session = UMQTTSession(self.mqtt_client,
+                                         self.longest_sleep_delay(),
+                                         on_connect=self.on_broker_connect)
+        if self.remote_config is not None:
+            self.mqtt_client.set_callback(self.remote_config.on_message)
 
         # use device guid as MQTT Client ID
         self.log_message(f"Broker configured MQTTClient {self.guid}",
                          LogLevel.INFO)
         return None
 
+    def on_broker_connect(self):
+        # Called each time the MQTT session (re)connects, subscriptions do
+        # not survive a clean session
+        if self.remote_config is not None:
+            self.remote_config.subscribe(self.mqtt_client)
+        self.drain_publish_queue()
+
     def disconnect_broker(self):
+        if self.mqtt_session is None:
+            return None  # the broker was never reached
         try:
-            self.mqtt_client.disconnect()
+            self.mqtt_session.disconnect()
         except Exception as e:
             error_message = f"{self.__class__.__name__}.disconnect_broker() Error during disconnect_broker: {e}"  # noqa: E501
             print(error_message)
@@ -129,26 +375,287 @@ class UPicoWSensorNode:
 
         return None
 
+    def publish(self, topic, payload, retain=False):
+        # Publish on the persistent broker session, reconnecting on demand.
+        # With a publish queue configured, a publish that cannot be delivered
+        # is stored on flash with its retain flag and the time, and sent on
+        # the next successful connection.
+        if self.publish_queue is None:
+            self.mqtt_session.publish(topic, payload, retain)
+            if self.first_publish_ms is None:
+                self.record_first_publish()
+            return True
+
+        if self.mqtt_session is not None and self.mqtt_session.connected:
+            try:
+                self.mqtt_session.publish(topic, payload, retain)
+                if self.first_publish_ms is None:
+                    self.record_first_publish()
+                return True
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.publish() {repr(e)}",  # noqa: E501
+                                 LogLevel.INFO)
+
+        timestamp = time.time() if utime.localtime()[0] >= self.STATIC_RTC_VALID_YEAR else 0  # noqa: E501
+        self.publish_queue.append(topic, payload, timestamp, retain)
+        self.log_message(f"Queued publish to {topic}, {len(self.publish_queue)} pending",  # noqa: E501
+                         LogLevel.INFO)
+        return False
+
+    def record_first_publish(self):
+        # ticks_ms counts from reset, so this is the boot time a HAT or deep
+        # sleep cycled node pays for every reading
+        self.first_publish_ms = clock.ticks_ms()
+        self.log_format(LogLevel.INFO, "First publish {} ms after reset",
+                        self.first_publish_ms)
+
+    def publish_channel(self, channel, topic, value, payload=None,
+                        force=False, type_code=None):
+        # Publish one channel's value. With REPORT_BY_EXCEPTION the value is
+        # only sent when it has moved past the channel's deadband, when the
+        # channel's heartbeat has expired, or when force is set. type_code
+        # packs the value in a struct batch, by default the channel's code
+        # in SENSOR_DATA_CHANNELS. Channels
+        # in sent_channels were sent by an earlier attempt at the reading.
+        if self.sent_channels is not None and \
+                channel in self.sent_channels:
+            return True
+        if self._report_state_pending:
+            self.restore_report_state()
+        if self.report_by_exception is not None and \
+                not self.report_by_exception.should_report(channel, value,
+                                                           force):
+            self.log_format(LogLevel.DEBUG,
+                            "{} {} within deadband, not published",
+                            channel, value)
+            return False
+        if self.batch_payload is not None:
+            # sent with the other channels by publish_batch()
+            self.batch_payload.add(channel, topic, value,
+                                   type_code or dict(self.SENSOR_DATA_CHANNELS).get(channel))  # noqa: E501
+            published = True
+        else:
+            published = self.publish(topic, f"{value}" if payload is None else payload)  # noqa: E501
+            if self.sent_channels is not None:
+                self.sent_channels.add(channel)
+        if self.report_by_exception is not None:
+            self.report_by_exception.mark_reported(channel, value)
+        return published
+
+    def publish_batch(self):
+        # With MQTT_BATCH_PUBLISH, send the channels collected this cycle as
+        # one message on MQTT_TOPIC_node. The schema, needed to decode it
+        # and fan it out to the channel topics, is published retained on
+        # MQTT_TOPIC_node/schema whenever a channel is added.
+        if self.batch_payload is None or len(self.batch_payload) == 0:
+            return
+        if self.sent_channels is not None and \
+                self.MQTT_TOPIC_node in self.sent_channels:
+            self.batch_payload.clear()  # the batch went out on a try before
+            return
+        if self.batch_payload.schema_changed:
+            # queued again each cycle until it is sent, so the newest
+            # records in a full queue keep a copy
+            if self.publish(f"{self.MQTT_TOPIC_node}/schema",
+                            self.batch_payload.schema_payload(), retain=True):
+                self.batch_payload.schema_changed = False
+        payload = self.batch_payload.encode()
+        self.batch_payload.clear()
+        self.log_format(LogLevel.DEBUG, "Batch of {} bytes to >{}",
+                        len(payload), self.MQTT_TOPIC_node)
+        self.publish(self.MQTT_TOPIC_node, payload)
+        if self.sent_channels is not None:
+            self.sent_channels.add(self.MQTT_TOPIC_node)
+
+    def drain_publish_queue(self):
+        # Send queued publishes oldest first, called whenever the broker
+        # session connects
+        if self.publish_queue is None or len(self.publish_queue) == 0 or \
+                self._draining_publish_queue:
+            return
+        self._draining_publish_queue = True
+        try:
+            sent = self.publish_queue.drain(self.publish_queued)
+            self.log_message(f"Sent {sent} queued publishes, {len(self.publish_queue)} pending",  # noqa: E501
+                             LogLevel.INFO)
+        except Exception as e:
+            self.log_message(f"{self.__class__.__name__}.drain_publish_queue() {repr(e)}",  # noqa: E501
+                             LogLevel.ERROR)
+        finally:
+            self._draining_publish_queue = False
+
+    def publish_queued(self, topic, payload, timestamp, retain):
+        # A record from the publish queue, topic and payload are bytes
+        if timestamp and not retain:
+            self.mqtt_session.publish(
+                self.STATIC_PUBLISH_QUEUE_TIMESTAMP_TOPIC.format(topic.decode()),  # noqa: E501
+                f"{timestamp}")
+        self.mqtt_session.publish(topic, payload, retain)
+
+    def log_session_counters(self):
+        if not self.log.is_enabled(LogLevel.DEBUG) or \
+                self.mqtt_session is None:
+            return
+        counters = self.mqtt_session.counters()
+        self.log_format(
+            LogLevel.DEBUG,
+            "MQTT: handshakes {} ({:.2f}/h) publishes {} latency {} ms avg {:.1f} ms max {} ms",  # noqa: E501
+            counters["handshakes"], counters["handshakes_per_hour"],
+            counters["publishes"], counters["publish_latency_ms"],
+            counters["publish_latency_avg_ms"],
+            counters["publish_latency_max_ms"])
+
     def initialize_sensors(self):
+        # Create the drivers listed in SENSORS, nodes with hard-wired
+        # sensors override read_sensor_data and post_sensor_data instead
+        if not getattr(self, 'SENSORS', None):
+            return None
+        from lib.inboxidau.sensor_drivers import create_driver, USensorScheduler  # noqa: E501
+        self.sensor_drivers = [create_driver(self, sensor_config)
+                               for sensor_config in self.SENSORS]
+        for driver in self.sensor_drivers:
+            driver.initialize()
+            self.log_format(LogLevel.INFO, "Sensor {} ({}) every {} s",
+                            driver.name, driver.TYPE, driver.period_s)
+        self.SENSOR_DATA_CHANNELS = tuple(
+            (f"{driver.name}_{channel}", type_code)
+            for driver in self.sensor_drivers
+            for channel, type_code in driver.CHANNELS)
+        self.sensor_scheduler = USensorScheduler(self.sensor_drivers)
         return None
 
     def read_sensor_data(self):
+        # Sample the drivers that are due, sensor_data keeps the latest
+        # value of every channel as <sensor name>_<channel>
+        self.sampled_drivers = []
+        if self.sensor_scheduler is None:
+            return None
+        for driver in self.sensor_scheduler.due():
+            try:
+                for channel, value in driver.sample().items():
+                    self.sensor_data[f"{driver.name}_{channel}"] = value
+                self.sampled_drivers.append(driver)
+            except Exception as e:
+                driver.errors += 1
+                self.log_message(f"{self.__class__.__name__}.read_sensor_data() {driver.name} {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
         return None
 
     def post_sensor_data(self):
+        for driver in self.sampled_drivers:
+            try:
+                driver.post(self.sensor_data)
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.post_sensor_data() {driver.name} {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+        if self.sampled_drivers and self.LOG_SENSOR_DATA:
+            self.write_sensor_data()
         return None
 
+    def next_sleep_delay(self):
+        # Seconds to sleep before the next cycle, with SENSORS until the
+        # next sensor is due, with an adaptive cadence its current period
+        if self.sensor_scheduler is not None:
+            return self.sensor_scheduler.next_due_s()
+        if self.adaptive_cadence is not None:
+            return self.adaptive_cadence.period_s
+        if self.rollup is not None:
+            return self.ROLLUP_SAMPLE_PERIOD
+        return self.STATIC_NODE_SENSE_REPEAT_DELAY
+
+    def longest_sleep_delay(self):
+        # The longest next_sleep_delay() can return, the broker keepalive
+        # is sized to it so an idle session outlives every sleep
+        if self.sensor_scheduler is not None and self.sensor_drivers:
+            return max(driver.period_s for driver in self.sensor_drivers)
+        if self.adaptive_cadence is not None:
+            return self.adaptive_cadence.max_s
+        if self.rollup is not None:
+            return self.ROLLUP_SAMPLE_PERIOD
+        return self.STATIC_NODE_SENSE_REPEAT_DELAY
+
+    def report_sensor_data(self):
+        # post_sensor_data, or with ROLLUP_WINDOW the rollup stage in its
+        # place followed by post_immediate_data
+        if self.rollup is not None:
+            self.rollup_sensor_data()
+            self.post_immediate_data()
+            self.publish_batch()
+            return
+        self.post_sensor_data()
+        self.publish_batch()
+
+    def post_immediate_data(self):
+        # What post_sensor_data does besides publishing each reading, kept
+        # when a rollup publishes in its place: bursts and the sensor data
+        # log. Subclasses add the readings that can not wait for the
+        # window, e.g. an occupancy change.
+        try:
+            self.publish_burst()
+            if self.LOG_SENSOR_DATA and \
+                    (self.sensor_scheduler is None or self.sampled_drivers):
+                self.write_sensor_data()
+        except Exception as e:
+            self.log_message(f"{self.__class__.__name__}.post_immediate_data() {repr(e)}",  # noqa: E501
+                             LogLevel.ERROR)
+
+    def rollup_channels(self):
+        # the sensor_data channels read this cycle
+        if self.sensor_scheduler is not None:
+            return [f"{driver.name}_{channel}"
+                    for driver in self.sampled_drivers
+                    for channel in driver.values]
+        if self.SENSOR_DATA_CHANNELS:
+            return [channel for channel, _ in self.SENSOR_DATA_CHANNELS]
+        return list(self.sensor_data)
+
+    def rollup_sensor_data(self):
+        # Add this cycle's readings to the window statistics, and publish
+        # the rollup when the window is over instead of every reading
+        if self._rollup_state_pending:
+            self.restore_rollup_state()
+        now = time.time()
+        for channel in self.rollup_channels():
+            value = self.sensor_data.get(channel)
+            if isinstance(value, (int, float)):
+                self.rollup.add(channel, value, now)
+        if self.rollup.window_elapsed(now):
+            self.rollup.close(now)
+            self.publish_rollups()
+
+    def publish_rollups(self, aggregator=None):
+        # Oldest first, rollups that can not be published stay in the
+        # history for the next window
+        aggregator = aggregator or self.rollup
+        for rollup in aggregator.pending():
+            try:
+                self.publish(self.MQTT_TOPIC_rollup,
+                             ujson.dumps(rollup, separators=(',', ':')))
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.publish_rollups() {len(aggregator.pending())} pending {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+                return
+            aggregator.mark_sent()
+
     def generate_guid(self):
         # Generate a unique ID using the MAC address of the device
         mac = ubinascii.hexlify(machine.unique_id()).decode('utf-8')
         return mac
 
     def load_config(self, file_path):
-        # load the config from the json fie into a config_data array
+        # load the validated config, from the compiled snapshot unless the
+        # json file changed since, see UConfigSchema
         try:
-            with open(file_path, 'r') as file:
-                config_data = ujson.load(file)
-            self.log_message(f"{self.__class__.__name__} config loaded",
+            config_data, compiled = self.config_schema.load(
+                file_path, self.STATIC_NODE_CONFIG_SNAPSHOT_FILE)
+            if compiled:
+                for key in self.config_schema.coerced:
+                    self.log_format(LogLevel.INFO, "Config {} coerced to {}",
+                                    key, config_data[key])
+                for key in self.config_schema.unknown:
+                    self.log_format(LogLevel.DEBUG, "Config {} not used by {}",  # noqa: E501
+                                    key, self.__class__.__name__)
+            self.log_message(f"{self.__class__.__name__} config {'compiled' if compiled else 'loaded'}",  # noqa: E501
                              LogLevel.INFO)
             return config_data
         except Exception as e:
@@ -159,7 +666,6 @@ class UPicoWSensorNode:
             )
 
             raise ValueError(exception_details)
-            return None
 
     def force_boolean(self, json_value, key="Unspecified"):
         # Check if the JSON value is a string
@@ -177,29 +683,70 @@ class UPicoWSensorNode:
             return json_value
 
     def __init__(self, log, config_path='UPicoWSensorNode.json'):
+        self._iso_date = ""
+        self._iso_date_second = None
+        self.wifi = None
+        self.wifi_connect_ms = None
+        self._wifi_static_ifconfig = False
+        self.wifi_cache = UWiFiLinkCache(self.STATIC_WIFI_CACHE_FILE)
+        self.wifi_cache.load()
         self.mqtt_client = None
+        self.mqtt_session = None
+        self.publish_queue = None
+        self.sensor_data_log = None
+        self.report_by_exception = None
+        self.batch_payload = None
+        self.rollup = None
+        self.adaptive_cadence = None
+        self.metrics = None
+        self.remote_config = None
+        self.burst = None
+        self.periodic_scheduler = None
+        self.first_publish_ms = None
+        self.sensor_drivers = []
+        self.sensor_scheduler = None
+        self.sampled_drivers = []
+        self._draining_publish_queue = False
+        self._report_state_pending = False
+        self._rollup_state_pending = False
+        self.sent_channels = None  # set by the async runtime's retries
         self.log = log                                       # noqa: E501 Assign the log variable passed from main.py
         self.config_path = config_path                       # noqa: E501 Assign the path to the config file
-        self.config = self.load_config(config_path)
-        self.guid = self.generate_guid()                     # noqa: E501 Assign a device ID for reference
+        self.config_schema = UConfigSchema(self.CONFIG_FIELDS)
+        # waking from a deep sleep skips the config load and GUID generation
+        self.resume_state = None
+        if USleepScheduler.woke_from_deep_sleep():
+            self.resume_state = USleepScheduler.load_resume_state(
+                self.STATIC_NODE_RESUME_STATE_FILE, config_path)
+        if self.resume_state is not None:
+            self.config = self.resume_state["config"]
+            self.guid = self.resume_state["guid"]
+            self.log_message(f"Resumed from saved sleep state, cycle {self.resume_state['cycle']}",  # noqa: E501
+                             LogLevel.INFO)
+        else:
+            self.config = self.load_config(config_path)
+            self.guid = self.generate_guid()                 # noqa: E501 Assign a device ID for reference
+        self.cycle = 0 if self.resume_state is None else self.resume_state["cycle"]  # noqa: E501
+        # diagnostics go out on the first cycle after a power on, a HAT
+        # powered node never reaches its METRICS_PUBLISH_CYCLES cycle
+        self._metrics_due = self.resume_state is None
         self.sensor_data = {}                                # noqa: E501 Assign an empty dictionary for sensor data
         if self.config:
-            # Global Wi-Fi credentials
-            self.WIFI_SSID = self.config.get('WIFI_SSID', '')
-            self.WIFI_PASSWORD = self.config.get('WIFI_PASSWORD', '')
-            # MQTT Broker Details
-            self.MQTT_BROKER = self.config.get('MQTT_BROKER', '')
-            self.MQTT_PORT = self.config.get('MQTT_PORT', 0)
-            self.MQTT_USERNAME = self.config.get('MQTT_USERNAME', '')
-            self.MQTT_PASSWORD = self.config.get('MQTT_PASSWORD', 0)
-            self.MQTT_CA_CERTS = self.config.get('MQTT_CA_CERTS', '')
-            # flake8 max line warning avoidance using hat_value
-            hat_value = self.config.get('MAKERVERSE_NANO_POWER_TIMER_HAT',
-                                        "False")
-            self.MAKERVERSE_NANO_POWER_TIMER_HAT = self.force_boolean(hat_value, 'MAKERVERSE_NANO_POWER_TIMER_HAT')  # noqa: E501
-            self.LOG_SENSOR_DATA = self.force_boolean(self.config.get('LOG_SENSOR_DATA', 'False'), 'LOG_SENSOR_DATA')  # noqa: E501
-            self.LOG_SENSOR_DATA_FILE = self.config.get('LOG_SENSOR_DATA_FILE', 'main.dat')  # noqa: E501
-            self.log_message(f"SENSOR LOG {self.LOG_SENSOR_DATA} {self.LOG_SENSOR_DATA_FILE}", LogLevel.DEBUG)  # noqa: E501
+            self.config_schema.apply(self, self.config)
+            self.log_format(LogLevel.DEBUG, "SENSOR LOG {} {}", self.LOG_SENSOR_DATA, self.LOG_SENSOR_DATA_FILE)  # noqa: E501
+            if self.PUBLISH_QUEUE:
+                self.initialize_publish_queue()
+            self.initialize_report_by_exception()
+            self.initialize_batch_payload()
+            self.initialize_rollup()
+            self.initialize_burst_capture()
+            self.initialize_periodic_scheduler()
+            if self.METRICS_ENABLED:
+                self.initialize_metrics()
+            if self.REMOTE_CONFIG:
+                from lib.inboxidau.remote_config import URemoteConfig
+                self.remote_config = URemoteConfig(
+                    self, self.MQTT_TOPIC_config, self.MQTT_TOPIC_config_ack)
 
             self.log_message("UPicoWSensorNode Config values applied",
                              LogLevel.DEBUG)
@@ -207,87 +754,500 @@ class UPicoWSensorNode:
             self.log_message("UPicoWSensorNode Failed to load config file.",
                              LogLevel.ERROR)
 
-        self.log_message(f"UPicoWSensorNode initialized device with guid {self.guid}", LogLevel.DEBUG)  # noqa: E501
+        self.sleep_scheduler = USleepScheduler(
+            self, getattr(self, 'SLEEP_MODE', USleepScheduler.BUSY))
+        self.log_format(LogLevel.DEBUG, "UPicoWSensorNode initialized device with guid {}", self.guid)  # noqa: E501
 
-    def cycle_makerverse_nano_hat(self):
-        if self.MAKERVERSE_NANO_POWER_TIMER_HAT == "True":
+    def on_config_changed(self, keys):
+        # Called with the keys a remote config message changed once their
+        # attributes are set. Rebuilds what was built from them and returns
+        # the keys that need a restart, subclasses extend it for theirs.
+        changed = set(keys)
+        if changed & {'REPORT_BY_EXCEPTION', 'REPORT_DEADBANDS',
+                      'REPORT_HEARTBEAT'}:
+            self.initialize_report_by_exception()
+        if changed & {'MQTT_BATCH_PUBLISH', 'MQTT_BATCH_ENCODING'}:
+            self.initialize_batch_payload()
+        if changed & {'ROLLUP_WINDOW', 'ROLLUP_HISTORY'}:
+            self.initialize_rollup()
+        if [key for key in changed if key.startswith('BURST_')]:
+            self.initialize_burst_capture()
+        if 'SLEEP_MODE' in changed:
+            self.sleep_scheduler = USleepScheduler(self, self.SLEEP_MODE)
+        if [key for key in changed if key.startswith('PERIODIC_')]:
+            self.initialize_periodic_scheduler()
+        return [key for key in keys if key in self.STATIC_CONFIG_RESTART_KEYS]  # noqa: E501
+
+    def initialize_report_by_exception(self):
+        self.report_by_exception = None
+        if self.REPORT_BY_EXCEPTION:
+            from lib.inboxidau.report_by_exception import UReportByException  # noqa: E501
+            self.report_by_exception = UReportByException(
+                self.REPORT_DEADBANDS, self.REPORT_HEARTBEAT)
+            # restored on the first publish, the RTC may not be set yet
+            self._report_state_pending = True
+
+    def restore_report_state(self):
+        # The last values reported before a HAT power down or deep sleep
+        self._report_state_pending = False
+        if utime.localtime()[0] < self.STATIC_RTC_VALID_YEAR:
+            self.log_message("RTC not set, report by exception starts afresh",  # noqa: E501
+                             LogLevel.INFO)
+            return
+        try:
+            with open(self.STATIC_NODE_REPORT_STATE_FILE, 'r') as file:
+                state = ujson.load(file)
+            self.report_by_exception.restore_state(state, int(time.time()))
+        except (OSError, ValueError, TypeError) as e:
+            self.log_format(LogLevel.DEBUG, "{}.restore_report_state() {}",
+                            self.__class__.__name__, repr(e))
+
+    def save_report_state(self):
+        # Called before power is lost, only writes when a value was
+        # reported since the last save
+        rbe = self.report_by_exception
+        if rbe is None or not rbe.dirty:
+            return
+        self.write_to_json(self.STATIC_NODE_REPORT_STATE_FILE,
+                           rbe.save_state(int(time.time())))
+
+    def initialize_batch_payload(self):
+        self.batch_payload = None
+        if self.MQTT_BATCH_PUBLISH:
+            from lib.inboxidau.payload_encoding import UBatchPayload
+            self.batch_payload = UBatchPayload(self.MQTT_BATCH_ENCODING)
+
+    def initialize_rollup(self):
+        previous = self.rollup
+        self.rollup = None
+        if self.ROLLUP_WINDOW:
+            from lib.inboxidau.rollup import URollupAggregator
+            self.rollup = URollupAggregator(self.ROLLUP_WINDOW,
+                                            self.ROLLUP_HISTORY)
+        if previous is None:
+            # restored on the first reading, the RTC may not be set yet
+            self._rollup_state_pending = self.rollup is not None
+            return
+        # rebuilt by a config change, the open window closes with the old
+        # settings and no pending rollup is lost
+        previous.close(time.time())
+        if self.rollup is None:
+            self.publish_rollups(previous)
+            return
+        for rollup in previous.pending():
+            self.rollup.keep(rollup)
+
+    def restore_rollup_state(self):
+        # The window and history saved before a HAT power down or deep sleep
+        self._rollup_state_pending = False
+        if utime.localtime()[0] < self.STATIC_RTC_VALID_YEAR:
+            self.log_message("RTC not set, rollup starts afresh",
+                             LogLevel.INFO)
+            return
+        try:
+            with open(self.STATIC_NODE_ROLLUP_STATE_FILE, 'r') as file:
+                state = ujson.load(file)
+            self.rollup.restore_state(state)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            self.log_format(LogLevel.DEBUG, "{}.restore_rollup_state() {}",
+                            self.__class__.__name__, repr(e))
+
+    def save_rollup_state(self):
+        # Called before power is lost
+        if self.rollup is None:
+            return
+        self.write_to_json(self.STATIC_NODE_ROLLUP_STATE_FILE,
+                           self.rollup.save_state())
+
+    def initialize_burst_capture(self):
+        self.burst = None
+        if self.BURST_CAPTURE:
+            from lib.inboxidau.burst_capture import UBurstCapture
+            self.burst = UBurstCapture(self.BURST_RATE_HZ,
+                                       self.BURST_DURATION_S,
+                                       self.STATIC_BURST_TYPECODE)
+
+    def initialize_periodic_scheduler(self):
+        self.periodic_scheduler = None
+        if self.PERIODIC_SCHEDULE:
+            from lib.inboxidau.periodic_scheduler import UPeriodicScheduler
+            self.periodic_scheduler = UPeriodicScheduler(
+                self.PERIODIC_OVERRUN, self.PERIODIC_ALIGN)
+            if utime.localtime()[0] >= self.STATIC_RTC_VALID_YEAR:
+                self.clock_synced()  # a reboot with the RTC still set
+
+    def burst_due(self):
+        return self.burst is not None and \
+            self.cycle % self.BURST_EVERY_CYCLES == 0
+
+    def capture_burst(self, read):
+        # Sample read() for a burst, returns the samples array
+        samples = self.burst.capture(read, int(time.time()))
+        self.log_format(LogLevel.DEBUG, "Burst of {} samples, {} overruns",
+                        self.burst.count, self.burst.overruns)
+        return samples
+
+    def publish_burst(self):
+        # Publish the last burst as binary chunks, once
+        burst = self.burst
+        if burst is None or not burst.count or not self.MQTT_TOPIC_burst:
+            return
+        try:
+            for payload in burst.payloads(self.BURST_CHUNK_SAMPLES):
+                self.publish(self.MQTT_TOPIC_burst, payload)
+        except Exception as e:
+            self.log_message(f"{self.__class__.__name__}.publish_burst() {repr(e)}",  # noqa: E501
+                             LogLevel.ERROR)
+        burst.count = 0
+
+    def initialize_metrics(self):
+        # Time the phases of a cycle by wrapping the methods on this
+        # instance, nodes without metrics call them directly
+        from lib.inboxidau.node_metrics import UNodeMetrics
+        self.metrics = UNodeMetrics()
+        for phase, method in (("wifi", "connect_to_wifi"),
+                              ("broker", "connect_broker"),
+                              ("read", "read_sensor_data"),
+                              ("post", "post_sensor_data"),
+                              ("sleep", "sleep")):
+            setattr(self, method,
+                    self.metrics.timed(phase, getattr(self, method)))
+
+    def publish_metrics(self):
+        # Every METRICS_PUBLISH_CYCLES cycles and on the first cycle after a
+        # power on, one compact diagnostics message on
+        # MQTT_TOPIC_diagnostics
+        metrics = self.metrics
+        metrics.sample_memory()
+        if self.cycle % self.METRICS_PUBLISH_CYCLES and not self._metrics_due:  # noqa: E501
+            return
+        self._metrics_due = False
+        try:
+            metrics.rssi = self.wifi.status('rssi')
+        except Exception:
+            metrics.rssi = None
+        extra = {"cycle": self.cycle,
+                 "first_publish_ms": self.first_publish_ms}
+        if self.mqtt_session is not None:
+            extra["handshakes"] = self.mqtt_session.handshakes
+            extra["publishes"] = self.mqtt_session.publish_count
+        if self.publish_queue is not None:
+            extra["queued"] = len(self.publish_queue)
+        if self.report_by_exception is not None:
+            extra["suppressed"] = self.report_by_exception.suppressed
+        if self.adaptive_cadence is not None:
+            extra["sample_period"] = self.adaptive_cadence.period_s
+        if self.periodic_scheduler is not None:
+            scheduler = self.periodic_scheduler
+            extra["overruns"] = scheduler.overruns
+            extra["jitter_mean_ms"] = scheduler.jitter_mean_ms()
+            extra["jitter_max_ms"] = scheduler.jitter_max_ms
+        try:
+            self.publish(self.MQTT_TOPIC_diagnostics,
+                         ujson.dumps(metrics.snapshot(**extra),
+                                     separators=(',', ':')))
+        except Exception as e:
+            self.log_message(f"{self.__class__.__name__}.publish_metrics() {repr(e)}",  # noqa: E501
+                             LogLevel.ERROR)
+        metrics.reset_window()
+
+    def initialize_publish_queue(self):
+        from lib.inboxidau.publish_queue import UFlashPublishQueue
+        self.publish_queue = UFlashPublishQueue(
+            self.PUBLISH_QUEUE_FILE,
+            slots=self.PUBLISH_QUEUE_SLOTS,
+            slot_size=self.PUBLISH_QUEUE_SLOT_SIZE,
+            drop_oldest=self.PUBLISH_QUEUE_DROP_OLDEST)
+        self.log_message(f"Publish queue {self.PUBLISH_QUEUE_FILE} {len(self.publish_queue)} pending",  # noqa: E501
+                         LogLevel.INFO)
+
+    def sleep(self, seconds):
+        # Sleep between cycles using the configured SLEEP_MODE
+        self.sleep_scheduler.sleep(seconds)
+
+    def sleep_until_next_cycle(self):
+        # With PERIODIC_SCHEDULE sleep until the next slot rather than a
+        # whole period. SENSORS already sleep until a sensor is due.
+        scheduler = self.periodic_scheduler
+        if scheduler is None or self.sensor_scheduler is not None:
+            self.sleep(self.next_sleep_delay())
+            return
+        delay_s = scheduler.delay_s(self.next_sleep_delay())
+        if scheduler.late:
+            self.log_format(LogLevel.INFO,
+                            "Cycle overran its slot, {} overruns {} slots skipped",  # noqa: E501
+                            scheduler.overruns, scheduler.skipped)
+        self.sleep(delay_s)
+        scheduler.woke()
+        self.log_format(LogLevel.DEBUG, "Slot jitter {} ms mean {:.1f} ms max {} ms",  # noqa: E501
+                        scheduler.jitter_ms, scheduler.jitter_mean_ms(),
+                        scheduler.jitter_max_ms)
+
+    def prepare_for_sleep(self, mode):
+        # Called before a light or deep sleep powers the radio down
+        if mode == USleepScheduler.DEEP:
+            self.save_resume_state()
+            self.save_report_state()
+            self.save_rollup_state()
+        try:
+            if self.mqtt_session is not None:
+                self.disconnect_broker()
+        except Exception as e:
+            self.log_message(f"{self.__class__.__name__}.prepare_for_sleep() {repr(e)}",  # noqa: E501
+                             LogLevel.INFO)
+        self.log.flush()
+        if self.wifi is not None:
+            self.wifi.active(False)
+
+    def resume_from_sleep(self, mode):
+        # Called after a light sleep, the next cycle reconnects Wi-Fi and
+        # the broker
+        if self.wifi is not None:
+            self.wifi.active(True)
+
+    def save_resume_state(self):
+        # RTC memory is rewritten before every deep sleep to carry the cycle
+        # count. On flash the state is only written when there is no valid
+        # copy, then just the 4 byte cycle count
+        if self.resume_state is not None and \
+                not USleepScheduler.has_rtc_memory():
+            self.resume_state["cycle"] = self.cycle
+            USleepScheduler.save_resume_cycle(
+                self.STATIC_NODE_RESUME_STATE_FILE, self.cycle)
+            return
+        self.resume_state = {"guid": self.guid, "config": self.config,
+                             "cycle": self.cycle}
+        USleepScheduler.save_resume_state(
+            self.STATIC_NODE_RESUME_STATE_FILE, self.config_path,
+            self.resume_state)
+
+    def power_down_hat(self):
+        # Ask the Makerverse HAT to remove power, False when there is no HAT
+        if self.MAKERVERSE_NANO_POWER_TIMER_HAT:
             self.log_message("Power down HAT.", LogLevel.INFO)
+            self.save_report_state()
+            self.save_rollup_state()
+            # a broken session must not keep the HAT from removing power
+            try:
+                self.disconnect_broker()
+                self.log_message("MQTT: Disconnected.", LogLevel.DEBUG)
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.power_down_hat() {repr(e)}",  # noqa: E501
+                                 LogLevel.INFO)
+            self.log.flush()  # buffered log messages are lost on power down
             POWERDOWN.on()
+            return True
+        return False
+
+    def cycle_makerverse_nano_hat(self):
+        if self.power_down_hat():
             count = 0
-            max_count = 30
+            max_count = self.STATIC_HAT_POWERDOWN_WAIT_S
             while True:
                 if count >= max_count:
                     break  # Exit the loop after reaching maximum count
-                self.log_message(f"count {count} sheep.", LogLevel.DEBUG)
+                self.log_format(LogLevel.DEBUG, "count {} sheep.", count)
                 count += 1
                 time.sleep(1)  # Sleep for 1 second between each output
 
     def execute_sensor_reading(self):
-        try:
-            self.read_sensor_data()
-            self.post_sensor_data()
-        finally:
-            self.disconnect_broker()
-            self.log_message("MQTT: Disconnected.", LogLevel.DEBUG)
+        # the broker session stays open between readings, it is only
+        # disconnected when the HAT is about to remove power
+        if self.mqtt_session is not None:
+            # a config change can lengthen the sleeps, a larger keepalive
+            # reaches the broker on the next connect
+            self.mqtt_session.set_cycle(self.longest_sleep_delay())
+            try:
+                self.mqtt_session.keep_alive()
+            except Exception as e:
+                if self.publish_queue is None:
+                    raise
+                # the reading is still taken and queued
+                self.log_message(f"{self.__class__.__name__}.execute_sensor_reading() {repr(e)}",  # noqa: E501
+                                 LogLevel.INFO)
+        self.read_sensor_data()
+        self.report_sensor_data()
+        self.log_session_counters()
 
-    def initialize_wifi(self):
+    def initialize_wifi(self, bssid=None, ifconfig=None):
+        # Start an association, with a known BSSID to skip the scan and a
+        # static ifconfig to skip DHCP when given
         self.wifi = network.WLAN(network.STA_IF)
+        if self.wifi.isconnected():
+            return  # the link is already up, nothing to restart
         self.wifi.disconnect()
         self.wifi.active(True)
-        self.wifi.connect(self.WIFI_SSID, self.WIFI_PASSWORD)
+        if ifconfig:
+            self.wifi.ifconfig(tuple(ifconfig))
+            self._wifi_static_ifconfig = True
+        elif self._wifi_static_ifconfig:
+            self.wifi.ifconfig('dhcp')  # undo a failed static attempt
+            self._wifi_static_ifconfig = False
+        if bssid:
+            self.wifi.connect(self.WIFI_SSID, self.WIFI_PASSWORD,
+                              bssid=bssid)
+        else:
+            self.wifi.connect(self.WIFI_SSID, self.WIFI_PASSWORD)
 
-    def wait_for_wifi_connection(self):
-        retries_remaining = self.STATIC_WIFI_MAX_RETRIES
-        for _ in range(self.STATIC_WIFI_MAX_RETRIES):
+    def wait_for_wifi_connection(self, timeout_s=None):
+        # Poll until connected, returns the milliseconds it took
+        if timeout_s is None:
+            timeout_s = self.STATIC_WIFI_MAX_RETRIES * self.STATIC_WIFI_RETRY_DELAY  # noqa: E501
+        self.log_format(LogLevel.DEBUG,
+                        "Waiting for connection to {} for up to {} s",
+                        self.WIFI_SSID, timeout_s)
+        start = clock.ticks_ms()
+        while True:
+            elapsed_ms = clock.ticks_diff(clock.ticks_ms(), start)
             if self.wifi.isconnected():
-                break
-            self.log_message(
-                f'Waiting for re-connection to {self.WIFI_SSID}. Retries left: {retries_remaining}',  # noqa: E501
-                LogLevel.DEBUG
-            )
+                return elapsed_ms
+            if elapsed_ms >= timeout_s * 1000:
+                self.log_message(f'{self.__class__.__name__}.connect_to_wifi() {self.WIFI_SSID} network connection failed', LogLevel.ERROR)  # noqa: E501
 
-            time.sleep(self.STATIC_WIFI_RETRY_DELAY)
-            retries_remaining -= 1
-        else:
-            self.log_message(f'{self.__class__.__name__}.connect_to_wifi() {self.WIFI_SSID} network connection failed', LogLevel.ERROR)  # noqa: E501
+                raise RuntimeError('network connection failed.', LogLevel.ERROR)  # noqa: E501
+            time.sleep(self.STATIC_WIFI_POLL_MS / 1000)
+
+    def fast_connect_params(self):
+        # (bssid, ifconfig) to try before a full connect, or None
+        cache = self.wifi_cache
+        ifconfig = self.WIFI_STATIC_IP or None
+        if ifconfig is None and cache.get("lease_time") is not None and \
+                0 <= time.time() - cache.get("lease_time") < self.STATIC_WIFI_LEASE_REUSE_S:  # noqa: E501
+            ifconfig = cache.get("ifconfig")
+        bssid = None
+        if cache.get("ssid") == self.WIFI_SSID and cache.get("bssid"):
+            bssid = ubinascii.unhexlify(cache.get("bssid"))
+        if bssid is None and ifconfig is None:
+            return None
+        return bssid, ifconfig
 
-            raise RuntimeError('network connection failed.', LogLevel.ERROR)
+    def remember_wifi_link(self):
+        # Cache the lease and the access point after a full connect, the
+        # BSSID is read from the association so no scan is needed, ports
+        # that cannot report it only reuse the lease
+        update = {"ssid": self.WIFI_SSID}
+        if not self.WIFI_STATIC_IP:
+            update["ifconfig"] = list(self.wifi.ifconfig())
+            update["lease_time"] = time.time()
+        try:
+            bssid = self.wifi.config('bssid')
+            if bssid:
+                update["bssid"] = ubinascii.hexlify(bssid).decode()
+        except Exception as e:
+            self.log_format(LogLevel.DEBUG, "{}.remember_wifi_link() {}",
+                            self.__class__.__name__, repr(e))
+        self.wifi_cache.update(**update)
+
+    def connect_to_network(self):
+        # Connect to Wi-Fi and the broker. With a publish queue an outage is
+        # not fatal, readings are queued and sent on the next connection.
+        try:
+            self.connect_to_wifi()
+            self.connect_broker()
+        except Exception as e:
+            if self.publish_queue is None:
+                raise
+            self.log_message(f"{self.__class__.__name__}.connect_to_network() offline, queueing readings {repr(e)}",  # noqa: E501
+                             LogLevel.ERROR)
 
     def connect_to_wifi(self):
+        steps = self.connect_to_wifi_steps()
+        try:
+            timeout_s = next(steps)
+            while True:
+                try:
+                    elapsed_ms = self.wait_for_wifi_connection(timeout_s)
+                except RuntimeError as e:
+                    timeout_s = steps.throw(e)
+                else:
+                    timeout_s = steps.send(elapsed_ms)
+        except StopIteration:
+            pass
+
+    def connect_to_wifi_steps(self):
+        # The Wi-Fi connect as a generator, so the async runtime can wait
+        # without blocking. Each wait for the association is yielded as
+        # its timeout in seconds and resumed with the milliseconds it
+        # took, or with the RuntimeError of a timeout thrown in.
         # Check if already connected
         if self.wifi.status() != 3:
             self.log_message(f"Connecting to {self.WIFI_SSID}...",
                              LogLevel.INFO)
-            self.initialize_wifi()
-            self.wait_for_wifi_connection()
-            self.set_network_time()
+            connected = False
+            fast_params = self.fast_connect_params() if self.WIFI_FAST_CONNECT else None  # noqa: E501
+            if fast_params is not None:
+                try:
+                    self.initialize_wifi(*fast_params)
+                    self.wifi_connect_ms = yield self.STATIC_WIFI_FAST_CONNECT_TIMEOUT  # noqa: E501
+                    connected = True
+                    self.log_message(f"Wi-Fi fast connect in {self.wifi_connect_ms} ms",  # noqa: E501
+                                     LogLevel.INFO)
+                except (RuntimeError, OSError) as e:
+                    # stale cached parameters can fail to associate or be
+                    # refused by the driver
+                    self.log_message(f"Wi-Fi fast connect failed, using a full connect {repr(e)}",  # noqa: E501
+                                     LogLevel.INFO)
+                    self.wifi_cache.forget_link()
+                    self.wifi.disconnect()
+
+            if not connected:
+                self.initialize_wifi(None, self.WIFI_STATIC_IP or None)
+                self.wifi_connect_ms = yield self.STATIC_WIFI_CONNECT_TIMEOUT  # noqa: E501
+                self.log_message(f"Wi-Fi full connect in {self.wifi_connect_ms} ms",  # noqa: E501
+                                 LogLevel.INFO)
+                if self.WIFI_FAST_CONNECT:
+                    self.remember_wifi_link()
+
+            self.sync_network_time_if_needed()
+            self.wifi_cache.save()
 
     def main(self):
         self.wifi = network.WLAN(network.STA_IF)
-        self.connect_to_wifi()
-        self.initialize_broker()
+        if getattr(self, 'ASYNC_RUNTIME', False):
+            self.main_async()
 
-        # Main Sensor Node execution
+        # Main Sensor Node execution, the broker is initialized by the
+        # first connect_to_network() that brings Wi-Fi up
         while True:
             try:
                 self.initialize_sensors()  # noqa: E501 ensure sensors are ready for reading
-                self.connect_broker()      # noqa: E501 ensure that the broker client is ready for posting
                 while True:
-                    # Connect to Wi-Fi if not connected
-                    self.connect_to_wifi()
+                    # Connect to Wi-Fi and the broker if not connected
+                    self.connect_to_network()
 
                     self.execute_sensor_reading()
+                    self.cycle += 1
+                    if self.metrics is not None:
+                        self.publish_metrics()
                     self.cycle_makerverse_nano_hat()
 
-                    self.log_message(f"Sleeping {self.STATIC_NODE_SENSE_REPEAT_DELAY} seconds.",  # noqa: E501
-                                     LogLevel.INFO)
-                    time.sleep(self.STATIC_NODE_SENSE_REPEAT_DELAY)
+                    self.sleep_until_next_cycle()
 
             except Exception as e:
                 # sys.print_exception(e)  # Print basic exception information
                 exception_details = f"{self.__class__.__name__}.main() {repr(e)}"  # noqa: E501
                 self.log_message(exception_details, LogLevel.ERROR)
+                if self.metrics is not None:
+                    self.metrics.error("main")
 
             self.log_message(f"{self.__class__.__name__}.Main() Sleeping on exception recovery", LogLevel.INFO)  # noqa: E501
-            time.sleep(self.STATIC_NODE_SENSE_REPEAT_DELAY)
+            self.sleep(self.STATIC_NODE_SENSE_REPEAT_DELAY)
         #         self.log_message("Main method of UPicoWSensorNode called")
+
+    def main_async(self):
+        # Sensing, publishing, link supervision and log flushing as
+        # cooperative tasks, see UAsyncNodeRuntime. Sleeps between cycles
+        # are the event loop's idle time so SLEEP_MODE does not apply.
+        from lib.inboxidau.async_node_runtime import UAsyncNodeRuntime
+        if self.SLEEP_MODE != USleepScheduler.BUSY:
+            self.log_message(f"SLEEP_MODE {self.SLEEP_MODE} is not used by the async runtime",  # noqa: E501
+                             LogLevel.INFO)
+        self.initialize_broker()
+        while True:
+            try:
+                UAsyncNodeRuntime(self, self.ASYNC_QUEUE_SIZE,
+                                  self.ASYNC_QUEUE_DROP_OLDEST).run()
+            except Exception as e:
+                self.log_message(f"{self.__class__.__name__}.main_async() {repr(e)}",  # noqa: E501
+                                 LogLevel.ERROR)
+            time.sleep(self.STATIC_NODE_RESTART_DELAY)
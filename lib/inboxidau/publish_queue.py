@@ -0,0 +1,217 @@
+import os
+import struct
+
+
+class PublishQueueException(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class UFlashPublishQueue:
+
+    # Store-and-forward publish queue
+    # How it works: Publishes that cannot be delivered are appended to a
+    # fixed-size ring file on flash as (timestamp, retain, topic, payload)
+    # records. A record takes as many consecutive slots as it needs, so a
+    # diagnostics message or a burst chunk queues like a single reading;
+    # when the ring is full whole records are dropped. The file is created
+    # at its full size, so it never grows, and the head, record count and
+    # slots used are kept in a small header so pending records survive a
+    # reboot or a HAT power down. Only one record is ever held in RAM.
+
+    # Usage:
+    # queue = UFlashPublishQueue("publish_queue.dat", slots=64, slot_size=128)
+    # queue.append(topic, payload, time.time(), retain=False)
+    # queue.drain(lambda topic, payload, timestamp, retain: client.publish(topic, payload, retain))  # noqa: E501
+
+    # File layout, all little endian
+    #   header: magic, slots, slot_size, head, count, used, dropped
+    #   record: timestamp, flags, topic length, payload length, topic,
+    #           payload, continued in the following slots
+    HEADER_FORMAT = "<4sHHHHHI"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    RECORD_FORMAT = "<IBBH"
+    RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+    MAGIC = b"UPQ2"
+    FLAG_RETAIN = 0x01
+
+    # The header is rewritten after this many drained records, a power loss
+    # mid-drain re-sends at most this many records (at-least-once delivery)
+    STATIC_DRAIN_HEADER_INTERVAL = 8
+
+    def __init__(self, file_path, slots=64, slot_size=128, drop_oldest=True):
+        if slots < 1:
+            raise ValueError("slots must be greater than zero.")
+        if slot_size <= self.RECORD_SIZE:
+            raise ValueError(f"slot_size must be greater than {self.RECORD_SIZE}.")  # noqa: E501
+        self.file_path = file_path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.drop_oldest = drop_oldest
+        self.head = 0
+        self.count = 0
+        self.used = 0  # slots taken by the count records
+        self.dropped = 0
+        self._slot = bytearray(slot_size)  # the single slot buffer
+        self._open_or_create()
+
+    def __len__(self):
+        return self.count
+
+    def span(self, topic_len, payload_len):
+        # slots taken by a record
+        return (self.RECORD_SIZE + topic_len + payload_len +
+                self.slot_size - 1) // self.slot_size
+
+    def append(self, topic, payload, timestamp, retain=False):
+        # Queue a record, returns False if it was dropped because the queue
+        # is full and drop_oldest is False
+        topic = topic.encode() if isinstance(topic, str) else topic
+        payload = payload.encode() if isinstance(payload, str) else payload
+        span = self.span(len(topic), len(payload))
+        if len(topic) > 255 or len(payload) > 0xFFFF or span > self.slots:
+            raise PublishQueueException(
+                f"record for {topic} does not fit in {self.slots} slots of {self.slot_size} bytes")  # noqa: E501
+
+        with open(self.file_path, 'r+b') as file:
+            if self.used + span > self.slots:
+                if not self.drop_oldest:
+                    self.dropped += 1
+                    self._write_header(file)
+                    return False
+                while self.used + span > self.slots:
+                    self._drop_head(file)
+
+            tail = (self.head + self.used) % self.slots
+            record = struct.pack(self.RECORD_FORMAT, int(timestamp),
+                                 self.FLAG_RETAIN if retain else 0,
+                                 len(topic), len(payload))
+            file.seek(self._slot_offset(tail))
+            if tail + span <= self.slots:
+                file.write(record)
+                file.write(topic)
+                file.write(payload)
+            else:
+                # wraps round to the first slot
+                record = record + topic + payload
+                split = (self.slots - tail) * self.slot_size
+                file.write(record[:split])
+                file.seek(self._slot_offset(0))
+                file.write(record[split:])
+            self.count += 1
+            self.used += span
+            self._write_header(file)
+        return True
+
+    def drain(self, publish, max_records=None):
+        # Publish queued records oldest first via publish(topic, payload,
+        # timestamp, retain), stopping at the first failure. Returns the
+        # number of records sent, the failing record stays at the head of
+        # the queue.
+        sent = 0
+        if self.count == 0:
+            return sent
+        with open(self.file_path, 'r+b') as file:
+            try:
+                while self.count > 0 and \
+                        (max_records is None or sent < max_records):
+                    timestamp, flags, topic, payload, span = \
+                        self._read_head(file)
+
+                    publish(topic, payload, timestamp,
+                            bool(flags & self.FLAG_RETAIN))
+
+                    self._pop_head(span)
+                    sent += 1
+                    if sent % self.STATIC_DRAIN_HEADER_INTERVAL == 0:
+                        self._write_header(file)
+            finally:
+                self._write_header(file)
+        return sent
+
+    def _read_head(self, file):
+        # (timestamp, flags, topic, payload, span) of the oldest record
+        file.seek(self._slot_offset(self.head))
+        file.readinto(self._slot)
+        timestamp, flags, topic_len, payload_len = struct.unpack_from(
+            self.RECORD_FORMAT, self._slot, 0)
+        span = self.span(topic_len, payload_len)
+        record = self._slot
+        if span > 1:
+            record = bytearray(span * self.slot_size)
+            record[:self.slot_size] = self._slot
+            view = memoryview(record)
+            first = min(span, self.slots - self.head) * self.slot_size
+            file.readinto(view[self.slot_size:first])
+            if first < len(record):
+                file.seek(self._slot_offset(0))
+                file.readinto(view[first:])
+        start = self.RECORD_SIZE
+        topic = bytes(record[start:start + topic_len])
+        start += topic_len
+        payload = bytes(record[start:start + payload_len])
+        return timestamp, flags, topic, payload, span
+
+    def _drop_head(self, file):
+        file.seek(self._slot_offset(self.head))
+        file.readinto(self._slot)
+        _, _, topic_len, payload_len = struct.unpack_from(
+            self.RECORD_FORMAT, self._slot, 0)
+        self._pop_head(self.span(topic_len, payload_len))
+        self.dropped += 1
+
+    def _pop_head(self, span):
+        self.head = (self.head + span) % self.slots
+        self.count -= 1
+        self.used -= span
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.used = 0
+        with open(self.file_path, 'r+b') as file:
+            self._write_header(file)
+
+    def _slot_offset(self, slot):
+        return self.HEADER_SIZE + slot * self.slot_size
+
+    def _open_or_create(self):
+        try:
+            with open(self.file_path, 'rb') as file:
+                header = file.read(self.HEADER_SIZE)
+            magic, slots, slot_size, head, count, used, dropped = \
+                struct.unpack(self.HEADER_FORMAT, header)
+            if magic == self.MAGIC and slots == self.slots and \
+                    slot_size == self.slot_size and head < slots and \
+                    count <= used <= slots:
+                self.head = head
+                self.count = count
+                self.used = used
+                self.dropped = dropped
+                return
+        except Exception:
+            pass
+        # missing, corrupt or resized queue, start again
+        self._create()
+
+    def _create(self):
+        try:
+            os.remove(self.file_path)
+        except OSError:
+            pass
+        with open(self.file_path, 'wb') as file:
+            self._write_header(file)
+            for _ in range(self.slots):
+                file.write(self._slot)  # zero filled, fixes the file size
+
+    def _write_header(self, file=None):
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC, self.slots,
+                             self.slot_size, self.head, self.count,
+                             self.used, self.dropped)
+        if file is None:
+            with open(self.file_path, 'r+b') as file:
+                file.write(header)
+        else:
+            file.seek(0)
+            file.write(header)
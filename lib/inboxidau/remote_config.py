@@ -0,0 +1,134 @@
+from lib.inboxidau.rolling_appender_log import LogLevel  # type: ignore
+import os
+try:
+    import ujson as json  # type: ignore
+except ImportError:
+    import json
+
+
+class URemoteConfig:
+
+    # Remote configuration
+    # How it works: The node subscribes to its config topic each time the
+    # MQTT session connects. A message is a JSON object of config keys to
+    # new values, with an optional "id" echoed in the acknowledgement. The
+    # values are checked against the node's UConfigSchema, a message with
+    # any unknown key or invalid value is rejected as a whole. Keys whose
+    # value actually changes are applied to the running node and handed to
+    # node.on_config_changed(). Only once that rebuild succeeds are they
+    # written into the config file through a temporary file and a rename,
+    # so a power loss leaves either the old or the new file. A failed
+    # rebuild or write puts the old values back and rebuilds from them, so
+    # the node and its file stay in step. The next boot recompiles the
+    # config snapshot. Every
+    # message is answered on the ack topic with the keys applied and those
+    # that only take effect after a restart, or the error. A retained
+    # config message re-delivered on reconnect changes nothing and does
+    # not rewrite the file.
+
+    # Usage:
+    # remote = URemoteConfig(node, "e661.../config", "e661.../config/ack")
+    # client.set_callback(remote.on_message)
+    # remote.subscribe(client)  # on every connect
+    # client.check_msg()  # delivers to on_message
+
+    def __init__(self, node, topic, ack_topic):
+        self.node = node
+        self.topic = topic
+        self.ack_topic = ack_topic
+        self._topic = topic.encode()
+        # counters
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+
+    def subscribe(self, client):
+        client.subscribe(self.topic)
+
+    def on_message(self, topic, msg):
+        # umqtt callback, topic and msg are bytes
+        if topic != self._topic:
+            return
+        self.received += 1
+        ack = self.update(msg)
+        try:
+            self.node.publish(self.ack_topic,
+                              json.dumps(ack, separators=(',', ':')))
+        except Exception as e:
+            self.node.log_message(f"{self.__class__.__name__}.on_message() ack {repr(e)}",  # noqa: E501
+                                  LogLevel.ERROR)
+
+    def update(self, msg):
+        # Apply one config message, returns the acknowledgement
+        request_id = None
+        try:
+            delta = json.loads(msg)
+            if not isinstance(delta, dict):
+                raise ValueError("config message should be an object")
+            request_id = delta.pop("id", None)
+            schema = self.node.config_schema
+            values = schema.validate(delta)
+            if schema.unknown:
+                raise ValueError("unknown config keys: " + ", ".join(schema.unknown))  # noqa: E501
+            config = self.node.config
+            changed = dict((key, value) for key, value in values.items()
+                           if key not in config or config[key] != value)
+            restart = []
+            if changed:
+                # attributes of keys missing from the file hold defaults
+                previous = dict((key, getattr(self.node, key))
+                                for key in changed)
+                missing = [key for key in changed if key not in config]
+                config.update(changed)
+                for key, value in changed.items():
+                    setattr(self.node, key, value)
+                try:
+                    restart = self.node.on_config_changed(sorted(changed))
+                    self.persist(changed)
+                except Exception:
+                    self.roll_back(previous, missing)
+                    raise
+                self.applied += 1
+        except Exception as e:
+            self.rejected += 1
+            self.node.log_message(f"{self.__class__.__name__} rejected config {repr(e)}",  # noqa: E501
+                                  LogLevel.ERROR)
+            return {"id": request_id, "ok": False, "error": str(e)}
+        self.node.log_message(f"{self.__class__.__name__} applied {sorted(changed)}",  # noqa: E501
+                              LogLevel.INFO)
+        return {"id": request_id, "ok": True, "applied": sorted(changed),
+                "restart": restart}
+
+    def roll_back(self, previous, missing):
+        # Restores the values from before a failed update and rebuilds
+        # from them
+        config = self.node.config
+        for key, value in previous.items():
+            setattr(self.node, key, value)
+            if key in missing:
+                del config[key]
+            else:
+                config[key] = value
+        try:
+            self.node.on_config_changed(sorted(previous))
+        except Exception as e:
+            self.node.log_message(f"{self.__class__.__name__}.roll_back() {repr(e)}",  # noqa: E501
+                                  LogLevel.ERROR)
+
+    def persist(self, changed):
+        # Write changed into the config file, atomically where the
+        # filesystem renames over an existing file (littlefs does)
+        path = self.node.config_path
+        with open(path, 'r') as file:
+            data = json.load(file)
+        data.update(changed)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(data, file)
+        try:
+            os.rename(temp_path, path)
+        except OSError as e:
+            if e.args[0] != 17:  # EEXIST, FAT will not rename over a file
+                raise
+            os.remove(path)
+            os.rename(temp_path, path)
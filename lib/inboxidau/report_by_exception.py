@@ -0,0 +1,80 @@
+from lib.inboxidau import clock
+
+
+class UReportByException:
+
+    # Report by exception
+    # How it works: Remembers the last value reported on each channel and
+    # only reports a new value when it has moved further than the channel's
+    # deadband, when the channel has been silent for heartbeat_s seconds, or
+    # when the caller forces it (e.g. an occupancy change). Values that are
+    # not numbers, and booleans, are reported whenever they change.
+    # save_state() and restore_state() carry the last values across a
+    # reboot, with the report times in epoch seconds as ticks_ms restarts.
+
+    # Usage:
+    # rbe = UReportByException({"distance": 50}, heartbeat_s=900)
+    # if rbe.should_report("distance", value):
+    #     publish(...)
+    #     rbe.mark_reported("distance", value)
+    # state = rbe.save_state(time.time())  # before power down
+    # rbe.restore_state(state, time.time())  # after the next boot
+
+    def __init__(self, deadbands=None, heartbeat_s=900, default_deadband=0):
+        self.deadbands = deadbands or {}
+        self.default_deadband = default_deadband
+        self.heartbeat_ms = int(heartbeat_s * 1000)
+        self.last_value = {}
+        self.last_reported_ms = {}
+        self.dirty = False  # reported since the state was last saved
+        # counters
+        self.reported = 0
+        self.suppressed = 0
+
+    def should_report(self, channel, value, force=False):
+        if force or channel not in self.last_value:
+            return True
+        silent_ms = clock.ticks_diff(clock.ticks_ms(),
+                                     self.last_reported_ms[channel])
+        if silent_ms >= self.heartbeat_ms:
+            return True
+        last = self.last_value[channel]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            changed = value != last
+        else:
+            deadband = self.deadbands.get(channel, self.default_deadband)
+            changed = abs(value - last) > deadband
+        if not changed:
+            self.suppressed += 1
+        return changed
+
+    def mark_reported(self, channel, value):
+        self.last_value[channel] = value
+        self.last_reported_ms[channel] = clock.ticks_ms()
+        self.reported += 1
+        self.dirty = True
+
+    def save_state(self, now_s):
+        # {channel: [value, epoch seconds reported]}, now_s is the time now
+        now = clock.ticks_ms()
+        self.dirty = False
+        return dict((channel, [value, now_s - clock.ticks_diff(now, self.last_reported_ms[channel]) // 1000])  # noqa: E501
+                    for channel, value in self.last_value.items())
+
+    def restore_state(self, state, now_s):
+        # Channels whose heartbeat has not expired by now_s are restored
+        now = clock.ticks_ms()
+        for channel, (value, reported_s) in state.items():
+            silent_ms = (now_s - reported_s) * 1000
+            if 0 <= silent_ms < self.heartbeat_ms:
+                self.last_value[channel] = value
+                self.last_reported_ms[channel] = clock.ticks_add(now, -silent_ms)  # noqa: E501
+
+    def forget(self, channel=None):
+        # The next value on the channel, or every channel, is reported
+        if channel is None:
+            self.last_value = {}
+            self.last_reported_ms = {}
+        elif channel in self.last_value:
+            del self.last_value[channel]
+            del self.last_reported_ms[channel]
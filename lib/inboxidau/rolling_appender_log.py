@@ -1,4 +1,5 @@
 import os
+import time
 
 
 class LogLevel:
@@ -7,6 +8,21 @@ class LogLevel:
     INFO = 3
 
 
+# Levels written for each log_level, ERROR is always written
+_ENABLED_LEVELS = {
+    LogLevel.ERROR: (LogLevel.ERROR,),
+    LogLevel.INFO: (LogLevel.ERROR, LogLevel.INFO),
+    LogLevel.DEBUG: (LogLevel.ERROR, LogLevel.DEBUG, LogLevel.INFO)
+}
+
+# The text between the TID and the message for each level
+_PREFIXES = {
+    LogLevel.INFO: "-INFO-",
+    LogLevel.DEBUG: "-DEBUG-",
+    LogLevel.ERROR: "-ERROR-"
+}
+
+
 class LogOperationException(Exception):
     def __init__(self, message):
         self.message = message
@@ -14,65 +30,211 @@ class LogOperationException(Exception):
 
 
 class URollingAppenderLog:
+
+    ROTATION_SHIFT = "shift"
+    ROTATION_CIRCULAR = "circular"
+
     def __init__(self, log_file, max_file_size_bytes=4 * 20,
-                 max_backups=5, print_messages=False, log_level=LogLevel.INFO):
+                 max_backups=5, print_messages=False, log_level=LogLevel.INFO,
+                 buffer_size=0, buffer_max_bytes=1024, flush_interval_s=60,
+                 rotation=ROTATION_SHIFT):
         # if log_level is set to LogLevel.DEBUG then the class will emit
         #  its own debug information as "CONSOLE:" only to stdout
+        #
+        # buffer_size > 0 enables the buffered mode, messages are held in a
+        # bounded in-memory buffer of buffer_size slots and written to the
+        # log file in a single write when the buffer is full, when it holds
+        # more than buffer_max_bytes, when flush_interval_s has passed since
+        # the last flush, when an ERROR is logged or when flush() is called.
+        # A flush that fails keeps the messages for the next one, once the
+        # buffer is full the oldest message is dropped for each new one and
+        # counted in dropped_messages.
+        #
+        # rotation chooses how backups are numbered when the log rolls over
+        #   shift    - log_file.1 is always the newest backup, every backup
+        #              is renamed up one index on each rollover
+        #   circular - backups are slots log_file.1 to log_file.<max_backups>
+        #              and a rollover overwrites the oldest slot, a constant
+        #              number of file operations whatever max_backups is. The
+        #              last slot written is kept in the sidecar file
+        #              log_file.idx, backups() lists them newest first.
+        # The directory is scanned once, the first time the log is written,
+        # after that the file size and the backups are tracked in memory.
         if max_backups < 0:
             raise ValueError("max_backups must be greater than or equal to zero.")  # noqa: E501
+        if buffer_size < 0:
+            raise ValueError("buffer_size must be greater than or equal to zero.")  # noqa: E501
+        if rotation not in (self.ROTATION_SHIFT, self.ROTATION_CIRCULAR):
+            raise ValueError(f"unknown rotation {rotation}")
         self.log_file = log_file
         self.max_file_size_bytes = max_file_size_bytes
         self.max_backups = max_backups
         self.print_messages = print_messages
         self.log_level = log_level
+        self.rotation = rotation
+        self.existing_backups = []
+        self._index_file = f"{log_file}.idx"
+        self._last_slot = 0  # circular rotation, the newest backup slot
+
+        self.buffer_size = buffer_size
+        self.buffer_max_bytes = buffer_max_bytes
+        self.flush_interval_s = flush_interval_s
+        self._buffer = [None] * buffer_size  # preallocated message slots
+        self._buffer_head = 0  # slot of the oldest message
+        self._buffer_count = 0
+        self._buffer_bytes = 0
+        self._last_flush = time.time()
+        self.dropped_messages = 0
+        # size of the log file on flash, None until the first write stats
+        # the file, afterwards it is maintained as a counter
+        self._log_file_size = None
+
+    @property
+    def log_level(self):
+        return self._log_level
+
+    @log_level.setter
+    def log_level(self, log_level):
+        self._log_level = log_level
+        self._enabled_levels = _ENABLED_LEVELS.get(log_level,
+                                                   (LogLevel.ERROR,))
+
+    def is_enabled(self, level):
+        # True when messages of this level are written, callers can check
+        # this before building an expensive message
+        return level in self._enabled_levels
+
+    def log_format(self, level, fmt, *args):
+        # Lazy log_message, fmt.format(*args) only runs when the level is
+        # enabled
+        if level in self._enabled_levels:
+            self.log_message(fmt.format(*args), level)
 
     def log_message(self, message, level=LogLevel.INFO, tid="0000-00-00T00:00:00Z"):  # noqa: E501
-        display_message = False
+        if level not in self._enabled_levels:
+            return
 
-        prefix_mapping = {
-            LogLevel.INFO: "INFO",
-            LogLevel.DEBUG: "DEBUG",
-            LogLevel.ERROR: "ERROR"
-        }
+        message = f"TID:{tid}{_PREFIXES[level]}{message}"
 
-        prefix = prefix_mapping.get(level, "UNKNOWN")
+        if self.print_messages is True:
+            print(message)
 
-        if level == LogLevel.ERROR or \
-            (self.log_level == LogLevel.INFO and level == LogLevel.INFO) or \
-                (self.log_level == LogLevel.DEBUG and
-                 level in (LogLevel.DEBUG, LogLevel.INFO)):
-            display_message = True
-        else:
-            display_message = False
+        if self.buffer_size > 0:
+            self._buffer_message(message, level)
+            return
 
-        message = f"TID:{tid}-{prefix}-{message}"
+        try:
+            self._append(message + '\n')
+        except OSError as e:
+            error_message = f"Error during log_message() {e}"
+            self._print_console_message(error_message)
+            raise LogOperationException(error_message)
+
+    def flush(self):
+        # Write all buffered messages to the log file in a single write.
+        # Safe to call when unbuffered or when the buffer is empty.
+        if self._buffer_count == 0:
+            return
 
-        if display_message is True:
-            if self.print_messages is True:
-                print(message)
+        end = self._buffer_head + self._buffer_count
+        if end <= self.buffer_size:
+            data = "".join(self._buffer[self._buffer_head:end])
+        else:
+            # the messages wrap around the end of the slots
+            data = "".join(self._buffer[self._buffer_head:]) + \
+                "".join(self._buffer[:end - self.buffer_size])
+        try:
+            self._append(data)
+        except OSError as e:
+            # the messages stay buffered for the next flush
+            error_message = f"Error during flush() {e}"
+            self._print_console_message(error_message)
+            raise LogOperationException(error_message)
+        self._clear_buffer()
 
-            self.existing_backups = [f for f in os.listdir() if f.startswith(f"{self.log_file}.")]  # noqa: E501
+    def _append(self, data):
+        # Roll over when the file is over size, then append data in a
+        # single write
+        if self._log_file_size is None:
+            self._initialise_file_state()
 
-            # Check if the log file exists and if its size exceeds the limit
-            if self.log_file in os.listdir():
-                log_file_size = os.stat(self.log_file)[6]    # noqa: E501 Index 6 corresponds to the size in the os.stat result
-                if log_file_size > self.max_file_size_bytes:
-                    # Roll over backups if the maximum number is reached
+        if self._log_file_size > self.max_file_size_bytes:
+            if self.max_backups == 0:
+                # Without backups the log file is kept as it is and only
+                # backups left by an earlier configuration are deleted
+                if self.existing_backups:
                     self.roll_over_backups()
+            else:
+                # Roll over backups if the maximum number is reached
+                self.roll_over_backups()
+                self._log_file_size = 0
+
+        with open(self.log_file, 'a') as file:
+            file.write(data)
+        self._log_file_size += len(data.encode())  # bytes, not characters
+
+    def _buffer_message(self, message, level):
+        line = message + '\n'
+        if self._buffer_count >= self.buffer_size:
+            self._drop_oldest()  # a failed flush left the buffer full
+        slot = (self._buffer_head + self._buffer_count) % self.buffer_size
+        self._buffer[slot] = line
+        self._buffer_count += 1
+        self._buffer_bytes += len(line.encode())
+
+        if level == LogLevel.ERROR or \
+            self._buffer_count >= self.buffer_size or \
+                self._buffer_bytes >= self.buffer_max_bytes or \
+                time.time() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def _drop_oldest(self):
+        # The slots are a ring, dropping the oldest message only moves the
+        # head
+        self._buffer_bytes -= len(self._buffer[self._buffer_head].encode())
+        self._buffer[self._buffer_head] = None
+        self._buffer_head = (self._buffer_head + 1) % self.buffer_size
+        self._buffer_count -= 1
+        self.dropped_messages += 1
+
+    def _clear_buffer(self):
+        for index in range(self.buffer_size):
+            self._buffer[index] = None
+        self._buffer_head = 0
+        self._buffer_count = 0
+        self._buffer_bytes = 0
+        self._last_flush = time.time()
 
-            try:
-                # Open the log file in append mode and write the message
-                with open(self.log_file, 'a') as file:
-                    file.write(message + '\n')
-            except OSError as e:
-                error_message = f"Error during log_message() {e}"
-                self._print_console_message(error_message)
-                raise LogOperationException(error_message)
+    def _initialise_file_state(self):
+        # The only directory scan and stat, after this the file size is
+        # tracked as a counter of bytes written and the backups in memory.
+        files = os.listdir()
+        backups = [f for f in files if f.startswith(f"{self.log_file}.") and f != self._index_file]  # noqa: E501
+        if self.log_file in files:
+            self._log_file_size = os.stat(self.log_file)[6]    # noqa: E501 Index 6 corresponds to the size in the os.stat result
+        else:
+            self._log_file_size = 0
+        if self.rotation == self.ROTATION_CIRCULAR:
+            self._load_last_slot(backups)
+            self.existing_backups = self._circular_backups(backups)
+        else:
+            self.existing_backups = backups
+
+    def backups(self):
+        # Backup file names, newest first
+        if self._log_file_size is None:
+            self._initialise_file_state()
+        if self.rotation == self.ROTATION_CIRCULAR:
+            return list(self.existing_backups)
+        return sorted(self.existing_backups,
+                      key=lambda x: int(x.split('.')[-1]))
 
     def roll_over_backups(self):
         try:
             if self.max_backups == 0:
                 self._delete_all_backups()
+            elif self.rotation == self.ROTATION_CIRCULAR:
+                self._overwrite_oldest_slot()
             else:
                 self._remove_extra_backups()
                 self._rename_existing_backups()
@@ -91,6 +253,56 @@ class URollingAppenderLog:
             os.remove(backup_file)
         self.existing_backups = []
 
+    # circular rotation
+
+    def _slot_name(self, slot):
+        return f"{self.log_file}.{slot}"
+
+    def _circular_backups(self, files):
+        # The slots present, newest first, counting back from the last slot
+        backups = []
+        slot = self._last_slot
+        for _ in range(self.max_backups):
+            if slot < 1:
+                slot = self.max_backups
+            if self._slot_name(slot) in files:
+                backups.append(self._slot_name(slot))
+            slot -= 1
+        return backups
+
+    def _load_last_slot(self, files):
+        try:
+            with open(self._index_file, 'r') as file:
+                self._last_slot = int(file.read())
+        except (OSError, ValueError):
+            # no sidecar, take the most recently modified slot as the newest
+            newest = None
+            self._last_slot = 0
+            for slot in range(1, self.max_backups + 1):
+                if self._slot_name(slot) in files:
+                    mtime = os.stat(self._slot_name(slot))[8]
+                    if newest is None or mtime > newest:
+                        newest = mtime
+                        self._last_slot = slot
+        if not 0 <= self._last_slot <= self.max_backups:
+            self._last_slot = 0
+
+    def _overwrite_oldest_slot(self):
+        # The log becomes the slot after the newest, which holds the oldest
+        # backup, then the sidecar records it
+        slot = self._last_slot % self.max_backups + 1
+        slot_name = self._slot_name(slot)
+        if slot_name in self.existing_backups:
+            self._print_console_message(f"remove {slot_name}")
+            os.remove(slot_name)
+            self.existing_backups.remove(slot_name)
+        self._print_console_message(f"rename {self.log_file} to {slot_name}")  # noqa: E501
+        os.rename(self.log_file, slot_name)
+        self.existing_backups.insert(0, slot_name)
+        with open(self._index_file, 'w') as file:
+            file.write(str(slot))
+        self._last_slot = slot
+
     def _remove_extra_backups(self):
         # Remove extra backups if the number exceeds max_backups
         while len(self.existing_backups) >= self.max_backups:
@@ -113,12 +325,14 @@ class URollingAppenderLog:
         os.rename(self.log_file, f"{self.log_file}.1")
 
     def _update_existing_backups_list(self):
-        # Adjust the list of existing backups after renaming
-        self.existing_backups = [f"{self.log_file}.{i}" for i in range(1, self._get_next_backup_index())]  # noqa: E501
+        # Adjust the list of existing backups after renaming, every backup
+        # moved up one index and the current log file became backup 1
+        self.existing_backups = [f"{self.log_file}.{i}" for i in range(1, self._get_next_backup_index() + 1)]  # noqa: E501
 
     def _handle_rotation_error(self, e):
         error_message = f"Error during backup rotation: {e}"
         self._print_console_message(error_message)
+        self._log_file_size = None  # rescan the directory on the next write
         raise LogOperationException(error_message)
 
     def _get_next_backup_index(self):
@@ -0,0 +1,136 @@
+import math
+
+
+class UWelfordStats:
+
+    # Streaming statistics
+    # How it works: Welford's algorithm keeps the count, mean and the sum of
+    # squared differences from the mean (m2) so the variance is available
+    # at any time in constant memory and without the cancellation of a sum
+    # of squares. Min and max are tracked alongside.
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def variance(self):
+        # population variance of the values added
+        if self.count < 2:
+            return 0.0
+        return self.m2 / self.count
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def summary(self):
+        return {"count": self.count, "min": self.min, "max": self.max,
+                "mean": self.mean, "stddev": self.stddev()}
+
+
+class URollupAggregator:
+
+    # Rollup aggregator
+    # How it works: Every reading is added to per-channel UWelfordStats.
+    # When window_s seconds have passed since the window started, close()
+    # turns the statistics into a rollup, {"start": t, "end": t, and per
+    # channel count, min, max, mean, stddev}, and starts the next window.
+    # Rollups wait in a history of up to history entries until they are
+    # marked sent, the oldest is dropped when it is full, so rollups made
+    # while offline are published once the node is back. save_state() and
+    # restore_state() carry the open window and the history across a HAT
+    # power down or deep sleep.
+
+    # Usage:
+    # rollup = URollupAggregator(900, history=8)
+    # rollup.add("tempC", 21.5, time.time())
+    # if rollup.window_elapsed(time.time()):
+    #     rollup.close(time.time())
+    # for each in rollup.pending(): publish, then rollup.mark_sent()
+
+    def __init__(self, window_s, history=8):
+        if window_s <= 0:
+            raise ValueError("window_s must be greater than zero")
+        if history < 1:
+            raise ValueError("history must be at least 1")
+        self.window_s = window_s
+        self.history = history
+        self.stats = {}
+        self.window_start = None
+        self._pending = []
+        self.dropped = 0
+
+    def add(self, channel, value, timestamp):
+        if self.window_start is None:
+            self.window_start = timestamp
+        stats = self.stats.get(channel)
+        if stats is None:
+            stats = self.stats[channel] = UWelfordStats()
+        stats.add(value)
+
+    def window_elapsed(self, timestamp):
+        return self.window_start is not None and \
+            timestamp - self.window_start >= self.window_s
+
+    def close(self, timestamp):
+        # Finish the window, returns its rollup or None when it was empty
+        rollup = None
+        if self.window_start is not None:
+            rollup = {"start": self.window_start, "end": timestamp}
+            for channel, stats in self.stats.items():
+                if stats.count:
+                    rollup[channel] = stats.summary()
+                stats.reset()
+            self.keep(rollup)
+        self.window_start = None
+        return rollup
+
+    def keep(self, rollup):
+        # add a closed rollup to the history, dropping the oldest when full
+        if len(self._pending) >= self.history:
+            self._pending.pop(0)
+            self.dropped += 1
+        self._pending.append(rollup)
+
+    def save_state(self):
+        # The open window and the pending rollups as JSON-able values
+        return {"start": self.window_start,
+                "stats": dict((channel, [stats.count, stats.mean, stats.m2,
+                                         stats.min, stats.max])
+                              for channel, stats in self.stats.items()
+                              if stats.count),
+                "pending": self._pending,
+                "dropped": self.dropped}
+
+    def restore_state(self, state):
+        self.window_start = state["start"]
+        for channel, values in state["stats"].items():
+            stats = self.stats[channel] = UWelfordStats()
+            stats.count, stats.mean, stats.m2, stats.min, stats.max = values
+        self.dropped = state["dropped"]
+        for rollup in state["pending"]:
+            self.keep(rollup)
+
+    def pending(self):
+        # rollups not yet sent, oldest first
+        return list(self._pending)
+
+    def mark_sent(self):
+        # the oldest pending rollup was published
+        if self._pending:
+            self._pending.pop(0)
@@ -0,0 +1,137 @@
+import os
+import struct
+
+
+class USensorDataLog:
+
+    # Binary sensor data log
+    # How it works: Each reading is appended as one fixed-width struct packed
+    # record, a timestamp followed by one value per channel. The file starts
+    # with a small schema header naming the channels and their struct type
+    # codes so that it can be decoded without knowing which node wrote it.
+    # When the file would exceed max_file_size_bytes it is rotated to
+    # file.1 .. file.<max_backups>.
+
+    # Usage:
+    # data_log = USensorDataLog("data.log", (("tempC", "f"), ("humRH", "f")))
+    # data_log.append(sensor_data, time.time())
+
+    # Header layout, all little endian
+    #   magic, record size, channel count
+    #   per channel: type code, name length, name
+    MAGIC = b"USD1"
+    HEADER_FORMAT = "<4sHB"
+    CHANNEL_FORMAT = "<BB"
+    TIMESTAMP_CODE = "I"
+
+    def __init__(self, file_path, channels, max_file_size_bytes=65536,
+                 max_backups=1):
+        if not channels:
+            raise ValueError("at least one channel is required.")
+        if max_backups < 0:
+            raise ValueError("max_backups must be greater than or equal to zero.")  # noqa: E501
+        self.file_path = file_path
+        self.channels = tuple(channels)
+        self.max_file_size_bytes = max_file_size_bytes
+        self.max_backups = max_backups
+
+        self.record_format = "<" + self.TIMESTAMP_CODE + \
+            "".join(code for _, code in self.channels)
+        self.record_size = struct.calcsize(self.record_format)
+        self.header = self.encode_header(self.channels)
+        self._record = bytearray(self.record_size)
+        self._values = [0] * (len(self.channels) + 1)
+        # size of the data file, None until the first append checks it
+        self._file_size = None
+
+    @classmethod
+    def encode_header(cls, channels):
+        record_format = "<" + cls.TIMESTAMP_CODE + \
+            "".join(code for _, code in channels)
+        header = struct.pack(cls.HEADER_FORMAT, cls.MAGIC,
+                             struct.calcsize(record_format), len(channels))
+        for name, code in channels:
+            name = name.encode()
+            header += struct.pack(cls.CHANNEL_FORMAT, ord(code),
+                                  len(name)) + name
+        return header
+
+    @classmethod
+    def read_header(cls, file):
+        # Returns (channels, record_format, header_size) from an open file
+        fixed = file.read(struct.calcsize(cls.HEADER_FORMAT))
+        magic, record_size, count = struct.unpack(cls.HEADER_FORMAT, fixed)
+        if magic != cls.MAGIC:
+            raise ValueError(f"not a sensor data log, magic {magic}")
+        header_size = len(fixed)
+        channels = []
+        for _ in range(count):
+            code, length = struct.unpack(
+                cls.CHANNEL_FORMAT,
+                file.read(struct.calcsize(cls.CHANNEL_FORMAT)))
+            name = file.read(length).decode()
+            channels.append((name, chr(code)))
+            header_size += struct.calcsize(cls.CHANNEL_FORMAT) + length
+        record_format = "<" + cls.TIMESTAMP_CODE + \
+            "".join(code for _, code in channels)
+        if struct.calcsize(record_format) != record_size:
+            raise ValueError("sensor data log header is corrupt")
+        return tuple(channels), record_format, header_size
+
+    def append(self, sensor_data, timestamp):
+        # Append one record, channels missing from sensor_data are written
+        # as zero
+        values = self._values
+        values[0] = int(timestamp)
+        for index, (name, code) in enumerate(self.channels):
+            value = sensor_data.get(name, 0)
+            values[index + 1] = value if code in "fd" else int(value)
+        struct.pack_into(self.record_format, self._record, 0, *values)
+
+        if self._file_size is None:
+            self._file_size = self._check_file()
+        if self._file_size + self.record_size > self.max_file_size_bytes:
+            self.rotate()
+
+        with open(self.file_path, 'ab') as file:
+            if self._file_size == 0:
+                file.write(self.header)
+                self._file_size = len(self.header)
+            file.write(self._record)
+        self._file_size += self.record_size
+
+    def rotate(self):
+        if self.max_backups == 0:
+            os.remove(self.file_path)
+        else:
+            try:
+                os.remove(f"{self.file_path}.{self.max_backups}")
+            except OSError:
+                pass  # fewer backups than max_backups so far
+            for index in range(self.max_backups - 1, 0, -1):
+                try:
+                    os.rename(f"{self.file_path}.{index}",
+                              f"{self.file_path}.{index + 1}")
+                except OSError:
+                    pass  # that backup does not exist yet
+            os.rename(self.file_path, f"{self.file_path}.1")
+        self._file_size = 0
+
+    def _check_file(self):
+        # Size of an existing data file with a matching header, an existing
+        # file written with a different schema is rotated out of the way
+        try:
+            size = os.stat(self.file_path)[6]
+        except OSError:
+            return 0
+        if size == 0:
+            return 0
+        try:
+            with open(self.file_path, 'rb') as file:
+                header = file.read(len(self.header))
+        except OSError:
+            header = b""
+        if header != self.header:
+            self.rotate()
+            return 0
+        return size
@@ -0,0 +1,207 @@
+from lib.inboxidau import clock  # type: ignore
+import heapq
+
+
+class USensorDriver:
+
+    # Sensor driver
+    # How it works: One sensor on a node composed from the "SENSORS" list in
+    # the config. Each entry names a driver TYPE and gives the driver its
+    # own sample PERIOD in seconds, TOPICS to publish each channel on, and
+    # optionally a FILTER (see create_filter) applied to every channel.
+    # A driver subclass opens the hardware in initialize() and returns a
+    # dict of channel values from read().
+
+    # Usage:
+    # {"TYPE": "bme280", "NAME": "atmos", "PERIOD": 60,
+    #  "TOPICS": {"tempC": "weatherstn/temperature"}}
+
+    TYPE = None
+    # (channel, struct type code) pairs, as SENSOR_DATA_CHANNELS
+    CHANNELS = ()
+    DEFAULT_PERIOD_S = 60
+
+    def __init__(self, node, config):
+        self.node = node
+        self.config = config
+        self.name = config.get("NAME", self.TYPE)
+        self.period_s = config.get("PERIOD", self.DEFAULT_PERIOD_S)
+        if self.period_s <= 0:
+            raise ValueError(f"sensor {self.name} PERIOD must be greater than zero")  # noqa: E501
+        self.topics = config.get("TOPICS", {})
+        self.filters = {}  # channel -> filter, created on first use
+        self.values = {}
+        # counters
+        self.samples = 0
+        self.errors = 0
+
+    def initialize(self):
+        return None
+
+    def read(self):
+        return {}
+
+    def filtered(self, channel, value):
+        # value passed through the channel's filter, when one is configured
+        if not self.config.get("FILTER"):
+            return value
+        sensor_filter = self.filters.get(channel)
+        if sensor_filter is None:
+            from lib.inboxidau.sensor_reading_filter import create_filter
+            sensor_filter = create_filter(
+                self.config["FILTER"], self.config.get("FILTER_WINDOW", 5),
+                **self.config.get("FILTER_OPTIONS", {}))
+            self.filters[channel] = sensor_filter
+        return sensor_filter.add_reading(value)
+
+    def sample(self):
+        # sliding window filters start again every sample, streaming
+        # filters keep their state
+        for sensor_filter in self.filters.values():
+            if not sensor_filter.STREAMING:
+                sensor_filter.reset()
+        self.values = self.read()
+        self.samples += 1
+        return self.values
+
+    def post(self, sensor_data):
+        # publishes this driver's <name>_<channel> values from sensor_data,
+        # which may be a reading queued by the async runtime
+        for channel, type_code in self.CHANNELS:
+            topic = self.topics.get(channel)
+            key = f"{self.name}_{channel}"
+            if topic and key in sensor_data:
+                self.node.publish_channel(key, topic, sensor_data[key],
+                                          type_code=type_code)
+
+
+class BME280Driver(USensorDriver):
+
+    # PiicoDev BME280 temperature, pressure and humidity
+
+    TYPE = "bme280"
+    CHANNELS = (("tempC", "f"), ("pres_hPa", "f"), ("humRH", "f"))
+    DEFAULT_PERIOD_S = 60
+
+    def initialize(self):
+        from lib.PiicoDev_BME280 import PiicoDev_BME280  # type: ignore
+        self.sensor = PiicoDev_BME280()
+
+    def read(self):
+        tempC, presPa, humRH = self.sensor.values()
+        return {"tempC": self.filtered("tempC", tempC),
+                "pres_hPa": self.filtered("pres_hPa", presPa / 100),
+                "humRH": self.filtered("humRH", humRH)}
+
+
+class VL53L1XDriver(USensorDriver):
+
+    # PiicoDev VL53L1X distance in mm, READINGS readings are filtered per
+    # sample. With OCCUPANCY_DISTANCE set, occupancy is reported as the
+    # filtered distance being closer than it, debounced over
+    # OCCUPANCY_SAMPLES samples with an OCCUPANCY_HYSTERESIS band either
+    # side and OCCUPANCY_MIN_DWELL seconds between changes.
+
+    TYPE = "vl53l1x"
+    CHANNELS = (("distance", "f"), ("occupancy", "B"))
+    DEFAULT_PERIOD_S = 5
+
+    def __init__(self, node, config):
+        super().__init__(node, config)
+        self.readings = config.get("READINGS", 1)
+        if self.readings < 1:
+            raise ValueError(f"sensor {self.name} READINGS must be at least 1")  # noqa: E501
+
+    def initialize(self):
+        from lib.PiicoDev_VL53L1X import PiicoDev_VL53L1X  # type: ignore
+        self.sensor = PiicoDev_VL53L1X()
+        self.occupancy = None
+        occupancy_distance = self.config.get("OCCUPANCY_DISTANCE")
+        if occupancy_distance is not None:
+            from lib.inboxidau.hysteresis_debouncer import UHysteresisDebouncer  # noqa: E501
+            hysteresis = self.config.get("OCCUPANCY_HYSTERESIS", 0)
+            self.occupancy = UHysteresisDebouncer(
+                occupancy_distance - hysteresis,
+                occupancy_distance + hysteresis,
+                self.config.get("OCCUPANCY_SAMPLES", 1),
+                self.config.get("OCCUPANCY_MIN_DWELL", 0))
+
+    def read(self):
+        for _ in range(self.readings):
+            distance = self.filtered("distance", self.sensor.read())
+        values = {"distance": distance}
+        if self.occupancy is not None:
+            self.occupancy.update(distance)
+            if self.occupancy.state is not None:
+                values["occupancy"] = self.occupancy.state
+        return values
+
+
+SENSOR_DRIVERS = {}
+
+
+def register_driver(driver_class):
+    # Make a driver available to the "SENSORS" config by its TYPE
+    SENSOR_DRIVERS[driver_class.TYPE] = driver_class
+    return driver_class
+
+
+register_driver(BME280Driver)
+register_driver(VL53L1XDriver)
+
+
+def create_driver(node, config):
+    driver_class = SENSOR_DRIVERS.get(config.get("TYPE"))
+    if driver_class is None:
+        raise ValueError(f"unknown sensor type {config.get('TYPE')}")
+    return driver_class(node, config)
+
+
+class USensorScheduler:
+
+    # Sensor scheduler
+    # How it works: A min-heap of (next due time, driver index) so that each
+    # driver is sampled on its own period and the node sleeps until the
+    # earliest one is due. Due times are absolute, a late sample does not
+    # shift the ones after it, and a driver more than a period behind skips
+    # the samples it missed. Times are milliseconds since the scheduler
+    # started, accumulated from ticks so they do not wrap.
+
+    # Usage:
+    # scheduler = USensorScheduler(drivers)
+    # for driver in scheduler.due(): driver.sample()
+    # sleep(scheduler.next_due_s())
+
+    def __init__(self, drivers):
+        self.drivers = drivers
+        self._last_ticks = clock.ticks_ms()
+        self._now_ms = 0
+        # every driver is due straight away
+        self.heap = [(0, index) for index in range(len(drivers))]
+        heapq.heapify(self.heap)
+
+    def now_ms(self):
+        ticks = clock.ticks_ms()
+        self._now_ms += clock.ticks_diff(ticks, self._last_ticks)
+        self._last_ticks = ticks
+        return self._now_ms
+
+    def due(self):
+        # The drivers due now, earliest first, each rescheduled a period on
+        now = self.now_ms()
+        drivers = []
+        while self.heap and self.heap[0][0] <= now:
+            due_ms, index = heapq.heappop(self.heap)
+            driver = self.drivers[index]
+            drivers.append(driver)
+            period_ms = int(driver.period_s * 1000)
+            due_ms += period_ms
+            if due_ms <= now:
+                due_ms = now + period_ms
+            heapq.heappush(self.heap, (due_ms, index))
+        return drivers
+
+    def next_due_s(self):
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - self.now_ms()) / 1000
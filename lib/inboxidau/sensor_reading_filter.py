@@ -1,3 +1,91 @@
+def _bisect_left(values, count, value):
+    # Index of the first of the first count sorted values that is >= value
+    low = 0
+    high = count
+    while low < high:
+        middle = (low + high) >> 1
+        if values[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class SlidingWindow:
+
+    # Sliding Window
+    # How it works: Keeps the last window_size readings in a preallocated
+    # circular buffer, a second preallocated list holding the same readings
+    # in sorted order, and a running sum. A new reading replaces the oldest
+    # one in both lists in place, so adding a reading allocates nothing.
+    # The sorted list is searched by bisection and only the entries between
+    # the old and new value are shifted.
+
+    # Usage:
+    # window = SlidingWindow(5)
+    # window.add(value)
+    # window.sorted[0], window.sorted[window.count - 1], window.total
+
+    def __init__(self, window_size=5):
+        if window_size < 1:
+            raise ValueError("window_size must be greater than zero.")
+        self.window_size = window_size
+        self.buffer = [0] * window_size  # readings in arrival order
+        self.sorted = [0] * window_size  # the first count entries are sorted
+        self.head = 0                    # index of the oldest reading
+        self.count = 0
+        self.total = 0
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        values = self.sorted
+        if self.count < self.window_size:
+            self.buffer[(self.head + self.count) % self.window_size] = value
+            index = self.count
+            self.count += 1
+            self.total += value
+        else:
+            old = self.buffer[self.head]
+            self.buffer[self.head] = value
+            self.head = (self.head + 1) % self.window_size
+            self.total += value - old
+            if self.head == 0:
+                # resynchronise the running sum once per lap so floating
+                # point error cannot accumulate
+                total = 0
+                for reading in self.buffer:
+                    total += reading
+                self.total = total
+            # the slot of the old value is reused for the new one
+            index = _bisect_left(values, self.count, old)
+            if value > old:
+                while index + 1 < self.count and values[index + 1] < value:
+                    values[index] = values[index + 1]
+                    index += 1
+                values[index] = value
+                return
+        while index > 0 and values[index - 1] > value:
+            values[index] = values[index - 1]
+            index -= 1
+        values[index] = value
+
+    def sum_sorted(self, start, stop):
+        # Sum of sorted[start:stop] without creating a slice
+        total = 0
+        for index in range(start, stop):
+            total += self.sorted[index]
+        return total
+
+    def readings(self):
+        # The readings in arrival order, allocates a new list
+        return [self.buffer[(self.head + index) % self.window_size]
+                for index in range(self.count)]
+
+
 class DiscardExtremesFilter:
 
     # Discard Extremes
@@ -10,24 +98,35 @@ class DiscardExtremesFilter:
     # filter = DiscardExtremesFilter(window_size=5)
     # filtered_value = filter.add_reading(sensor_value)
 
+    # Each reading costs one bisection and an in-place shift of the sorted
+    # window, the extremes are its first and last entries.
+
+    # Needs a full window of readings from the current cycle, nodes reset
+    # it before each set of readings
+    STREAMING = False
+
     def __init__(self, window_size=5):
-        self.window = []
+        self.sliding_window = SlidingWindow(window_size)
         self.window_size = window_size
 
+    @property
+    def window(self):
+        return self.sliding_window.readings()
+
     def reset(self):
         # Resets the filter to its initial empty state.
-        self.window = []
+        self.sliding_window.reset()
 
     def add_reading(self, value):
-        if len(self.window) >= self.window_size:
-            self.window.pop(0)
-        self.window.append(value)
+        window = self.sliding_window
+        window.add(value)
 
-        if len(self.window) > 2:  # Ensure we have enough data to discard
-            sorted_window = sorted(self.window)
+        count = window.count
+        if count > 2:  # Ensure we have enough data to discard
             # Remove highest and lowest, then calculate mean
-            trimmed_window = sorted_window[1:-1]
-            return sum(trimmed_window) / len(trimmed_window)
+            trimmed_total = window.total - window.sorted[0] - \
+                window.sorted[count - 1]
+            return trimmed_total / (count - 2)
         return value  # Return the value directly if not enough data
 
 
@@ -45,27 +144,344 @@ class TrimmedMeanFilter:
     # filter = TrimmedMeanFilter(window_size=5, trim_percent=0.1)
     # filtered_value = filter.add_reading(sensor_value)
 
+    # The running sum less the trimmed ends of the sorted window gives the
+    # trimmed sum, so only the 2 * trim_count trimmed values are summed.
+
+    # Needs a full window of readings from the current cycle, nodes reset
+    # it before each set of readings
+    STREAMING = False
+
     def __init__(self, window_size=5, trim_percent=0.1):
-        self.window = []
+        self.sliding_window = SlidingWindow(window_size)
         self.window_size = window_size
         self.trim_percent = trim_percent
 
+    @property
+    def window(self):
+        return self.sliding_window.readings()
+
     def reset(self):
         # Resets the filter to its initial empty state.
-        self.window = []
+        self.sliding_window.reset()
 
     def add_reading(self, value):
         # Maintain window of fixed size
-        if len(self.window) >= self.window_size:
-            self.window.pop(0)
-        self.window.append(value)
+        window = self.sliding_window
+        window.add(value)
 
         # Calculate trimmed mean if enough data
-        if len(self.window) > 1:
-            sorted_window = sorted(self.window)
-            trim_count = int(len(sorted_window) * self.trim_percent)
-            trimmed_window = sorted_window[trim_count:-trim_count] if trim_count else sorted_window
-            return sum(trimmed_window) / len(trimmed_window)
+        count = window.count
+        if count > 1:
+            trim_count = int(count * self.trim_percent)
+            if trim_count == 0:
+                return window.total / count
+            trimmed_total = window.total - \
+                window.sum_sorted(0, trim_count) - \
+                window.sum_sorted(count - trim_count, count)
+            return trimmed_total / (count - 2 * trim_count)
 
         # Return value directly if not enough data
         return value
+
+
+class RunningMedianFilter:
+
+    # Running Median
+    # How it works: The median of a sliding window of the last n readings,
+    # kept with two heaps. A max-heap holds the lower half of the window and
+    # a min-heap the upper half, so the median is at the top of one or both.
+    # The heaps hold buffer slot numbers and each slot remembers its heap
+    # position, so the reading leaving the window is removed in O(log n).
+    # All storage is preallocated, a reading allocates nothing.
+
+    # Usage:
+    # filter = RunningMedianFilter(window_size=5)
+    # filtered_value = filter.add_reading(sensor_value)
+
+    STREAMING = True
+
+    def __init__(self, window_size=5):
+        if window_size < 1:
+            raise ValueError("window_size must be greater than zero.")
+        self.window_size = window_size
+        self.values = [0] * window_size    # readings by buffer slot
+        self.low = [0] * window_size       # max-heap of slots, lower half
+        self.high = [0] * window_size      # min-heap of slots, upper half
+        self.in_low = [False] * window_size
+        self.position = [0] * window_size  # heap index of each slot
+        self.reset()
+
+    def reset(self):
+        # Resets the filter to its initial empty state.
+        self.low_count = 0
+        self.high_count = 0
+        self.head = 0
+        self.count = 0
+
+    def add_reading(self, value):
+        if self.count < self.window_size:
+            slot = (self.head + self.count) % self.window_size
+            self.count += 1
+        else:
+            slot = self.head
+            self.head = (self.head + 1) % self.window_size
+            self._remove(slot)
+        self.values[slot] = value
+        self._insert(slot)
+        return self.median()
+
+    def median(self):
+        if self.count == 0:
+            return None
+        if self.low_count > self.high_count:
+            return self.values[self.low[0]]
+        return (self.values[self.low[0]] + self.values[self.high[0]]) / 2
+
+    def _insert(self, slot):
+        if self.low_count == 0 or \
+                self.values[slot] <= self.values[self.low[0]]:
+            self._push(True, slot)
+        else:
+            self._push(False, slot)
+        # keep low the same size as high or one larger
+        while self.low_count > self.high_count + 1:
+            self._push(False, self._pop(True))
+        while self.high_count > self.low_count:
+            self._push(True, self._pop(False))
+
+    def _remove(self, slot):
+        is_low = self.in_low[slot]
+        heap = self.low if is_low else self.high
+        index = self.position[slot]
+        if is_low:
+            self.low_count -= 1
+            size = self.low_count
+        else:
+            self.high_count -= 1
+            size = self.high_count
+        if index < size:
+            last = heap[size]
+            heap[index] = last
+            self.position[last] = index
+            self._sift_up(is_low, index)
+            self._sift_down(is_low, self.position[last], size)
+
+    def _push(self, is_low, slot):
+        heap = self.low if is_low else self.high
+        if is_low:
+            index = self.low_count
+            self.low_count += 1
+        else:
+            index = self.high_count
+            self.high_count += 1
+        heap[index] = slot
+        self.in_low[slot] = is_low
+        self.position[slot] = index
+        self._sift_up(is_low, index)
+
+    def _pop(self, is_low):
+        heap = self.low if is_low else self.high
+        top = heap[0]
+        self._remove(top)
+        return top
+
+    def _before(self, is_low, slot_a, slot_b):
+        # True if slot_a belongs nearer the top of its heap than slot_b
+        if is_low:
+            return self.values[slot_a] > self.values[slot_b]
+        return self.values[slot_a] < self.values[slot_b]
+
+    def _sift_up(self, is_low, index):
+        heap = self.low if is_low else self.high
+        slot = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if not self._before(is_low, slot, heap[parent]):
+                break
+            heap[index] = heap[parent]
+            self.position[heap[index]] = index
+            index = parent
+        heap[index] = slot
+        self.position[slot] = index
+
+    def _sift_down(self, is_low, index, size):
+        heap = self.low if is_low else self.high
+        slot = heap[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and \
+                    self._before(is_low, heap[child + 1], heap[child]):
+                child += 1
+            if not self._before(is_low, heap[child], slot):
+                break
+            heap[index] = heap[child]
+            self.position[heap[index]] = index
+            index = child
+        heap[index] = slot
+        self.position[slot] = index
+
+
+class ExponentialMovingAverageFilter:
+
+    # Exponential Moving Average
+    # How it works: Each output moves a fraction alpha of the way from the
+    # previous output towards the new reading. Smaller alpha smooths more.
+    # Only the previous output is stored.
+
+    # Usage:
+    # filter = ExponentialMovingAverageFilter(alpha=0.3)
+    # filtered_value = filter.add_reading(sensor_value)
+
+    STREAMING = True
+
+    def __init__(self, alpha=0.3):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be greater than 0 and at most 1.")
+        self.alpha = alpha
+        self.value = None
+
+    def reset(self):
+        # Resets the filter to its initial empty state.
+        self.value = None
+
+    def add_reading(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class KalmanFilter:
+
+    # 1-D Kalman Filter
+    # How it works: Tracks an estimate of a slowly changing value and the
+    # variance of that estimate. Each reading is blended in with a gain
+    # that weighs the estimate's variance against the sensor's
+    # measurement_variance, process_variance is how much the true value is
+    # expected to change between readings.
+
+    # Usage:
+    # filter = KalmanFilter(process_variance=1.0, measurement_variance=25.0)
+    # filtered_value = filter.add_reading(sensor_value)
+
+    STREAMING = True
+
+    def __init__(self, process_variance=1.0, measurement_variance=25.0):
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self.reset()
+
+    def reset(self):
+        # Resets the filter to its initial empty state.
+        self.estimate = None
+        self.error_variance = 0
+
+    def add_reading(self, value):
+        if self.estimate is None:
+            self.estimate = value
+            self.error_variance = self.measurement_variance
+            return self.estimate
+        self.error_variance += self.process_variance
+        gain = self.error_variance / \
+            (self.error_variance + self.measurement_variance)
+        self.estimate += gain * (value - self.estimate)
+        self.error_variance *= 1 - gain
+        return self.estimate
+
+
+class HampelFilter:
+
+    # Hampel Filter
+    # How it works: Compares each reading with the median of a sliding
+    # window. A reading further than n_sigmas scaled median absolute
+    # deviations (MAD) from the median is an outlier and is replaced by the
+    # median, other readings pass through unchanged. The MAD is found by
+    # walking outwards from the median in the sorted window, so nothing is
+    # allocated.
+
+    # Usage:
+    # filter = HampelFilter(window_size=7, n_sigmas=3.0)
+    # filtered_value = filter.add_reading(sensor_value)
+
+    STREAMING = True
+
+    # scales the MAD to a standard deviation for normally distributed data
+    MAD_SCALE = 1.4826
+
+    def __init__(self, window_size=7, n_sigmas=3.0):
+        self.sliding_window = SlidingWindow(window_size)
+        self.window_size = window_size
+        self.n_sigmas = n_sigmas
+        self.outliers = 0
+
+    def reset(self):
+        # Resets the filter to its initial empty state.
+        self.sliding_window.reset()
+
+    def add_reading(self, value):
+        window = self.sliding_window
+        window.add(value)
+        if window.count < 3:
+            return value
+
+        median = self.median()
+        threshold = self.n_sigmas * self.MAD_SCALE * self.mad(median)
+        if abs(value - median) > threshold:
+            self.outliers += 1
+            return median
+        return value
+
+    def median(self):
+        values = self.sliding_window.sorted
+        count = self.sliding_window.count
+        middle = count >> 1
+        if count & 1:
+            return values[middle]
+        return (values[middle - 1] + values[middle]) / 2
+
+    def mad(self, median):
+        # Median of |reading - median|. The deviations below and above the
+        # median are each already in order in the sorted window, so merging
+        # them from the median outwards yields deviations in increasing
+        # order.
+        values = self.sliding_window.sorted
+        count = self.sliding_window.count
+        upper = _bisect_left(values, count, median)
+        lower = upper - 1
+        wanted_low = (count - 1) >> 1
+        wanted_high = count >> 1
+        low_deviation = 0
+        for rank in range(wanted_high + 1):
+            if lower < 0:
+                deviation = values[upper] - median
+                upper += 1
+            elif upper >= count or \
+                    median - values[lower] <= values[upper] - median:
+                deviation = median - values[lower]
+                lower -= 1
+            else:
+                deviation = values[upper] - median
+                upper += 1
+            if rank == wanted_low:
+                low_deviation = deviation
+        return (low_deviation + deviation) / 2
+
+
+def create_filter(name, window_size=5, **options):
+    # Creates a filter by name, options are passed to its constructor
+    if name == "discard_extremes":
+        return DiscardExtremesFilter(window_size)
+    if name == "trimmed_mean":
+        return TrimmedMeanFilter(window_size, **options)
+    if name == "median":
+        return RunningMedianFilter(window_size)
+    if name == "ema":
+        return ExponentialMovingAverageFilter(**options)
+    if name == "kalman":
+        return KalmanFilter(**options)
+    if name == "hampel":
+        return HampelFilter(window_size, **options)
+    raise ValueError(f"unknown filter {name}")
@@ -0,0 +1,187 @@
+from lib.inboxidau.rolling_appender_log import LogLevel  # type: ignore
+import machine  # type: ignore
+import os
+import struct
+import time  # type: ignore
+import ujson  # type: ignore
+
+
+class USleepScheduler:
+
+    # Sleep Scheduler
+    # How it works: Replaces the plain time.sleep between sensing cycles
+    # with one of three modes.
+    #   busy  - time.sleep, CPU and radio stay powered (the original
+    #           behaviour)
+    #   light - the WLAN is powered down and machine.lightsleep is used, RAM
+    #           and program state are kept
+    #   deep  - the node's state is saved and machine.deepsleep is used, the
+    #           board restarts from main.py on wake and resumes from the
+    #           saved state without reloading the config or the GUID
+    # A mode is stepped down to a lighter one when the sleep is too short
+    # for it to pay off. Subclass and override sleep_<mode> to plug in
+    # board specific behaviour.
+
+    # Usage:
+    # scheduler = USleepScheduler(node, mode="light")
+    # scheduler.sleep(300)
+
+    BUSY = "busy"
+    LIGHT = "light"
+    DEEP = "deep"
+    MODES = (BUSY, LIGHT, DEEP)
+
+    # Shortest sleeps worth powering the radio down or rebooting for
+    STATIC_LIGHT_SLEEP_MIN_S = 2
+    STATIC_DEEP_SLEEP_MIN_S = 30
+
+    def __init__(self, node, mode=BUSY):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown sleep mode {mode}")
+        self.node = node
+        self.mode = mode
+        self.last_mode = None
+        self.sleeps = {self.BUSY: 0, self.LIGHT: 0, self.DEEP: 0}
+
+    def choose_mode(self, seconds):
+        mode = self.mode
+        if mode == self.DEEP and seconds < self.STATIC_DEEP_SLEEP_MIN_S:
+            mode = self.LIGHT
+        if mode == self.LIGHT and seconds < self.STATIC_LIGHT_SLEEP_MIN_S:
+            mode = self.BUSY
+        return mode
+
+    def sleep(self, seconds):
+        mode = self.choose_mode(seconds)
+        self.last_mode = mode
+        self.sleeps[mode] += 1
+        if mode != self.mode:
+            self.node.log_message(
+                f"Sleeping {seconds} seconds ({mode}, {self.mode} sleep needs longer)",  # noqa: E501
+                LogLevel.INFO)
+        else:
+            self.node.log_message(f"Sleeping {seconds} seconds ({mode}).",
+                                  LogLevel.INFO)
+
+        if mode == self.DEEP:
+            self.sleep_deep(seconds)
+        elif mode == self.LIGHT:
+            self.sleep_light(seconds)
+        else:
+            self.sleep_busy(seconds)
+
+    def sleep_busy(self, seconds):
+        time.sleep(seconds)
+
+    def sleep_light(self, seconds):
+        self.node.prepare_for_sleep(self.LIGHT)
+        machine.lightsleep(int(seconds * 1000))
+        self.node.resume_from_sleep(self.LIGHT)
+
+    def sleep_deep(self, seconds):
+        self.node.prepare_for_sleep(self.DEEP)
+        machine.deepsleep(int(seconds * 1000))  # does not return
+
+    # Resume state, written before a deep sleep and read back on the next
+    # boot after a deep sleep, a power on starts afresh. RTC memory is used
+    # where the port provides it, otherwise a small file on flash written
+    # once, with the cycle count in a fixed-size sidecar file rewritten
+    # before every deep sleep. A sleeping marker is set with the cycle
+    # count and cleared when the state is loaded, rp2 reports a watchdog
+    # reset or machine.reset() as the same reset cause as a deep sleep
+    # wake and those must start afresh.
+
+    STATIC_RESUME_CYCLE_FORMAT = "<IB"  # cycle, sleeping
+
+    @staticmethod
+    def woke_from_deep_sleep():
+        # rp2 has no DEEPSLEEP_RESET, its deepsleep() restarts the board
+        # through the watchdog
+        try:
+            cause = machine.reset_cause()
+            return cause == getattr(machine, 'DEEPSLEEP_RESET',
+                                    machine.WDT_RESET)
+        except AttributeError:
+            return False
+
+    @staticmethod
+    def _rtc_memory():
+        try:
+            rtc = machine.RTC()
+            rtc.memory()
+            return rtc
+        except (AttributeError, OSError):
+            return None
+
+    @classmethod
+    def has_rtc_memory(cls):
+        return cls._rtc_memory() is not None
+
+    @staticmethod
+    def config_stamp(config_path):
+        # size and mtime of the config file, a changed config on flash
+        # invalidates the saved state
+        try:
+            stat = os.stat(config_path)
+            return [stat[6], stat[8]]
+        except OSError:
+            return None
+
+    @classmethod
+    def save_resume_state(cls, file_path, config_path, state):
+        state["config_stamp"] = cls.config_stamp(config_path)
+        rtc = cls._rtc_memory()
+        if rtc is not None:
+            cls._save_rtc_state(rtc, state, True)
+            return
+        with open(file_path, 'w') as file:
+            file.write(ujson.dumps(state))
+        cls.save_resume_cycle(file_path, state["cycle"])
+
+    @staticmethod
+    def _save_rtc_state(rtc, state, sleeping):
+        state = dict(state)
+        state["sleeping"] = sleeping
+        rtc.memory(ujson.dumps(state).encode())
+
+    @classmethod
+    def save_resume_cycle(cls, file_path, cycle, sleeping=True):
+        # The cycle count of the state in file_path and the sleeping
+        # marker, 5 bytes
+        with open(f"{file_path}.cycle", 'wb') as file:
+            file.write(struct.pack(cls.STATIC_RESUME_CYCLE_FORMAT, cycle,
+                                   1 if sleeping else 0))
+
+    @classmethod
+    def load_resume_state(cls, file_path, config_path):
+        # The saved state or None when there is none, it is stale or the
+        # node did not go to sleep since it was last loaded
+        format_size = struct.calcsize(cls.STATIC_RESUME_CYCLE_FORMAT)
+        try:
+            rtc = cls._rtc_memory()
+            if rtc is not None:
+                data = rtc.memory()
+                if not data:
+                    return None
+                state = ujson.loads(data)
+                sleeping = state.pop("sleeping", False)
+            else:
+                with open(file_path, 'r') as file:
+                    state = ujson.load(file)
+                with open(f"{file_path}.cycle", 'rb') as file:
+                    state["cycle"], sleeping = struct.unpack(
+                        cls.STATIC_RESUME_CYCLE_FORMAT,
+                        file.read(format_size))
+            if not sleeping:
+                return None
+            # clear the marker, a reset before the next deep sleep starts
+            # afresh
+            if rtc is not None:
+                cls._save_rtc_state(rtc, state, False)
+            else:
+                cls.save_resume_cycle(file_path, state["cycle"], False)
+        except (OSError, ValueError, struct.error):
+            return None
+        if state.get("config_stamp") != cls.config_stamp(config_path):
+            return None
+        return state
@@ -0,0 +1,64 @@
+import ujson  # type: ignore
+
+
+class UWiFiLinkCache:
+
+    # Wi-Fi link cache
+    # How it works: Remembers what the last successful association used, the
+    # access point BSSID, the DHCP lease (ip, netmask, gateway,
+    # dns) and when it was obtained, and when the clock was last set by NTP.
+    # The node tries these first on the next connect so that the scan and
+    # DHCP can be skipped. Kept in a small JSON file so it survives deep
+    # sleep and power cycles.
+
+    # Usage:
+    # cache = UWiFiLinkCache("wifi.json")
+    # cache.load()
+    # cache.update(ssid=..., bssid=..., ifconfig=..., lease_time=...)
+    # cache.save()
+
+    FIELDS = ("ssid", "bssid", "ifconfig", "lease_time", "ntp_synced")
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.data = {}
+        self._dirty = False
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r') as file:
+                data = ujson.load(file)
+            # Fields from older versions of the file are dropped
+            self.data = {key: value for key, value in data.items()
+                         if key in self.FIELDS}
+        except (OSError, ValueError):
+            self.data = {}
+        self._dirty = False
+        return self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **values):
+        for key, value in values.items():
+            if key not in self.FIELDS:
+                raise ValueError(f"unknown wifi cache field {key}")
+            if self.data.get(key) != value:
+                self.data[key] = value
+                self._dirty = True
+
+    def forget_link(self):
+        # Drop the association details, e.g. after a failed fast connect,
+        # the NTP time is kept
+        for key in ("bssid", "ifconfig", "lease_time"):
+            if key in self.data:
+                del self.data[key]
+                self._dirty = True
+
+    def save(self):
+        # Only writes when something changed, to spare the flash
+        if not self._dirty:
+            return
+        with open(self.file_path, 'w') as file:
+            ujson.dump(self.data, file)
+        self._dirty = False
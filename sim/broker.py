@@ -0,0 +1,173 @@
+class FakeSocket:
+
+    def __init__(self, client):
+        self.client = client
+
+    def close(self):
+        self.client.sock = None
+
+
+class FakeBroker:
+
+    # In-process MQTT broker stand-in
+    # How it works: Records every message published by FakeMQTTClient
+    # sessions, keeps retained messages, and delivers messages published
+    # with deliver() to sessions subscribed to the topic on their next
+    # check_msg(), or with schedule() once the clock reaches the time
+    # given. A connect takes handshake_s of virtual time (TLS on a
+    # Pico W takes seconds) and a publish publish_s. While down() is true
+    # connects and publishes fail with OSError, as does any client whose
+    # Wi-Fi link is not up or that sent nothing for one and a half times
+    # its keepalive, when the broker closes the session.
+
+    def __init__(self, clock, wlan_up=None, down=None, handshake_s=1.5,
+                 publish_s=0.02):
+        self.clock = clock
+        self.wlan_up = wlan_up or (lambda: True)
+        self.down = down or (lambda: False)
+        self.handshake_s = handshake_s
+        self.publish_s = publish_s
+        self.messages = []  # (elapsed s, topic, payload, retain)
+        self.retained = {}
+        self.sessions = []
+        self.scheduled = []  # (elapsed s, topic, payload), in time order
+        # counters
+        self.handshakes = 0
+        self.pings = 0
+        self.publishes = 0
+        self.payload_bytes = 0
+        self.failed = 0
+        self.expired = 0  # sessions closed for exceeding their keepalive
+
+    def reachable(self):
+        return self.wlan_up() and not self.down()
+
+    def client_class(self):
+        broker = self
+
+        class MQTTClient(FakeMQTTClient):
+            def __init__(self, client_id, server, port=0, user=None,
+                         password=None, keepalive=0, ssl=False,
+                         ssl_params=None):
+                super().__init__(broker, client_id, server, port, user,
+                                 password, keepalive, ssl, ssl_params)
+        return MQTTClient
+
+    def topic_messages(self, topic):
+        return [message for message in self.messages if message[1] == topic]
+
+    def deliver(self, topic, payload, retain=False):
+        # publish to the node from elsewhere
+        if retain:
+            self.retained[topic] = payload
+        for session in self.sessions:
+            session.receive(topic, payload)
+
+    def schedule(self, at_s, topic, payload):
+        self.scheduled.append((at_s, topic, payload))
+        self.scheduled.sort(key=lambda message: message[0])
+
+    def deliver_due(self):
+        now = self.clock.elapsed_s()
+        while self.scheduled and self.scheduled[0][0] <= now:
+            _, topic, payload = self.scheduled.pop(0)
+            self.deliver(topic, payload)
+
+    def record(self, topic, payload, retain):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.publishes += 1
+        self.payload_bytes += len(payload)
+        self.messages.append((self.clock.elapsed_s(), topic, payload, retain))
+        if retain:
+            self.retained[topic] = payload
+
+
+class FakeMQTTClient:
+
+    # The umqtt.simple MQTTClient interface the node uses
+
+    def __init__(self, broker, client_id, server, port=0, user=None,
+                 password=None, keepalive=0, ssl=False, ssl_params=None):
+        self.broker = broker
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        self.sock = None
+        self.last_packet_s = 0
+        self.cb = None
+        self.subscriptions = set()
+        self.inbox = []
+
+    def _check(self):
+        now = self.broker.clock.elapsed_s()
+        if self.sock is not None and self.keepalive and \
+                now - self.last_packet_s > 1.5 * self.keepalive:
+            self.sock = None
+            self.broker.expired += 1
+        if self.sock is None or not self.broker.reachable():
+            self.sock = None
+            self.broker.failed += 1
+            raise OSError(104)  # ECONNRESET
+        self.last_packet_s = now
+
+    def set_callback(self, callback):
+        self.cb = callback
+
+    def connect(self, clean_session=True):
+        broker = self.broker
+        broker.clock.advance(broker.handshake_s)
+        if not broker.reachable():
+            broker.failed += 1
+            raise OSError(113)  # EHOSTUNREACH
+        self.sock = FakeSocket(self)
+        self.last_packet_s = broker.clock.elapsed_s()
+        broker.handshakes += 1
+        if clean_session:
+            self.subscriptions = set()
+        if self not in broker.sessions:
+            broker.sessions.append(self)
+        return 0
+
+    def disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._check()
+        self.broker.clock.advance(self.broker.publish_s)
+        self.broker.record(topic, msg, retain)
+
+    def subscribe(self, topic, qos=0):
+        self._check()
+        self.subscriptions.add(topic)
+        retained = self.broker.retained.get(topic)
+        if retained is not None:
+            self.inbox.append((topic, retained))
+
+    def receive(self, topic, payload):
+        if self.sock is not None and topic in self.subscriptions:
+            self.inbox.append((topic, payload))
+
+    def ping(self):
+        self._check()
+        self.broker.pings += 1
+
+    def check_msg(self):
+        self._check()
+        self.broker.deliver_due()
+        while self.inbox:
+            topic, payload = self.inbox.pop(0)
+            if isinstance(topic, str):
+                topic = topic.encode()
+            if isinstance(payload, str):
+                payload = payload.encode()
+            if self.cb is not None:
+                self.cb(topic, payload)
+
+    def wait_msg(self):
+        self.check_msg()
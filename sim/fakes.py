@@ -0,0 +1,341 @@
+import binascii
+import math
+import types
+
+
+class SimulatedReset(BaseException):
+
+    # The board lost power or rebooted, main.py starts again after
+    # off_s seconds. Raised by machine.deepsleep(), machine.reset() and the
+    # Makerverse HAT power down pin.
+
+    def __init__(self, reason, off_s=0):
+        super().__init__(reason, off_s)
+        self.reason = reason
+        self.off_s = off_s
+
+
+class FakePin:
+
+    OUT = 1
+    IN = 0
+
+    def __init__(self, board, pin_id, mode=None, *args, **kwargs):
+        self.board = board
+        self.pin_id = pin_id
+        self._value = 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+        if self._value and self.pin_id == self.board.powerdown_pin:
+            self.board.power_down()
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+
+class FakeBoard:
+
+    # Fake machine module
+    # How it works: A Pico W without RTC memory. lightsleep advances the
+    # virtual clock, deepsleep and reset raise SimulatedReset. Driving the
+    # Makerverse HAT power down pin high raises SimulatedReset when
+    # hat_period_s is set, with the board off until the HAT timer's next
+    # interval. reset_cause() is WDT_RESET after a deepsleep or reset, as
+    # on rp2, and PWRON_RESET after a HAT power down.
+
+    PWRON_RESET = 1
+    WDT_RESET = 3
+
+    def __init__(self, clock, unique_id=b"\xe6\x61\x41\x04\x03\x2b\x6a\x2c",
+                 hat_period_s=None, powerdown_pin=22):
+        self.clock = clock
+        self._unique_id = unique_id
+        self.hat_period_s = hat_period_s
+        self.powerdown_pin = powerdown_pin
+        self.reset_cause = self.PWRON_RESET
+        # counters
+        self.lightsleeps = 0
+        self.deepsleeps = 0
+        self.power_downs = 0
+
+    def module(self):
+        board = self
+        machine = types.ModuleType("machine")
+
+        class Pin(FakePin):
+            def __init__(self, pin_id, mode=None, *args, **kwargs):
+                super().__init__(board, pin_id, mode, *args, **kwargs)
+        Pin.OUT = FakePin.OUT
+        Pin.IN = FakePin.IN
+
+        class RTC:
+            # the rp2 port has no RTC memory, the resume state goes to flash
+            pass
+
+        machine.Pin = Pin
+        machine.RTC = RTC
+        machine.unique_id = lambda: self._unique_id
+        machine.lightsleep = self.lightsleep
+        machine.deepsleep = self.deepsleep
+        machine.reset = self.reset
+        machine.freq = lambda *args: 125000000
+        machine.reset_cause = lambda: self.reset_cause
+        machine.PWRON_RESET = self.PWRON_RESET
+        machine.WDT_RESET = self.WDT_RESET
+        return machine
+
+    def lightsleep(self, ms=None):
+        self.lightsleeps += 1
+        self.clock.sleep((ms or 0) / 1000)
+
+    def deepsleep(self, ms=None):
+        self.deepsleeps += 1
+        self.reset_cause = self.WDT_RESET
+        raise SimulatedReset("deepsleep", (ms or 0) / 1000)
+
+    def reset(self):
+        self.reset_cause = self.WDT_RESET
+        raise SimulatedReset("reset")
+
+    def power_down(self):
+        if self.hat_period_s is None:
+            return
+        self.power_downs += 1
+        self.reset_cause = self.PWRON_RESET
+        # the HAT restores power at its next timer interval
+        elapsed = self.clock.elapsed_s()
+        off_s = self.hat_period_s - elapsed % self.hat_period_s
+        raise SimulatedReset("hat", off_s)
+
+
+class FakeNetwork:
+
+    # Fake network module
+    # How it works: One station interface shared by every network.WLAN()
+    # call. An association completes after assoc_s seconds of virtual time
+    # (scan_s more without a BSSID, dhcp_s more without a static address)
+    # unless the access point is down, see down(). scan() reports one
+    # access point for the configured SSID.
+
+    STA_IF = 0
+    AP_IF = 1
+    STAT_IDLE = 0
+    STAT_CONNECTING = 1
+    STAT_GOT_IP = 3
+
+    def __init__(self, clock, ssid, password, bssid=b"\x10\x20\x30\x40\x50\x60",  # noqa: E501
+                 channel=6, rssi=-60, assoc_s=0.4, scan_s=1.5, dhcp_s=0.8,
+                 down=None):
+        self.clock = clock
+        self.ssid = ssid
+        self.password = password
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+        self.assoc_s = assoc_s
+        self.scan_s = scan_s
+        self.dhcp_s = dhcp_s
+        self.down = down or (lambda: False)
+        self.wlan = None
+        # counters
+        self.associations = 0
+        self.scans = 0
+        self.dhcp_leases = 0
+
+    def module(self):
+        network = types.ModuleType("network")
+        network.STA_IF = self.STA_IF
+        network.AP_IF = self.AP_IF
+        network.STAT_IDLE = self.STAT_IDLE
+        network.STAT_CONNECTING = self.STAT_CONNECTING
+        network.STAT_GOT_IP = self.STAT_GOT_IP
+        network.WLAN = self.WLAN
+        return network
+
+    def WLAN(self, interface=STA_IF):
+        if self.wlan is None:
+            self.wlan = FakeWLAN(self)
+        return self.wlan
+
+
+class FakeWLAN:
+
+    def __init__(self, network):
+        self.network = network
+        self._active = False
+        self._connected_at = None
+        self._static = None
+
+    def active(self, active=None):
+        if active is None:
+            return self._active
+        self._active = bool(active)
+        if not self._active:
+            self._connected_at = None
+
+    def connect(self, ssid, key=None, bssid=None):
+        network = self.network
+        network.associations += 1
+        if ssid != network.ssid or key != network.password:
+            self._connected_at = None
+            return
+        delay_s = network.assoc_s
+        if bssid is None or bssid != network.bssid:
+            delay_s += network.scan_s
+        if self._static is None:
+            delay_s += network.dhcp_s
+            network.dhcp_leases += 1
+        self._connected_at = network.clock.elapsed_s() + delay_s
+
+    def disconnect(self):
+        self._connected_at = None
+
+    def isconnected(self):
+        return self._active and self._connected_at is not None and \
+            not self.network.down() and \
+            self.network.clock.elapsed_s() >= self._connected_at
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return self.network.rssi
+        if self.isconnected():
+            return self.network.STAT_GOT_IP
+        if self._connected_at is not None:
+            return self.network.STAT_CONNECTING
+        return self.network.STAT_IDLE
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self._static or ("192.168.1.50", "255.255.255.0",
+                                    "192.168.1.1", "192.168.1.1")
+        self._static = None if config == 'dhcp' else tuple(config)
+
+    def scan(self):
+        network = self.network
+        network.scans += 1
+        network.clock.advance(network.scan_s)
+        if network.down():
+            return []
+        return [(network.ssid.encode(), network.bssid, network.channel,
+                 network.rssi, 3, 0)]
+
+    def config(self, *args, **kwargs):
+        if args == ('mac',):
+            return b"\x28\xcd\xc1\x00\x00\x01"
+        if args == ('bssid',):
+            # the access point associated with, once connect() was called
+            return self.network.bssid if self._connected_at is not None \
+                else None
+        return None
+
+
+class FakeNtp:
+
+    # Fake ntptime module, settime() takes sync_s of virtual time and
+    # fails while the network is down
+
+    def __init__(self, clock, sync_s=0.2, down=None):
+        self.clock = clock
+        self.sync_s = sync_s
+        self.down = down or (lambda: False)
+        # counters
+        self.syncs = 0
+
+    def module(self):
+        ntptime = types.ModuleType("ntptime")
+        ntptime.settime = self.settime
+        ntptime.host = "pool.ntp.org"
+        return ntptime
+
+    def settime(self):
+        self.clock.advance(self.sync_s)
+        if self.down():
+            raise OSError(110)  # ETIMEDOUT
+        self.syncs += 1
+
+
+def ubinascii_module():
+    ubinascii = types.ModuleType("ubinascii")
+    ubinascii.hexlify = binascii.hexlify
+    ubinascii.unhexlify = binascii.unhexlify
+    ubinascii.a2b_base64 = binascii.a2b_base64
+    ubinascii.b2a_base64 = binascii.b2a_base64
+    ubinascii.crc32 = binascii.crc32
+    return ubinascii
+
+
+# Scripted sensors. A script is a function of the simulated seconds
+# elapsed returning the true value, the fakes add seeded noise.
+
+def car_park_script(arrivals, empty_mm=2500, parked_mm=600, drive_s=8):
+    # Distance to a car park bay floor, arrivals are (arrive_s, leave_s)
+    def distance(t):
+        for arrive_s, leave_s in arrivals:
+            if arrive_s <= t < arrive_s + drive_s:
+                return empty_mm - (empty_mm - parked_mm) * \
+                    (t - arrive_s) / drive_s
+            if arrive_s + drive_s <= t < leave_s:
+                return parked_mm
+            if leave_s <= t < leave_s + drive_s:
+                return parked_mm + (empty_mm - parked_mm) * \
+                    (t - leave_s) / drive_s
+        return empty_mm
+    return distance
+
+
+def weather_script(mean_c=18, swing_c=6, pressure_pa=101325,
+                   humidity_rh=60):
+    # A daily temperature cycle, coldest at 04:00, humidity moving the
+    # other way
+    def values(t):
+        phase = math.cos(2 * math.pi * ((t / 3600 - 16) % 24) / 24)
+        return (mean_c + swing_c * phase,
+                pressure_pa + 150 * math.sin(2 * math.pi * t / 86400 / 3),
+                humidity_rh - 15 * phase)
+    return values
+
+
+class ScriptedVL53L1X:
+
+    # Stands in for PiicoDev_VL53L1X, each read() takes read_s of virtual
+    # time
+
+    def __init__(self, clock, script, rng, noise_mm=10, read_s=0.05):
+        self.clock = clock
+        self.script = script
+        self.rng = rng
+        self.noise_mm = noise_mm
+        self.read_s = read_s
+        self.reads = 0
+
+    def read(self):
+        self.clock.advance(self.read_s)
+        self.reads += 1
+        value = self.script(self.clock.elapsed_s())
+        return int(value + self.rng.uniform(-self.noise_mm, self.noise_mm))
+
+
+class ScriptedBME280:
+
+    # Stands in for PiicoDev_BME280, values() returns (tempC, presPa, humRH)
+
+    def __init__(self, clock, script, rng, read_s=0.01):
+        self.clock = clock
+        self.script = script
+        self.rng = rng
+        self.read_s = read_s
+        self.reads = 0
+
+    def values(self):
+        self.clock.advance(self.read_s)
+        self.reads += 1
+        temp_c, pres_pa, hum_rh = self.script(self.clock.elapsed_s())
+        return (temp_c + self.rng.gauss(0, 0.05),
+                pres_pa + self.rng.gauss(0, 2),
+                hum_rh + self.rng.gauss(0, 0.3))
@@ -0,0 +1,402 @@
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.rolling_appender_log import LogLevel, URollingAppenderLog  # noqa: E402, E501
+from sim.fakes import (FakeBoard, FakeNetwork, FakeNtp, ScriptedBME280,  # noqa: E402, E501
+                       ScriptedVL53L1X, car_park_script, weather_script)
+from sim.harness import (ATMOSPHERIC_CONFIG, BASE_CONFIG, DISTANCE_CONFIG,  # noqa: E402, E501
+                         ModulePatcher, install_node_modules, percentile)
+from sim.tcp_broker import (TcpBroker, TcpMQTTClient, client_context,  # noqa: E402, E501
+                            self_signed_certificate, server_context)
+from sim.virtual_clock import SimulationComplete, VirtualClock  # noqa: E402
+
+# Host-side fleet load generator: many unmodified nodes, each on its own
+# thread with its own scratch directory and fake hardware, publishing in
+# real time over real sockets to a TcpBroker, to find where a broker
+# saturates and what persistent sessions save over reconnecting every
+# cycle.
+#
+# Usage:
+#   report = NodeFleet(nodes=200, cadence_s=5, duration_s=60,
+#                      tls=True).run()
+#   print(format_report(report))
+
+DISTANCE = "DistanceSensorNode:DistanceSensorNode"
+ATMOSPHERIC = "AtmosphericSensorNode:AtmosphericSensorNode"
+NODE_CONFIGS = {DISTANCE: DISTANCE_CONFIG, ATMOSPHERIC: ATMOSPHERIC_CONFIG}
+
+
+def node_config(config, name, port, cadence_s):
+    # A node's config: the local broker, the fleet's cadence and topics of
+    # its own
+    config = dict(config, MQTT_BROKER="127.0.0.1", MQTT_PORT=port,
+                  STATIC_NODE_SENSE_REPEAT_DELAY=cadence_s)
+    for key, value in config.items():
+        if key.startswith("MQTT_TOPIC_"):
+            config[key] = value.replace("/sim/", f"/{name}/")
+    return config
+
+
+class WallClock(VirtualClock):
+
+    # The VirtualClock interface on real time, shared by the nodes of a
+    # worker. A sleep that would pass end_s ends the node's run.
+
+    def __init__(self, start, end_s):
+        # start is time.monotonic() when the fleet started, the same in
+        # every worker process
+        self.start = start
+        self.start_epoch = int(time.time() - (time.monotonic() - start))
+        self.end_s = end_s
+
+    @property
+    def _now_us(self):
+        return int((time.monotonic() - self.start) * 1000000)
+
+    def advance(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def sleep(self, seconds):
+        remaining = self.end_s - self.elapsed_s()
+        if seconds >= remaining:
+            self.advance(remaining)
+            raise SimulationComplete()
+        self.advance(seconds)
+
+
+class FleetLog(URollingAppenderLog):
+
+    # A node's log, counting its errors for the worker
+
+    def __init__(self, worker, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.worker = worker
+
+    def log_message(self, message, level=LogLevel.INFO, tid="0000-00-00T00:00:00Z"):  # noqa: E501
+        if level == LogLevel.ERROR:
+            self.worker.count_error(message)
+        super().log_message(message, level, tid)
+
+
+class FleetWorker:
+
+    # Runs the nodes given by indices in this process, a thread each.
+    # spec is the picklable part of a NodeFleet, see NodeFleet.spec().
+
+    def __init__(self, spec, indices):
+        self.spec = spec
+        self.indices = list(indices)
+        self.clock = WallClock(spec["start"], spec["duration_s"])
+        self.nodes = []
+        self.exceptions = []
+        self.sent = {}  # client id: TcpMQTTClient.sent_times
+        self.connect_times = []
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._seeds = itertools.count(spec["seed"] * 100000)
+        self._classes = {}
+
+    def count_error(self, message):
+        with self._lock:
+            self.errors += 1
+            self.last_error = message
+
+    def client_class(self):
+        worker = self
+        context = client_context() if self.spec["tls"] else False
+
+        class MQTTClient(TcpMQTTClient):
+            def __init__(self, client_id, server, port=0, user=None,
+                         password=None, keepalive=0, ssl=False,
+                         ssl_params=None):
+                # TLS is the fleet's choice, the node always asks for it
+                super().__init__(client_id, server, port, user, password,
+                                 keepalive, context, ssl_params)
+                self.sent_times = worker.sent.setdefault(client_id, [])
+                self.connect_times = worker.connect_times
+        return MQTTClient
+
+    def distance_sensor(self, *args, **kwargs):
+        # a car arrives in the bay sometime in the first half of the run
+        rng = random.Random(next(self._seeds))
+        half_s = self.spec["duration_s"] / 2
+        arrive_s = rng.uniform(0, half_s)
+        return ScriptedVL53L1X(self.clock,
+                               car_park_script([(arrive_s, arrive_s + half_s)]),  # noqa: E501
+                               rng, read_s=0)
+
+    def atmospheric_sensor(self, *args, **kwargs):
+        rng = random.Random(next(self._seeds))
+        return ScriptedBME280(self.clock, weather_script(), rng, read_s=0)
+
+    def install(self, patcher):
+        clock = self.clock
+        # the radio, NTP and sensors answer at once, the fleet is about
+        # the broker
+        network = FakeNetwork(clock, BASE_CONFIG["WIFI_SSID"],
+                              BASE_CONFIG["WIFI_PASSWORD"], assoc_s=0,
+                              scan_s=0, dhcp_s=0)
+        install_node_modules(patcher, clock, FakeBoard(clock), network,
+                             FakeNtp(clock, sync_s=0), self.client_class(),
+                             self.distance_sensor, self.atmospheric_sensor)
+        for class_path in set(self.spec["node_classes"]):
+            module_name, class_name = class_path.split(":")
+            self._classes[class_path] = getattr(
+                importlib.import_module(module_name), class_name)
+
+    def node_class(self, class_path, name, directory):
+        # The node class with its files in directory and its own GUID
+        reconnect_each_cycle = self.spec["reconnect_each_cycle"]
+
+        class FleetNode(self._classes[class_path]):
+            STATIC_WIFI_CACHE_FILE = os.path.join(directory, "wifi.json")
+            STATIC_NODE_RESUME_STATE_FILE = os.path.join(directory,
+                                                         "resume.json")
+            STATIC_NODE_CONFIG_SNAPSHOT_FILE = os.path.join(
+                directory, "config.snapshot")
+            STATIC_NODE_REPORT_STATE_FILE = os.path.join(
+                directory, "report_state.json")
+
+            def generate_guid(self):
+                return name
+
+            def execute_sensor_reading(self):
+                super().execute_sensor_reading()
+                if reconnect_each_cycle:
+                    # a node without a persistent session, the next
+                    # publish connects again
+                    self.disconnect_broker()
+        FleetNode.__name__ = self._classes[class_path].__name__
+        return FleetNode
+
+    def run_node(self, index):
+        spec = self.spec
+        clock = self.clock
+        node = None
+        try:
+            # the fleet comes up over its first cycle
+            clock.sleep(max(0, spec["cadence_s"] * index / spec["nodes"] -
+                            clock.elapsed_s()))
+            class_path = spec["node_classes"][index % len(spec["node_classes"])]  # noqa: E501
+            name = f"fleet{index:04d}"
+            directory = os.path.join(spec["work_dir"], name)
+            os.makedirs(directory, exist_ok=True)
+            config_path = os.path.join(directory, "config.json")
+            with open(config_path, "w") as file:
+                json.dump(node_config(dict(NODE_CONFIGS.get(class_path, BASE_CONFIG),  # noqa: E501
+                                           **spec["config"]),
+                                      name, spec["port"], spec["cadence_s"]),
+                          file)
+            log = FleetLog(self, os.path.join(directory, "node.log"),
+                           max_file_size_bytes=4096, max_backups=1,
+                           log_level=LogLevel.ERROR)
+            node = self.node_class(class_path, name, directory)(
+                log=log, config_path=config_path)
+            with self._lock:
+                self.nodes.append(node)
+            while True:
+                # what main.py does
+                try:
+                    node.main()
+                except Exception as e:
+                    self.exceptions.append(repr(e))
+                    clock.sleep(node.STATIC_NODE_RESTART_DELAY)
+        except SimulationComplete:
+            pass
+        except Exception as e:
+            self.exceptions.append(repr(e))
+        finally:
+            if node is not None and node.mqtt_session is not None:
+                try:
+                    node.mqtt_session.disconnect()
+                except Exception:
+                    pass
+
+    def run(self):
+        patcher = ModulePatcher()
+        try:
+            self.install(patcher)
+            threads = [threading.Thread(target=self.run_node, args=(index,),
+                                        daemon=True)
+                       for index in self.indices]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            patcher.restore()
+        return {
+            "nodes": len(self.nodes),
+            "cycles": sum(node.cycle for node in self.nodes),
+            "exceptions": self.exceptions,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "sent": self.sent,
+            "connect_times": self.connect_times,
+        }
+
+
+def run_worker(job):
+    spec, indices = job
+    return FleetWorker(spec, indices).run()
+
+
+class NodeFleet:
+
+    # Fleet load generator
+    # How it works: Starts a TcpBroker, plain or TLS, then runs nodes
+    # nodes, of node_classes in turn, each on a thread of its own exactly
+    # as main.py would, with the fake Wi-Fi, NTP, board and sensors of the
+    # simulation answering at once and time passing for real. Every node
+    # publishes on topics of its own every cadence_s, the fleet comes up
+    # over the first cycle. With reconnect_each_cycle the nodes disconnect
+    # from the broker after each reading, like a HAT cycled node. workers
+    # above 1 spread the nodes over that many processes, so the broker's
+    # threads are not competing with the nodes for the GIL. config is
+    # merged into every node's config, e.g. {"MQTT_BATCH_PUBLISH": True}.
+    #
+    # Publish latency is from the node's publish() call to the broker
+    # having read the whole PUBLISH, matched per client id in order.
+    # Reconnects are connects beyond the first of each node.
+
+    def __init__(self, node_classes=(DISTANCE, ATMOSPHERIC), nodes=100,
+                 cadence_s=5, duration_s=60, tls=False,
+                 reconnect_each_cycle=False, workers=1, config=None,
+                 certfile=None, keyfile=None, seed=1, work_dir=None):
+        self.node_classes = tuple(node_classes)
+        self.nodes = nodes
+        self.cadence_s = cadence_s
+        self.duration_s = duration_s
+        self.tls = tls
+        self.reconnect_each_cycle = reconnect_each_cycle
+        self.workers = max(1, min(workers, nodes))
+        self.config = dict(config or {})
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.seed = seed
+        self.work_dir = work_dir
+        self.broker = None
+
+    def spec(self, port, start, work_dir):
+        return {
+            "node_classes": self.node_classes,
+            "nodes": self.nodes,
+            "cadence_s": self.cadence_s,
+            "duration_s": self.duration_s,
+            "tls": self.tls,
+            "reconnect_each_cycle": self.reconnect_each_cycle,
+            "config": self.config,
+            "seed": self.seed,
+            "port": port,
+            "start": start,
+            "work_dir": work_dir,
+        }
+
+    def run(self):
+        scratch = None
+        if self.work_dir is None:
+            scratch = tempfile.TemporaryDirectory()
+            work_dir = scratch.name
+        else:
+            work_dir = self.work_dir
+        try:
+            context = None
+            if self.tls:
+                certfile, keyfile = self.certfile, self.keyfile
+                if certfile is None:
+                    certfile, keyfile = self_signed_certificate(work_dir)
+                context = server_context(certfile, keyfile)
+            self.broker = TcpBroker(ssl_context=context)
+            port = self.broker.start()
+            start = time.monotonic()
+            spec = self.spec(port, start, work_dir)
+            # interleaved, so every worker's nodes come up across the cycle
+            jobs = [(spec, range(worker, self.nodes, self.workers))
+                    for worker in range(self.workers)]
+            try:
+                if self.workers == 1:
+                    results = [run_worker(jobs[0])]
+                else:
+                    context = multiprocessing.get_context("spawn")
+                    with context.Pool(self.workers) as pool:
+                        results = pool.map(run_worker, jobs)
+            finally:
+                self.broker.stop()
+            wall_s = time.monotonic() - start
+        finally:
+            if scratch is not None:
+                scratch.cleanup()
+        return self.report(results, start, wall_s)
+
+    def report(self, results, start, wall_s):
+        broker = self.broker
+        sent = {}
+        for result in results:
+            sent.update(result["sent"])
+        latencies = []
+        unmatched = 0
+        per_second = {}
+        for client_id, received in broker.received.items():
+            times = sent.get(client_id, [])
+            unmatched += abs(len(times) - len(received))
+            latencies.extend((receive - send) * 1000
+                             for send, receive in zip(times, received))
+            for receive in received:
+                second = int(receive - start)
+                per_second[second] = per_second.get(second, 0) + 1
+        connect_ms = [seconds * 1000 for result in results
+                      for seconds in result["connect_times"]]
+        node_hours = self.nodes * self.duration_s / 3600
+        reconnects = broker.connects - len(broker.received)
+        report = {
+            "nodes": self.nodes,
+            "workers": self.workers,
+            "tls": self.tls,
+            "session": "reconnect" if self.reconnect_each_cycle else "persistent",  # noqa: E501
+            "cadence_s": self.cadence_s,
+            "duration_s": self.duration_s,
+            "wall_s": wall_s,
+            "nodes_started": sum(result["nodes"] for result in results),
+            "cycles": sum(result["cycles"] for result in results),
+            "node_exceptions": sum(len(result["exceptions"]) for result in results),  # noqa: E501
+            "node_errors": sum(result["errors"] for result in results),
+            "publishes": broker.publishes,
+            "publishes_per_s": broker.publishes / self.duration_s,
+            "publishes_per_s_peak": max(per_second.values(), default=0),
+            "payload_bytes": broker.payload_bytes,
+            "bytes_per_s": broker.bytes_received / self.duration_s,
+            "latency_ms_p50": percentile(latencies, 0.5),
+            "latency_ms_p95": percentile(latencies, 0.95),
+            "latency_ms_p99": percentile(latencies, 0.99),
+            "latency_ms_max": max(latencies, default=0),
+            "latency_unmatched": unmatched,
+            "connects": broker.connects,
+            "reconnects": reconnects,
+            "reconnects_per_node_h": reconnects / node_hours if node_hours else 0,  # noqa: E501
+            "disconnects": broker.disconnects,
+            "drops": broker.drops,
+            "takeovers": broker.takeovers,
+            "peak_connections": broker.peak_connections,
+            "connect_ms_p50": percentile(connect_ms, 0.5),
+            "connect_ms_p95": percentile(connect_ms, 0.95),
+            "pings": broker.pings,
+            "broker_cpu_s": broker.cpu_s,
+        }
+        if self.tls:
+            handshake_ms = [seconds * 1000
+                            for seconds in broker.tls_handshake_s]
+            report["tls_handshake_ms_p50"] = percentile(handshake_ms, 0.5)
+            report["tls_handshake_ms_p95"] = percentile(handshake_ms, 0.95)
+            report["tls_failures"] = broker.tls_failures
+        return report
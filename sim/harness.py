@@ -0,0 +1,460 @@
+import bisect
+import builtins
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.broker import FakeBroker  # noqa: E402
+from sim.fakes import (FakeBoard, FakeNetwork, FakeNtp, ScriptedBME280,  # noqa: E402, E501
+                       ScriptedVL53L1X, SimulatedReset, car_park_script,
+                       ubinascii_module, weather_script)
+from sim.virtual_clock import SimulationComplete, VirtualClock  # noqa: E402
+
+# Host-side simulation of a node's whole lifecycle: UPicoWSensorNode.main()
+# runs unmodified against a virtual clock, a fake Wi-Fi interface, NTP,
+# Makerverse HAT and RTC, scripted VL53L1X and BME280 sensors and an
+# in-process MQTT broker, in a scratch directory standing in for flash.
+# Simulated days take seconds, and the report counts publishes, TLS
+# handshakes, Wi-Fi associations, filesystem operations and CPU time per
+# cycle.
+#
+# Usage:
+#   report = NodeSimulation("DistanceSensorNode:DistanceSensorNode",
+#                           days=1).run()
+#   print(format_report(report))
+
+BASE_CONFIG = {
+    "WIFI_SSID": "SimNet",
+    "WIFI_PASSWORD": "sim password",
+    "MQTT_BROKER": "broker.sim",
+    "MQTT_PORT": 8883,
+    "MQTT_USERNAME": "IoT",
+    "MQTT_PASSWORD": "sim password",
+    "MQTT_CA_CERTS": "/ca.crt",
+    "MAKERVERSE_NANO_POWER_TIMER_HAT": False,
+    "LOG_SENSOR_DATA": False
+}
+
+DISTANCE_CONFIG = dict(BASE_CONFIG, **{
+    "MQTT_TOPIC_distance": "carpark01/sim/distance",
+    "MQTT_TOPIC_occupancy": "carpark01/sim/occupancy",
+    "OCCUPANCY_DISTANCE": 900
+})
+
+ATMOSPHERIC_CONFIG = dict(BASE_CONFIG, **{
+    "MQTT_TOPIC_temperature": "weatherstn/sim/temperature",
+    "MQTT_TOPIC_humidity": "weatherstn/sim/humidity",
+    "MQTT_TOPIC_airPressure": "weatherstn/sim/airPressure"
+})
+
+
+def workday_arrivals(days):
+    # a car in the bay from 08:00 to 17:00 every day
+    return [(day * 86400 + 8 * 3600, day * 86400 + 17 * 3600)
+            for day in range(int(days) + 1)]
+
+
+class CountingFile:
+
+    # Wraps a file object to count reads and writes
+
+    def __init__(self, counter, file):
+        self._counter = counter
+        self._file = file
+
+    def write(self, data):
+        self._counter.writes += 1
+        self._counter.bytes_written += len(data)
+        return self._file.write(data)
+
+    def read(self, *args):
+        self._counter.reads += 1
+        data = self._file.read(*args)
+        self._counter.bytes_read += len(data)
+        return data
+
+    def readinto(self, buffer):
+        self._counter.reads += 1
+        count = self._file.readinto(buffer)
+        self._counter.bytes_read += count or 0
+        return count
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class FileSystemCounter:
+
+    # Counts the node's file operations while installed, the flash wear
+    # and the time a Pico W spends in littlefs
+
+    OS_FUNCTIONS = ("remove", "rename", "stat", "listdir", "mkdir",
+                    "rmdir")
+
+    def __init__(self):
+        self.opens = 0
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.os_calls = dict((name, 0) for name in self.OS_FUNCTIONS)
+        self._saved = None
+
+    def install(self):
+        counter = self
+        real_open = builtins.open
+
+        def counting_open(file, mode='r', *args, **kwargs):
+            counter.opens += 1
+            return CountingFile(counter, real_open(file, mode, *args, **kwargs))  # noqa: E501
+
+        self._saved = {"open": real_open}
+        builtins.open = counting_open
+        for name in self.OS_FUNCTIONS:
+            real = getattr(os, name)
+            self._saved[name] = real
+            setattr(os, name, self._counting(name, real))
+
+    def _counting(self, name, real):
+        def function(*args, **kwargs):
+            self.os_calls[name] += 1
+            return real(*args, **kwargs)
+        return function
+
+    def uninstall(self):
+        builtins.open = self._saved.pop("open")
+        for name, real in self._saved.items():
+            setattr(os, name, real)
+        self._saved = None
+
+    def total(self):
+        return self.opens + sum(self.os_calls.values())
+
+
+class ModulePatcher:
+
+    # Replaces module attributes and sys.modules entries, and puts them
+    # back
+
+    def __init__(self):
+        self._attributes = []
+        self._modules = {}
+
+    def module(self, name, module):
+        if name not in self._modules:
+            self._modules[name] = sys.modules.get(name)
+        sys.modules[name] = module
+
+    def attribute(self, target, name, value):
+        self._attributes.append((target, name, getattr(target, name, None)))
+        setattr(target, name, value)
+
+    def restore(self):
+        for target, name, value in reversed(self._attributes):
+            setattr(target, name, value)
+        for name, module in self._modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        self._attributes = []
+        self._modules = {}
+
+
+def install_node_modules(patcher, clock, board, network, ntp, client_class,
+                         distance_sensor, atmospheric_sensor):
+    # Installs the fakes in place of the MicroPython modules and binds them
+    # into the node modules already imported. client_class stands in for
+    # umqtt.simple.MQTTClient, distance_sensor and atmospheric_sensor for
+    # the PiicoDev driver classes.
+    machine = board.module()
+    network = network.module()
+    ntptime = ntp.module()
+    ubinascii = ubinascii_module()
+    umqtt = types.ModuleType("umqtt")
+    umqtt_simple = types.ModuleType("umqtt.simple")
+    umqtt_simple.MQTTClient = client_class
+    umqtt.simple = umqtt_simple
+    vl53l1x = types.ModuleType("lib.PiicoDev_VL53L1X")
+    vl53l1x.PiicoDev_VL53L1X = distance_sensor
+    bme280 = types.ModuleType("lib.PiicoDev_BME280")
+    bme280.PiicoDev_BME280 = atmospheric_sensor
+    for name, module in (("machine", machine), ("network", network),
+                         ("ntptime", ntptime), ("utime", clock),
+                         ("ujson", json), ("ubinascii", ubinascii),
+                         ("umqtt", umqtt), ("umqtt.simple", umqtt_simple),
+                         ("lib.PiicoDev_VL53L1X", vl53l1x),
+                         ("lib.PiicoDev_BME280", bme280)):
+        patcher.module(name, module)
+
+    # modules imported before the fakes keep their own bindings
+    from lib.inboxidau import clock as node_clock
+    for name in ("ticks_ms", "ticks_us", "ticks_add", "ticks_diff",
+                 "sleep_us"):
+        patcher.attribute(node_clock, name, getattr(clock, name))
+    node_module = importlib.import_module("lib.inboxidau.pico_w_sensor_node")  # noqa: E501
+    for name, value in (("time", clock), ("utime", clock),
+                        ("machine", machine), ("network", network),
+                        ("ujson", json), ("ubinascii", ubinascii),
+                        ("POWERDOWN", machine.Pin(22, machine.Pin.OUT))):
+        patcher.attribute(node_module, name, value)
+    for module_name, bindings in (
+            ("lib.inboxidau.sleep_scheduler",
+             (("time", clock), ("machine", machine), ("ujson", json))),
+            ("lib.inboxidau.rolling_appender_log", (("time", clock),)),
+            ("lib.inboxidau.wifi_link_cache", (("ujson", json),))):
+        module = importlib.import_module(module_name)
+        for name, value in bindings:
+            patcher.attribute(module, name, value)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class NodeSimulation:
+
+    # Node simulation
+    # How it works: Installs the fakes in place of the MicroPython modules,
+    # binds them into the node modules, writes config.json to a scratch
+    # directory and then behaves like main.py: construct the node, call
+    # main(), and restart it after an exception. A deep sleep, reset or
+    # HAT power down raises SimulatedReset, the simulated board stays off
+    # for the time given and boots a new node, which finds its files and
+    # resume state in the scratch directory. The run ends when a sleep
+    # reaches the simulated duration. messages are (at s, topic, payload)
+    # published to the node from elsewhere, e.g. remote config.
+    #
+    # A cycle is measured from the end of one node.sleep() to the start of
+    # the next, its wall time on this host is reported as CPU time, the
+    # virtual time spent waiting on the fakes is not included.
+
+    def __init__(self, node_class, config=None, days=1, seed=1,
+                 arrivals=None, weather=None, outages=(), hat_period_s=None,
+                 handshake_s=1.5, log_level=None, trace_allocations=False,
+                 work_dir=None, messages=()):
+        self.node_class = node_class
+        self.config = dict(config if config is not None else DISTANCE_CONFIG)  # noqa: E501
+        self.days = days
+        self.seed = seed
+        self.arrivals = arrivals if arrivals is not None else workday_arrivals(days)  # noqa: E501
+        self.weather = weather or weather_script()
+        self.outages = tuple(outages)  # (start s, end s) without Wi-Fi
+        self.hat_period_s = hat_period_s
+        self.handshake_s = handshake_s
+        self.log_level = log_level
+        self.trace_allocations = trace_allocations
+        self.work_dir = work_dir
+        self.messages = tuple(messages)
+        self.clock = None
+        self.broker = None
+        self.node = None
+
+    def outage(self):
+        now = self.clock.elapsed_s()
+        return any(start <= now < end for start, end in self.outages)
+
+    def build(self):
+        rng = random.Random(self.seed)
+        self.clock = VirtualClock(end_s=self.days * 86400)
+        self.board = FakeBoard(self.clock, hat_period_s=self.hat_period_s)
+        self.network = FakeNetwork(self.clock, self.config.get("WIFI_SSID"),
+                                   self.config.get("WIFI_PASSWORD"),
+                                   down=self.outage)
+        self.ntp = FakeNtp(self.clock, down=self.outage)
+        self.broker = FakeBroker(
+            self.clock, handshake_s=self.handshake_s, down=self.outage,
+            wlan_up=lambda: self.network.wlan is not None and
+            self.network.wlan.isconnected())
+        for at_s, topic, payload in self.messages:
+            self.broker.schedule(at_s, topic, payload)
+        self.distance_sensor = ScriptedVL53L1X(
+            self.clock, car_park_script(self.arrivals), rng)
+        self.atmospheric_sensor = ScriptedBME280(self.clock, self.weather,
+                                                 rng)
+
+    def install(self, patcher):
+        install_node_modules(
+            patcher, self.clock, self.board, self.network, self.ntp,
+            self.broker.client_class(),
+            lambda *args, **kwargs: self.distance_sensor,
+            lambda *args, **kwargs: self.atmospheric_sensor)
+
+    def node_factory(self):
+        if not isinstance(self.node_class, str):
+            return self.node_class
+        module_name, class_name = self.node_class.split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def instrument(self, node):
+        # time every cycle, from the end of one sleep to the next
+        sleep = node.sleep
+
+        def timed_sleep(seconds):
+            self.end_cycle()
+            try:
+                sleep(seconds)
+            finally:
+                self.start_cycle()
+        node.sleep = timed_sleep
+
+    def start_cycle(self):
+        self._cycle_start = time.perf_counter()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self._cycle_memory = tracemalloc.get_traced_memory()[0]
+
+    def end_cycle(self):
+        self.cycle_times.append(time.perf_counter() - self._cycle_start)
+        if self.trace_allocations:
+            self.cycle_allocations.append(
+                tracemalloc.get_traced_memory()[1] - self._cycle_memory)
+
+    def boot(self, node_class):
+        from lib.inboxidau.rolling_appender_log import URollingAppenderLog
+        log_level = self.log_level or node_class.STATIC_NODE_LOG_LEVEL
+        log = URollingAppenderLog("node.log", max_file_size_bytes=4096,
+                                  max_backups=10, log_level=log_level,
+                                  buffer_size=16)
+        self.boots += 1
+        self.boot_times.append(self.clock.elapsed_s())
+        self.start_cycle()
+        node = node_class(log=log, config_path="config.json")
+        self.node = node
+        self.instrument(node)
+        return node
+
+    def run_main(self, node):
+        # what main.py does
+        while True:
+            try:
+                node.main()
+            except Exception as e:
+                self.main_exceptions.append(repr(e))
+                self.clock.sleep(node.STATIC_NODE_RESTART_DELAY)
+
+    def run(self):
+        self.build()
+        self.boots = 0
+        self.boot_times = []
+        self.resets = {}
+        self.main_exceptions = []
+        self.cycle_times = []
+        self.cycle_allocations = []
+        patcher = ModulePatcher()
+        filesystem = FileSystemCounter()
+        cwd = os.getcwd()
+        scratch = None
+        if self.work_dir is None:
+            scratch = tempfile.TemporaryDirectory()
+            work_dir = scratch.name
+        else:
+            work_dir = self.work_dir
+        wall_start = time.perf_counter()
+        try:
+            self.install(patcher)
+            node_class = self.node_factory()
+            os.chdir(work_dir)
+            with open("config.json", "w") as file:
+                json.dump(self.config, file)
+            if self.trace_allocations:
+                tracemalloc.start()
+            filesystem.install()
+            try:
+                while True:
+                    try:
+                        self.run_main(self.boot(node_class))
+                    except SimulatedReset as reset:
+                        self.resets[reset.reason] = self.resets.get(reset.reason, 0) + 1  # noqa: E501
+                        self.clock.sleep(reset.off_s)
+            except SimulationComplete:
+                pass
+            finally:
+                filesystem.uninstall()
+                if self.trace_allocations:
+                    tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+            patcher.restore()
+            if scratch is not None:
+                scratch.cleanup()
+        wall_s = time.perf_counter() - wall_start
+        return self.report(wall_s, filesystem)
+
+    def boot_to_publish(self):
+        # simulated seconds from each boot to its first publish
+        times = [message[0] for message in self.broker.messages]
+        delays = []
+        ends = self.boot_times[1:] + [self.clock.elapsed_s()]
+        for boot, end in zip(self.boot_times, ends):
+            index = bisect.bisect_left(times, boot)
+            if index < len(times) and times[index] < end:
+                delays.append(times[index] - boot)
+        return delays
+
+    def report(self, wall_s, filesystem):
+        cycle_ms = [seconds * 1000 for seconds in self.cycle_times]
+        boot_to_publish = self.boot_to_publish()
+        report = {
+            "simulated_s": self.clock.elapsed_s(),
+            "wall_s": wall_s,
+            "boots": self.boots,
+            "resets": dict(self.resets),
+            "main_exceptions": len(self.main_exceptions),
+            "cycles": len(cycle_ms),
+            "cpu_ms_mean": sum(cycle_ms) / len(cycle_ms) if cycle_ms else 0,  # noqa: E501
+            "cpu_ms_p50": percentile(cycle_ms, 0.5),
+            "cpu_ms_p95": percentile(cycle_ms, 0.95),
+            "cpu_ms_max": max(cycle_ms) if cycle_ms else 0,
+            "boot_to_publish_s": sum(boot_to_publish) / len(boot_to_publish) if boot_to_publish else 0,  # noqa: E501
+            "publishes": self.broker.publishes,
+            "payload_bytes": self.broker.payload_bytes,
+            "handshakes": self.broker.handshakes,
+            "pings": self.broker.pings,
+            "broker_failures": self.broker.failed,
+            "broker_expired": self.broker.expired,
+            "wifi_associations": self.network.associations,
+            "wifi_scans": self.network.scans,
+            "dhcp_leases": self.network.dhcp_leases,
+            "ntp_syncs": self.ntp.syncs,
+            "sensor_reads": self.distance_sensor.reads + self.atmospheric_sensor.reads,  # noqa: E501
+            "fs_ops": filesystem.total(),
+            "fs_opens": filesystem.opens,
+            "fs_writes": filesystem.writes,
+            "fs_bytes_written": filesystem.bytes_written,
+        }
+        for name, count in filesystem.os_calls.items():
+            report[f"fs_{name}"] = count
+        if self.trace_allocations:
+            report["alloc_peak_bytes_p95"] = percentile(self.cycle_allocations, 0.95)  # noqa: E501
+            report["alloc_peak_bytes_max"] = max(self.cycle_allocations, default=0)  # noqa: E501
+        return report
+
+
+def format_report(report):
+    lines = []
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}" if value < 100 else f"{value:.0f}"
+        lines.append(f"{key:<24}{value}")
+    return "\n".join(lines)
@@ -0,0 +1,457 @@
+import select
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+# MQTT 3.1.1 over real sockets, for driving many nodes at once: a broker
+# stand-in to measure, and the umqtt.simple client interface the node uses.
+# Only what the nodes need is implemented, QoS 0 publishes, PINGREQ,
+# SUBSCRIBE with QoS 0 grants and DISCONNECT.
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+class MQTTException(Exception):
+    pass
+
+
+def encode_length(length):
+    # MQTT remaining length, 7 bits per byte
+    encoded = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return len(value).to_bytes(2, "big") + value
+
+
+def decode_string(data, offset):
+    # (bytes, offset after it)
+    length = int.from_bytes(data[offset:offset + 2], "big")
+    offset += 2
+    return bytes(data[offset:offset + length]), offset + length
+
+
+def packet(header, body=b""):
+    return bytes((header,)) + encode_length(len(body)) + body
+
+
+def packet_size(body):
+    return 1 + len(encode_length(len(body))) + len(body)
+
+
+def receive_exact(sock, count):
+    data = bytearray()
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise OSError(-1, "connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def read_packet(sock):
+    # (first header byte, body) of the next packet
+    header = receive_exact(sock, 1)[0]
+    length = 0
+    shift = 0
+    while True:
+        byte = receive_exact(sock, 1)[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return header, receive_exact(sock, length) if length else b""
+
+
+def self_signed_certificate(directory, common_name="localhost"):
+    # (certfile, keyfile) for a TLS broker, made with the openssl tool
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        raise RuntimeError("openssl not found, give a certificate and key")
+    certfile = f"{directory}/broker.crt"
+    keyfile = f"{directory}/broker.key"
+    subprocess.run([openssl, "req", "-x509", "-newkey", "rsa:2048",
+                    "-nodes", "-days", "1", "-subj", f"/CN={common_name}",
+                    "-keyout", keyfile, "-out", certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def server_context(certfile, keyfile):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def client_context():
+    # Like the node, which passes ssl=True without a CA, the broker's
+    # certificate is not verified. The Pico W's mbedTLS speaks TLS 1.2.
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+
+class TcpBroker:
+
+    # TCP MQTT broker stand-in
+    # How it works: Listens on a real port, plain or TLS, and serves each
+    # connection on its own thread. It answers CONNECT, PINGREQ and
+    # SUBSCRIBE and counts everything the fleet sends: connects, clean
+    # disconnects, connections dropped without a DISCONNECT, sessions taken
+    # over by a second connect with the same client id, publishes and
+    # bytes. The time each PUBLISH is fully read is kept per client id, in
+    # the order the client sent them, for publish latency. Messages are not
+    # routed to subscribers. cpu_s adds up the CPU time of the broker's
+    # threads.
+
+    # Usage:
+    # broker = TcpBroker(ssl_context=server_context(certfile, keyfile))
+    # port = broker.start()
+    # ...
+    # broker.stop()
+    # broker.publishes, broker.received["e661..."]
+
+    def __init__(self, host="127.0.0.1", port=0, ssl_context=None,
+                 backlog=1024):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.backlog = backlog
+        self.received = {}  # client id: [time.monotonic() of each publish]
+        self.tls_handshake_s = []
+        self._lock = threading.Lock()
+        self._listener = None
+        self._threads = []
+        self._sessions = {}  # client id: socket
+        self._sockets = set()
+        self._stopping = False
+        # counters
+        self.connections = 0
+        self.open_connections = 0
+        self.peak_connections = 0
+        self.connects = 0
+        self.disconnects = 0
+        self.drops = 0
+        self.takeovers = 0
+        self.tls_failures = 0
+        self.publishes = 0
+        self.payload_bytes = 0
+        self.bytes_received = 0
+        self.pings = 0
+        self.subscribes = 0
+        self.cpu_s = 0.0
+
+    def start(self):
+        # Listen and accept in the background, returns the port
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        listener.settimeout(0.2)  # to notice stop()
+        self._listener = listener
+        self.port = listener.getsockname()[1]
+        self._start_thread(self._accept)
+        return self.port
+
+    def stop(self):
+        self._stopping = True
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join(5)
+        self._listener.close()
+
+    def client_ids(self):
+        return list(self.received)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=self._timed, args=(target,) + args,
+                                  daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _timed(self, target, *args):
+        try:
+            target(*args)
+        finally:
+            cpu_s = time.thread_time()
+            with self._lock:
+                self.cpu_s += cpu_s
+
+    def _accept(self):
+        while not self._stopping:
+            try:
+                sock, _ = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._sockets.add(sock)
+                self.connections += 1
+                self.open_connections += 1
+                self.peak_connections = max(self.peak_connections,
+                                            self.open_connections)
+            self._start_thread(self._serve, sock)
+
+    def _serve(self, sock):
+        client_id = None
+        clean = False
+        try:
+            if self.ssl_context is not None:
+                start = time.perf_counter()
+                try:
+                    tls = self.ssl_context.wrap_socket(sock, server_side=True)
+                except (OSError, ssl.SSLError):
+                    with self._lock:
+                        self.tls_failures += 1
+                    return
+                with self._lock:
+                    self._sockets.discard(sock)
+                    self._sockets.add(tls)
+                    self.tls_handshake_s.append(time.perf_counter() - start)
+                sock = tls
+            while not self._stopping:
+                header, body = read_packet(sock)
+                kind = header >> 4
+                if kind == PUBLISH:
+                    self._publish(client_id, header, body)
+                elif kind == PINGREQ:
+                    with self._lock:
+                        self.pings += 1
+                    sock.sendall(packet(PINGRESP << 4))
+                elif kind == CONNECT:
+                    client_id = self._connect(sock, body)
+                    sock.sendall(packet(CONNACK << 4, b"\x00\x00"))
+                elif kind == SUBSCRIBE:
+                    sock.sendall(self._subscribe(body))
+                elif kind == DISCONNECT:
+                    clean = True
+                    break
+                else:
+                    raise MQTTException(f"unexpected packet type {kind}")
+        except (OSError, MQTTException):
+            pass
+        finally:
+            self._close(client_id, sock, clean)
+
+    def _connect(self, sock, body):
+        # the client id follows the 10 byte variable header
+        client_id, _ = decode_string(body, 10)
+        client_id = client_id.decode()
+        with self._lock:
+            self.connects += 1
+            self.bytes_received += packet_size(body)
+            self.received.setdefault(client_id, [])
+            previous = self._sessions.get(client_id)
+            self._sessions[client_id] = sock
+        if previous is not None:
+            # MQTT closes the older connection of a client id
+            with self._lock:
+                self.takeovers += 1
+            try:
+                previous.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return client_id
+
+    def _publish(self, client_id, header, body):
+        now = time.monotonic()
+        topic, offset = decode_string(body, 0)
+        if header & 0x06:
+            offset += 2  # packet id, only with QoS 1 and 2
+        with self._lock:
+            self.publishes += 1
+            self.payload_bytes += len(body) - offset
+            self.bytes_received += packet_size(body)
+            self.received.setdefault(client_id, []).append(now)
+
+    def _subscribe(self, body):
+        # SUBACK granting QoS 0 for every topic filter
+        topics = 0
+        offset = 2
+        while offset < len(body):
+            _, offset = decode_string(body, offset)
+            offset += 1  # requested QoS
+            topics += 1
+        with self._lock:
+            self.subscribes += topics
+        return packet(SUBACK << 4, body[:2] + b"\x00" * topics)
+
+    def _close(self, client_id, sock, clean):
+        with self._lock:
+            self._sockets.discard(sock)
+            self.open_connections -= 1
+            taken_over = client_id is not None and \
+                self._sessions.get(client_id) is not sock
+            if not taken_over:
+                self._sessions.pop(client_id, None)
+                if clean:
+                    self.disconnects += 1
+                elif client_id is not None:
+                    self.drops += 1
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+class TcpMQTTClient:
+
+    # The umqtt.simple MQTTClient interface over a real socket
+    # How it works: connect() opens a TCP connection, wrapped in TLS when
+    # ssl is True or an SSLContext, and waits for the CONNACK. A publish is
+    # written straight to the socket, check_msg() only reads when the
+    # socket has data waiting. Socket errors are raised as OSError, like
+    # on the Pico W. sent_times holds time.monotonic() at the start of
+    # every publish written and connect_times the seconds from opening
+    # the connection to the CONNACK, TLS handshake included.
+
+    # Usage:
+    # client = TcpMQTTClient("e661...", "127.0.0.1", port=1883)
+    # client.connect()
+    # client.publish("topic", "payload")
+    # client.disconnect()
+
+    def __init__(self, client_id, server, port=0, user=None, password=None,
+                 keepalive=0, ssl=False, ssl_params=None, timeout_s=10):
+        if port == 0:
+            port = 8883 if ssl else 1883
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.ssl = ssl
+        self.ssl_params = ssl_params or {}
+        self.timeout_s = timeout_s
+        self.sock = None
+        self.cb = None
+        self.sent_times = []
+        self.connect_times = []
+
+    def set_callback(self, callback):
+        self.cb = callback
+
+    def _socket(self):
+        if self.sock is None:
+            raise OSError(107, "not connected")  # ENOTCONN
+        return self.sock
+
+    def connect(self, clean_session=True):
+        start = time.monotonic()
+        sock = socket.create_connection((self.server, self.port),
+                                        timeout=self.timeout_s)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.ssl:
+            context = self.ssl if isinstance(self.ssl, ssl.SSLContext) \
+                else client_context()
+            try:
+                sock = context.wrap_socket(sock,
+                                           server_hostname=self.server)
+            except OSError:
+                sock.close()
+                raise
+        flags = 0x02 if clean_session else 0
+        payload = encode_string(self.client_id)
+        if self.user:
+            flags |= 0x80
+            payload += encode_string(self.user)
+            if self.password:
+                flags |= 0x40
+                payload += encode_string(self.password)
+        body = encode_string("MQTT") + bytes((4, flags)) + \
+            self.keepalive.to_bytes(2, "big") + payload
+        try:
+            sock.sendall(packet(CONNECT << 4, body))
+            header, response = read_packet(sock)
+        except OSError:
+            sock.close()
+            raise
+        if header >> 4 != CONNACK or response[1] != 0:
+            sock.close()
+            raise MQTTException(response[1] if len(response) > 1 else header)  # noqa: E501
+        self.sock = sock
+        self.connect_times.append(time.monotonic() - start)
+        return response[0] & 1
+
+    def disconnect(self):
+        sock = self._socket()
+        self.sock = None
+        try:
+            sock.sendall(packet(DISCONNECT << 4))
+        finally:
+            sock.close()
+
+    def ping(self):
+        self._socket().sendall(packet(PINGREQ << 4))
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        if qos != 0:
+            raise MQTTException("only QoS 0 is supported")
+        if isinstance(msg, str):
+            msg = msg.encode()
+        sock = self._socket()
+        start = time.monotonic()
+        sock.sendall(packet(PUBLISH << 4 | (1 if retain else 0),
+                            encode_string(topic) + msg))
+        self.sent_times.append(start)
+
+    def subscribe(self, topic, qos=0):
+        self._socket().sendall(packet(SUBSCRIBE << 4 | 0x02,
+                                      b"\x00\x01" + encode_string(topic) +
+                                      bytes((qos,))))
+        while self.wait_msg() != SUBACK:
+            pass
+
+    def wait_msg(self):
+        # Read one packet, a PUBLISH goes to the callback, returns the
+        # type of any other packet
+        header, body = read_packet(self._socket())
+        kind = header >> 4
+        if kind != PUBLISH:
+            return kind
+        topic, offset = decode_string(body, 0)
+        if header & 0x06:
+            offset += 2
+        if self.cb is not None:
+            self.cb(topic, bytes(body[offset:]))
+        return None
+
+    def check_msg(self):
+        sock = self._socket()
+        pending = isinstance(sock, ssl.SSLSocket) and sock.pending()
+        if not pending:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                return None
+        return self.wait_msg()
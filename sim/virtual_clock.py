@@ -0,0 +1,91 @@
+import time as _time
+
+# MicroPython's ticks_ms wraps at 2**30, the virtual clock wraps the same
+# way so that simulated days exercise the wrap-safe arithmetic
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+# 2024-06-01T00:00:00Z
+DEFAULT_START_EPOCH = 1717200000
+
+
+class SimulationComplete(BaseException):
+
+    # Raised from a sleep once the simulated duration is over. Derived from
+    # BaseException so that the node's own except Exception handlers do
+    # not swallow it.
+
+    pass
+
+
+class VirtualClock:
+
+    # Virtual clock
+    # How it works: Stands in for the time and utime modules. Simulated
+    # time only moves when the node sleeps or a fake device takes time to
+    # respond, so days of node lifecycle run in seconds. The ticks_*
+    # functions wrap like MicroPython's. When end_s is given, a sleep that
+    # reaches it raises SimulationComplete.
+
+    # Usage:
+    # clock = VirtualClock(end_s=86400)
+    # clock.sleep(5)
+    # clock.elapsed_s()
+
+    def __init__(self, start_epoch=DEFAULT_START_EPOCH, end_s=None):
+        self.start_epoch = start_epoch
+        self.end_s = end_s
+        self._now_us = 0
+        # counters
+        self.sleeps = 0
+        self.slept_s = 0.0
+
+    def elapsed_s(self):
+        return self._now_us / 1000000
+
+    def advance(self, seconds):
+        # time spent working, never ends the simulation
+        if seconds > 0:
+            self._now_us += int(seconds * 1000000)
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        self.slept_s += seconds
+        self.advance(seconds)
+        if self.end_s is not None and self.elapsed_s() >= self.end_s:
+            raise SimulationComplete()
+
+    def sleep_ms(self, ms):
+        self.sleep(ms / 1000)
+
+    def sleep_us(self, us):
+        self.sleep(us / 1000000)
+
+    def time(self):
+        return self.start_epoch + self._now_us // 1000000
+
+    def time_ns(self):
+        return (self.start_epoch * 1000000 + self._now_us) * 1000
+
+    def monotonic(self):
+        return self.elapsed_s()
+
+    def localtime(self, secs=None):
+        # MicroPython's 8-tuple, UTC like a Pico W after ntptime.settime()
+        return tuple(_time.gmtime(self.time() if secs is None else secs))[:8]  # noqa: E501
+
+    gmtime = localtime
+
+    def ticks_ms(self):
+        return (self._now_us // 1000) & TICKS_MAX
+
+    def ticks_us(self):
+        return self._now_us & TICKS_MAX
+
+    def ticks_add(self, ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(self, ticks1, ticks2):
+        return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - \
+            TICKS_HALFPERIOD
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.adaptive_cadence import UAdaptiveCadence  # noqa: E402
+
+
+class TestAdaptiveCadence(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cadence = UAdaptiveCadence(min_s=1, max_s=16, threshold=900,
+                                        rate_threshold=100, burst_samples=2)
+
+    def update(self, value):
+        delay = self.cadence.update(value)
+        self.now += int(delay * 1000)
+        return delay
+
+    def test_backs_off_while_stable(self):
+        delays = [self.update(2000) for _ in range(7)]
+        self.assertEqual(delays, [2, 4, 8, 16, 16, 16, 16])
+        self.assertEqual(self.cadence.rate_hz(), 1 / 16)
+
+    def test_threshold_crossing_bursts(self):
+        for _ in range(5):
+            self.update(2000)
+        self.assertEqual(self.update(500), 1)
+        self.assertEqual(self.cadence.bursts, 1)
+        # burst_samples more at the fast rate, then back off again
+        self.assertEqual([self.update(500) for _ in range(4)], [1, 1, 2, 4])
+
+    def test_fast_change_bursts(self):
+        for _ in range(5):
+            self.update(2000)
+        # 16 s at the slow rate, 2000 mm is 125 mm/s
+        self.assertEqual(self.update(4000), 1)
+        # 10 mm/s is slow enough to back off
+        self.assertEqual(self.update(4010), 1)
+        self.assertEqual(self.update(4020), 1)
+        self.assertEqual(self.update(4030), 2)
+
+    def test_crossing_during_burst_extends_it(self):
+        self.update(2000)
+        self.update(500)
+        self.update(2000)
+        self.assertEqual(self.cadence.bursts, 1)
+        self.assertEqual(self.cadence.burst_remaining, 2)
+
+    def test_no_threshold(self):
+        cadence = UAdaptiveCadence(min_s=1, max_s=4)
+        self.assertEqual([cadence.update(value) for value in (1, 900, 1)],
+                         [2, 4, 4])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            UAdaptiveCadence(min_s=0)
+        with self.assertRaises(ValueError):
+            UAdaptiveCadence(min_s=10, max_s=5)
+        with self.assertRaises(ValueError):
+            UAdaptiveCadence(backoff=0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
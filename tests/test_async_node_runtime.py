@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.async_node_runtime import BoundedQueue, UAsyncNodeRuntime  # noqa: E402, E501
+from lib.inboxidau.sensor_drivers import (SENSOR_DRIVERS,  # noqa: E402
+                                          USensorDriver, register_driver)
+from sim.broker import FakeBroker  # noqa: E402
+from sim.fakes import FakeBoard, FakeNetwork, FakeNtp  # noqa: E402
+from sim.harness import BASE_CONFIG, ModulePatcher, install_node_modules  # noqa: E402, E501
+from sim.virtual_clock import VirtualClock  # noqa: E402
+
+
+class FakeLog:
+
+    flush_interval_s = 0.05
+
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+
+class FakeWLAN:
+
+    def __init__(self, node):
+        self.node = node
+
+    def isconnected(self):
+        return self.node.network_up
+
+    def disconnect(self):
+        pass
+
+
+class FakeCache:
+
+    def forget_link(self):
+        pass
+
+    def save(self):
+        pass
+
+
+class FakeSession:
+
+    def __init__(self, node):
+        self.node = node
+        self.connected = False
+
+    def keep_alive(self):
+        if not self.node.network_up:
+            self.connected = False
+            raise OSError("link down")
+
+
+class FakeNode:
+
+    # Just enough of UPicoWSensorNode for the runtime, the network comes up
+    # after network_up_after samples
+    STATIC_NODE_SENSE_REPEAT_DELAY = 0.02
+    STATIC_NODE_RESTART_DELAY = 0.02
+    STATIC_WIFI_POLL_MS = 1
+    STATIC_WIFI_CONNECT_TIMEOUT = 0.01
+    MAKERVERSE_NANO_POWER_TIMER_HAT = False
+    WIFI_FAST_CONNECT = False
+    WIFI_STATIC_IP = []
+    metrics = None
+
+    def __init__(self, network_up_after):
+        self.log = FakeLog()
+        self.wifi = FakeWLAN(self)
+        self.mqtt_session = FakeSession(self)
+        self.wifi_cache = FakeCache()
+        self.publish_queue = None
+        self.sensor_scheduler = None
+        self.network_up_after = network_up_after
+        self.network_up = False
+        self.cycle = 0
+        self.sensor_data = {}
+        self.sampled_drivers = []
+        self.posted = []
+        self.reading = 0
+
+    def log_message(self, message, log_level=None):
+        pass
+
+    def initialize_sensors(self):
+        pass
+
+    def next_sleep_delay(self):
+        return self.STATIC_NODE_SENSE_REPEAT_DELAY
+
+    def read_sensor_data(self):
+        self.reading += 1
+        self.sensor_data["value"] = self.reading
+        if self.reading > self.network_up_after:
+            self.network_up = True
+
+    def post_sensor_data(self):
+        # like the node subclasses, errors are not raised
+        if self.network_up:
+            self.posted.append(self.sensor_data["value"])
+        else:
+            self.mqtt_session.connected = False
+
+    def report_sensor_data(self):
+        self.post_sensor_data()
+
+    def initialize_wifi(self, bssid=None, ifconfig=None):
+        pass
+
+    def connect_to_wifi_steps(self):
+        if not self.wifi.isconnected():
+            self.initialize_wifi()
+            self.wifi_connect_ms = yield self.STATIC_WIFI_CONNECT_TIMEOUT
+
+    def sync_network_time_if_needed(self):
+        pass
+
+    def connect_broker(self):
+        if not self.network_up:
+            raise OSError("no route")
+        self.mqtt_session.connected = True
+
+    def log_session_counters(self):
+        pass
+
+
+class TwoChannelNode(FakeNode):
+
+    # Publishes each reading on two channels through publish_channel, the
+    # broker drops the session on the first "b" publish
+
+    def __init__(self):
+        super().__init__(network_up_after=0)
+        self.network_up = True
+        self.sent_channels = None
+        self.failures = 1
+
+    def publish_channel(self, channel, value):
+        if self.sent_channels is not None and \
+                channel in self.sent_channels:
+            return True
+        if channel == "b" and self.failures:
+            self.failures -= 1
+            self.mqtt_session.connected = False
+            raise OSError("connection reset")
+        self.posted.append((channel, value))
+        if self.sent_channels is not None:
+            self.sent_channels.add(channel)
+        return True
+
+    def post_sensor_data(self):
+        try:
+            for channel in ("a", "b"):
+                self.publish_channel(channel, self.sensor_data["value"])
+        except OSError:
+            pass
+
+
+class CountingDriver(USensorDriver):
+
+    # reads 1, 2, 3, ...
+
+    TYPE = "counting"
+    CHANNELS = (("count", "H"),)
+
+    def read(self):
+        return {"count": self.samples + 1}
+
+
+def run_for(runtime, seconds):
+    async def run():
+        try:
+            await asyncio.wait_for(runtime.run_tasks(), seconds)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(run())
+
+
+class TestBoundedQueue(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        queue = BoundedQueue(3)
+        for item in range(5):
+            self.assertTrue(queue.put_nowait(item))
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual([queue.pop() for _ in range(3)], [2, 3, 4])
+        with self.assertRaises(IndexError):
+            queue.peek()
+
+    def test_backpressure(self):
+        queue = BoundedQueue(2, drop_oldest=False)
+        received = []
+
+        async def producer():
+            for item in range(6):
+                await queue.put(item)
+
+        async def consumer():
+            while len(received) < 6:
+                await queue.wait_not_empty()
+                self.assertLessEqual(len(queue), 2)
+                received.append(queue.pop())
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(producer(), consumer())
+
+        asyncio.run(run())
+        self.assertEqual(received, list(range(6)))
+        self.assertEqual(queue.dropped, 0)
+
+
+class TestUAsyncNodeRuntime(unittest.TestCase):
+
+    def make_runtime(self, node, queue_size=8):
+        runtime = UAsyncNodeRuntime(node, queue_size)
+        runtime.STATIC_LINK_CHECK_S = 0.005
+        runtime.STATIC_LINK_BACKOFF_MIN_S = 0.005
+        runtime.STATIC_LINK_BACKOFF_MAX_S = 0.01
+        return runtime
+
+    def test_readings_posted_in_order_once_the_link_is_up(self):
+        node = FakeNode(network_up_after=4)
+        runtime = self.make_runtime(node)
+        run_for(runtime, 0.3)
+        self.assertGreater(runtime.samples, 8)
+        self.assertEqual(node.posted, list(range(1, len(node.posted) + 1)))
+        self.assertGreaterEqual(len(node.posted), runtime.samples - 1)
+        self.assertGreater(node.log.flushes, 0)
+
+    def test_sampling_continues_while_offline(self):
+        node = FakeNode(network_up_after=1000)
+        runtime = self.make_runtime(node, queue_size=4)
+        run_for(runtime, 0.25)
+        # about one sample per cadence although nothing can be posted
+        self.assertGreater(runtime.samples, 8)
+        self.assertEqual(node.posted, [])
+        self.assertEqual(len(runtime.queue), 4)
+        self.assertEqual(runtime.queue.dropped, runtime.samples - 4)
+
+    def test_retry_skips_channels_already_sent(self):
+        node = TwoChannelNode()
+        runtime = self.make_runtime(node)
+        self.assertIsNone(runtime.queue)  # made on the running loop
+        run_for(runtime, 0.15)
+        self.assertEqual(runtime.post_failures, 1)
+        self.assertEqual(node.posted[:4],
+                         [("a", 1), ("b", 1), ("a", 2), ("b", 2)])
+        self.assertEqual(len(node.posted), len(set(node.posted)))
+
+    def test_post_adapter_restores_live_sensor_data(self):
+        node = FakeNode(network_up_after=0)
+        node.network_up = True
+        runtime = self.make_runtime(node)
+        node.sensor_data = {"value": 99}
+        runtime.post_reading(({"value": 7}, []))
+        self.assertEqual(node.posted, [7])
+        self.assertEqual(node.sensor_data, {"value": 99})
+
+
+class TestDriverNodeReadings(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        config = dict(BASE_CONFIG, SENSORS=[
+            {"TYPE": "counting", "NAME": "fast", "PERIOD": 5,
+             "TOPICS": {"count": "node/fast"}},
+            {"TYPE": "counting", "NAME": "slow", "PERIOD": 60,
+             "TOPICS": {"count": "node/slow"}}])
+        with open("config.json", "w") as file:
+            json.dump(config, file)
+        register_driver(CountingDriver)
+        self.clock = VirtualClock()
+        network = FakeNetwork(self.clock, config["WIFI_SSID"],
+                              config["WIFI_PASSWORD"])
+        self.patcher = ModulePatcher()
+        install_node_modules(self.patcher, self.clock, FakeBoard(self.clock),
+                             network, FakeNtp(self.clock),
+                             FakeBroker(self.clock).client_class(), None,
+                             None)
+
+    def tearDown(self):
+        self.patcher.restore()
+        SENSOR_DRIVERS.pop("counting")
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_queued_readings_post_their_own_drivers_and_values(self):
+        from lib.inboxidau.pico_w_sensor_node import UPicoWSensorNode
+        from lib.inboxidau.rolling_appender_log import URollingAppenderLog
+        node = UPicoWSensorNode(URollingAppenderLog("node.log"),
+                                "config.json")
+        published = []
+        node.publish = lambda topic, payload, retain=False: \
+            published.append((topic, payload))
+        node.initialize_sensors()
+        runtime = UAsyncNodeRuntime(node)
+        readings = []
+        for _ in range(3):
+            readings.append(runtime.take_sample())
+            self.clock.advance(5)
+        for reading in readings:
+            runtime.post_reading(reading)
+        self.assertEqual(published, [("node/fast", "1"), ("node/slow", "1"),
+                                     ("node/fast", "2"), ("node/fast", "3")])
+
+
+if __name__ == '__main__':
+    unittest.main()
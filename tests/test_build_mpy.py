@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from tools.build_mpy import (compile_command, manifest, mpy_path,  # noqa: E402
+                             sources)
+
+
+class TestBuildMpy(unittest.TestCase):
+
+    def test_sources(self):
+        modules = sources(nodes=["DistanceSensorNode.py", "main.py"])
+        self.assertIn(os.path.join("lib", "inboxidau", "pico_w_sensor_node.py"), modules)  # noqa: E501
+        self.assertIn(os.path.join("lib", "inboxidau", "clock.py"), modules)
+        self.assertEqual(modules[-1], "DistanceSensorNode.py")
+        # main.py is always run from source
+        self.assertNotIn("main.py", modules)
+
+    def test_compile_command(self):
+        source = os.path.join("lib", "inboxidau", "clock.py")
+        self.assertEqual(
+            compile_command("mpy-cross", source, "/tmp/clock.mpy",
+                            "armv6m", 2),
+            ["mpy-cross", "-o", "/tmp/clock.mpy", "-march=armv6m", "-O2",
+             "-s", "lib/inboxidau/clock.py", source])
+        self.assertEqual(mpy_path(source),
+                         os.path.join("lib", "inboxidau", "clock.mpy"))
+
+    def test_manifest(self):
+        text = manifest([os.path.join("lib", "inboxidau", "clock.py"),
+                         "DistanceSensorNode.py"], root="/src")
+        self.assertIn('require("umqtt.simple")', text)
+        self.assertIn('module("lib/inboxidau/clock.py", base_path="/src")',
+                      text)
+        self.assertIn('module("DistanceSensorNode.py", base_path="/src")',
+                      text)
+
+
+if __name__ == '__main__':
+    unittest.main()
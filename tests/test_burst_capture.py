@@ -0,0 +1,96 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.burst_capture import UBurstCapture  # noqa: E402
+
+
+class FakeClock:
+
+    # microsecond ticks that only move on sleep_us or a sensor read
+
+    def __init__(self):
+        self.now_us = 0
+        self.sleeps = []
+
+    def ticks_us(self):
+        return self.now_us
+
+    def sleep_us(self, us):
+        self.sleeps.append(us)
+        self.now_us += us
+
+
+class TestUBurstCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.multiple(clock, ticks_us=self.clock.ticks_us,
+                                 sleep_us=self.clock.sleep_us)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sensor(self, values, read_us=1000):
+        values = iter(values)
+
+        def read():
+            self.clock.now_us += read_us
+            return next(values)
+        return read
+
+    def test_capture_is_paced(self):
+        burst = UBurstCapture(rate_hz=50, duration_s=0.1)
+        samples = burst.capture(self.sensor(range(900, 905)), 1717200000)
+        self.assertEqual(list(samples), [900, 901, 902, 903, 904])
+        self.assertEqual(burst.count, 5)
+        self.assertEqual(burst.overruns, 0)
+        # a 20 ms slot less the 1 ms read
+        self.assertEqual(self.clock.sleeps, [19000] * 4)
+        # the array is reused by the next burst
+        self.assertIs(burst.capture(self.sensor(range(5)), 0), samples)
+
+    def test_slow_reads_are_counted(self):
+        burst = UBurstCapture(rate_hz=50, duration_s=0.1)
+        burst.capture(self.sensor(range(5), read_us=30000), 0)
+        self.assertEqual(burst.overruns, 4)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_payloads_round_trip(self):
+        burst = UBurstCapture(rate_hz=20, duration_s=1)
+        burst.capture(self.sensor(range(600, 620)), 1717200000)
+        payloads = list(burst.payloads(chunk_samples=8))
+        self.assertEqual(len(payloads), 3)
+        self.assertEqual(len(payloads[0]), UBurstCapture.HEADER_SIZE + 16)
+        samples = []
+        for payload in payloads:
+            header, chunk = UBurstCapture.decode(payload)
+            self.assertEqual(header["first"], len(samples))
+            samples += chunk
+        self.assertEqual(samples, list(range(600, 620)))
+        self.assertEqual(header, {"timestamp": 1717200000,
+                                  "interval_us": 50000, "first": 16,
+                                  "count": 4, "total": 20, "overruns": 0,
+                                  "typecode": "H"})
+
+    def test_float_samples(self):
+        burst = UBurstCapture(rate_hz=10, duration_s=0.3, typecode="f")
+        burst.capture(self.sensor([21.5, 21.75, 22.0]), 0)
+        header, samples = UBurstCapture.decode(next(burst.payloads()))
+        self.assertEqual(samples, [21.5, 21.75, 22.0])
+        self.assertEqual(header["typecode"], "f")
+
+    def test_invalid_burst(self):
+        with self.assertRaises(ValueError):
+            UBurstCapture(rate_hz=50, duration_s=0)
+        with self.assertRaises(ValueError):
+            UBurstCapture(typecode="d")
+        with self.assertRaises(ValueError):
+            UBurstCapture.decode(b"XX" + bytes(UBurstCapture.HEADER_SIZE))
+
+
+if __name__ == '__main__':
+    unittest.main()
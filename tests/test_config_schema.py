@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import config_schema  # noqa: E402
+from lib.inboxidau.config_schema import (BOOL, DICT, INT, LIST,  # noqa: E402
+                                         NUMBER, STR, UConfigSchema)
+
+FIELDS = (
+    ('WIFI_SSID', STR, ''),
+    ('MQTT_PORT', INT, 0),
+    ('HAT', BOOL, False),
+    ('DEADBANDS', DICT, {}),
+    ('STATIC_IP', LIST, []),
+    ('RATE_THRESHOLD', NUMBER, None),
+    ('WINDOW', NUMBER, lambda node: node.DELAY),
+    ('SLEEP_MODE', STR, 'busy', ('busy', 'light', 'deep')),
+)
+
+
+class TestUConfigSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = UConfigSchema(FIELDS)
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, "config.json")
+        self.snapshot_path = os.path.join(self.directory.name,
+                                          "config.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_config(self, config):
+        with open(self.config_path, "w") as file:
+            json.dump(config, file)
+
+    def test_validate_coerces_booleans(self):
+        config = self.schema.validate({"HAT": "True", "MQTT_PORT": 8883.0,
+                                       "RATE_THRESHOLD": None,
+                                       "OTHER": 1})
+        self.assertEqual(config, {"HAT": True, "MQTT_PORT": 8883,
+                                  "RATE_THRESHOLD": None})
+        self.assertEqual(self.schema.coerced, ["HAT", "MQTT_PORT"])
+        self.assertEqual(self.schema.unknown, ["OTHER"])
+        self.assertIs(self.schema.validate({"HAT": "false"})["HAT"], False)
+
+    def test_validate_reports_every_invalid_field(self):
+        with self.assertRaises(ValueError) as raised:
+            self.schema.validate({"MQTT_PORT": "8883", "HAT": "yes",
+                                  "WIFI_SSID": None, "SLEEP_MODE": "hibernate",  # noqa: E501
+                                  "WINDOW": True})
+        message = str(raised.exception)
+        for key in ("MQTT_PORT", "HAT", "WIFI_SSID", "SLEEP_MODE", "WINDOW"):
+            self.assertIn(key, message)
+
+    def test_apply_defaults(self):
+        node = SimpleNamespace(DELAY=300)
+        other = SimpleNamespace(DELAY=60)
+        self.schema.apply(node, {"WIFI_SSID": "home"})
+        self.schema.apply(other, {})
+        self.assertEqual(node.WIFI_SSID, "home")
+        self.assertEqual(node.SLEEP_MODE, "busy")
+        self.assertEqual(node.WINDOW, 300)
+        self.assertEqual(other.WINDOW, 60)
+        self.assertIsNone(node.RATE_THRESHOLD)
+        # mutable defaults are not shared
+        node.STATIC_IP.append("192.168.1.50")
+        self.assertEqual(other.STATIC_IP, [])
+
+    def test_load_compiles_then_reuses_snapshot(self):
+        self.write_config({"WIFI_SSID": "home", "HAT": "True",
+                           "DEADBANDS": {"tempC": 0.5},
+                           "STATIC_IP": ["192.168.1.50", "255.255.255.0"]})
+        config, compiled = self.schema.load(self.config_path,
+                                            self.snapshot_path)
+        self.assertTrue(compiled)
+        with patch.object(config_schema.json, "loads") as loads:
+            again, compiled = self.schema.load(self.config_path,
+                                               self.snapshot_path)
+        loads.assert_not_called()
+        self.assertFalse(compiled)
+        self.assertEqual(again, config)
+        self.assertEqual(again, {"WIFI_SSID": "home", "HAT": True,
+                                 "DEADBANDS": {"tempC": 0.5},
+                                 "STATIC_IP": ["192.168.1.50",
+                                               "255.255.255.0"]})
+
+    def test_touched_config_is_not_reparsed(self):
+        self.write_config({"WIFI_SSID": "home"})
+        self.schema.load(self.config_path, self.snapshot_path)
+        stat = os.stat(self.config_path)
+        os.utime(self.config_path, (stat.st_atime, stat.st_mtime + 10))
+        with patch.object(config_schema.json, "loads") as loads:
+            config, compiled = self.schema.load(self.config_path,
+                                                self.snapshot_path)
+        loads.assert_not_called()
+        self.assertFalse(compiled)
+        self.assertEqual(config, {"WIFI_SSID": "home"})
+
+    def test_changed_config_or_schema_recompiles(self):
+        self.write_config({"WIFI_SSID": "home"})
+        self.schema.load(self.config_path, self.snapshot_path)
+        self.write_config({"WIFI_SSID": "work"})
+        stat = os.stat(self.config_path)
+        os.utime(self.config_path, (stat.st_atime, stat.st_mtime + 10))
+        config, compiled = self.schema.load(self.config_path,
+                                            self.snapshot_path)
+        self.assertTrue(compiled)
+        self.assertEqual(config, {"WIFI_SSID": "work"})
+        # a snapshot of another schema is ignored
+        schema = UConfigSchema(FIELDS + (('EXTRA', INT, 0),))
+        config, compiled = schema.load(self.config_path, self.snapshot_path)
+        self.assertTrue(compiled)
+
+    def test_invalid_config_raises(self):
+        self.write_config({"MQTT_PORT": "8883"})
+        with self.assertRaises(ValueError):
+            self.schema.load(self.config_path, self.snapshot_path)
+        self.assertFalse(os.path.exists(self.snapshot_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import shutil
+import socket
+import sys
+import time
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.fleet import DISTANCE, NodeFleet, WallClock, node_config  # noqa: E402
+from sim.harness import DISTANCE_CONFIG  # noqa: E402
+from sim.tcp_broker import TcpBroker, TcpMQTTClient, encode_length  # noqa: E402, E501
+from sim.virtual_clock import SimulationComplete  # noqa: E402
+
+
+def wait_for(condition, timeout_s=2):
+    deadline = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestTcpBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = TcpBroker()
+        self.port = self.broker.start()
+
+    def tearDown(self):
+        self.broker.stop()
+
+    def client(self, client_id="node01"):
+        return TcpMQTTClient(client_id, "127.0.0.1", port=self.port,
+                             user="IoT", password="secret", keepalive=60)
+
+    def test_encode_length(self):
+        self.assertEqual(encode_length(0), b"\x00")
+        self.assertEqual(encode_length(127), b"\x7f")
+        self.assertEqual(encode_length(128), b"\x80\x01")
+        self.assertEqual(encode_length(16384), b"\x80\x80\x01")
+
+    def test_session(self):
+        client = self.client()
+        self.assertEqual(client.connect(), 0)
+        client.publish("carpark01/node01/distance", "612")
+        client.publish("carpark01/node01/distance", b"x" * 300, retain=True)
+        client.ping()
+        client.subscribe("node01/config")
+        client.check_msg()
+        client.disconnect()
+        broker = self.broker
+        self.assertTrue(wait_for(lambda: broker.disconnects == 1))
+        self.assertEqual(broker.connects, 1)
+        self.assertEqual(broker.publishes, 2)
+        self.assertEqual(broker.payload_bytes, 303)
+        self.assertEqual(broker.pings, 1)
+        self.assertEqual(broker.subscribes, 1)
+        self.assertEqual(broker.drops, 0)
+        self.assertEqual(len(broker.received["node01"]), 2)
+        self.assertEqual(len(client.sent_times), 2)
+        self.assertLessEqual(client.sent_times[0], broker.received["node01"][0])  # noqa: E501
+        self.assertEqual(len(client.connect_times), 1)
+
+    def test_subscribe_waits_for_suback(self):
+        client = self.client()
+        client.connect()
+        client.ping()
+        # the PINGRESP is read on the way to the SUBACK
+        client.subscribe("node01/config")
+        self.assertIsNone(client.check_msg())
+        client.disconnect()
+
+    def test_lost_connection_is_a_drop(self):
+        client = self.client()
+        client.connect()
+        client.sock.close()
+        client.sock = None
+        self.assertTrue(wait_for(lambda: self.broker.drops == 1))
+        with self.assertRaises(OSError):
+            client.publish("topic", "1")
+
+    def test_second_connect_takes_over_the_session(self):
+        first = self.client()
+        second = self.client()
+        first.connect()
+        second.connect()
+        self.assertTrue(wait_for(lambda: self.broker.takeovers == 1))
+        with self.assertRaises(OSError):
+            first.wait_msg()
+        second.disconnect()
+        self.assertTrue(wait_for(lambda: self.broker.disconnects == 1))
+        self.assertEqual(self.broker.drops, 0)
+
+    def test_refused_connection_raises_oserror(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        client = TcpMQTTClient("node01", "127.0.0.1", port=port)
+        with self.assertRaises(OSError):
+            client.connect()
+
+
+class TestNodeFleet(unittest.TestCase):
+
+    def test_wall_clock_ends_the_run(self):
+        clock = WallClock(time.monotonic(), end_s=0.2)
+        clock.sleep(0.05)
+        self.assertGreaterEqual(clock.elapsed_s(), 0.05)
+        with self.assertRaises(SimulationComplete):
+            clock.sleep(1)
+        self.assertLess(clock.elapsed_s(), 0.5)
+
+    def test_node_config(self):
+        config = node_config(DISTANCE_CONFIG, "fleet0001", 1883, 2)
+        self.assertEqual(config["MQTT_TOPIC_distance"],
+                         "carpark01/fleet0001/distance")
+        self.assertEqual((config["MQTT_BROKER"], config["MQTT_PORT"]),
+                         ("127.0.0.1", 1883))
+        self.assertEqual(config["STATIC_NODE_SENSE_REPEAT_DELAY"], 2)
+
+    def test_persistent_sessions_against_reconnects(self):
+        reports = [NodeFleet(nodes=4, cadence_s=0.5, duration_s=1.6,
+                             reconnect_each_cycle=reconnect).run()
+                   for reconnect in (False, True)]
+        for report in reports:
+            self.assertEqual(report["nodes_started"], 4)
+            self.assertEqual(report["node_exceptions"], 0)
+            self.assertGreaterEqual(report["cycles"], 8)
+            self.assertGreater(report["publishes"], 0)
+            self.assertEqual(report["latency_unmatched"], 0)
+            self.assertGreater(report["latency_ms_max"], 0)
+            self.assertEqual(report["drops"], 0)
+        persistent, reconnect = reports
+        self.assertEqual(persistent["connects"], 4)
+        self.assertEqual(persistent["reconnects"], 0)
+        self.assertEqual(reconnect["connects"], reconnect["cycles"])
+        self.assertGreater(reconnect["reconnects_per_node_h"], 0)
+
+    @unittest.skipIf(shutil.which("openssl") is None,
+                     "openssl is not installed")
+    def test_tls_fleet(self):
+        report = NodeFleet([DISTANCE], nodes=3, cadence_s=0.5,
+                           duration_s=1.2, tls=True).run()
+        self.assertEqual(report["tls_failures"], 0)
+        self.assertEqual(report["connects"], 3)
+        self.assertGreater(report["tls_handshake_ms_p50"], 0)
+        self.assertGreater(report["publishes"], 0)
+        self.assertEqual(report["node_exceptions"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
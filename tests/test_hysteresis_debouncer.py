@@ -0,0 +1,96 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.hysteresis_debouncer import UHysteresisDebouncer  # noqa: E402, E501
+
+
+class TestHysteresisDebouncer(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def feed(self, debouncer, values):
+        return [debouncer.update(value) for value in values]
+
+    def test_first_state_needs_a_run(self):
+        debouncer = UHysteresisDebouncer(900, 900, run_length=3)
+        self.assertEqual(self.feed(debouncer, [500, 500]), [False, False])
+        self.assertIsNone(debouncer.state)
+        self.assertTrue(debouncer.update(500))
+        self.assertTrue(debouncer.state)
+
+    def test_first_run_restarts_when_it_switches_sides(self):
+        debouncer = UHysteresisDebouncer(900, 900, run_length=3)
+        self.feed(debouncer, [500, 500, 2000, 2000])
+        self.assertIsNone(debouncer.state)
+        self.assertTrue(debouncer.update(2000))
+        self.assertFalse(debouncer.state)
+
+    def test_change_needs_consecutive_samples(self):
+        debouncer = UHysteresisDebouncer(900, 900, run_length=3)
+        self.feed(debouncer, [2000] * 3)
+        self.assertEqual(self.feed(debouncer, [500, 500, 2000, 500, 500]),
+                         [False] * 5)
+        self.assertFalse(debouncer.state)
+        self.assertTrue(debouncer.update(500))
+        self.assertTrue(debouncer.state)
+        self.assertEqual(debouncer.changes, 2)
+
+    def test_no_flapping_inside_the_band(self):
+        debouncer = UHysteresisDebouncer(850, 950, run_length=1)
+        self.assertTrue(debouncer.update(800))
+        # inside the band stays occupied
+        self.assertEqual(self.feed(debouncer, [920, 880, 949, 860]),
+                         [False] * 4)
+        self.assertTrue(debouncer.update(951))
+        self.assertFalse(debouncer.state)
+        # inside the band stays vacant
+        self.assertEqual(self.feed(debouncer, [870, 940, 851]), [False] * 3)
+        self.assertTrue(debouncer.update(849))
+
+    def test_active_above(self):
+        debouncer = UHysteresisDebouncer(30, 25, run_length=1)
+        self.assertTrue(debouncer.update(20))
+        self.assertFalse(debouncer.state)
+        self.assertFalse(debouncer.update(28))
+        self.assertTrue(debouncer.update(31))
+        self.assertTrue(debouncer.state)
+        self.assertFalse(debouncer.update(26))
+        self.assertTrue(debouncer.update(24))
+        self.assertFalse(debouncer.state)
+
+    def test_min_dwell_holds_changes(self):
+        debouncer = UHysteresisDebouncer(900, 900, run_length=1,
+                                         min_dwell_s=10)
+        self.assertTrue(debouncer.update(500))
+        self.now = 5000
+        self.assertFalse(debouncer.update(2000))
+        self.assertEqual(debouncer.held, 1)
+        self.assertTrue(debouncer.state)
+        self.now = 10000
+        self.assertTrue(debouncer.update(2000))
+        self.assertFalse(debouncer.state)
+
+    def test_update_state_takes_assessed_samples(self):
+        debouncer = UHysteresisDebouncer(850, 950, run_length=2)
+        self.assertTrue(debouncer.candidate(800))
+        self.assertEqual([debouncer.update_state(debouncer.candidate(value))
+                          for value in (800, 800, 900, 1000, 1000)],
+                         [False, True, False, False, True])
+        self.assertFalse(debouncer.state)
+
+    def test_invalid_run_length(self):
+        with self.assertRaises(ValueError):
+            UHysteresisDebouncer(900, 900, run_length=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
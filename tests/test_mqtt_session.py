@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.mqtt_session import UMQTTSession  # noqa: E402
+
+
+class TestUMQTTSession(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = MagicMock()
+        self.session = UMQTTSession(self.client, cycle_seconds=60)
+
+    def test_keepalive_sized_to_cycle(self):
+        self.assertEqual(UMQTTSession.keepalive_for(60), 150)
+        self.assertEqual(UMQTTSession.keepalive_for(100000), 65535)
+
+    def test_session_stays_open_across_publishes(self):
+        self.session.connect()
+        self.session.publish("a", "1")
+        self.session.publish("b", "2")
+        self.session.connect()
+        self.assertEqual(self.client.connect.call_count, 1)
+        self.assertEqual(self.session.handshakes, 1)
+        self.assertEqual(self.session.publish_count, 2)
+
+    def test_publish_connects_lazily(self):
+        self.session.publish("a", "1")
+        self.client.connect.assert_called_once()
+
+    def test_publish_failure_reconnects_once(self):
+        self.session.connect()
+        self.client.publish.side_effect = [OSError(104), None]
+        self.session.publish("a", "1")
+        self.assertEqual(self.session.handshakes, 2)
+        self.assertEqual(self.session.reconnects, 1)
+        self.assertEqual(self.session.publish_count, 1)
+
+    def test_keep_alive_pings_only_when_idle(self):
+        self.session.connect()
+        self.now = 1000
+        self.session.keep_alive()
+        self.client.ping.assert_not_called()
+        self.now = self.session.ping_interval_ms
+        self.session.keep_alive()
+        self.client.ping.assert_called_once()
+
+    def test_keep_alive_leaves_closed_session_closed(self):
+        self.session.keep_alive()
+        self.client.connect.assert_not_called()
+
+    def test_keep_alive_failure_reconnects_lazily(self):
+        self.session.connect()
+        self.client.check_msg.side_effect = OSError(104)
+        self.session.keep_alive()
+        self.assertFalse(self.session.connected)
+        self.assertEqual(self.client.connect.call_count, 1)
+        self.session.keep_alive()  # nothing to send, still no handshake
+        self.assertEqual(self.client.connect.call_count, 1)
+        self.session.publish("a", "1")
+        self.assertEqual(self.session.handshakes, 2)
+        self.assertEqual(self.session.reconnects, 1)
+
+    def test_keep_alive_ping_failure_closes_the_session(self):
+        self.session.connect()
+        self.client.ping.side_effect = OSError(104)
+        self.now = self.session.ping_interval_ms
+        self.session.keep_alive()
+        self.assertFalse(self.session.connected)
+        self.assertEqual(self.session.handshakes, 1)
+
+    def test_handshakes_per_hour(self):
+        self.session.connect()
+        self.now = 1800000
+        self.assertEqual(self.session.handshakes_per_hour(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau import node_metrics  # noqa: E402
+from lib.inboxidau.node_metrics import UNodeMetrics  # noqa: E402
+
+
+class TestNodeMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.metrics = UNodeMetrics()
+
+    def work(self, ms, fail=False):
+        self.now += ms
+        if fail:
+            raise OSError("failed")
+        return ms
+
+    def test_timed_phases(self):
+        read = self.metrics.timed("read", self.work)
+        self.assertEqual(read(10), 10)
+        read(30)
+        with self.assertRaises(OSError):
+            read(5, fail=True)
+        self.assertEqual(self.metrics.phases["read"], [3, 45, 30, 1])
+        snapshot = self.metrics.snapshot(cycle=3)
+        self.assertEqual(snapshot["phases"]["read"], [3, 15.0, 30, 1])
+        self.assertEqual(snapshot["cycle"], 3)
+        self.assertNotIn("rssi", snapshot)
+
+    def test_reset_window_keeps_errors(self):
+        read = self.metrics.timed("read", self.work)
+        read(10)
+        self.metrics.error("read")
+        self.metrics.reset_window()
+        self.assertEqual(self.metrics.phases["read"], [0, 0, 0, 1])
+        self.assertEqual(self.metrics.snapshot()["phases"]["read"],
+                         [0, 0, 0, 1])
+
+    def test_uptime(self):
+        self.now = 5500
+        self.assertEqual(self.metrics.snapshot()["uptime_s"], 5)
+        self.now = 12000
+        self.assertEqual(self.metrics.snapshot()["uptime_s"], 12)
+
+    def test_memory_marks(self):
+        free = iter([5000, 3000, 4000, 4000])
+        alloc = iter([100, 300, 200])
+        gc = mock.Mock(mem_free=lambda: next(free),
+                       mem_alloc=lambda: next(alloc))
+        with mock.patch.object(node_metrics, 'gc', gc):
+            metrics = UNodeMetrics()
+            for _ in range(3):
+                metrics.sample_memory()
+            snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["mem_free_min"], 3000)
+        self.assertEqual(snapshot["mem_alloc_max"], 300)
+        self.assertEqual(snapshot["mem_free"], 4000)
+
+    def test_no_memory_on_cpython(self):
+        self.metrics.sample_memory()
+        self.assertNotIn("mem_free", self.metrics.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
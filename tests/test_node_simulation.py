@@ -0,0 +1,428 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.harness import (ATMOSPHERIC_CONFIG, DISTANCE_CONFIG,  # noqa: E402
+                         NodeSimulation)
+from lib.inboxidau.burst_capture import UBurstCapture  # noqa: E402
+from lib.inboxidau.rolling_appender_log import LogLevel  # noqa: E402
+from sim.broker import FakeMQTTClient  # noqa: E402
+from sim.virtual_clock import (SimulationComplete, TICKS_PERIOD,  # noqa: E402
+                               VirtualClock)
+
+DISTANCE = "DistanceSensorNode:DistanceSensorNode"
+ATMOSPHERIC = "AtmosphericSensorNode:AtmosphericSensorNode"
+
+
+class TestVirtualClock(unittest.TestCase):
+
+    def test_sleep_advances_time(self):
+        clock = VirtualClock(start_epoch=1000)
+        start = clock.ticks_ms()
+        clock.sleep(2.5)
+        self.assertEqual(clock.ticks_diff(clock.ticks_ms(), start), 2500)
+        self.assertEqual(clock.time(), 1002)
+        self.assertEqual(clock.localtime()[:3], (1970, 1, 1))
+
+    def test_ticks_wrap(self):
+        clock = VirtualClock()
+        clock.advance((TICKS_PERIOD - 500) / 1000)
+        start = clock.ticks_ms()
+        deadline = clock.ticks_add(start, 1000)
+        clock.advance(2)
+        self.assertLess(clock.ticks_ms(), start)
+        self.assertEqual(clock.ticks_diff(clock.ticks_ms(), start), 2000)
+        self.assertEqual(clock.ticks_diff(clock.ticks_ms(), deadline), 1000)
+
+    def test_end_of_simulation(self):
+        clock = VirtualClock(end_s=10)
+        clock.sleep(9)
+        with self.assertRaises(SimulationComplete):
+            clock.sleep(1)
+
+
+class TestNodeSimulation(unittest.TestCase):
+
+    def test_distance_node_reports_a_car(self):
+        simulation = NodeSimulation(DISTANCE, days=1 / 24,
+                                    arrivals=[(600, 1800)])
+        modules = dict(sys.modules)
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertEqual(report["handshakes"], 1)
+        self.assertGreater(report["cycles"], 600)
+        changes = []
+        for elapsed, _, payload, _ in simulation.broker.topic_messages(
+                DISTANCE_CONFIG["MQTT_TOPIC_occupancy"]):
+            if not changes or changes[-1][1] != payload:
+                changes.append((elapsed, payload))
+        self.assertEqual([payload for _, payload in changes],
+                         [b"False", b"True", b"False"])
+        self.assertLess(changes[1][0] - 600, 30)
+        self.assertLess(changes[2][0] - 1800, 30)
+        # the fakes are removed again
+        for name in ("machine", "network", "umqtt.simple"):
+            self.assertIs(sys.modules.get(name), modules.get(name))
+
+    def test_deep_sleep_reboots_and_resumes(self):
+        config = dict(ATMOSPHERIC_CONFIG, SLEEP_MODE="deep")
+        simulation = NodeSimulation(ATMOSPHERIC, config=config, days=1 / 24)
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertGreater(report["resets"]["deepsleep"], 30)
+        # every deep sleep boots a new node, unless the run ends while the
+        # last one is asleep
+        self.assertIn(report["resets"]["deepsleep"],
+                      (report["boots"] - 1, report["boots"]))
+        # later boots resume from the saved state instead of the config
+        self.assertIsNotNone(simulation.node.resume_state)
+        # and the cycle count carries on across the deep sleeps
+        self.assertGreaterEqual(simulation.node.cycle, report["boots"] - 1)
+        self.assertEqual(report["ntp_syncs"], 1)
+        # the BSSID is read from the association, no scan is needed
+        self.assertEqual(report["wifi_scans"], 0)
+        # the cached BSSID and skipped NTP sync keep each boot short
+        self.assertGreater(report["boot_to_publish_s"], 0)
+        self.assertLess(report["boot_to_publish_s"], 5)
+
+    def test_periodic_schedule_keeps_readings_on_the_grid(self):
+        topic = ATMOSPHERIC_CONFIG["MQTT_TOPIC_temperature"]
+        for sleep_mode in ("busy", "deep"):
+            config = dict(ATMOSPHERIC_CONFIG, SLEEP_MODE=sleep_mode,
+                          PERIODIC_SCHEDULE=True, PERIODIC_ALIGN=True)
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 24)
+            report = simulation.run()
+            self.assertEqual(report["main_exceptions"], 0)
+            times = [elapsed for elapsed, _, _, _ in
+                     simulation.broker.topic_messages(topic)]
+            self.assertGreater(len(times), 50)
+            # after the first reading every cycle starts on a minute, the
+            # simulated epoch starts on one too
+            offsets = [elapsed % 60 for elapsed in times[1:]]
+            self.assertLess(max(offsets) - min(offsets), 0.01)
+
+    def test_periodic_schedule_stays_aligned_after_a_config_change(self):
+        topic = ATMOSPHERIC_CONFIG["MQTT_TOPIC_temperature"]
+        config = dict(ATMOSPHERIC_CONFIG, PERIODIC_SCHEDULE=True,
+                      PERIODIC_ALIGN=True, REMOTE_CONFIG=True,
+                      MQTT_TOPIC_config="weather01/sim/config",
+                      MQTT_TOPIC_config_ack="weather01/sim/config/ack")
+        delta = {"id": 1, "PERIODIC_OVERRUN": "catch_up"}
+        simulation = NodeSimulation(
+            ATMOSPHERIC, config=config, days=1 / 24,
+            messages=[(600, config["MQTT_TOPIC_config"], json.dumps(delta))])
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        scheduler = simulation.node.periodic_scheduler
+        self.assertEqual(scheduler.overrun, "catch_up")
+        self.assertIsNotNone(scheduler._epoch_ms)
+        # the rebuilt scheduler is synced to the RTC again, so cycles
+        # after the change still start on a minute
+        times = [elapsed for elapsed, _, _, _ in
+                 simulation.broker.topic_messages(topic)]
+        offsets = [elapsed % 60 for elapsed in times if elapsed > 700]
+        self.assertGreater(len(offsets), 40)
+        self.assertLess(max(offsets) - min(offsets), 0.01)
+
+    def test_hat_powers_down_after_each_reading(self):
+        # the config's string "True" is coerced once when it is compiled
+        config = dict(ATMOSPHERIC_CONFIG,
+                      MAKERVERSE_NANO_POWER_TIMER_HAT="True")
+        with tempfile.TemporaryDirectory() as work_dir:
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 24, hat_period_s=300,
+                                        work_dir=work_dir)
+            report = simulation.run()
+            snapshot = os.path.join(
+                work_dir, simulation.node.STATIC_NODE_CONFIG_SNAPSHOT_FILE)
+            self.assertTrue(os.path.exists(snapshot))
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertEqual(report["resets"], {"hat": 12})
+        self.assertEqual(report["sensor_reads"], 12)
+        self.assertIs(simulation.node.MAKERVERSE_NANO_POWER_TIMER_HAT, True)
+
+    def test_hat_powers_down_when_the_disconnect_fails(self):
+        for broken in (False, True):
+            with tempfile.TemporaryDirectory() as work_dir, \
+                    patch.object(FakeMQTTClient, "disconnect",
+                                 side_effect=OSError(104) if broken else None):  # noqa: E501
+                config = dict(ATMOSPHERIC_CONFIG,
+                              MAKERVERSE_NANO_POWER_TIMER_HAT=True)
+                simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                            days=1 / 24, hat_period_s=300,
+                                            work_dir=work_dir,
+                                            log_level=LogLevel.DEBUG)
+                report = simulation.run()
+                with open(os.path.join(work_dir, "node.log")) as file:
+                    lines = file.read().splitlines()
+            self.assertEqual(report["main_exceptions"], 0)
+            self.assertEqual(report["resets"], {"hat": 12})
+            # the last line before the power is cut reaches the file
+            last = "power_down_hat() RuntimeError" if broken else "MQTT: Disconnected."  # noqa: E501
+            self.assertIn(last, lines[-1])
+
+    def test_keepalive_outlasts_the_longest_sleep(self):
+        # no car, the adaptive cadence backs off to a minute between
+        # readings, past the keepalive a 5 s period alone would give
+        config = dict(DISTANCE_CONFIG, ADAPTIVE_CADENCE=True,
+                      ADAPTIVE_MIN_PERIOD=5, ADAPTIVE_MAX_PERIOD=60)
+        simulation = NodeSimulation(DISTANCE, config=config, days=1 / 12,
+                                    arrivals=[])
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertEqual(simulation.node.adaptive_cadence.period_s, 60)
+        self.assertEqual(report["broker_expired"], 0)
+        self.assertEqual(report["handshakes"], 1)
+
+    def test_remote_config_is_applied_live(self):
+        config = dict(DISTANCE_CONFIG, REMOTE_CONFIG=True,
+                      MQTT_TOPIC_config="carpark01/sim/config",
+                      MQTT_TOPIC_config_ack="carpark01/sim/config/ack")
+        delta = {"id": 1, "STATIC_NODE_SENSE_REPEAT_DELAY": 30,
+                 "OCCUPANCY_DISTANCE": 1000}
+        with tempfile.TemporaryDirectory() as work_dir:
+            simulation = NodeSimulation(
+                DISTANCE, config=config, days=1 / 24, work_dir=work_dir,
+                messages=[(600, config["MQTT_TOPIC_config"],
+                           json.dumps(delta))])
+            report = simulation.run()
+            with open(os.path.join(work_dir, "config.json")) as file:
+                saved = json.load(file)
+        self.assertEqual(report["main_exceptions"], 0)
+        acks = simulation.broker.topic_messages(config["MQTT_TOPIC_config_ack"])  # noqa: E501
+        self.assertEqual(len(acks), 1)
+        self.assertEqual(json.loads(acks[0][2])["applied"],
+                         ["OCCUPANCY_DISTANCE", "STATIC_NODE_SENSE_REPEAT_DELAY"])  # noqa: E501
+        self.assertEqual(saved["OCCUPANCY_DISTANCE"], 1000)
+        self.assertEqual(simulation.node.occupancy.exit_threshold, 1000)
+        # readings are 5 s apart before the update and 30 s after it
+        times = [message[0] for message in
+                 simulation.broker.topic_messages(config["MQTT_TOPIC_distance"])]  # noqa: E501
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        self.assertLess(max(gaps[:50]), 10)
+        self.assertGreater(min(gaps[-50:]), 25)
+
+    def test_remote_config_that_fails_to_rebuild_is_not_saved(self):
+        config = dict(DISTANCE_CONFIG, REMOTE_CONFIG=True,
+                      MQTT_TOPIC_config="carpark01/sim/config",
+                      MQTT_TOPIC_config_ack="carpark01/sim/config/ack")
+        topic = config["MQTT_TOPIC_config"]
+        # an unknown filter fails the schema, unknown options the rebuild
+        deltas = [{"id": 1, "DISTANCE_FILTER": "mean"},
+                  {"id": 2, "DISTANCE_FILTER": "ema",
+                   "DISTANCE_FILTER_OPTIONS": {"gain": 0.5}}]
+        with tempfile.TemporaryDirectory() as work_dir:
+            simulation = NodeSimulation(
+                DISTANCE, config=config, days=1 / 24, work_dir=work_dir,
+                messages=[(600, topic, json.dumps(deltas[0])),
+                          (1200, topic, json.dumps(deltas[1]))])
+            report = simulation.run()
+            with open(os.path.join(work_dir, "config.json")) as file:
+                saved = json.load(file)
+        self.assertEqual(report["main_exceptions"], 0)
+        acks = [json.loads(message[2]) for message in
+                simulation.broker.topic_messages(config["MQTT_TOPIC_config_ack"])]  # noqa: E501
+        self.assertEqual([(ack["id"], ack["ok"]) for ack in acks],
+                         [(1, False), (2, False)])
+        self.assertIn("DISTANCE_FILTER should be one of", acks[0]["error"])
+        self.assertEqual(saved, config)
+        node = simulation.node
+        self.assertEqual(node.DISTANCE_FILTER, "discard_extremes")
+        self.assertEqual(node.DISTANCE_FILTER_OPTIONS, {})
+        self.assertEqual(node.filtered_distance_sensor.__class__.__name__,
+                         "DiscardExtremesFilter")
+
+    def test_bursts_are_published_in_chunks(self):
+        config = dict(DISTANCE_CONFIG, BURST_CAPTURE=True, BURST_RATE_HZ=10,
+                      BURST_DURATION_S=3, BURST_CHUNK_SAMPLES=16,
+                      BURST_EVERY_CYCLES=12,
+                      MQTT_TOPIC_burst="carpark01/sim/burst")
+        simulation = NodeSimulation(DISTANCE, config=config, days=1 / 24)
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        chunks = [UBurstCapture.decode(message[2]) for message in
+                  simulation.broker.topic_messages(config["MQTT_TOPIC_burst"])]  # noqa: E501
+        self.assertGreater(len(chunks), 10)
+        header, samples = chunks[0]
+        self.assertEqual((header["first"], header["count"], header["total"]),
+                         (0, 16, 30))
+        self.assertEqual(header["interval_us"], 100000)
+        self.assertEqual(header["overruns"], 0)
+        self.assertEqual(chunks[1][0]["first"], 16)
+        # the bay is empty, about 2500 mm
+        self.assertTrue(all(2480 <= sample <= 2520 for sample in samples))
+
+    def test_outage_is_queued_and_sent(self):
+        config = dict(DISTANCE_CONFIG, PUBLISH_QUEUE=True)
+        simulation = NodeSimulation(DISTANCE, config=config, days=1 / 24,
+                                    arrivals=[], outages=[(600, 900)])
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertEqual(report["handshakes"], 2)
+        times = [message[0] for message in simulation.broker.messages]
+        self.assertFalse([t for t in times if 600 <= t < 900])
+        # the readings queued during the outage are sent on reconnect, a
+        # cycle publishes two
+        self.assertGreater(len([t for t in times if 900 <= t < 910]), 20)
+
+    def test_replayed_publishes_keep_their_time_and_retain_flag(self):
+        topic = DISTANCE_CONFIG["MQTT_TOPIC_distance"]
+        config = dict(DISTANCE_CONFIG, PUBLISH_QUEUE=True,
+                      MQTT_BATCH_PUBLISH=True,
+                      MQTT_TOPIC_node="carpark01/sim/node",
+                      METRICS_ENABLED=True, METRICS_PUBLISH_CYCLES=5,
+                      MQTT_TOPIC_diagnostics="carpark01/sim/diagnostics")
+        # the clock is set on the first cycle
+        simulation = NodeSimulation(DISTANCE, config=config, days=1 / 24,
+                                    arrivals=[], outages=[(0.5, 900)])
+        report = simulation.run()
+        self.assertEqual(report["main_exceptions"], 0)
+        start_epoch = simulation.clock.start_epoch
+        # queued records are sent with an encoded topic
+        messages = [(message[1].decode() if isinstance(message[1], bytes)
+                     else message[1], message[2], message[3])
+                    for message in simulation.broker.messages
+                    if message[0] < 910]
+        replayed = [(message, messages[index + 1]) for index, message in
+                    enumerate(messages) if message[0].endswith("/queued_at")]  # noqa: E501
+        # the 64 slot queue keeps the newest records
+        self.assertGreater(len(replayed), 20)
+        for queued_at, message in replayed:
+            self.assertEqual(queued_at[0], message[0] + "/queued_at")
+            self.assertLessEqual(int(queued_at[1]) - start_epoch, 900)
+        # diagnostics are larger than a 128 byte slot
+        self.assertIn("carpark01/sim/diagnostics",
+                      [message[0] for _, message in replayed])
+        schema = [message for message in messages
+                  if message[0] == "carpark01/sim/node/schema"]
+        self.assertTrue(schema)
+        self.assertTrue(all(message[2] for message in schema))
+        self.assertFalse(simulation.broker.topic_messages(topic))
+
+    def test_report_by_exception_survives_power_downs(self):
+        topic = ATMOSPHERIC_CONFIG["MQTT_TOPIC_temperature"]
+        for sleep_mode, hat_period_s in (("deep", None), ("busy", 300)):
+            config = dict(ATMOSPHERIC_CONFIG, SLEEP_MODE=sleep_mode,
+                          MAKERVERSE_NANO_POWER_TIMER_HAT=bool(hat_period_s),  # noqa: E501
+                          REPORT_BY_EXCEPTION=True,
+                          REPORT_DEADBANDS={"tempC": 0.5})
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 4,
+                                        hat_period_s=hat_period_s)
+            report = simulation.run()
+            self.assertEqual(report["main_exceptions"], 0)
+            self.assertGreater(report["boots"], 50)
+            published = len(simulation.broker.topic_messages(topic))
+            self.assertLess(published, report["sensor_reads"] / 2)
+
+    def test_rollups_from_nodes_that_power_down(self):
+        topic = "weatherstn/sim/rollup"
+        for sleep_mode, hat_period_s in (("deep", None), ("busy", 300)):
+            config = dict(ATMOSPHERIC_CONFIG, ROLLUP_WINDOW=900,
+                          ROLLUP_SAMPLE_PERIOD=60, SLEEP_MODE=sleep_mode,
+                          MAKERVERSE_NANO_POWER_TIMER_HAT=bool(hat_period_s),  # noqa: E501
+                          MQTT_TOPIC_rollup=topic)
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 8,
+                                        hat_period_s=hat_period_s)
+            report = simulation.run()
+            self.assertEqual(report["main_exceptions"], 0)
+            self.assertGreater(report["boots"], 30)
+            rollups = [json.loads(message[2]) for message in
+                       simulation.broker.topic_messages(topic)]
+            # a window spans several boots
+            self.assertGreaterEqual(len(rollups), 8)
+            self.assertTrue(all(rollup["tempC"]["count"] > 2
+                                for rollup in rollups))
+
+    def test_rollup_keeps_occupancy_changes_and_the_data_log(self):
+        config = dict(DISTANCE_CONFIG, ROLLUP_WINDOW=900,
+                      MQTT_TOPIC_rollup="carpark01/sim/rollup",
+                      LOG_SENSOR_DATA=True)
+        with tempfile.TemporaryDirectory() as work_dir:
+            simulation = NodeSimulation(DISTANCE, config=config, days=1 / 2,
+                                        work_dir=work_dir)
+            report = simulation.run()
+            self.assertGreater(os.stat(os.path.join(work_dir, "main.dat"))[6],  # noqa: E501
+                               1000)
+        self.assertEqual(report["main_exceptions"], 0)
+        self.assertGreater(len(simulation.broker.topic_messages(
+            config["MQTT_TOPIC_rollup"])), 40)
+        # the car arrives at 08:00
+        occupied = [message[0] for message in simulation.broker.topic_messages(  # noqa: E501
+            config["MQTT_TOPIC_occupancy"]) if message[2] == b"True"]
+        self.assertEqual(len(occupied), 1)
+        self.assertLess(abs(occupied[0] - 8 * 3600), 60)
+        # a rebuild closes the open window into the new aggregator
+        node = simulation.node
+        self.assertIsNotNone(node.rollup.window_start)
+        node.ROLLUP_WINDOW = 600
+        node.on_config_changed(["ROLLUP_WINDOW"])
+        self.assertEqual(node.rollup.window_s, 600)
+        self.assertEqual(len(node.rollup.pending()), 1)
+
+    def test_outage_at_boot_is_queued_and_sent(self):
+        topic = ATMOSPHERIC_CONFIG["MQTT_TOPIC_temperature"]
+        for hat_period_s in (None, 300):
+            config = dict(ATMOSPHERIC_CONFIG, PUBLISH_QUEUE=True,
+                          MAKERVERSE_NANO_POWER_TIMER_HAT=bool(hat_period_s))  # noqa: E501
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 24, outages=[(0, 1000)],
+                                        hat_period_s=hat_period_s)
+            report = simulation.run()
+            self.assertEqual(report["main_exceptions"], 0)
+            # queued records are sent with an encoded topic
+            times = [message[0] for message in simulation.broker.messages
+                     if message[1] in (topic, topic.encode())]
+            self.assertFalse([t for t in times if t < 1000])
+            self.assertEqual(len(times), report["sensor_reads"])
+
+    def test_diagnostics_are_published(self):
+        config = dict(ATMOSPHERIC_CONFIG, METRICS_ENABLED=True,
+                      METRICS_PUBLISH_CYCLES=5,
+                      MQTT_TOPIC_diagnostics="weatherstn/sim/$SYS/diagnostics")  # noqa: E501
+        simulation = NodeSimulation(ATMOSPHERIC, config=config, days=1 / 24)
+        simulation.run()
+        messages = simulation.broker.topic_messages(
+            config["MQTT_TOPIC_diagnostics"])
+        self.assertGreaterEqual(len(messages), 10)
+        diagnostics = json.loads(messages[-1][2])
+        self.assertEqual(diagnostics["cycle"] % 5, 0)
+        self.assertEqual(diagnostics["rssi"], -60)
+        self.assertEqual(sorted(diagnostics["phases"]),
+                         ["broker", "post", "read", "sleep", "wifi"])
+        self.assertEqual(diagnostics["phases"]["read"][0], 5)
+
+    def test_diagnostics_from_nodes_that_power_down(self):
+        topic = "weatherstn/sim/$SYS/diagnostics"
+        for sleep_mode, hat_period_s in (("deep", None), ("busy", 300)):
+            config = dict(ATMOSPHERIC_CONFIG, METRICS_ENABLED=True,
+                          METRICS_PUBLISH_CYCLES=5, SLEEP_MODE=sleep_mode,
+                          MAKERVERSE_NANO_POWER_TIMER_HAT=bool(hat_period_s),  # noqa: E501
+                          MQTT_TOPIC_diagnostics=topic)
+            simulation = NodeSimulation(ATMOSPHERIC, config=config,
+                                        days=1 / 12,
+                                        hat_period_s=hat_period_s)
+            report = simulation.run()
+            cycles = [json.loads(message[2])["cycle"] for message in
+                      simulation.broker.topic_messages(topic)]
+            if hat_period_s:
+                # every boot is a power on and its only cycle
+                self.assertEqual(cycles, [1] * report["boots"])
+            else:
+                # the first cycle, then every fifth across the deep sleeps
+                self.assertGreater(report["boots"], 100)
+                self.assertEqual(cycles[0], 1)
+                self.assertEqual(cycles[1:], list(range(5, cycles[-1] + 1, 5)))  # noqa: E501
+                self.assertIn("first_publish_ms", json.loads(
+                    simulation.broker.topic_messages(topic)[-1][2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.payload_encoding import (  # noqa: E402
+    ENCODINGS, UBatchPayload, decode, decode_cbor, encode_cbor)
+from tools.mqtt_fanout import FanOut  # noqa: E402
+
+CHANNELS = (("tempC", "weatherstn/temperature", 21.5, None),
+            ("pres_hPa", "weatherstn/airPressure", 1013, None),
+            ("occupancy", "carpark/occupancy", True, "B"))
+
+
+def make_batch(encoding):
+    batch = UBatchPayload(encoding)
+    for channel, topic, value, type_code in CHANNELS:
+        batch.add(channel, topic, value, type_code)
+    return batch
+
+
+class TestUBatchPayload(unittest.TestCase):
+
+    def test_round_trip(self):
+        for encoding in ENCODINGS:
+            batch = make_batch(encoding)
+            values = decode(encoding, batch.encode(), batch.schema)
+            self.assertEqual(values, {"tempC": 21.5, "pres_hPa": 1013,
+                                      "occupancy": True}, encoding)
+            self.assertIs(values["occupancy"], True)
+
+    def test_json_is_compact(self):
+        self.assertEqual(make_batch("json").encode(),
+                         b'{"tempC":21.5,"pres_hPa":1013,"occupancy":true}')
+
+    def test_struct_skips_channels_not_published(self):
+        batch = make_batch("struct")
+        batch.clear()
+        batch.add("occupancy", "carpark/occupancy", False)
+        payload = batch.encode()
+        self.assertEqual(payload, bytes((3, 0b100, 0)))
+        self.assertEqual(decode("struct", payload, batch.schema),
+                         {"occupancy": False})
+        with self.assertRaises(ValueError):
+            decode("struct", payload, batch.schema[:2])
+
+    def test_schema(self):
+        batch = make_batch("struct")
+        self.assertTrue(batch.schema_changed)
+        self.assertEqual(json.loads(batch.schema_payload()), {
+            "encoding": "struct",
+            "channels": [["tempC", "f", "weatherstn/temperature"],
+                         ["pres_hPa", "i", "weatherstn/airPressure"],
+                         ["occupancy", "?", "carpark/occupancy"]]})
+        with self.assertRaises(ValueError):
+            UBatchPayload("struct").add("name", "topic", "text")
+        with self.assertRaises(ValueError):
+            UBatchPayload("xml")
+
+    def test_integer_channel_widened_to_float(self):
+        batch = UBatchPayload("struct")
+        batch.add("atmos_tempC", "weatherstn/temperature", 21)
+        batch.encode()
+        batch.schema_changed = False
+        batch.add("atmos_tempC", "weatherstn/temperature", 21.5)
+        self.assertTrue(batch.schema_changed)
+        self.assertEqual(batch.schema[0][1], "f")
+        self.assertEqual(decode("struct", batch.encode(), batch.schema),
+                         {"atmos_tempC": 21.5})
+
+    def test_cbor(self):
+        # RFC 8949 appendix A examples
+        self.assertEqual(encode_cbor(1000000), bytes.fromhex("1a000f4240"))
+        self.assertEqual(encode_cbor(-1000), bytes.fromhex("3903e7"))
+        self.assertEqual(encode_cbor({"a": [1, 2]}),
+                         bytes.fromhex("a161618201" "02"))
+        self.assertEqual(decode_cbor(bytes.fromhex("f93e00"), 0), (1.5, 3))
+        value = {"a": -24, "b": "text", "c": None, "d": [0.25, False]}
+        self.assertEqual(decode_cbor(encode_cbor(value), 0)[0], value)
+
+
+class TestFanOut(unittest.TestCase):
+
+    def test_batches_are_fanned_out_to_channel_topics(self):
+        for encoding in ENCODINGS:
+            batch = make_batch(encoding)
+            fan_out = FanOut()
+            self.assertEqual(fan_out.handle("node", batch.encode()), [])
+            fan_out.handle("node/schema", batch.schema_payload())
+            self.assertEqual(fan_out.handle("node", batch.encode()), [
+                ("weatherstn/temperature", "21.5"),
+                ("weatherstn/airPressure", "1013"),
+                ("carpark/occupancy", "True")])
+
+
+if __name__ == '__main__':
+    unittest.main()
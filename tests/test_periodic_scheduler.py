@@ -0,0 +1,112 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.periodic_scheduler import UPeriodicScheduler  # noqa: E402
+
+
+class TestPeriodicScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cycle(self, scheduler, work_ms, period_s=5, late_ms=0):
+        # one cycle of work_ms, then the sleep, waking late_ms late
+        self.now += work_ms
+        delay = scheduler.delay_s(period_s)
+        self.now += int(delay * 1000) + late_ms
+        scheduler.woke()
+        return delay
+
+    def test_work_time_is_taken_off_the_sleep(self):
+        scheduler = UPeriodicScheduler()
+        delays = [self.cycle(scheduler, work) for work in (1200, 300, 2500)]
+        self.assertEqual(delays, [3.8, 4.7, 2.5])
+        # every cycle starts on the grid
+        self.assertEqual(self.now, 1000 + 3 * 5000)
+        self.assertEqual(scheduler.overruns, 0)
+        self.assertEqual(scheduler.jitter_max_ms, 0)
+
+    def test_overrun_skips_missed_slots(self):
+        scheduler = UPeriodicScheduler()
+        self.cycle(scheduler, 1000)
+        delay = self.cycle(scheduler, 11000)
+        self.assertTrue(scheduler.late)
+        self.assertEqual(scheduler.overruns, 1)
+        self.assertEqual(scheduler.skipped, 2)
+        # back on the grid, slot 4
+        self.assertEqual(delay, 4)
+        self.assertEqual(self.now, 1000 + 4 * 5000)
+        self.cycle(scheduler, 1000)
+        self.assertFalse(scheduler.late)
+
+    def test_overrun_catches_up(self):
+        scheduler = UPeriodicScheduler(overrun=UPeriodicScheduler.CATCH_UP)
+        self.cycle(scheduler, 1000)
+        self.assertEqual(self.cycle(scheduler, 11000), 0)
+        self.assertEqual(self.cycle(scheduler, 100), 0)
+        # slots 2 and 3 ran back to back, slot 4 is ahead
+        self.assertEqual(self.cycle(scheduler, 100), 3.8)
+        self.assertEqual(self.now, 1000 + 4 * 5000)
+        self.assertEqual(scheduler.overruns, 2)
+        self.assertEqual(scheduler.skipped, 0)
+
+    def test_jitter_statistics(self):
+        scheduler = UPeriodicScheduler()
+        for late_ms in (10, 30, -10, 50):
+            self.cycle(scheduler, 500, late_ms=late_ms)
+        stats = scheduler.stats()
+        self.assertEqual(stats["slots"], 4)
+        self.assertEqual(stats["jitter_ms"], 50)
+        self.assertEqual(stats["jitter_max_ms"], 50)
+        self.assertAlmostEqual(stats["jitter_mean_ms"], 20)
+        self.assertAlmostEqual(stats["jitter_std_ms"], 25.82, places=2)
+
+    def test_aligns_to_wall_clock_after_sync(self):
+        scheduler = UPeriodicScheduler(align=True)
+        # 12:00:02.5 by the wall clock
+        scheduler.sync(1717243202500)
+        delay = self.cycle(scheduler, 1000, period_s=300)
+        # 12:05:00 is 297.5 s after the sync
+        self.assertEqual(delay, 296.5)
+        self.assertEqual(self.cycle(scheduler, 1000, period_s=300), 299)
+
+    def test_sync_without_align_keeps_the_grid(self):
+        scheduler = UPeriodicScheduler()
+        scheduler.sync(1717243202500)
+        self.assertEqual(self.cycle(scheduler, 1000), 4)
+
+    def test_realign_snaps_to_the_nearest_boundary(self):
+        scheduler = UPeriodicScheduler(align=True)
+        self.cycle(scheduler, 0, period_s=60)
+        # the next slot would be 1 s after a minute boundary, it is moved
+        # back rather than a whole minute on
+        scheduler.sync(1717243201000)
+        self.assertEqual(self.cycle(scheduler, 0, period_s=60), 59)
+
+    def test_sync_takes_a_float_epoch(self):
+        # MicroPython's ticks_add() raises TypeError for a float
+        def ticks_add(ticks, delta):
+            if not isinstance(ticks, int) or not isinstance(delta, int):
+                raise TypeError("can't convert float to int")
+            return ticks + delta
+
+        scheduler = UPeriodicScheduler(align=True)
+        scheduler.sync(1717243202.0 * 1000)
+        with mock.patch.object(clock, 'ticks_add', ticks_add):
+            self.assertEqual(self.cycle(scheduler, 1000, period_s=300), 297)
+
+    def test_unknown_overrun_policy(self):
+        with self.assertRaises(ValueError):
+            UPeriodicScheduler(overrun="drop")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.publish_queue import UFlashPublishQueue, PublishQueueException  # noqa: E402, E501
+
+
+class TestUFlashPublishQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.dat")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def drain_all(self, queue):
+        sent = []
+        queue.drain(lambda topic, payload, timestamp, retain:
+                    sent.append((topic, payload, timestamp, retain)))
+        return sent
+
+    def test_file_has_fixed_size(self):
+        queue = UFlashPublishQueue(self.path, slots=4, slot_size=32)
+        size = os.stat(self.path)[6]
+        for index in range(10):
+            queue.append("t", str(index), index)
+        self.assertEqual(os.stat(self.path)[6], size)
+        self.assertEqual(size, queue.HEADER_SIZE + 4 * 32)
+
+    def test_records_survive_reopen(self):
+        queue = UFlashPublishQueue(self.path, slots=4, slot_size=32)
+        queue.append("a/b", "1", 100)
+        queue.append("a/c", b"2", 101, retain=True)
+        reopened = UFlashPublishQueue(self.path, slots=4, slot_size=32)
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(self.drain_all(reopened),
+                         [(b"a/b", b"1", 100, False),
+                          (b"a/c", b"2", 101, True)])
+        self.assertEqual(len(UFlashPublishQueue(self.path, slots=4,
+                                                slot_size=32)), 0)
+
+    def test_drop_oldest(self):
+        queue = UFlashPublishQueue(self.path, slots=2, slot_size=32)
+        for index in range(3):
+            queue.append("t", str(index), index)
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual([p for _, p, _, _ in self.drain_all(queue)],
+                         [b"1", b"2"])
+
+    def test_drop_newest(self):
+        queue = UFlashPublishQueue(self.path, slots=2, slot_size=32,
+                                   drop_oldest=False)
+        self.assertTrue(queue.append("t", "0", 0))
+        self.assertTrue(queue.append("t", "1", 1))
+        self.assertFalse(queue.append("t", "2", 2))
+        self.assertEqual([p for _, p, _, _ in self.drain_all(queue)],
+                         [b"0", b"1"])
+
+    def test_drain_stops_at_failure(self):
+        queue = UFlashPublishQueue(self.path, slots=4, slot_size=32)
+        for index in range(3):
+            queue.append("t", str(index), index)
+
+        def publish(topic, payload, timestamp, retain):
+            if payload == b"1":
+                raise OSError(104)
+
+        with self.assertRaises(OSError):
+            queue.drain(publish)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(self.drain_all(queue)[0][1], b"1")
+
+    def test_oversized_record(self):
+        queue = UFlashPublishQueue(self.path, slots=2, slot_size=16)
+        with self.assertRaises(PublishQueueException):
+            queue.append("a/long/topic", "a longer payload", 0)
+
+    def test_large_records_span_slots(self):
+        queue = UFlashPublishQueue(self.path, slots=6, slot_size=16)
+        size = os.stat(self.path)[6]
+        large = bytes(range(30))  # three slots
+        queue.append("t", "0", 0)
+        queue.append("t", "1", 1)
+        queue.append("t", large, 2)
+        self.assertEqual((len(queue), queue.used), (3, 5))
+        # the oldest records make room, the new one wraps round
+        queue.append("t", large, 3)
+        self.assertEqual((len(queue), queue.used, queue.dropped), (2, 6, 2))
+        self.assertEqual(os.stat(self.path)[6], size)
+        reopened = UFlashPublishQueue(self.path, slots=6, slot_size=16)
+        self.assertEqual(self.drain_all(reopened),
+                         [(b"t", large, 2, False), (b"t", large, 3, False)])
+        self.assertEqual(reopened.used, 0)
+
+    def test_resized_queue_is_recreated(self):
+        queue = UFlashPublishQueue(self.path, slots=2, slot_size=32)
+        queue.append("t", "0", 0)
+        self.assertEqual(len(UFlashPublishQueue(self.path, slots=3,
+                                                slot_size=32)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import remote_config  # noqa: E402
+from lib.inboxidau.config_schema import (BOOL, NUMBER, STR,  # noqa: E402
+                                         UConfigSchema)
+from lib.inboxidau.remote_config import URemoteConfig  # noqa: E402
+
+TOPIC = "e6614104032b6a2c/config"
+ACK_TOPIC = "e6614104032b6a2c/config/ack"
+
+
+class FakeNode:
+
+    CONFIG_FIELDS = (
+        ('MQTT_BROKER', STR, ''),
+        ('OCCUPANCY_DISTANCE', NUMBER, 0),
+        ('REPORT_BY_EXCEPTION', BOOL, False),
+    )
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self.config_schema = UConfigSchema(self.CONFIG_FIELDS)
+        with open(config_path) as file:
+            self.config = self.config_schema.validate(json.load(file))
+        self.config_schema.apply(self, self.config)
+        self.published = []
+        self.changes = []
+
+    def publish(self, topic, payload, retain=False):
+        self.published.append((topic, json.loads(payload)))
+
+    def log_message(self, message, log_level=None):
+        pass
+
+    def on_config_changed(self, keys):
+        self.changes.append(keys)
+        if self.OCCUPANCY_DISTANCE < 0:
+            raise ValueError("OCCUPANCY_DISTANCE below 0")
+        return [key for key in keys if key == 'MQTT_BROKER']
+
+
+class TestURemoteConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.directory.name, "config.json")
+        with open(self.config_path, "w") as file:
+            json.dump({"MQTT_BROKER": "broker.local",
+                       "OCCUPANCY_DISTANCE": 900, "WIFI_SSID": "home"}, file)
+        self.node = FakeNode(self.config_path)
+        self.remote = URemoteConfig(self.node, TOPIC, ACK_TOPIC)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def send(self, delta, topic=TOPIC):
+        self.remote.on_message(topic.encode(), json.dumps(delta).encode())
+        return self.node.published[-1][1] if self.node.published else None
+
+    def saved_config(self):
+        with open(self.config_path) as file:
+            return json.load(file)
+
+    def test_delta_is_applied_persisted_and_acknowledged(self):
+        ack = self.send({"id": 3, "OCCUPANCY_DISTANCE": 1000,
+                         "REPORT_BY_EXCEPTION": "True",
+                         "MQTT_BROKER": "broker2.local"})
+        self.assertEqual(ack, {"id": 3, "ok": True,
+                               "applied": ["MQTT_BROKER", "OCCUPANCY_DISTANCE",  # noqa: E501
+                                           "REPORT_BY_EXCEPTION"],
+                               "restart": ["MQTT_BROKER"]})
+        self.assertEqual(self.node.published[-1][0], ACK_TOPIC)
+        self.assertEqual(self.node.OCCUPANCY_DISTANCE, 1000)
+        self.assertIs(self.node.REPORT_BY_EXCEPTION, True)
+        self.assertEqual(self.node.config["OCCUPANCY_DISTANCE"], 1000)
+        # keys the node does not use are kept in the file
+        self.assertEqual(self.saved_config(),
+                         {"MQTT_BROKER": "broker2.local",
+                          "OCCUPANCY_DISTANCE": 1000, "WIFI_SSID": "home",
+                          "REPORT_BY_EXCEPTION": True})
+        self.assertFalse(os.path.exists(self.config_path + ".tmp"))
+
+    def test_unchanged_values_are_not_rewritten(self):
+        with patch.object(remote_config.os, "rename") as rename:
+            ack = self.send({"OCCUPANCY_DISTANCE": 900})
+        rename.assert_not_called()
+        self.assertEqual(ack["applied"], [])
+        self.assertEqual(self.node.changes, [])
+
+    def test_invalid_delta_is_rejected_whole(self):
+        ack = self.send({"id": 4, "OCCUPANCY_DISTANCE": 1000,
+                         "MQTT_BROKER": 5})
+        self.assertFalse(ack["ok"])
+        self.assertEqual(ack["id"], 4)
+        self.assertIn("MQTT_BROKER", ack["error"])
+        ack = self.send({"OCCUPANCY_DISTANCE": 1000, "SENSE_DELAY": 5})
+        self.assertIn("SENSE_DELAY", ack["error"])
+        self.remote.on_message(TOPIC.encode(), b"not json")
+        self.assertFalse(self.node.published[-1][1]["ok"])
+        self.assertEqual(self.node.OCCUPANCY_DISTANCE, 900)
+        self.assertEqual(self.saved_config()["OCCUPANCY_DISTANCE"], 900)
+        self.assertEqual(self.remote.rejected, 3)
+
+    def test_failed_write_leaves_config_unchanged(self):
+        with patch.object(remote_config.os, "rename",
+                          side_effect=OSError(28)):
+            ack = self.send({"OCCUPANCY_DISTANCE": 1000})
+        self.assertFalse(ack["ok"])
+        self.assertEqual(self.node.OCCUPANCY_DISTANCE, 900)
+        self.assertEqual(self.node.config["OCCUPANCY_DISTANCE"], 900)
+        self.assertEqual(self.saved_config()["OCCUPANCY_DISTANCE"], 900)
+
+    def test_failed_rebuild_is_rolled_back_and_not_written(self):
+        with open(self.config_path, "rb") as file:
+            before = file.read()
+        ack = self.send({"id": 5, "OCCUPANCY_DISTANCE": -1,
+                         "REPORT_BY_EXCEPTION": True})
+        self.assertEqual(ack, {"id": 5, "ok": False,
+                               "error": "OCCUPANCY_DISTANCE below 0"})
+        with open(self.config_path, "rb") as file:
+            self.assertEqual(file.read(), before)
+        self.assertEqual(self.node.OCCUPANCY_DISTANCE, 900)
+        self.assertIs(self.node.REPORT_BY_EXCEPTION, False)
+        self.assertNotIn("REPORT_BY_EXCEPTION", self.node.config)
+        # rebuilt again from the restored values
+        self.assertEqual(self.node.changes[-1],
+                         ["OCCUPANCY_DISTANCE", "REPORT_BY_EXCEPTION"])
+        self.assertEqual((self.remote.applied, self.remote.rejected), (0, 1))
+
+    def test_other_topics_are_ignored(self):
+        self.assertIsNone(self.send({"OCCUPANCY_DISTANCE": 1000},
+                                    topic="other/config"))
+        self.assertEqual(self.remote.received, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
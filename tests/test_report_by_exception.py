@@ -0,0 +1,87 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.report_by_exception import UReportByException  # noqa: E402, E501
+
+
+class TestReportByException(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rbe = UReportByException({"distance": 50}, heartbeat_s=60)
+
+    def report(self, channel, value, force=False):
+        if self.rbe.should_report(channel, value, force):
+            self.rbe.mark_reported(channel, value)
+            return True
+        return False
+
+    def test_first_value_is_reported(self):
+        self.assertTrue(self.report("distance", 1000))
+
+    def test_deadband(self):
+        self.report("distance", 1000)
+        self.assertFalse(self.report("distance", 1040))
+        self.assertFalse(self.report("distance", 960))
+        self.assertTrue(self.report("distance", 1051))
+        # measured from the last value reported
+        self.assertFalse(self.report("distance", 1010))
+        self.assertEqual(self.rbe.suppressed, 3)
+
+    def test_channels_without_deadband_report_any_change(self):
+        self.report("occupancy", False)
+        self.assertFalse(self.report("occupancy", False))
+        self.assertTrue(self.report("occupancy", True))
+        self.report("tempC", 21.5)
+        self.assertTrue(self.report("tempC", 21.6))
+
+    def test_heartbeat(self):
+        self.report("distance", 1000)
+        self.now = 59999
+        self.assertFalse(self.report("distance", 1000))
+        self.now = 60000
+        self.assertTrue(self.report("distance", 1000))
+
+    def test_force_and_forget(self):
+        self.report("distance", 1000)
+        self.assertTrue(self.report("distance", 1000, force=True))
+        self.rbe.forget("distance")
+        self.assertTrue(self.report("distance", 1000))
+
+    def test_state_survives_a_reboot(self):
+        self.now = 5000
+        self.report("distance", 1000)
+        self.report("occupancy", True)
+        self.assertTrue(self.rbe.dirty)
+        self.now = 20000
+        state = self.rbe.save_state(1717200020)
+        self.assertFalse(self.rbe.dirty)
+        self.assertEqual(state, {"distance": [1000, 1717200005],
+                                 "occupancy": [True, 1717200005]})
+        # ticks_ms starts again after the reboot
+        self.now = 100
+        rbe = UReportByException({"distance": 50}, heartbeat_s=60)
+        rbe.restore_state(state, 1717200050)
+        self.assertFalse(rbe.should_report("distance", 1040))
+        self.assertFalse(rbe.should_report("occupancy", True))
+        # the heartbeat runs from the report before the reboot
+        self.now = 100 + 15000
+        self.assertTrue(rbe.should_report("distance", 1040))
+
+    def test_expired_state_is_not_restored(self):
+        rbe = UReportByException(heartbeat_s=60)
+        rbe.restore_state({"distance": [1000, 1717200000]}, 1717200060)
+        rbe.restore_state({"tempC": [21.5, 1717200100]}, 1717200060)
+        self.assertEqual(rbe.last_value, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
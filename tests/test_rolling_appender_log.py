@@ -0,0 +1,221 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.rolling_appender_log import (LogLevel,  # noqa: E402
+                                                LogOperationException,
+                                                URollingAppenderLog)
+
+
+class TestURollingAppenderLog(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def read_log(self):
+        with open("test.log") as file:
+            return file.read().splitlines()
+
+    def test_unbuffered_writes_each_message(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024)
+        log.log_message("one", LogLevel.INFO, "T")
+        log.log_message("two", LogLevel.INFO, "T")
+        self.assertEqual(self.read_log(),
+                         ["TID:T-INFO-one", "TID:T-INFO-two"])
+
+    def test_buffered_holds_messages_until_full(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=3)
+        log.log_message("one", LogLevel.INFO, "T")
+        log.log_message("two", LogLevel.INFO, "T")
+        self.assertNotIn("test.log", os.listdir())
+        log.log_message("three", LogLevel.INFO, "T")
+        self.assertEqual(len(self.read_log()), 3)
+
+    def test_buffered_flushes_on_error(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=10)
+        log.log_message("one", LogLevel.INFO, "T")
+        log.log_message("boom", LogLevel.ERROR, "T")
+        self.assertEqual(self.read_log(),
+                         ["TID:T-INFO-one", "TID:T-ERROR-boom"])
+
+    def test_buffered_flushes_on_byte_threshold(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=10, buffer_max_bytes=20)
+        log.log_message("a message that is long", LogLevel.INFO, "T")
+        self.assertEqual(len(self.read_log()), 1)
+
+    def test_explicit_flush(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=10)
+        log.flush()  # nothing buffered
+        self.assertNotIn("test.log", os.listdir())
+        log.log_message("one", LogLevel.INFO, "T")
+        log.flush()
+        self.assertEqual(self.read_log(), ["TID:T-INFO-one"])
+
+    def test_buffered_rolls_over_using_size_counter(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=40,
+                                  max_backups=2, buffer_size=1)
+        for index in range(20):
+            log.log_message(f"message {index}", LogLevel.INFO, "T")
+        files = sorted(os.listdir())
+        self.assertEqual(files, ["test.log", "test.log.1", "test.log.2"])
+        self.assertTrue(self.read_log()[-1].endswith("message 19"))
+
+    def test_size_counter_counts_bytes(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024)
+        log.log_message("21.5°C", LogLevel.INFO, "T")
+        log.log_message("22.0°C", LogLevel.INFO, "T")
+        self.assertEqual(log._log_file_size, os.stat("test.log")[6])
+
+    def test_failed_flush_keeps_the_messages(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=3)
+        log.log_message("one", LogLevel.INFO, "T")
+        with mock.patch.object(log, '_append', side_effect=OSError(28)):
+            with self.assertRaises(LogOperationException):
+                log.log_message("boom", LogLevel.ERROR, "T")
+            # the buffer is bounded, the oldest message makes room
+            for index in range(3):
+                with self.assertRaises(LogOperationException):
+                    log.log_message(f"more {index}", LogLevel.INFO, "T")
+        self.assertEqual(log.dropped_messages, 2)
+        log.flush()
+        self.assertEqual(self.read_log(),
+                         ["TID:T-INFO-more 0", "TID:T-INFO-more 1",
+                          "TID:T-INFO-more 2"])
+
+    def test_filtered_messages_are_not_buffered(self):
+        log = URollingAppenderLog("test.log", log_level=LogLevel.INFO,
+                                  buffer_size=1)
+        log.log_message("hidden", LogLevel.DEBUG, "T")
+        self.assertNotIn("test.log", os.listdir())
+
+    def test_unbuffered_scans_the_directory_once(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024)
+        calls = []
+        listdir = os.listdir
+        with mock.patch.object(os, 'listdir',
+                               lambda *args: calls.append(1) or listdir(*args)):  # noqa: E501
+            for index in range(10):
+                log.log_message(f"message {index}", LogLevel.INFO, "T")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(self.read_log()), 10)
+
+    def test_zero_backups_keeps_the_log_and_deletes_old_backups(self):
+        for name in ("test.log.1", "test.log.2"):
+            with open(name, "w") as file:
+                file.write("old backup\n")
+        log = URollingAppenderLog("test.log", max_file_size_bytes=40,
+                                  max_backups=0)
+        for index in range(20):
+            log.log_message(f"message {index}", LogLevel.INFO, "T")
+        self.assertEqual(os.listdir(), ["test.log"])
+        self.assertEqual(len(self.read_log()), 20)
+
+    def test_dropping_from_a_full_buffer_keeps_the_order(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=1024,
+                                  buffer_size=4)
+        with mock.patch.object(log, '_append', side_effect=OSError(28)):
+            for index in range(10):
+                with self.assertRaises(LogOperationException):
+                    log.log_message(f"message {index}", LogLevel.ERROR,
+                                    "T")
+        self.assertEqual(log.dropped_messages, 6)
+        self.assertEqual(log._buffer_bytes,
+                         sum(len(f"TID:T-ERROR-message {index}\n")
+                             for index in range(6, 10)))
+        log.flush()
+        self.assertEqual(self.read_log(),
+                         [f"TID:T-ERROR-message {index}"
+                          for index in range(6, 10)])
+        # the ring starts again from the first slot
+        log.log_message("after", LogLevel.INFO, "T")
+        log.flush()
+        self.assertEqual(self.read_log()[-1], "TID:T-INFO-after")
+
+    def test_circular_rotation_overwrites_the_oldest_slot(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=10,
+                                  max_backups=3, rotation="circular")
+        for index in range(8):
+            log.log_message(f"message {index}", LogLevel.INFO, "T")
+        # each message fills the log, so backups hold one message each
+        self.assertEqual(sorted(os.listdir()),
+                         ["test.log", "test.log.1", "test.log.2",
+                          "test.log.3", "test.log.idx"])
+        newest_first = []
+        for backup in log.backups():
+            with open(backup) as file:
+                newest_first.append(file.read().split("-")[-1].strip())
+        self.assertEqual(newest_first, ["message 6", "message 5", "message 4"])  # noqa: E501
+        self.assertTrue(self.read_log()[-1].endswith("message 7"))
+
+    def test_circular_rollover_cost_does_not_grow_with_backups(self):
+        operations = {}
+        for max_backups in (2, 20):
+            log = URollingAppenderLog(f"log{max_backups}", max_file_size_bytes=10,  # noqa: E501
+                                      max_backups=max_backups,
+                                      rotation="circular")
+            for index in range(3 * max_backups):
+                log.log_message("x", LogLevel.INFO, "T")
+            with mock.patch.object(os, 'rename', wraps=os.rename) as rename, \
+                    mock.patch.object(os, 'remove', wraps=os.remove) as remove:  # noqa: E501
+                log.log_message("x", LogLevel.INFO, "T")
+            operations[max_backups] = rename.call_count + remove.call_count
+        self.assertEqual(operations[2], operations[20])
+        self.assertLessEqual(operations[2], 2)
+
+    def test_circular_rotation_resumes_from_sidecar(self):
+        log = URollingAppenderLog("test.log", max_file_size_bytes=10,
+                                  max_backups=3, rotation="circular")
+        for index in range(5):
+            log.log_message(f"message {index}", LogLevel.INFO, "T")
+        with open("test.log.idx") as file:
+            self.assertEqual(file.read(), "1")
+        log = URollingAppenderLog("test.log", max_file_size_bytes=10,
+                                  max_backups=3, rotation="circular")
+        self.assertEqual(log.backups(),
+                         ["test.log.1", "test.log.3", "test.log.2"])
+        log.log_message("message 5", LogLevel.INFO, "T")
+        self.assertEqual(log.backups()[0], "test.log.2")
+
+    def test_unknown_rotation(self):
+        with self.assertRaises(ValueError):
+            URollingAppenderLog("test.log", rotation="random")
+
+    def test_is_enabled_follows_log_level(self):
+        log = URollingAppenderLog("test.log", log_level=LogLevel.INFO)
+        self.assertTrue(log.is_enabled(LogLevel.ERROR))
+        self.assertTrue(log.is_enabled(LogLevel.INFO))
+        self.assertFalse(log.is_enabled(LogLevel.DEBUG))
+        log.log_level = LogLevel.DEBUG
+        self.assertTrue(log.is_enabled(LogLevel.DEBUG))
+        log.log_level = LogLevel.ERROR
+        self.assertFalse(log.is_enabled(LogLevel.INFO))
+
+    def test_log_format_only_formats_enabled_levels(self):
+        class Unformattable:
+            def __format__(self, spec):
+                raise AssertionError("formatted a filtered message")
+
+        log = URollingAppenderLog("test.log", log_level=LogLevel.INFO)
+        log.log_format(LogLevel.DEBUG, "{}", Unformattable())
+        log.log_format(LogLevel.INFO, "{} of {:.1f}", 1, 2)
+        self.assertEqual(self.read_log(),
+                         ["TID:0000-00-00T00:00:00Z-INFO-1 of 2.0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
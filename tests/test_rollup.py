@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import sys
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.rollup import UWelfordStats, URollupAggregator  # noqa: E402, E501
+
+
+class TestWelfordStats(unittest.TestCase):
+
+    def test_summary_matches_statistics(self):
+        values = [21.5, 21.7, 22.0, 21.9, 21.4, 20.8, 23.1]
+        stats = UWelfordStats()
+        for value in values:
+            stats.add(value)
+        summary = stats.summary()
+        self.assertEqual(summary["count"], len(values))
+        self.assertEqual(summary["min"], min(values))
+        self.assertEqual(summary["max"], max(values))
+        self.assertAlmostEqual(summary["mean"], statistics.fmean(values))
+        self.assertAlmostEqual(summary["stddev"], statistics.pstdev(values))
+
+    def test_large_offset_is_stable(self):
+        # a naive sum of squares loses the variance at this offset
+        values = [1e9 + delta for delta in (4, 7, 13, 16)]
+        stats = UWelfordStats()
+        for value in values:
+            stats.add(value)
+        self.assertAlmostEqual(stats.variance(), statistics.pvariance(values))
+
+    def test_single_value(self):
+        stats = UWelfordStats()
+        stats.add(5)
+        self.assertEqual(stats.stddev(), 0.0)
+        stats.reset()
+        self.assertEqual(stats.count, 0)
+        self.assertIsNone(stats.min)
+
+
+class TestRollupAggregator(unittest.TestCase):
+
+    def test_window(self):
+        rollup = URollupAggregator(60)
+        self.assertFalse(rollup.window_elapsed(1000))
+        rollup.add("tempC", 20.0, 1000)
+        rollup.add("tempC", 22.0, 1030)
+        rollup.add("humRH", 50, 1030)
+        self.assertFalse(rollup.window_elapsed(1059))
+        self.assertTrue(rollup.window_elapsed(1060))
+        closed = rollup.close(1060)
+        self.assertEqual(closed["start"], 1000)
+        self.assertEqual(closed["end"], 1060)
+        self.assertEqual(closed["tempC"]["count"], 2)
+        self.assertEqual(closed["tempC"]["mean"], 21.0)
+        self.assertEqual(closed["tempC"]["stddev"], 1.0)
+        self.assertEqual(closed["humRH"]["min"], 50)
+        self.assertEqual(rollup.pending(), [closed])
+
+    def test_next_window_starts_empty(self):
+        rollup = URollupAggregator(60)
+        rollup.add("tempC", 20.0, 0)
+        rollup.add("humRH", 50, 0)
+        rollup.close(60)
+        rollup.add("tempC", 25.0, 70)
+        closed = rollup.close(130)
+        self.assertEqual(closed["start"], 70)
+        self.assertEqual(closed["tempC"]["count"], 1)
+        self.assertNotIn("humRH", closed)
+
+    def test_empty_window_is_not_kept(self):
+        rollup = URollupAggregator(60)
+        self.assertIsNone(rollup.close(60))
+        self.assertEqual(rollup.pending(), [])
+
+    def test_history_is_bounded(self):
+        rollup = URollupAggregator(10, history=3)
+        for window in range(5):
+            rollup.add("tempC", window, window * 10)
+            rollup.close(window * 10 + 10)
+        self.assertEqual(rollup.dropped, 2)
+        self.assertEqual([each["start"] for each in rollup.pending()],
+                         [20, 30, 40])
+
+    def test_mark_sent(self):
+        rollup = URollupAggregator(10)
+        for window in range(3):
+            rollup.add("tempC", window, window * 10)
+            rollup.close(window * 10 + 10)
+        rollup.mark_sent()
+        self.assertEqual([each["start"] for each in rollup.pending()],
+                         [10, 20])
+        rollup.mark_sent()
+        rollup.mark_sent()
+        rollup.mark_sent()
+        self.assertEqual(rollup.pending(), [])
+
+    def test_state_survives_a_power_down(self):
+        rollup = URollupAggregator(60, history=2)
+        rollup.add("tempC", 20.0, 0)
+        rollup.close(60)
+        rollup.add("tempC", 20.0, 70)
+        rollup.add("tempC", 22.0, 80)
+        state = json.loads(json.dumps(rollup.save_state()))
+        restored = URollupAggregator(60, history=2)
+        restored.restore_state(state)
+        self.assertEqual(restored.pending(), rollup.pending())
+        restored.add("tempC", 24.0, 90)
+        self.assertTrue(restored.window_elapsed(130))
+        closed = restored.close(130)
+        self.assertEqual(closed["start"], 70)
+        self.assertEqual((closed["tempC"]["count"], closed["tempC"]["mean"],
+                          closed["tempC"]["max"]), (3, 22.0, 24.0))
+        self.assertEqual(len(restored.pending()), 2)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            URollupAggregator(0)
+        with self.assertRaises(ValueError):
+            URollupAggregator(60, history=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
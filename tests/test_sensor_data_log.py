@@ -0,0 +1,83 @@
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.sensor_data_log import USensorDataLog  # noqa: E402
+
+try:
+    import numpy  # noqa: F401
+    from tools.read_sensor_data_log import load
+except ImportError:
+    load = None
+
+CHANNELS = (("distance", "f"), ("occupancy", "B"))
+
+
+class TestUSensorDataLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "data.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_records(self, path):
+        with open(path, 'rb') as file:
+            channels, record_format, _ = USensorDataLog.read_header(file)
+            data = file.read()
+        size = struct.calcsize(record_format)
+        return channels, [struct.unpack_from(record_format, data, offset)
+                          for offset in range(0, len(data), size)]
+
+    def test_appends_fixed_width_records(self):
+        data_log = USensorDataLog(self.path, CHANNELS)
+        self.assertEqual(data_log.record_size, 9)
+        data_log.append({"distance": 812.5, "occupancy": True}, 100)
+        data_log.append({"distance": 1500.0, "occupancy": False}, 105)
+        channels, records = self.read_records(self.path)
+        self.assertEqual(channels, CHANNELS)
+        self.assertEqual(records, [(100, 812.5, 1), (105, 1500.0, 0)])
+
+    def test_keeps_history_across_instances(self):
+        USensorDataLog(self.path, CHANNELS).append({"distance": 1.0}, 1)
+        USensorDataLog(self.path, CHANNELS).append({"distance": 2.0}, 2)
+        _, records = self.read_records(self.path)
+        self.assertEqual([r[0] for r in records], [1, 2])
+
+    def test_rotates_at_size_cap(self):
+        data_log = USensorDataLog(self.path, CHANNELS, max_file_size_bytes=60,
+                                  max_backups=2)
+        for index in range(20):
+            data_log.append({"distance": float(index)}, index)
+        self.assertLessEqual(os.stat(self.path)[6], 60)
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        _, records = self.read_records(self.path)
+        self.assertEqual(records[-1][0], 19)
+
+    def test_schema_change_rotates_old_file(self):
+        with open(self.path, 'w') as file:
+            file.write('{"distance": 1}')
+        USensorDataLog(self.path, CHANNELS).append({"distance": 3.0}, 3)
+        _, records = self.read_records(self.path)
+        self.assertEqual(records, [(3, 3.0, 0)])
+        self.assertTrue(os.path.exists(self.path + ".1"))
+
+    @unittest.skipIf(load is None, "numpy is not installed")
+    def test_numpy_reader(self):
+        data_log = USensorDataLog(self.path, CHANNELS)
+        for index in range(10):
+            data_log.append({"distance": index * 10.0,
+                             "occupancy": index % 2}, index)
+        columns = load(self.path, chunk_records=3)
+        self.assertEqual(list(columns["timestamp"]), list(range(10)))
+        self.assertEqual(float(columns["distance"][9]), 90.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
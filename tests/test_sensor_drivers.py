@@ -0,0 +1,119 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import clock  # noqa: E402
+from lib.inboxidau.sensor_drivers import (  # noqa: E402
+    USensorDriver, USensorScheduler, SENSOR_DRIVERS, BME280Driver,
+    VL53L1XDriver, create_driver, register_driver)
+
+
+class FakeDriver(USensorDriver):
+
+    TYPE = "fake"
+    CHANNELS = (("value", "f"),)
+
+    def __init__(self, node, config):
+        super().__init__(node, config)
+        self.readings = iter(config.get("READINGS", []))
+
+    def read(self):
+        return {"value": self.filtered("value", next(self.readings))}
+
+
+class FakeNode:
+
+    def __init__(self):
+        self.published = []
+
+    def publish_channel(self, channel, topic, value, type_code=None):
+        self.published.append((channel, topic, value, type_code))
+
+
+class TestUSensorDriver(unittest.TestCase):
+
+    def test_registry(self):
+        self.assertIs(SENSOR_DRIVERS["bme280"], BME280Driver)
+        self.assertIs(SENSOR_DRIVERS["vl53l1x"], VL53L1XDriver)
+        register_driver(FakeDriver)
+        self.addCleanup(SENSOR_DRIVERS.pop, "fake")
+        driver = create_driver(None, {"TYPE": "fake", "PERIOD": 2})
+        self.assertIsInstance(driver, FakeDriver)
+        self.assertEqual((driver.name, driver.period_s), ("fake", 2))
+        with self.assertRaises(ValueError):
+            create_driver(None, {"TYPE": "unknown"})
+        with self.assertRaises(ValueError):
+            create_driver(None, {"TYPE": "fake", "PERIOD": 0})
+
+    def test_vl53l1x_needs_a_reading(self):
+        driver = create_driver(None, {"TYPE": "vl53l1x", "READINGS": 3})
+        self.assertEqual(driver.readings, 3)
+        with self.assertRaises(ValueError):
+            create_driver(None, {"TYPE": "vl53l1x", "READINGS": 0})
+
+    def test_filter_and_post(self):
+        node = FakeNode()
+        driver = FakeDriver(node, {"NAME": "bay", "FILTER": "median",
+                                   "FILTER_WINDOW": 3,
+                                   "READINGS": [10, 1000, 12],
+                                   "TOPICS": {"value": "bay/value"}})
+        self.assertEqual([driver.sample()["value"] for _ in range(3)],
+                         [10, 505, 12])
+        driver.post({"bay_value": 12, "other_value": 3})
+        # a queued reading is posted with its own values
+        driver.post({"bay_value": 505})
+        driver.post({})
+        self.assertEqual(node.published,
+                         [("bay_value", "bay/value", 12, "f"),
+                          ("bay_value", "bay/value", 505, "f")])
+
+    def test_channels_without_topic_are_not_posted(self):
+        node = FakeNode()
+        driver = FakeDriver(node, {"READINGS": [1]})
+        driver.sample()
+        driver.post({"fake_value": 1})
+        self.assertEqual(node.published, [])
+
+
+class TestUSensorScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        patcher = mock.patch.object(clock, 'ticks_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_driver(self, name, period_s):
+        return FakeDriver(None, {"NAME": name, "PERIOD": period_s})
+
+    def run_schedule(self, scheduler, seconds):
+        # follow the scheduler's sleeps, returns the sample times per driver
+        samples = {}
+        while self.now <= seconds * 1000:
+            for driver in scheduler.due():
+                samples.setdefault(driver.name, []).append(self.now / 1000)
+            self.now += int(scheduler.next_due_s() * 1000)
+        return samples
+
+    def test_each_driver_sampled_at_its_own_period(self):
+        scheduler = USensorScheduler([self.make_driver("fast", 5),
+                                      self.make_driver("slow", 60)])
+        samples = self.run_schedule(scheduler, 120)
+        self.assertEqual(samples["fast"], [5.0 * i for i in range(25)])
+        self.assertEqual(samples["slow"], [0.0, 60.0, 120.0])
+
+    def test_late_driver_skips_missed_samples(self):
+        scheduler = USensorScheduler([self.make_driver("fast", 5)])
+        scheduler.due()
+        self.now = 17000
+        self.assertEqual(len(scheduler.due()), 1)
+        self.assertEqual(scheduler.next_due_s(), 5.0)
+        self.now = 20000
+        self.assertEqual(scheduler.due(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import random
+import sys
+import unittest
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.sensor_reading_filter import (  # noqa: E402
+    SlidingWindow, DiscardExtremesFilter, TrimmedMeanFilter,
+    RunningMedianFilter, ExponentialMovingAverageFilter, KalmanFilter,
+    HampelFilter, create_filter)
+
+
+def discard_extremes(window):
+    if len(window) > 2:
+        trimmed = sorted(window)[1:-1]
+        return sum(trimmed) / len(trimmed)
+    return window[-1]
+
+
+def trimmed_mean(window, trim_percent):
+    if len(window) > 1:
+        ordered = sorted(window)
+        trim_count = int(len(ordered) * trim_percent)
+        trimmed = ordered[trim_count:-trim_count] if trim_count else ordered
+        return sum(trimmed) / len(trimmed)
+    return window[-1]
+
+
+class TestSlidingWindow(unittest.TestCase):
+
+    def test_sorted_window_tracks_readings(self):
+        random.seed(5)
+        window = SlidingWindow(7)
+        readings = []
+        for _ in range(200):
+            value = random.choice((random.randint(0, 50), 25))  # duplicates
+            window.add(value)
+            readings = (readings + [value])[-7:]
+            self.assertEqual(window.sorted[:window.count], sorted(readings))
+            self.assertEqual(window.readings(), readings)
+            self.assertEqual(window.total, sum(readings))
+
+    def test_reset(self):
+        window = SlidingWindow(3)
+        for value in (1, 2, 3, 4):
+            window.add(value)
+        window.reset()
+        window.add(9)
+        self.assertEqual(window.readings(), [9])
+        self.assertEqual(window.total, 9)
+
+
+class TestSlidingWindowFilters(unittest.TestCase):
+
+    def run_filter(self, sensor_filter, expected, window_size, readings):
+        window = []
+        for value in readings:
+            window = (window + [value])[-window_size:]
+            self.assertAlmostEqual(sensor_filter.add_reading(value),
+                                   expected(window), places=6)
+
+    def test_discard_extremes_matches_list_implementation(self):
+        random.seed(1)
+        for window_size in (1, 2, 3, 5, 10, 64):
+            readings = [random.uniform(20, 4000) for _ in range(300)]
+            self.run_filter(DiscardExtremesFilter(window_size),
+                            discard_extremes, window_size, readings)
+
+    def test_trimmed_mean_matches_list_implementation(self):
+        random.seed(2)
+        for window_size, trim_percent in ((5, 0.1), (10, 0.1), (10, 0.25),
+                                          (64, 0.2)):
+            readings = [random.randint(20, 4000) for _ in range(300)]
+            self.run_filter(TrimmedMeanFilter(window_size, trim_percent),
+                            lambda w: trimmed_mean(w, trim_percent),
+                            window_size, readings)
+
+    def test_reset_and_window(self):
+        sensor_filter = DiscardExtremesFilter(3)
+        for value in (10, 20, 30, 40):
+            sensor_filter.add_reading(value)
+        self.assertEqual(sensor_filter.window, [20, 30, 40])
+        sensor_filter.reset()
+        self.assertEqual(sensor_filter.add_reading(5), 5)
+        self.assertEqual(sensor_filter.window, [5])
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class TestStreamingFilters(unittest.TestCase):
+
+    def test_running_median_matches_sorted_median(self):
+        random.seed(3)
+        for window_size in (1, 2, 5, 8, 31):
+            sensor_filter = RunningMedianFilter(window_size)
+            window = []
+            for _ in range(300):
+                value = random.randint(0, 40)
+                window = (window + [value])[-window_size:]
+                self.assertEqual(sensor_filter.add_reading(value),
+                                 median(window))
+
+    def test_running_median_reset(self):
+        sensor_filter = RunningMedianFilter(3)
+        for value in (5, 1, 9):
+            sensor_filter.add_reading(value)
+        sensor_filter.reset()
+        self.assertEqual(sensor_filter.add_reading(7), 7)
+
+    def test_ema(self):
+        sensor_filter = ExponentialMovingAverageFilter(alpha=0.5)
+        self.assertEqual(sensor_filter.add_reading(10), 10)
+        self.assertEqual(sensor_filter.add_reading(20), 15)
+        self.assertEqual(sensor_filter.add_reading(20), 17.5)
+        with self.assertRaises(ValueError):
+            ExponentialMovingAverageFilter(alpha=0)
+
+    def test_kalman_converges_on_constant_signal(self):
+        random.seed(4)
+        sensor_filter = KalmanFilter(process_variance=0.01,
+                                     measurement_variance=100.0)
+        for _ in range(200):
+            estimate = sensor_filter.add_reading(1000 + random.gauss(0, 10))
+        self.assertAlmostEqual(estimate, 1000, delta=5)
+
+    def test_hampel_replaces_outliers_with_median(self):
+        sensor_filter = HampelFilter(window_size=5, n_sigmas=3.0)
+        for value in (100, 101, 99, 100):
+            self.assertEqual(sensor_filter.add_reading(value), value)
+        self.assertEqual(sensor_filter.add_reading(4000), 100)
+        self.assertEqual(sensor_filter.outliers, 1)
+        self.assertEqual(sensor_filter.add_reading(102), 102)
+
+    def test_hampel_mad_matches_sorted_mad(self):
+        random.seed(6)
+        sensor_filter = HampelFilter(window_size=9)
+        window = []
+        for _ in range(200):
+            value = random.randint(0, 100)
+            window = (window + [value])[-9:]
+            sensor_filter.add_reading(value)
+            centre = median(window)
+            self.assertEqual(sensor_filter.median(), centre)
+            self.assertEqual(sensor_filter.mad(centre),
+                             median([abs(v - centre) for v in window]))
+
+    def test_create_filter(self):
+        self.assertIsInstance(create_filter("median", 5), RunningMedianFilter)
+        self.assertEqual(create_filter("ema", alpha=0.2).alpha, 0.2)
+        self.assertFalse(create_filter("discard_extremes", 5).STREAMING)
+        self.assertTrue(create_filter("kalman").STREAMING)
+        with self.assertRaises(ValueError):
+            create_filter("unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
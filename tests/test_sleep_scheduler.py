@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, Mock
+
+# Mock the modules that are not available on a PC
+sys.modules['machine'] = Mock()
+sys.modules['ujson'] = json
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau import sleep_scheduler  # noqa: E402
+from lib.inboxidau.sleep_scheduler import USleepScheduler  # noqa: E402
+
+
+class TestUSleepScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.machine = MagicMock()
+        # the rp2 port has no RTC memory
+        self.machine.RTC.return_value.memory.side_effect = AttributeError
+        sleep_scheduler.machine = self.machine
+        self.node = MagicMock()
+
+    def test_mode_steps_down_for_short_sleeps(self):
+        scheduler = USleepScheduler(self.node, USleepScheduler.DEEP)
+        self.assertEqual(scheduler.choose_mode(300), "deep")
+        self.assertEqual(scheduler.choose_mode(10), "light")
+        self.assertEqual(scheduler.choose_mode(1), "busy")
+
+    def test_light_sleep_powers_radio_down_and_up(self):
+        scheduler = USleepScheduler(self.node, USleepScheduler.LIGHT)
+        scheduler.sleep(60)
+        self.node.prepare_for_sleep.assert_called_once_with("light")
+        self.machine.lightsleep.assert_called_once_with(60000)
+        self.node.resume_from_sleep.assert_called_once_with("light")
+        self.assertEqual(scheduler.sleeps["light"], 1)
+
+    def test_deep_sleep(self):
+        scheduler = USleepScheduler(self.node, USleepScheduler.DEEP)
+        scheduler.sleep(300)
+        self.node.prepare_for_sleep.assert_called_once_with("deep")
+        self.machine.deepsleep.assert_called_once_with(300000)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            USleepScheduler(self.node, "hibernate")
+
+    def test_resume_state_round_trip_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, "resume.json")
+            config_path = os.path.join(directory, "config.json")
+            with open(config_path, 'w') as file:
+                file.write('{"WIFI_SSID": "a"}')
+            self.assertIsNone(USleepScheduler.load_resume_state(
+                state_path, config_path))
+            USleepScheduler.save_resume_state(
+                state_path, config_path,
+                {"guid": "abc", "config": {"WIFI_SSID": "a"}, "cycle": 3})
+            state = USleepScheduler.load_resume_state(state_path,
+                                                      config_path)
+            self.assertEqual(state["guid"], "abc")
+            with open(config_path, 'w') as file:
+                file.write('{"WIFI_SSID": "changed"}')
+            self.assertIsNone(USleepScheduler.load_resume_state(
+                state_path, config_path))
+
+            USleepScheduler.save_resume_state(
+                state_path, config_path,
+                {"guid": "abc", "config": {"WIFI_SSID": "a"}, "cycle": 3})
+            USleepScheduler.save_resume_cycle(state_path, 7)
+            USleepScheduler.save_resume_cycle(state_path, 8)
+            self.assertEqual(os.path.getsize(f"{state_path}.cycle"), 5)
+            state = USleepScheduler.load_resume_state(state_path,
+                                                      config_path)
+            self.assertEqual(state["cycle"], 8)
+
+    def test_resume_state_needs_a_deep_sleep(self):
+        # a watchdog reset or machine.reset() after a resumed boot has the
+        # same reset cause on rp2 and must not resume the old state
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, "resume.json")
+            config_path = os.path.join(directory, "config.json")
+            with open(config_path, 'w') as file:
+                file.write('{"WIFI_SSID": "a"}')
+            USleepScheduler.save_resume_state(
+                state_path, config_path,
+                {"guid": "abc", "config": {"WIFI_SSID": "a"}, "cycle": 3})
+            self.assertIsNotNone(USleepScheduler.load_resume_state(
+                state_path, config_path))
+            self.assertIsNone(USleepScheduler.load_resume_state(
+                state_path, config_path))
+            # the next deep sleep only rewrites the cycle count
+            USleepScheduler.save_resume_cycle(state_path, 4)
+            state = USleepScheduler.load_resume_state(state_path,
+                                                      config_path)
+            self.assertEqual(state["cycle"], 4)
+            self.assertIsNone(USleepScheduler.load_resume_state(
+                state_path, config_path))
+
+    def test_resume_state_in_rtc_memory_needs_a_deep_sleep(self):
+        memory = {"data": b""}
+
+        def rtc_memory(data=None):
+            if data is None:
+                return memory["data"]
+            memory["data"] = data
+
+        self.machine.RTC.return_value.memory.side_effect = rtc_memory
+        USleepScheduler.save_resume_state(
+            "resume.json", "missing_config.json",
+            {"guid": "abc", "config": {}, "cycle": 3})
+        state = USleepScheduler.load_resume_state("resume.json",
+                                                  "missing_config.json")
+        self.assertEqual(state["cycle"], 3)
+        self.assertNotIn("sleeping", state)
+        self.assertIsNone(USleepScheduler.load_resume_state(
+            "resume.json", "missing_config.json"))
+
+    def test_woke_from_deep_sleep(self):
+        # rp2 reports a deep sleep wake as a watchdog reset
+        self.machine.WDT_RESET = 3
+        self.machine.PWRON_RESET = 1
+        del self.machine.DEEPSLEEP_RESET
+        self.machine.reset_cause.return_value = 3
+        self.assertTrue(USleepScheduler.woke_from_deep_sleep())
+        self.machine.reset_cause.return_value = 1
+        self.assertFalse(USleepScheduler.woke_from_deep_sleep())
+        # ports with DEEPSLEEP_RESET
+        self.machine.DEEPSLEEP_RESET = 4
+        self.assertFalse(USleepScheduler.woke_from_deep_sleep())
+        self.machine.reset_cause.return_value = 4
+        self.assertTrue(USleepScheduler.woke_from_deep_sleep())
+
+
+if __name__ == '__main__':
+    unittest.main()
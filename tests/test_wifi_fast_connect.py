@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Insert the path to the module under test
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.broker import FakeBroker  # noqa: E402
+from sim.fakes import FakeBoard, FakeNetwork, FakeNtp  # noqa: E402
+from sim.harness import BASE_CONFIG, ModulePatcher, install_node_modules  # noqa: E402, E501
+from sim.virtual_clock import VirtualClock  # noqa: E402
+
+OTHER_BSSID = b"\x10\x20\x30\x40\x50\x61"
+
+
+class TestWiFiFastConnect(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        with open("config.json", "w") as file:
+            json.dump(BASE_CONFIG, file)
+        self.clock = VirtualClock()
+        self.network = FakeNetwork(self.clock, BASE_CONFIG["WIFI_SSID"],
+                                   BASE_CONFIG["WIFI_PASSWORD"])
+        self.ntp = FakeNtp(self.clock)
+        broker = FakeBroker(self.clock)
+        self.patcher = ModulePatcher()
+        install_node_modules(self.patcher, self.clock,
+                             FakeBoard(self.clock), self.network, self.ntp,
+                             broker.client_class(), None, None)
+        from lib.inboxidau.pico_w_sensor_node import UPicoWSensorNode
+        from lib.inboxidau.rolling_appender_log import URollingAppenderLog
+        self.node_class = UPicoWSensorNode
+        self.log = URollingAppenderLog("node.log")
+
+    def tearDown(self):
+        self.patcher.restore()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def boot(self):
+        # a new node finds wifi.json from the last one, the link is down
+        if self.network.wlan is not None:
+            self.network.wlan.disconnect()
+        node = self.node_class(log=self.log, config_path="config.json")
+        node.wifi = self.network.WLAN()
+        return node
+
+    def test_full_connect_remembers_the_link(self):
+        node = self.boot()
+        node.connect_to_wifi()
+        self.assertTrue(node.wifi.isconnected())
+        with open("wifi.json") as file:
+            cache = json.load(file)
+        self.assertEqual(cache["bssid"], "102030405060")
+        self.assertNotIn("channel", cache)
+        # the BSSID comes from the association, not from a scan
+        self.assertEqual(self.network.scans, 0)
+        self.assertLessEqual(cache["lease_time"], self.clock.time())
+        self.assertEqual(self.network.dhcp_leases, 1)
+        self.assertEqual(self.ntp.syncs, 1)
+
+    def test_fast_connect_reuses_bssid_and_lease(self):
+        self.boot().connect_to_wifi()
+        self.clock.advance(600)
+        node = self.boot()
+        bssid, ifconfig = node.fast_connect_params()
+        self.assertEqual(bssid, self.network.bssid)
+        self.assertEqual(ifconfig[0], "192.168.1.50")
+        node.connect_to_wifi()
+        self.assertTrue(node.wifi.isconnected())
+        # no scan and no DHCP
+        self.assertEqual(self.network.scans, 0)
+        self.assertEqual(self.network.dhcp_leases, 1)
+        self.assertLess(node.wifi_connect_ms, 500)
+
+    def test_expired_lease_is_not_reused(self):
+        self.boot().connect_to_wifi()
+        node = self.boot()
+        self.clock.advance(node.STATIC_WIFI_LEASE_REUSE_S)
+        self.assertEqual(node.fast_connect_params(),
+                         (self.network.bssid, None))
+
+    def test_failed_fast_connect_forgets_the_link(self):
+        self.boot().connect_to_wifi()
+        # the access point was replaced
+        self.network.bssid = OTHER_BSSID
+        node = self.boot()
+        with patch.object(node, 'wait_for_wifi_connection',
+                          side_effect=[RuntimeError('network connection failed.'), 900]):  # noqa: E501
+            node.connect_to_wifi()
+        self.assertEqual(node.wifi_cache.get("bssid"), "102030405061")
+        self.assertEqual(self.network.dhcp_leases, 2)
+
+    def test_oserror_from_stale_parameters_falls_back(self):
+        self.boot().connect_to_wifi()
+        node = self.boot()
+        wifi = node.wifi
+        ifconfig = wifi.ifconfig
+
+        def refuse_static(config=None):
+            if config is not None and config != 'dhcp':
+                raise OSError(22)
+            return ifconfig(config)
+
+        with patch.object(wifi, 'ifconfig', side_effect=refuse_static):
+            node.connect_to_wifi()
+        self.assertTrue(node.wifi.isconnected())
+        self.assertEqual(self.network.dhcp_leases, 2)
+        self.assertIsNotNone(node.wifi_cache.get("lease_time"))
+
+    def test_async_runtime_falls_back_on_oserror(self):
+        from lib.inboxidau.async_node_runtime import UAsyncNodeRuntime
+        self.boot().connect_to_wifi()
+        node = self.boot()
+        runtime = UAsyncNodeRuntime(node)
+
+        async def wait_for_wifi_connection(timeout_s):
+            # the virtual clock only advances in the node's own wait
+            return node.wait_for_wifi_connection(timeout_s)
+
+        runtime.wait_for_wifi_connection = wait_for_wifi_connection
+        wifi = node.wifi
+        ifconfig = wifi.ifconfig
+
+        def refuse_static(config=None):
+            if config is not None and config != 'dhcp':
+                raise OSError(22)
+            return ifconfig(config)
+
+        with patch.object(wifi, 'ifconfig', side_effect=refuse_static):
+            asyncio.run(runtime.connect_to_wifi())
+        self.assertTrue(node.wifi.isconnected())
+        self.assertEqual(self.network.dhcp_leases, 2)
+
+    def test_forget_link_keeps_the_ntp_time(self):
+        node = self.boot()
+        node.connect_to_wifi()
+        node.wifi_cache.forget_link()
+        self.assertIsNone(node.fast_connect_params())
+        self.assertIsNotNone(node.wifi_cache.get("ntp_synced"))
+
+    def test_ntp_skipped_within_the_drift_budget(self):
+        self.boot().connect_to_wifi()
+        self.assertEqual(self.ntp.syncs, 1)
+        node = self.boot()
+        # 2 s at 50 ppm is 40000 s
+        self.clock.advance(30000)
+        node.sync_network_time_if_needed()
+        self.assertEqual(self.ntp.syncs, 1)
+        self.clock.advance(20000)
+        node.sync_network_time_if_needed()
+        self.assertEqual(self.ntp.syncs, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+# Host-side build of the precompiled node. Cross-compiles lib/inboxidau and
+# the node classes to .mpy bytecode with mpy-cross, so the Pico W loads
+# bytecode instead of compiling the source on every boot, which for a
+# node cycled by the Makerverse HAT or deep sleep is every reading. The
+# output directory mirrors the device filesystem, main.py is copied as
+# source as MicroPython only runs main.py and boot.py from source. With
+# --manifest a manifest.py for freezing the same modules into a custom
+# firmware build is written instead.
+# Needs mpy-cross built for the firmware's MicroPython version (pip install
+# mpy-cross==<version>, or make -C mpy-cross in the micropython repo).
+#
+# Usage:
+#   python tools/build_mpy.py [--out build] [--march armv6m] \
+#       [--main "SAMPLE Occupancy main.py"] [DistanceSensorNode.py ...]
+#   mpremote cp -r build/* :
+#
+#   python tools/build_mpy.py --manifest --out build
+#   make -C ports/rp2 BOARD=RPI_PICO_W FROZEN_MANIFEST=$PWD/build/manifest.py
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+LIBRARY = os.path.join("lib", "inboxidau")
+NODES = ("AtmosphericSensorNode.py", "DistanceSensorNode.py")
+# run as source by MicroPython, never compiled
+SOURCE_ONLY = ("main.py", "boot.py")
+
+
+def sources(root=ROOT, nodes=NODES):
+    # Paths relative to root of the modules to compile
+    library = sorted(os.path.join(LIBRARY, name)
+                     for name in os.listdir(os.path.join(root, LIBRARY))
+                     if name.endswith(".py"))
+    return library + [node for node in nodes if node not in SOURCE_ONLY]
+
+
+def mpy_path(source):
+    return source[:-len(".py")] + ".mpy"
+
+
+def compile_command(mpy_cross, source, output, march=None, opt=None):
+    command = [mpy_cross, "-o", output]
+    if march:
+        command.append(f"-march={march}")
+    if opt is not None:
+        command.append(f"-O{opt}")
+    # the source name recorded in tracebacks is the path on the device
+    command += ["-s", source.replace(os.sep, "/"), source]
+    return command
+
+
+def manifest(modules, root=ROOT):
+    # A frozen manifest for the modules, with the MicroPython libraries
+    # the node imports
+    lines = ['include("$(PORT_DIR)/boards/manifest.py")',
+             'require("umqtt.simple")',
+             'require("ntptime")']
+    for source in modules:
+        lines.append(f'module("{source.replace(os.sep, "/")}", base_path="{root}")')  # noqa: E501
+    return "\n".join(lines) + "\n"
+
+
+def build(out, mpy_cross, modules, main=None, march=None, opt=None,
+          root=ROOT):
+    # Compile modules into out, returns [(source, source bytes, mpy bytes)]
+    sizes = []
+    out = os.path.abspath(out)
+    for source in modules:
+        output = os.path.join(out, mpy_path(source))
+        os.makedirs(os.path.dirname(output) or out, exist_ok=True)
+        subprocess.run(compile_command(mpy_cross, source, output, march, opt),  # noqa: E501
+                       cwd=root, check=True)
+        sizes.append((source, os.path.getsize(os.path.join(root, source)),
+                      os.path.getsize(output)))
+    if main is not None:
+        shutil.copyfile(os.path.join(root, main),
+                        os.path.join(out, "main.py"))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("nodes", nargs="*", default=list(NODES),
+                        help="node class files to compile")
+    parser.add_argument("--out", default=os.path.join(ROOT, "build"))
+    parser.add_argument("--mpy-cross", default="mpy-cross")
+    parser.add_argument("--march", default="armv6m",
+                        help="native code architecture, armv6m for the RP2040")  # noqa: E501
+    parser.add_argument("-O", dest="opt", type=int,
+                        help="optimisation level, 3 drops asserts and line numbers")  # noqa: E501
+    parser.add_argument("--main", help="file to install as main.py")
+    parser.add_argument("--manifest", action="store_true",
+                        help="write a frozen manifest instead of .mpy files")
+    args = parser.parse_args()
+
+    modules = sources(nodes=args.nodes)
+    os.makedirs(args.out, exist_ok=True)
+    if args.manifest:
+        path = os.path.join(args.out, "manifest.py")
+        with open(path, "w") as file:
+            file.write(manifest(modules))
+        print(f"{path}: {len(modules)} modules")
+        return 0
+
+    mpy_cross = shutil.which(args.mpy_cross)
+    if mpy_cross is None:
+        print(f"{args.mpy_cross} not found, pip install mpy-cross matching the firmware version",  # noqa: E501
+              file=sys.stderr)
+        return 2
+    sizes = build(args.out, mpy_cross, modules, args.main, args.march,
+                  args.opt)
+    for source, source_bytes, mpy_bytes in sizes:
+        print(f"{source:<44}{source_bytes:>8}{mpy_bytes:>8}")
+    print(f"{'total':<44}{sum(size[1] for size in sizes):>8}"
+          f"{sum(size[2] for size in sizes):>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+
+# Host-side fleet load generator. Runs hundreds of unmodified Distance and
+# Atmospheric nodes with faked hardware against a local MQTT broker
+# stand-in, see sim/fleet.py, and reports the broker's throughput, publish
+# latency percentiles and connection churn. --compare runs the fleet twice,
+# with persistent sessions and reconnecting every cycle, and prints the two
+# reports side by side. --tls makes a throwaway self-signed certificate
+# with the openssl tool unless --certfile and --keyfile are given.
+#
+# Usage:
+#   python tools/fleet_load.py --nodes 200 --cadence 5 --duration 60 \
+#       [--tls] [--workers 4] [--node distance] [--compare]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from sim.fleet import ATMOSPHERIC, DISTANCE, NodeFleet  # noqa: E402
+from sim.harness import format_report  # noqa: E402
+
+NODE_CLASSES = {"distance": DISTANCE, "atmospheric": ATMOSPHERIC}
+
+
+def raise_file_limit():
+    # each node holds a socket, and with workers=1 so does the broker
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def format_comparison(reports, names):
+    lines = [f"{'':<24}" + "".join(f"{name:>14}" for name in names)]
+    for key in reports[0]:
+        cells = []
+        for report in reports:
+            value = report.get(key, "")
+            if isinstance(value, float):
+                value = f"{value:.3f}" if value < 100 else f"{value:.0f}"
+            cells.append(f"{value!s:>14}")
+        lines.append(f"{key:<24}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--cadence", type=float, default=5,
+                        help="seconds between readings")
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds to run")
+    parser.add_argument("--node", action="append",
+                        choices=sorted(NODE_CLASSES),
+                        help="node class, repeat for a mixed fleet")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to run the nodes in")
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--reconnect-each-cycle", action="store_true",
+                        help="disconnect after every reading")
+    parser.add_argument("--compare", action="store_true",
+                        help="run persistent sessions and reconnects")
+    parser.add_argument("--config", type=json.loads, default={},
+                        help="JSON merged into every node's config")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    node_classes = [NODE_CLASSES[name]
+                    for name in args.node or ("distance", "atmospheric")]
+    modes = (False, True) if args.compare else (args.reconnect_each_cycle,)
+    reports = []
+    for reconnect_each_cycle in modes:
+        reports.append(NodeFleet(node_classes, nodes=args.nodes,
+                                 cadence_s=args.cadence,
+                                 duration_s=args.duration, tls=args.tls,
+                                 reconnect_each_cycle=reconnect_each_cycle,
+                                 workers=args.workers, config=args.config,
+                                 certfile=args.certfile,
+                                 keyfile=args.keyfile).run())
+    if len(reports) == 1:
+        print(format_report(reports[0]))
+    else:
+        print(format_comparison(reports, [report["session"]
+                                          for report in reports]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import ssl
+import sys
+
+# Host-side fan-out for batched node payloads (MQTT_BATCH_PUBLISH).
+# Subscribes to node topics and their retained <node topic>/schema, decodes
+# each batch and republishes every channel on its own topic, as the node
+# would have without batching, so that MQTTThing accessories keep working.
+# Needs paho-mqtt (pip install paho-mqtt).
+#
+# Usage:
+#   python tools/mqtt_fanout.py --broker homebridge.local --port 8883 --tls \
+#       --username IoT --password secret carpark01/picodev_board/node
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.payload_encoding import JSON, decode  # noqa: E402
+
+
+def format_value(value, encoding):
+    # the text the node would have published for the value, floats sent as
+    # float32 are trimmed back to the digits float32 holds
+    if isinstance(value, float) and encoding != JSON:
+        value = float(f"{value:.7g}")
+    return f"{value}"
+
+
+class FanOut:
+
+    # Splits batch payloads into (topic, payload) pairs using the schema
+    # last seen for each node topic
+
+    def __init__(self):
+        self.schemas = {}
+
+    def handle(self, topic, payload):
+        if topic.endswith("/schema"):
+            self.schemas[topic[:-len("/schema")]] = json.loads(payload)
+            return []
+        schema = self.schemas.get(topic)
+        if schema is None:
+            return []  # nothing can be decoded before the schema arrives
+        encoding = schema["encoding"]
+        values = decode(encoding, payload, schema["channels"])
+        topics = dict((channel[0], channel[2])
+                      for channel in schema["channels"])
+        return [(topics[channel], format_value(value, encoding))
+                for channel, value in values.items() if topics.get(channel)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("node_topics", nargs="+")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--ca-certs")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    import paho.mqtt.client as mqtt
+
+    fan_out = FanOut()
+    client = mqtt.Client()
+    if args.username:
+        client.username_pw_set(args.username, args.password)
+    if args.tls:
+        client.tls_set(ca_certs=args.ca_certs, cert_reqs=ssl.CERT_REQUIRED
+                       if args.ca_certs else ssl.CERT_NONE)
+
+    def on_connect(client, userdata, flags, rc):
+        for topic in args.node_topics:
+            client.subscribe(f"{topic}/schema")
+            client.subscribe(topic)
+
+    def on_message(client, userdata, message):
+        try:
+            for topic, payload in fan_out.handle(message.topic,
+                                                 message.payload):
+                client.publish(topic, payload)
+        except (ValueError, KeyError) as e:
+            print(f"{message.topic}: {e}")
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port)
+    client.loop_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+
+# Host-side reader for the binary sensor data log written by USensorDataLog.
+# Streams records into NumPy arrays, one structured array per chunk, so that
+# large logs never have to be held as Python objects.
+#
+# Usage:
+#   python tools/read_sensor_data_log.py data.log [data.log.1 ...]
+#
+#   from tools.read_sensor_data_log import load
+#   columns = load(["data.log.1", "data.log"])
+#   columns["timestamp"], columns["distance"]
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))  # noqa: E501
+from lib.inboxidau.sensor_data_log import USensorDataLog  # noqa: E402
+
+# struct type code -> little endian NumPy type
+NUMPY_TYPES = {
+    "b": "i1", "B": "u1", "h": "<i2", "H": "<u2", "i": "<i4", "I": "<u4",
+    "l": "<i4", "L": "<u4", "q": "<i8", "Q": "<u8", "f": "<f4", "d": "<f8",
+    "?": "u1"
+}
+
+
+def record_dtype(channels):
+    fields = [("timestamp", NUMPY_TYPES[USensorDataLog.TIMESTAMP_CODE])]
+    fields += [(name, NUMPY_TYPES[code]) for name, code in channels]
+    return np.dtype(fields)
+
+
+def iter_chunks(path, chunk_records=4096):
+    # Yields structured arrays of up to chunk_records records. A trailing
+    # partial record, e.g. from a power loss mid-write, is ignored.
+    with open(path, 'rb') as file:
+        channels, _, _ = USensorDataLog.read_header(file)
+        dtype = record_dtype(channels)
+        chunk_bytes = chunk_records * dtype.itemsize
+        while True:
+            data = file.read(chunk_bytes)
+            usable = len(data) - len(data) % dtype.itemsize
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=dtype)
+            if len(data) < chunk_bytes:
+                break
+
+
+def load(paths, chunk_records=4096):
+    # Returns a dict of column name -> array for one or more log files read
+    # in the order given, e.g. oldest backup first
+    if isinstance(paths, str):
+        paths = [paths]
+    chunks = [chunk for path in paths
+              for chunk in iter_chunks(path, chunk_records)]
+    if not chunks:
+        return {}
+    names = chunks[0].dtype.names
+    for chunk in chunks[1:]:
+        if chunk.dtype.names != names:
+            raise ValueError("sensor data logs have different channels")
+    records = np.concatenate(chunks)
+    return {name: records[name] for name in names}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} data.log [data.log ...]")
+        return 2
+    columns = load(sys.argv[1:])
+    if not columns:
+        print("no records")
+        return 0
+    count = len(columns["timestamp"])
+    print(f"{count} records {columns['timestamp'][0]} .. {columns['timestamp'][-1]}")  # noqa: E501
+    for name, values in columns.items():
+        if name == "timestamp":
+            continue
+        print(f"{name:<12} min {values.min():>10.2f} max {values.max():>10.2f} mean {values.mean():>10.2f}")  # noqa: E501
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())